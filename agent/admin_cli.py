@@ -0,0 +1,473 @@
+"""
+Bulk admin operations on desktop sessions.
+
+Runs the admin endpoints of /api/desktop from the command line, with many
+requests in flight at once over one pooled HTTP session:
+
+    reset-macs       POST /reset-mac-address for every user in a CSV
+                     (an `email` or `userId` column, or one email/id per line)
+    cleanup          POST /cleanup-inactive-sessions
+    active-sessions  GET /active-sessions, written as JSONL or CSV
+
+Bulk runs use a bounded worker pool and a token-bucket rate limit, retry 429
+and 5xx answers with backoff, print progress to stderr and record every
+finished user in a state file (JSONL), so an interrupted run picks up where it
+stopped when started again with the same --state file.
+
+Sign in with an admin account (POST /api/auth/signin; the password is read from
+OFFICE_ADMIN_PASSWORD or prompted) or pass an existing token:
+    python admin_cli.py --login admin@example.com reset-macs users.csv --workers 16 --rate 50
+    python admin_cli.py --token "$TOKEN" active-sessions --format csv -o sessions.csv
+    python admin_cli.py --login admin cleanup
+
+Measure throughput against the in-process stand-in (fault_proxy.py):
+    python admin_cli.py --bench --users 1000
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import getpass
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from agent_tunables import Tunables
+from agent_tracing import TRACER, SPAN_KIND_CLIENT
+from desktop_agent_fixed import ApiClient, API_BASE_URL
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 20.0       # requests per second, 0 for no limit
+MAX_RETRIES = 5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+PROGRESS_INTERVAL = 1.0   # seconds between progress lines
+
+USER_COLUMNS = ('email', 'userId', 'user_id', 'id')
+SESSION_CSV_FIELDS = ('id', 'email', 'username', 'fullName', 'department', 'ssid', 'mac_address',
+                      'ip_address', 'computer_name', 'event_type', 'connection_start_time_formatted',
+                      'connection_duration_formatted', 'lastActivityAtFormatted')
+
+
+class RateLimiter:
+    """Token bucket shared by all workers"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class AdminClient(ApiClient):
+    """ApiClient signed in as an administrator, safe to share between worker threads"""
+
+    def __init__(self, base_url=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+                 max_retries=MAX_RETRIES, tunables=None):
+        tunables = tunables or Tunables(defaults={'api_base_url': base_url or API_BASE_URL})
+        super().__init__(tunables=tunables)
+        # One keep-alive connection per worker instead of requests' default pool of 10
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.credentials = None
+        self.retries = 0
+        self.bytes_received = 0
+        self._auth_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def signin_url(self):
+        base = self.base_url
+        if base.endswith('/desktop'):
+            base = base[:-len('/desktop')]
+        return f"{base}/auth/signin"
+
+    def use_token(self, token):
+        self.access_token = token
+        self.session.headers.update({'Authorization': f"Bearer {token}"})
+
+    def sign_in(self, login, password):
+        """Authenticate through the web sign-in, which does not bind a desktop device"""
+        try:
+            status, response_data = self.request('POST', self.signin_url,
+                                                 {'login': login, 'password': password})
+            if status != 200 or not response_data.get('success'):
+                return False, response_data.get('message', 'Sign-in failed')
+            data = response_data['data']
+            roles = data.get('roles') or []
+            if 'ROLE_ADMIN' not in roles and 'admin' not in roles:
+                return False, f"{login} is not an administrator"
+            self.user_data = data
+            self.credentials = (login, password)
+            self.use_token(data['accessToken'])
+            return True, response_data['message']
+        except Exception as e:
+            return False, f"Sign-in error: {str(e)}"
+
+    def _reauthenticate(self, stale_token):
+        """Sign in again after a 401, once for all workers that saw the same token"""
+        with self._auth_lock:
+            if self.access_token != stale_token:
+                return True
+            if not self.credentials:
+                return False
+            return self.sign_in(*self.credentials)[0]
+
+    def request(self, method, path, payload=None, params=None):
+        """(status, JSON body) with rate limiting and retries; status 0 if the server never answered.
+        `path` is relative to the API base URL unless it is a full URL."""
+        url = path if path.startswith(('http://', 'https://')) else f"{self.base_url}{path}"
+        status, body = 0, {'success': False, 'message': 'No response'}
+        reauthenticated = url == self.signin_url  # Never retry a failed sign-in by signing in
+        attempt = 0
+        while attempt <= self.max_retries:
+            self.limiter.acquire()
+            token = self.access_token
+            retry_after = None
+            try:
+                with TRACER.span(f"{method} {path}", SPAN_KIND_CLIENT, **{'http.method': method}) as span:
+                    response = self.session.request(method, url, json=payload,
+                                                    params=params, timeout=self.tunables.request_timeout,
+                                                    headers=TRACER.headers())
+                    span.set(**{'http.status_code': response.status_code})
+                with self._stats_lock:
+                    self.bytes_received += len(response.content)
+                status = response.status_code
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = {'success': False, 'message': response.text[:200]}
+                if status == 401 and not reauthenticated:
+                    reauthenticated = True
+                    if self._reauthenticate(token):
+                        continue
+                if status not in RETRY_STATUSES:
+                    return status, body
+                retry_after = response.headers.get('Retry-After')
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                status, body = 0, {'success': False, 'message': str(e)}
+
+            attempt += 1
+            if attempt > self.max_retries:
+                break
+            with self._stats_lock:
+                self.retries += 1
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = min(30.0, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            time.sleep(delay)
+        return status, body
+
+    def reset_mac(self, user):
+        """Deactivate a user's desktop sessions so their next login registers a new device"""
+        payload = {'userId': int(user)} if str(user).isdigit() else {'email': user}
+        return self.request('POST', '/reset-mac-address', payload)
+
+    def cleanup_inactive_sessions(self):
+        return self.request('POST', '/cleanup-inactive-sessions')
+
+    def active_sessions(self):
+        return self.request('GET', '/active-sessions')
+
+    def attendance_history(self, params):
+        return self.request('GET', '/attendance-history', params=params)
+
+
+def read_users(path):
+    """User emails/ids from a CSV with an email or userId column, or one value per line"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f))
+    rows = [row for row in rows if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip() for cell in rows[0]]
+    for column in USER_COLUMNS:
+        if column in header:
+            index = header.index(column)
+            return [row[index].strip() for row in rows[1:] if len(row) > index and row[index].strip()]
+    return [row[0].strip() for row in rows if row[0].strip()]
+
+
+class RunState:
+    """Append-only JSONL record of finished users, used to resume interrupted runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['user'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # A line cut short by the interruption
+        if path:
+            self._file = open(path, 'a')
+
+    def record(self, user, outcome, message):
+        if self._file is None:
+            return
+        line = json.dumps({'user': user, 'outcome': outcome, 'message': message,
+                           'at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Progress:
+    """Counts outcomes and prints a throttled progress line to stderr"""
+
+    def __init__(self, total, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.counts = {'reset': 0, 'no_sessions': 0, 'failed': 0}
+        self.started = time.monotonic()
+        self._printed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return sum(self.counts.values())
+
+    def add(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+            now = time.monotonic()
+            if self.stream and (now - self._printed >= self.interval or self.finished == self.total):
+                self._printed = now
+                self.stream.write(self.line() + '\n')
+                self.stream.flush()
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.finished / elapsed
+        remaining = (self.total - self.finished) / rate if rate else 0
+        counts = ' '.join(f"{name}={count}" for name, count in self.counts.items())
+        return (f"[{self.finished}/{self.total}] {counts}  {rate:.1f}/s  "
+                f"elapsed {elapsed:.0f}s  eta {remaining:.0f}s")
+
+
+def reset_macs(client, users, workers=DEFAULT_WORKERS, state=None, progress_stream=sys.stderr):
+    """Reset the registered device of every user; returns the summary dict"""
+    state = state or RunState(None)
+    pending = [user for user in dict.fromkeys(users) if user not in state.done]
+    progress = Progress(len(pending), progress_stream)
+    failures = []
+
+    def reset_one(user):
+        status, body = client.reset_mac(user)
+        message = body.get('message', '') if isinstance(body, dict) else ''
+        if status == 200:
+            outcome = 'reset'
+        elif status == 404 and 'No desktop sessions' in message:
+            outcome = 'no_sessions'  # Nothing bound to a device; the migration is done for them too
+        else:
+            outcome = 'failed'
+        return user, status, outcome, message
+
+    # Keep at most 2 x workers users queued so huge CSVs do not sit in the executor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        queue = iter(pending)
+        in_flight = set()
+        while True:
+            for user in queue:
+                in_flight.add(executor.submit(reset_one, user))
+                if len(in_flight) >= workers * 2:
+                    break
+            if not in_flight:
+                break
+            completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                user, status, outcome, message = future.result()
+                if outcome == 'failed':
+                    failures.append({'user': user, 'status': status, 'message': message})
+                else:
+                    state.record(user, outcome, message)
+                progress.add(outcome)
+
+    elapsed = time.monotonic() - progress.started
+    return {
+        'users': len(users),
+        'skipped_already_done': len(users) - len(pending),
+        'reset': progress.counts['reset'],
+        'no_sessions': progress.counts['no_sessions'],
+        'failed': progress.counts['failed'],
+        'retries': client.retries,
+        'elapsed_s': round(elapsed, 2),
+        'users_per_s': round(len(pending) / elapsed, 1) if elapsed else None,
+        'failures': failures[:50],
+    }
+
+
+def write_sessions(sessions, output, fmt):
+    """Write /active-sessions rows as JSONL or CSV (user fields flattened)"""
+    if fmt == 'jsonl':
+        for session in sessions:
+            output.write(json.dumps(session) + '\n')
+        return
+    writer = csv.DictWriter(output, fieldnames=SESSION_CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for session in sessions:
+        row = dict(session)
+        user = row.pop('user', None) or {}
+        for key in ('username', 'fullName', 'department'):
+            row[key] = user.get(key)
+        row['email'] = row.get('email') or user.get('email')
+        writer.writerow(row)
+
+
+def add_auth_arguments(parser):
+    """Server and credential options shared by the admin tools"""
+    parser.add_argument('--api', default=None, help=f"API base URL (default: {API_BASE_URL})")
+    parser.add_argument('--login', help="Admin username or email (password from OFFICE_ADMIN_PASSWORD or prompt)")
+    parser.add_argument('--token', help="Existing admin access token (or OFFICE_ADMIN_TOKEN)")
+
+
+def authenticate(client, args):
+    token = args.token or os.environ.get('OFFICE_ADMIN_TOKEN')
+    if token:
+        client.use_token(token)
+        return True
+    if not args.login:
+        print("Pass --login (or --token / OFFICE_ADMIN_TOKEN)", file=sys.stderr)
+        return False
+    password = os.environ.get('OFFICE_ADMIN_PASSWORD') or getpass.getpass(f"Password for {args.login}: ")
+    success, message = client.sign_in(args.login, password)
+    if not success:
+        print(message, file=sys.stderr)
+    return success
+
+
+# ===== Benchmark =====
+
+def run_benchmark(users=1000, workers_list=(1, 8, 32), latency=0.05, rate=0):
+    """Reset MACs for a synthetic user list through fault_proxy's stand-in at a fixed server latency"""
+    from fault_proxy import FaultProxy, FaultScript
+
+    results = []
+    for workers in workers_list:
+        proxy = FaultProxy(script=FaultScript([{'mode': 'latency', 'latency': latency}])).start()
+        try:
+            emails = [f"user{i}@bench.local" for i in range(users)]
+            with proxy.backend_lock:
+                for i, email in enumerate(emails):
+                    proxy.backend.sessions[(email, '02:00:00:%02x:%02x:%02x' % (
+                        (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff))] = time.time()
+            client = AdminClient(proxy.url, workers=workers, rate=rate)
+            success, message = client.sign_in('admin@bench.local', 'bench')
+            if not success:
+                raise RuntimeError(message)
+            summary = reset_macs(client, emails, workers, progress_stream=None)
+            with proxy.backend_lock:
+                left = len(proxy.backend.sessions)
+        finally:
+            proxy.stop()
+        results.append({
+            'workers': workers,
+            'users': users,
+            'elapsed_s': summary['elapsed_s'],
+            'users_per_s': summary['users_per_s'],
+            'projected_5000_users_min': round(5000 / summary['users_per_s'] / 60, 1),
+            'failed': summary['failed'],
+            'sessions_left': left,
+        })
+    return {'server_latency_s': latency, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk admin operations on desktop sessions")
+    add_auth_arguments(parser)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Concurrent requests")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="Requests per second, 0 for no limit")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Seconds per request")
+    parser.add_argument('--bench', action='store_true', help="Benchmark reset-macs against the stand-in")
+    parser.add_argument('--users', type=int, default=1000, help="Users per benchmark run")
+    subcommands = parser.add_subparsers(dest='command')
+
+    reset = subcommands.add_parser('reset-macs', help="Reset registered devices for users in a CSV")
+    reset.add_argument('csv', help="CSV with an email or userId column, or one email/id per line")
+    reset.add_argument('--state', help="Resume file (default: <csv>.state.jsonl)")
+
+    subcommands.add_parser('cleanup', help="Deactivate sessions without recent heartbeats")
+
+    sessions = subcommands.add_parser('active-sessions', help="Export active desktop sessions")
+    sessions.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+    sessions.add_argument('-o', '--output', help="Output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.users), indent=2))
+        return 0
+    if not args.command:
+        parser.print_help()
+        return 2
+
+    client = AdminClient(args.api, workers=args.workers, rate=args.rate)
+    client.tunables.apply_file({'request_timeout': args.timeout})
+    if not authenticate(client, args):
+        return 1
+
+    if args.command == 'reset-macs':
+        users = read_users(args.csv)
+        state = RunState(args.state or args.csv + '.state.jsonl')
+        try:
+            summary = reset_macs(client, users, args.workers, state)
+        finally:
+            state.close()
+        print(json.dumps(summary, indent=2))
+        return 0 if not summary['failed'] else 1
+
+    if args.command == 'cleanup':
+        status, body = client.cleanup_inactive_sessions()
+        print(json.dumps(body, indent=2))
+        return 0 if status == 200 else 1
+
+    status, body = client.active_sessions()
+    if status != 200:
+        print(body.get('message', f"HTTP {status}"), file=sys.stderr)
+        return 1
+    sessions = body.get('data') or []
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_sessions(sessions, f, args.format)
+    else:
+        write_sessions(sessions, sys.stdout, args.format)
+    print(f"{len(sessions)} active session(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
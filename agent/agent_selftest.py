@@ -0,0 +1,292 @@
+"""
+Self-test and diagnostics bundle for the Office Agent.
+
+    python desktop_agent_fixed.py --selftest        # from source
+    OfficeAgent.exe --selftest                      # installed build
+    python agent_selftest.py [--no-login] [--out DIR]
+
+Times every NetworkMonitor probe, measures DNS / TCP / TLS / HTTP latency to
+each configured API endpoint, checks the saved credentials and the token the
+server issues for them (not while the agent runs: a login would replace its
+session), and reports the log size and the RSS of the running agent (PID from
+the tray's lock file). The result is printed as JSON and written, with the
+tail of the log, to ~/office_agent_diagnostics_<host>_<time>.zip for the
+helpdesk ticket.
+`warnings` lists what looks wrong, so a slow machine can be triaged at a glance.
+
+The password and the token itself are never included.
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import base64
+import socket
+import zipfile
+import argparse
+import platform
+from datetime import datetime
+from urllib.parse import urlparse
+
+import desktop_agent_fixed
+from desktop_agent_fixed import NetworkMonitor, ApiClient, ConfigManager, TUNABLES
+from memory_watchdog import current_rss_bytes, RSS_LIMIT_MB
+from shutdown_pipeline import ShutdownJournal
+
+SCHEMA_VERSION = 1
+LOG_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_log.txt')
+LOCK_FILE = os.path.join(os.path.expanduser('~'), '.office_agent.lock')
+LOG_TAIL_LINES = 500
+TIMEOUT = 5.0
+
+# Thresholds for `warnings`
+SLOW_PROBE_MS = 1000
+SLOW_ENDPOINT_MS = 1000
+LARGE_LOG_BYTES = 20 * 1024 * 1024
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def time_probes(network=NetworkMonitor):
+    """Run every get_* probe of the network monitor once: {name: {ms, value | error}}"""
+    results = {}
+    for name in sorted(dir(network)):
+        if not name.startswith('get_'):
+            continue
+        started = time.perf_counter()
+        try:
+            value = getattr(network, name)()
+            results[name] = {'ms': _ms(time.perf_counter() - started), 'value': value}
+        except Exception as e:
+            results[name] = {'ms': _ms(time.perf_counter() - started), 'error': str(e)}
+    return results
+
+
+def measure_endpoint(url, timeout=TIMEOUT):
+    """DNS, TCP connect, TLS handshake and HTTP round trip (unauthenticated GET) to an endpoint"""
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    result = {'url': url}
+    sock = None
+    try:
+        started = time.perf_counter()
+        infos = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+        result['dns_ms'] = _ms(time.perf_counter() - started)
+        result['addresses'] = sorted({info[4][0] for info in infos})
+
+        started = time.perf_counter()
+        sock = socket.create_connection((parsed.hostname, port), timeout)
+        result['tcp_ms'] = _ms(time.perf_counter() - started)
+
+        if parsed.scheme == 'https':
+            started = time.perf_counter()
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname)
+            result['tls_ms'] = _ms(time.perf_counter() - started)
+            result['tls_version'] = sock.version()
+
+        # Any API route answers quickly without a token (401); this times the server itself
+        started = time.perf_counter()
+        request = (f"GET {parsed.path.rstrip('/')}/network-policy HTTP/1.1\r\n"
+                   f"Host: {parsed.netloc}\r\nConnection: close\r\n\r\n")
+        sock.sendall(request.encode('ascii'))
+        status_line = sock.makefile('rb').readline(256).decode('latin-1').split()
+        result['http_ms'] = _ms(time.perf_counter() - started)
+        result['http_status'] = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else None
+    except Exception as e:
+        result['error'] = f"{e.__class__.__name__}: {e}"
+    finally:
+        if sock is not None:
+            sock.close()
+    return result
+
+
+def _token_claims(token):
+    """Payload of a JWT (not verified; only for the report)"""
+    try:
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except Exception:
+        return None
+
+
+def check_auth(login=True, agent_running=False):
+    """Saved credentials, a login with them and whether the server accepts the issued token
+
+    A desktop login replaces the device's session token, and the running agent's next
+    request would then be refused ("Desktop session not found or has been logged out").
+    So the login is skipped while the tray agent is running; its own status covers it.
+    """
+    email, password = ConfigManager.load_credentials()
+    result = {'credentials': 'saved' if email and password else 'missing', 'email': email}
+    if not (email and password) or not login:
+        return result
+    if agent_running:
+        result['login_skipped'] = "agent running; a login would replace its session token"
+        return result
+
+    client = ApiClient()
+    started = time.perf_counter()
+    success, message = client.login(email, password, timeout=TIMEOUT)
+    result.update({'login_ms': _ms(time.perf_counter() - started), 'login_ok': success, 'message': message})
+    if success:
+        claims = _token_claims(client.access_token)
+        result['token_claims'] = {key: claims[key] for key in ('id', 'isDesktopClient', 'iat', 'exp')
+                                  if claims and key in claims}
+        started = time.perf_counter()
+        status, _, _ = client.fetch_network_policy()
+        result['token_check_ms'] = _ms(time.perf_counter() - started)
+        # 404 just means the server publishes no policy; 401/403 means the token was refused
+        result['token_accepted'] = status in (200, 404)
+    return result
+
+
+def process_info():
+    """PID and RSS of the running tray agent (from its lock file) and of this process"""
+    result = {'selftest_rss_mb': round(current_rss_bytes() / 1024 / 1024, 1)}
+    try:
+        with open(LOCK_FILE) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return dict(result, agent_running=False)
+    rss = current_rss_bytes(pid) if pid != os.getpid() else 0
+    result.update({'agent_pid': pid, 'agent_running': rss > 0,
+                   'agent_rss_mb': round(rss / 1024 / 1024, 1) if rss else None,
+                   'lock_age_s': round(time.time() - os.path.getmtime(LOCK_FILE))})
+    return result
+
+
+def log_info(path=LOG_FILE):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {'path': path, 'bytes': 0}
+    return {'path': path, 'bytes': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')}
+
+
+def log_tail(path=LOG_FILE, lines=LOG_TAIL_LINES):
+    """Last lines of the log, read from the end so a huge log costs nothing"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - lines * 200, 0))
+            data = f.read()
+    except OSError:
+        return ''
+    return b'\n'.join(data.splitlines()[-lines:]).decode('utf-8', errors='replace')
+
+
+def agent_version():
+    """Version from the bundle's update manifest ('source' when not an installed build)"""
+    if not getattr(sys, 'frozen', False):
+        return 'source'
+    from agent_updater import BUNDLE_MANIFEST
+    try:
+        with open(os.path.join(os.path.dirname(sys.executable), BUNDLE_MANIFEST)) as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return 'unknown'
+
+
+def warnings_for(report):
+    """Short findings for the helpdesk"""
+    found = []
+    for name, probe in report['probes'].items():
+        if 'error' in probe:
+            found.append(f"probe {name} failed: {probe['error']}")
+        elif probe['ms'] >= SLOW_PROBE_MS:
+            found.append(f"probe {name} slow: {probe['ms']} ms")
+    if report['probes'].get('get_current_ssid', {}).get('value') == 'Unknown':
+        found.append("SSID not detected")
+    for endpoint in report['endpoints']:
+        if 'error' in endpoint:
+            found.append(f"endpoint {endpoint['url']} unreachable: {endpoint['error']}")
+        else:
+            total = sum(endpoint.get(key, 0) for key in ('dns_ms', 'tcp_ms', 'tls_ms', 'http_ms'))
+            if total >= SLOW_ENDPOINT_MS:
+                found.append(f"endpoint {endpoint['url']} slow: {round(total)} ms to first response")
+    auth = report['auth']
+    if auth['credentials'] == 'missing':
+        found.append("no saved credentials")
+    elif auth.get('login_ok') is False:
+        found.append(f"login failed: {auth.get('message')}")
+    elif auth.get('token_accepted') is False:
+        found.append("server refused the issued token")
+    process = report['process']
+    if not process.get('agent_running'):
+        found.append("tray agent not running")
+    elif process.get('agent_rss_mb') and process['agent_rss_mb'] >= RSS_LIMIT_MB * 0.8:
+        found.append(f"agent RSS {process['agent_rss_mb']} MB near the {RSS_LIMIT_MB} MB restart limit")
+    if report['log']['bytes'] >= LARGE_LOG_BYTES:
+        found.append(f"log is {report['log']['bytes'] // (1024 * 1024)} MB")
+    return found
+
+
+def run_selftest(login=True):
+    """Collect the diagnostics report (a JSON-serialisable dict)"""
+    started = time.perf_counter()
+    TUNABLES.load_file()
+    process = process_info()
+    report = {
+        'schema': SCHEMA_VERSION,
+        'generated_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'agent': {'version': agent_version(), 'frozen': bool(getattr(sys, 'frozen', False)),
+                  'python': platform.python_version(), 'os': platform.platform(),
+                  'hostname': socket.gethostname()},
+        'probes': time_probes(),
+        'endpoints': [measure_endpoint(url) for url in (TUNABLES.api_endpoints or (TUNABLES.api_base_url,))],
+        'auth': check_auth(login, process.get('agent_running', False)),
+        'process': process,
+        'log': log_info(),
+        'shutdown_journal_pending': len(ShutdownJournal().pending()),
+        'tunables': {key: list(value) if isinstance(value, tuple) else value
+                     for key, value in TUNABLES.snapshot().items()},
+    }
+    report['warnings'] = warnings_for(report)
+    report['elapsed_ms'] = _ms(time.perf_counter() - started)
+    return report
+
+
+def write_bundle(report, directory=None):
+    """Zip the report and the log tail; returns the bundle's path"""
+    directory = directory or os.path.expanduser('~')
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(directory, f"office_agent_diagnostics_{report['agent']['hostname']}_{stamp}.zip")
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr('diagnostics.json', json.dumps(report, indent=2, default=str))
+        bundle.writestr('log_tail.txt', log_tail())
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent self-test")
+    parser.add_argument('--selftest', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--no-login', action='store_true', help="Skip the login / token check")
+    parser.add_argument('--out', help="Directory for the diagnostics bundle (default: home)")
+    args, _ = parser.parse_known_args(argv)
+
+    # Probe and API chatter goes to the bundle, not the console
+    saved_print = getattr(desktop_agent_fixed, 'print', None)
+    desktop_agent_fixed.print = lambda *args, **kwargs: None
+    try:
+        report = run_selftest(login=not args.no_login)
+    finally:
+        if saved_print is None:
+            del desktop_agent_fixed.print
+        else:
+            desktop_agent_fixed.print = saved_print
+    path = write_bundle(report, args.out)
+    if sys.stdout is not None:  # The windowed build has no console; the bundle is the output
+        print(json.dumps(report, separators=(',', ':'), default=str))
+        print(f"Diagnostics bundle: {path}")
+    desktop_agent_fixed.log_to_file(f"Self-test: {len(report['warnings'])} warnings, bundle {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
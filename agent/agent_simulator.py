@@ -0,0 +1,642 @@
+"""
+Deterministic simulator for the Office Agent.
+
+Runs the real OfficeAgent / ApiClient code against a virtual clock, a scripted
+network timeline and an in-process stand-in for the /api/desktop backend, so a
+full working day (or a whole fleet of agents) replays in seconds and every
+request the agent would have made is recorded.
+
+Usage:
+    python agent_simulator.py                         # built-in office day, 1 agent
+    python agent_simulator.py --agents 2000           # fleet run
+    python agent_simulator.py --timeline day.json --requests-out requests.jsonl
+    python agent_simulator.py --agents 500 --workload workload.json   # recorded logon curve
+    python agent_simulator.py --power battery         # on battery (also: ac, low)
+    python agent_simulator.py --activity              # follow the timeline's screen locks
+    python agent_simulator.py --link                  # link-driven transitions (see link_state.py)
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import bisect
+import random
+import argparse
+import contextlib
+from datetime import datetime
+from urllib.parse import urlencode, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+import desktop_agent_fixed
+from desktop_agent_fixed import OfficeAgent
+from agent_tunables import Tunables
+from workload_profile import Workload
+from office_network_policy import PolicyStore
+from power_state import PowerMonitor, StaticPowerSource
+from user_activity import ActivityMonitor, ActivityState
+from link_state import LinkMonitor, LinkState
+
+# --power choices: (on_battery, percent)
+POWER_PROFILES = {
+    'ac': (False, None),
+    'battery': (True, 80),
+    'low': (True, 15),
+}
+
+# All timelines are replayed on a fixed Monday so results are reproducible
+SIMULATION_DATE = '2025-05-19'
+
+DEFAULT_TIMELINE = {
+    'start': '08:30',
+    'end': '18:30',
+    'events': [
+        {'at': '09:00', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '11:00', 'locked': True},
+        {'at': '11:45', 'locked': False},
+        {'at': '13:00', 'ssid': 'Unknown'},
+        {'at': '13:45', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '15:00', 'server': 'down'},
+        {'at': '15:10', 'server': 'up'},
+        {'at': '16:30', 'suspend': 1200},
+        {'at': '18:00', 'ssid': 'Unknown'},
+    ],
+}
+
+
+def parse_clock_time(value):
+    """Convert 'HH:MM' (or 'HH:MM:SS') on SIMULATION_DATE to an epoch timestamp"""
+    fmt = '%Y-%m-%d %H:%M:%S' if value.count(':') == 2 else '%Y-%m-%d %H:%M'
+    return datetime.strptime(f"{SIMULATION_DATE} {value}", fmt).timestamp()
+
+
+class VirtualClock:
+    """Drop-in replacement for the time module that only advances when slept on"""
+
+    def __init__(self, start, end=None, suspends=None):
+        self.now = float(start)
+        self.end = end
+        self.wakeups = 0
+        self.on_expire = None
+        # (start, duration) pairs; crossing a start jumps the clock like a suspended laptop
+        self.suspends = sorted(suspends or [])
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        target = self.now + seconds if seconds > 0 else self.now
+        while self.suspends and self.suspends[0][0] <= target:
+            suspend_at, duration = self.suspends.pop(0)
+            if suspend_at >= self.now:
+                target += duration
+        self.now = target
+        self.wakeups += 1
+        if self.end is not None and target >= self.end and self.on_expire:
+            self.on_expire()
+
+    @property
+    def expired(self):
+        return self.end is not None and self.now >= self.end
+
+
+class NetworkTimeline:
+    """Scripted network conditions: SSID / IP changes, link state, server outages, suspends
+    and screen locks. The link is up while an SSID is joined unless an event sets it
+    explicitly ({'link': 'up'} for a cable or WSL with no SSID)."""
+
+    def __init__(self, start, end, events):
+        self.start = start
+        self.end = end
+        self.events = sorted(events, key=lambda event: event['at'])
+
+        # Pre-compute the state after each event so lookups are a single bisect
+        self._times = []
+        self._states = []
+        state = {'ssid': 'Unknown', 'ip': '127.0.0.1', 'link': False, 'server_up': True,
+                 'locked': False}
+        for event in self.events:
+            state = dict(state)
+            if 'ssid' in event:
+                state['ssid'] = event['ssid']
+                state['ip'] = event.get('ip', '127.0.0.1' if event['ssid'] == 'Unknown' else '10.0.0.2')
+                state['link'] = event['ssid'] != 'Unknown'
+            if 'link' in event:
+                state['link'] = event['link'] == 'up'
+                state['ip'] = event.get('ip', '10.0.0.2' if state['link'] else '127.0.0.1')
+            if 'server' in event:
+                state['server_up'] = event['server'] == 'up'
+            if 'locked' in event:
+                state['locked'] = bool(event['locked'])
+            self._times.append(event['at'])
+            self._states.append(state)
+        self._initial = {'ssid': 'Unknown', 'ip': '127.0.0.1', 'link': False, 'server_up': True,
+                         'locked': False}
+
+    @classmethod
+    def from_dict(cls, data, offset=0):
+        """Build a timeline from the JSON format, optionally shifting the whole day"""
+        events = []
+        for event in data.get('events', []):
+            event = dict(event)
+            event['at'] = parse_clock_time(event['at']) + offset
+            events.append(event)
+        return cls(parse_clock_time(data['start']) + offset, parse_clock_time(data['end']) + offset, events)
+
+    @classmethod
+    def from_file(cls, path, offset=0):
+        with open(path) as f:
+            return cls.from_dict(json.load(f), offset)
+
+    def state_at(self, timestamp):
+        """Network state in effect at the given time"""
+        index = bisect.bisect_right(self._times, timestamp)
+        return self._states[index - 1] if index else self._initial
+
+    def suspends(self):
+        return [(event['at'], event['suspend']) for event in self.events if 'suspend' in event]
+
+
+class SimulatedNetwork:
+    """NetworkMonitor stand-in that answers probes from a timeline"""
+
+    def __init__(self, timeline, clock, agent_id=0):
+        self.timeline = timeline
+        self.clock = clock
+        self.mac_address = '02:00:00:%02x:%02x:%02x' % (
+            (agent_id >> 16) & 0xff, (agent_id >> 8) & 0xff, agent_id & 0xff)
+        self.computer_name = f"SIM-{agent_id:05d}"
+        self.probe_count = 0
+
+    def get_current_ssid(self):
+        self.probe_count += 1
+        return self.timeline.state_at(self.clock.time())['ssid']
+
+    def get_ip_address(self):
+        return self.timeline.state_at(self.clock.time())['ip']
+
+    def get_mac_address(self):
+        return self.mac_address
+
+    def get_computer_name(self):
+        return self.computer_name
+
+
+class SimulatedActivity:
+    """User activity source answered from the timeline's screen locks"""
+
+    def __init__(self, timeline, clock):
+        self.timeline = timeline
+        self.clock = clock
+
+    def __call__(self):
+        return ActivityState(locked=self.timeline.state_at(self.clock.time())['locked'])
+
+
+class SimulatedLink:
+    """Link state source answered from the timeline"""
+
+    def __init__(self, timeline, clock):
+        self.timeline = timeline
+        self.clock = clock
+
+    def __call__(self):
+        return LinkState(self.timeline.state_at(self.clock.time())['link'])
+
+
+class SimulatedResponse:
+    """Minimal requests.Response look-alike"""
+
+    def __init__(self, status_code, payload, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+
+class SimulatedBackend:
+    """In-process stand-in that follows desktop.controller.js semantics"""
+
+    def __init__(self, keep_log=True, policy=None):
+        self.policy = policy       # office network policy served at /network-policy
+        self.sessions = {}         # (email, mac) -> last activity
+        self.active_records = {}   # (email, mac) -> connection start
+        self.idle = {}             # (email, mac) -> time reported idle; exempt from cleanup
+        self.tokens = {}           # token -> email
+        self.admins = set()        # tokens from /auth/signin, allowed on the admin endpoints
+        self.history = []          # /attendance-history records, newest connectionStartTime first
+        self._history_keys = None  # (record count, negated start epochs) for range lookups
+        self.log = []              # (agent_id, time, method, path, event_type, status)
+        self.keep_log = keep_log   # soak runs only count requests so memory stays flat
+        self.request_count = 0
+
+    def record(self, entry):
+        self.request_count += 1
+        if self.keep_log:
+            self.log.append(entry)
+
+    def handle(self, agent_id, now, server_up, method, path, headers, payload):
+        path, _, query = path.partition('?')
+        if query and payload is None:
+            payload = {key: values[-1] for key, values in parse_qs(query).items()}
+        event_type = (payload or {}).get('event_type')
+        if not server_up:
+            self.record((agent_id, now, method, path, event_type, 0))
+            raise requests.exceptions.ConnectionError(f"Simulated outage for {path}")
+        status, body = self._dispatch(now, path, headers, payload or {})
+        self.record((agent_id, now, method, path, event_type, status))
+        if path.endswith('/network-policy') and status in (200, 304):
+            return SimulatedResponse(status, body, {'ETag': self._policy_etag()})
+        return SimulatedResponse(status, body)
+
+    def _policy_etag(self):
+        return 'W/"%08x"' % zlib.crc32(json.dumps(self.policy, sort_keys=True).encode())
+
+    def _dispatch(self, now, path, headers, payload):
+        if path.endswith('/auth/signin'):
+            token = f"sim-admin-{payload.get('login')}"
+            self.admins.add(token)
+            return 200, {'success': True, 'message': 'Login successful',
+                         'data': {'username': payload.get('login'), 'roles': ['ROLE_ADMIN'],
+                                  'accessToken': token}}
+
+        token = headers.get('Authorization', '').replace('Bearer ', '')
+        if token in self.admins:
+            return self._dispatch_admin(now, path, payload)
+
+        if path.endswith('/login'):
+            email, mac = payload.get('email'), payload.get('macAddress')
+            token = f"sim-token-{email}"
+            self.tokens[token] = email
+            self.sessions[(email, mac)] = now
+            return 200, {'success': True, 'message': 'Login successful',
+                         'data': {'email': email, 'accessToken': token}}
+
+        email = self.tokens.get(token)
+        if not email:
+            return 401, {'success': False, 'message': 'Unauthorized!'}
+
+        if path.endswith('/logout'):
+            for key in [key for key in self.sessions if key[0] == email]:
+                self.sessions.pop(key, None)
+                self.active_records.pop(key, None)
+                self.idle.pop(key, None)
+            return 200, {'success': True, 'message': 'Logout successful'}
+
+        if path.endswith('/track-connection'):
+            key = (payload.get('email'), payload.get('mac_address'))
+            if key not in self.sessions:
+                return 400, {'success': False, 'message': 'No active session found for this device'}
+            self.sessions[key] = now
+            event_type = payload.get('event_type')
+            if event_type == 'connect':
+                self.idle.pop(key, None)
+                self.active_records[key] = now
+                return 200, {'success': True, 'message': 'Connection recorded successfully'}
+            if event_type == 'heartbeat':
+                self.idle.pop(key, None)
+                self.active_records.setdefault(key, now)
+                return 200, {'success': True, 'message': 'Heartbeat recorded successfully'}
+            if event_type == 'idle':
+                self.active_records.pop(key, None)
+                self.idle[key] = now
+                return 200, {'success': True, 'message': 'Idle recorded successfully'}
+            if event_type == 'disconnect':
+                if self.active_records.pop(key, None) is None:
+                    return 400, {'success': False, 'message': 'No active connection found to disconnect'}
+                return 200, {'success': True, 'message': 'Disconnection recorded successfully'}
+            return 400, {'success': False, 'message': 'Invalid event type'}
+
+        if path.endswith('/network-policy'):
+            if self.policy is None:
+                return 404, {'success': False, 'message': 'Not found'}
+            if headers.get('If-None-Match') == self._policy_etag():
+                return 304, None
+            return 200, {'success': True, 'message': 'Network policy', 'data': self.policy}
+
+        if path.endswith('/daily-summary'):
+            return 200, {'success': True, 'message': 'Daily summary recorded successfully'}
+
+        return 404, {'success': False, 'message': 'Not found'}
+
+    def _dispatch_admin(self, now, path, payload):
+        if path.endswith('/reset-mac-address'):
+            user = payload.get('email') or payload.get('userId')
+            if user is None:
+                return 400, {'success': False, 'message': 'Either userId or email is required'}
+            keys = [key for key in self.sessions if key[0] == user]
+            if not keys:
+                return 404, {'success': False, 'message': 'No desktop sessions found for this user'}
+            for key in keys:
+                self.sessions.pop(key, None)
+                self.active_records.pop(key, None)
+            return 200, {'success': True, 'message': 'MAC address reset successfully',
+                         'data': {'email': user, 'sessionsDeactivated': len(keys)}}
+
+        if path.endswith('/active-sessions'):
+            sessions = [{'email': email, 'mac_address': mac, 'timestamp': int(last),
+                         'event_type': 'connect' if (email, mac) in self.active_records else 'unknown'}
+                        for (email, mac), last in self.sessions.items()]
+            return 200, {'success': True, 'message': 'Active desktop sessions retrieved successfully',
+                         'data': sessions}
+
+        if path.endswith('/attendance-history'):
+            return 200, {'success': True, 'message': 'Attendance history retrieved successfully',
+                         'data': self._history_page(payload)}
+
+        if path.endswith('/cleanup-inactive-sessions'):
+            stale = [key for key, last in self.sessions.items()
+                     if now - self.idle.get(key, last) > (12 * 3600 if key in self.idle else 300)]
+            for key in stale:
+                self.sessions.pop(key, None)
+                self.active_records.pop(key, None)
+            return 200, {'success': True,
+                         'message': f"Successfully cleaned up {len(stale)} inactive sessions",
+                         'data': {'processedSessions': [{'email': key[0], 'macAddress': key[1]}
+                                                        for key in stale],
+                                  'totalFound': len(stale)}}
+
+        return 404, {'success': False, 'message': 'Not found'}
+
+    def _history_page(self, query):
+        """One page of self.history filtered like getAttendanceHistory (dates inclusive).
+        self.history is kept newest first with ties in descending id, the server's page order."""
+        if self._history_keys is None or self._history_keys[0] != len(self.history):
+            self._history_keys = (len(self.history), [-_iso_epoch(record['connectionStartTime'])
+                                                      for record in self.history])
+        keys = self._history_keys[1]
+        first, last = 0, len(keys)
+        if query.get('endDate'):
+            first = bisect.bisect_left(keys, -_iso_epoch(query['endDate']))
+        if query.get('startDate'):
+            last = bisect.bisect_right(keys, -_iso_epoch(query['startDate']))
+        if query.get('userId'):
+            matching = [record for record in self.history[first:last]
+                        if str((record.get('user') or {}).get('id')) == str(query['userId'])]
+        else:
+            matching = None
+        total = len(matching) if matching is not None else max(last - first, 0)
+        limit, offset = int(query.get('limit', 100)), int(query.get('offset', 0))
+        if matching is not None:
+            records = matching[offset:offset + limit]
+        else:
+            records = self.history[first + offset:min(first + offset + limit, last)]
+        return {'total': total, 'records': records,
+                'pagination': {'limit': limit, 'offset': offset,
+                               'hasMore': offset + len(records) < total}}
+
+
+def _iso_epoch(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class SimulatedSession:
+    """requests.Session stand-in routing every call to the SimulatedBackend"""
+
+    def __init__(self, backend, timeline, clock, agent_id):
+        self.backend = backend
+        self.timeline = timeline
+        self.clock = clock
+        self.agent_id = agent_id
+        self.headers = {}
+
+    def request(self, method, url, json=None, **kwargs):
+        if kwargs.get('params'):
+            url = f"{url}?{urlencode(kwargs['params'])}"
+        now = self.clock.time()
+        server_up = self.timeline.state_at(now)['server_up']
+        path = url.split('://', 1)[-1].split('/', 1)[-1]
+        headers = dict(self.headers)
+        headers.update(kwargs.get('headers') or {})
+        return self.backend.handle(self.agent_id, now, server_up, method, '/' + path,
+                                   headers, json)
+
+    def post(self, url, json=None, **kwargs):
+        return self.request('POST', url, json=json, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+@contextlib.contextmanager
+def quiet_agent():
+    """Silence the agent's console/log output while simulating"""
+    silent = lambda *args, **kwargs: None
+    saved = {name: getattr(desktop_agent_fixed, name, None) for name in ('print', 'log_to_file')}
+    desktop_agent_fixed.print = silent
+    desktop_agent_fixed.log_to_file = silent
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                delattr(desktop_agent_fixed, name)
+            else:
+                setattr(desktop_agent_fixed, name, value)
+
+
+def simulate_agent(timeline, backend, agent_id=0, platform='linux', overrides=None, power=None,
+                   activity=False, link=False):
+    """Replay one agent through a timeline. Returns per-agent statistics.
+    The agent follows the backend's office network policy when it publishes one,
+    runs on the given POWER_PROFILES entry (no power monitor when None),
+    with activity, pauses while the timeline has the screen locked and, with link,
+    reports connects/disconnects from the timeline's link state (Windows/Linux)."""
+    clock = VirtualClock(timeline.start, timeline.end, timeline.suspends())
+    network = SimulatedNetwork(timeline, clock, agent_id)
+    tunables = Tunables()
+    tunables.apply_file(overrides or {})
+    policy_store = PolicyStore(path=None, clock=clock) if backend.policy is not None else None
+    power_monitor = PowerMonitor(StaticPowerSource(*POWER_PROFILES[power]), clock) if power else None
+    activity_monitor = ActivityMonitor(SimulatedActivity(timeline, clock)) if activity else None
+    link_monitor = LinkMonitor(SimulatedLink(timeline, clock)) if link else None
+    agent = OfficeAgent(f"user{agent_id}@sim.local", 'simulated', clock=clock, network=network,
+                        tunables=tunables, policy_store=policy_store, power_monitor=power_monitor,
+                        activity_monitor=activity_monitor, link_monitor=link_monitor)
+    agent.platform = platform
+    agent.api_client.session = SimulatedSession(backend, timeline, clock, agent_id)
+    clock.on_expire = lambda: setattr(agent, 'is_running', False)
+
+    success, message = agent.api_client.login(agent.email, agent.password)
+    if success:
+        agent.is_running = True
+        agent.run_loop()
+        agent.stop()
+    return {
+        'agent_id': agent_id,
+        'logged_in': success,
+        'wakeups': clock.wakeups,
+        'probes': network.probe_count,
+        'simulated_seconds': clock.now - timeline.start,
+    }
+
+
+def _first_arrival(timeline_data):
+    """Seconds after midnight of the first network join in a timeline"""
+    for event in timeline_data['events']:
+        if event.get('ssid') and event['ssid'] != 'Unknown':
+            return parse_clock_time(event['at']) - parse_clock_time('00:00')
+    return parse_clock_time(timeline_data['start']) - parse_clock_time('00:00')
+
+
+def _simulate_range(timeline_data, first, last, agents, seed, spread_minutes, platform, overrides,
+                    workload_data=None, policy=None, power=None, activity=False, link=False):
+    """Simulate agents [first, last) against one backend"""
+    backend = SimulatedBackend(policy=policy)
+    results = []
+    workload = Workload(workload_data) if workload_data else None
+    arrival = _first_arrival(timeline_data)
+    with quiet_agent():
+        for agent_id in range(first, last):
+            # Offsets depend only on (seed, agent_id), so results don't depend on worker count
+            rng = random.Random(seed * 1000003 + agent_id)
+            login_minute = workload.sample_login_minute(rng) if workload else None
+            if login_minute is not None:
+                # Shift the day so this agent joins the office network at a recorded login time
+                offset = login_minute * 60 - arrival
+            else:
+                offset = rng.uniform(-spread_minutes, spread_minutes) * 60 if agents > 1 else 0
+            timeline = NetworkTimeline.from_dict(timeline_data, offset)
+            results.append(simulate_agent(timeline, backend, agent_id, platform, overrides, power,
+                                          activity, link))
+    return backend.log, results
+
+
+def simulate_fleet(timeline_data, agents=1, seed=0, spread_minutes=20, platform='linux', workers=1,
+                   overrides=None, workload_data=None, policy=None, power=None, activity=False,
+                   link=False):
+    """Replay many agents, each with its day shifted by a seeded random offset
+    (or to a login time drawn from a recorded workload)"""
+    backend = SimulatedBackend(policy=policy)
+    results = []
+    workers = max(1, min(workers, agents))
+    if workers == 1:
+        backend.log, results = _simulate_range(timeline_data, 0, agents, agents, seed,
+                                               spread_minutes, platform, overrides, workload_data,
+                                               policy, power, activity, link)
+        return backend, results
+
+    chunk = -(-agents // workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_simulate_range, timeline_data, first, min(first + chunk, agents),
+                               agents, seed, spread_minutes, platform, overrides, workload_data,
+                               policy, power, activity, link)
+                   for first in range(0, agents, chunk)]
+        for future in futures:
+            log, chunk_results = future.result()
+            backend.log.extend(log)
+            results.extend(chunk_results)
+    return backend, results
+
+
+def summarize(backend, results):
+    """Request volume per agent per day, broken down by endpoint and event type"""
+    per_agent = {}
+    by_kind = {}
+    per_minute = {}
+    failed = 0
+    for agent_id, now, method, path, event_type, status in backend.log:
+        per_agent[agent_id] = per_agent.get(agent_id, 0) + 1
+        kind = f"{method} {path}" + (f" [{event_type}]" if event_type else '')
+        by_kind[kind] = by_kind.get(kind, 0) + 1
+        minute = int(now // 60)
+        per_minute[minute] = per_minute.get(minute, 0) + 1
+        if status != 200:
+            failed += 1
+
+    counts = sorted(per_agent.get(result['agent_id'], 0) for result in results)
+    agents = len(results) or 1
+    hours = sum(r['simulated_seconds'] for r in results) / 3600 or 1
+    return {
+        'agents': len(results),
+        'total_requests': len(backend.log),
+        'failed_requests': failed,
+        'requests_per_agent': {
+            'mean': round(sum(counts) / agents, 1),
+            'p50': counts[len(counts) // 2] if counts else 0,
+            'p95': counts[int(len(counts) * 0.95)] if counts else 0,
+            'max': counts[-1] if counts else 0,
+        },
+        'requests_per_agent_by_kind': {kind: round(count / agents, 1)
+                                       for kind, count in sorted(by_kind.items())},
+        'peak_requests_per_minute': max(per_minute.values()) if per_minute else 0,
+        'wakeups_per_agent': round(sum(r['wakeups'] for r in results) / agents, 1),
+        'wakeups_per_hour': round(sum(r['wakeups'] for r in results) / hours, 1),
+        'probes_per_agent': round(sum(r['probes'] for r in results) / agents, 1),
+    }
+
+
+def write_request_log(backend, path):
+    """Write every recorded request as one JSON object per line"""
+    with open(path, 'w') as f:
+        for agent_id, now, method, path_, event_type, status in backend.log:
+            f.write(json.dumps({'agent': agent_id, 'time': now, 'method': method,
+                                'path': path_, 'event_type': event_type,
+                                'status': status}) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Office Agent days on a virtual clock")
+    parser.add_argument('--timeline', help="JSON timeline file (defaults to a built-in office day)")
+    parser.add_argument('--agents', type=int, default=1, help="Number of agents to simulate")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for per-agent time offsets")
+    parser.add_argument('--spread', type=float, default=20,
+                        help="Max per-agent shift of the timeline in minutes")
+    parser.add_argument('--platform', default='linux',
+                        help="sys.platform value the agent logic should assume")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes to spread a fleet simulation over")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a tunable, e.g. --set heartbeat_cycles=8")
+    parser.add_argument('--requests-out', help="Write every request to this JSONL file")
+    parser.add_argument('--workload', help="Workload file from workload_profile.py; agents join "
+                                           "at login times drawn from its recorded curve")
+    parser.add_argument('--policy', help="Office network policy JSON served at /network-policy "
+                                         "(as published by the backend)")
+    parser.add_argument('--power', choices=sorted(POWER_PROFILES),
+                        help="Power source the agent sees (default: no power monitor)")
+    parser.add_argument('--activity', action='store_true',
+                        help="Follow the timeline's screen locks (pause heartbeats while locked)")
+    parser.add_argument('--link', action='store_true',
+                        help="Report connects/disconnects from the timeline's link state "
+                             "(Windows/Linux platforms)")
+    args = parser.parse_args(argv)
+
+    if args.timeline:
+        with open(args.timeline) as f:
+            timeline_data = json.load(f)
+    else:
+        timeline_data = DEFAULT_TIMELINE
+
+    overrides = dict(item.split('=', 1) for item in args.set)
+    workload_data = Workload.from_file(args.workload).data if args.workload else None
+    policy = None
+    if args.policy:
+        with open(args.policy) as f:
+            policy = json.load(f)
+
+    started = time.perf_counter()
+    backend, results = simulate_fleet(timeline_data, args.agents, args.seed,
+                                      args.spread, args.platform, args.workers, overrides,
+                                      workload_data, policy, args.power, args.activity, args.link)
+    elapsed = time.perf_counter() - started
+
+    if args.requests_out:
+        write_request_log(backend, args.requests_out)
+
+    summary = summarize(backend, results)
+    summary['wall_seconds'] = round(elapsed, 2)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
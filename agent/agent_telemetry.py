@@ -0,0 +1,332 @@
+"""
+Fleet telemetry for the Office Agent, carried on heartbeats.
+
+Each agent keeps running totals in fixed-size arrays. These are a latency
+histogram of the SSID probe and of every API request, HTTP error counts by kind,
+and retries (outbound queue retries plus endpoint failovers). Every
+`telemetry_heartbeats`-th heartbeat, starting with the first, carries a small
+versioned summary of them, together with the shutdown journal depth, CPU
+seconds and RSS:
+
+    {"v": 1, "seq": 12, "uptime_s": 5400, "probe_ms": [...14], "http_ms": [...14],
+     "errors": [connection, timeout, 4xx, 5xx], "retries": 3, "journal": 0,
+     "queue": 0, "cpu_s": 4.2, "rss_mb": 38.5}
+
+Totals are cumulative since the agent started, so a summary lost with a
+coalesced heartbeat costs nothing: the next one includes it. The server keeps
+the latest summary per device (reference_server.py: table agentTelemetry),
+and this tool merges them into fleet percentiles:
+
+    python agent_telemetry.py aggregate --db desktop_api.sqlite
+    python agent_telemetry.py aggregate heartbeats.jsonl      # heartbeat payloads or exports
+    python agent_telemetry.py decode '{"v": 1, ...}'          # one summary, readable
+    python agent_telemetry.py --bench                         # agent cost, size, fleet merge time
+"""
+
+import sys
+import json
+import time
+import bisect
+import random
+import sqlite3
+import argparse
+import threading
+from array import array
+
+SCHEMA_VERSION = 1
+
+# Upper bounds (ms) of the latency buckets; a last bucket counts everything slower
+LATENCY_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+BUCKETS = len(LATENCY_BOUNDS_MS) + 1
+
+# Order of the `errors` array
+ERROR_KINDS = ('connection', 'timeout', 'client', 'server')
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def _bucket(seconds):
+    return bisect.bisect_left(LATENCY_BOUNDS_MS, seconds * 1000)
+
+
+class AgentTelemetry:
+    """Rolling totals of one agent; record_* are called from the agent's and the sender's threads"""
+
+    def __init__(self, clock=None):
+        self.clock = clock or time
+        self.started = self.clock.monotonic()
+        self.probe_ms = array('Q', bytes(8 * BUCKETS))
+        self.http_ms = array('Q', bytes(8 * BUCKETS))
+        self.errors = array('Q', bytes(8 * len(ERROR_KINDS)))
+        self.failovers = 0
+        self.sequence = 0
+        self._lock = threading.Lock()
+
+    def record_probe(self, seconds):
+        with self._lock:
+            self.probe_ms[_bucket(seconds)] += 1
+
+    def record_request(self, seconds, status=None, error=None):
+        """One API request: its status code, or error 'connection' / 'timeout' when none came back"""
+        with self._lock:
+            self.http_ms[_bucket(seconds)] += 1
+            if error is not None:
+                self.errors[ERROR_KINDS.index(error)] += 1
+            elif status is not None and status >= 500:
+                self.errors[3] += 1
+            elif status is not None and status >= 400:
+                self.errors[2] += 1
+
+    def record_failover(self):
+        with self._lock:
+            self.failovers += 1
+
+    def summary(self, retries=0, journal=0, queue=0):
+        """The next versioned summary (a small JSON-serialisable dict)"""
+        from memory_watchdog import current_rss_bytes
+        with self._lock:
+            self.sequence += 1
+            return {
+                'v': SCHEMA_VERSION,
+                'seq': self.sequence,
+                'uptime_s': int(self.clock.monotonic() - self.started),
+                'probe_ms': self.probe_ms.tolist(),
+                'http_ms': self.http_ms.tolist(),
+                'errors': self.errors.tolist(),
+                'retries': retries + self.failovers,
+                'journal': journal,
+                'queue': queue,
+                'cpu_s': round(time.process_time(), 1),
+                'rss_mb': round(current_rss_bytes() / 1024 / 1024, 1),
+            }
+
+
+def decode(summary):
+    """Validate a summary (dict or JSON text); raises ValueError for unknown versions or shapes"""
+    if isinstance(summary, (str, bytes)):
+        summary = json.loads(summary)
+    if not isinstance(summary, dict) or summary.get('v') != SCHEMA_VERSION:
+        raise ValueError(f"unsupported telemetry version: {summary.get('v') if isinstance(summary, dict) else None}")
+    for name, length in (('probe_ms', BUCKETS), ('http_ms', BUCKETS), ('errors', len(ERROR_KINDS))):
+        values = summary.get(name)
+        if not isinstance(values, list) or len(values) != length or not all(
+                isinstance(value, int) and value >= 0 for value in values):
+            raise ValueError(f"bad {name}")
+    return summary
+
+
+def histogram_percentile(counts, fraction):
+    """Latency (ms) at a fraction of a bucket histogram, linear within the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= target:
+            if index == len(LATENCY_BOUNDS_MS):
+                return float(LATENCY_BOUNDS_MS[-1])  # Slower than the last bound
+            lower = LATENCY_BOUNDS_MS[index - 1] if index else 0
+            return round(lower + (LATENCY_BOUNDS_MS[index] - lower) * (target - seen) / count, 1)
+        seen += count
+    return float(LATENCY_BOUNDS_MS[-1])
+
+
+def _percentiles(values, fractions=(0.5, 0.95)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {f"p{round(fraction * 100)}": values[min(int(len(values) * fraction), len(values) - 1)]
+              for fraction in fractions}
+    result['max'] = values[-1]
+    return result
+
+
+class FleetAggregate:
+    """Merge of the latest summary of many agents"""
+
+    def __init__(self):
+        self.agents = 0
+        self.rejected = 0
+        self.probe_ms = array('Q', bytes(8 * BUCKETS))
+        self.http_ms = array('Q', bytes(8 * BUCKETS))
+        self.errors = array('Q', bytes(8 * len(ERROR_KINDS)))
+        self.retries = []
+        self.journal = []
+        self.cpu_per_hour = []
+        self.rss_mb = []
+        self.error_rates = []
+
+    def add(self, summary):
+        try:
+            summary = decode(summary)
+        except ValueError:
+            self.rejected += 1
+            return
+        self.agents += 1
+        for merged, values in ((self.probe_ms, summary['probe_ms']), (self.http_ms, summary['http_ms']),
+                               (self.errors, summary['errors'])):
+            for index, value in enumerate(values):
+                merged[index] += value
+        requests = sum(summary['http_ms'])
+        self.error_rates.append(round(1000 * sum(summary['errors']) / requests, 1) if requests else 0.0)
+        self.retries.append(summary.get('retries', 0))
+        self.journal.append(summary.get('journal', 0))
+        self.rss_mb.append(summary.get('rss_mb', 0.0))
+        hours = summary.get('uptime_s', 0) / 3600
+        if hours >= 0.25:  # CPU rate of a freshly started agent is mostly startup
+            self.cpu_per_hour.append(round(summary.get('cpu_s', 0.0) / hours, 2))
+
+    def report(self):
+        latency = lambda counts: {f"p{round(fraction * 100)}": histogram_percentile(counts, fraction)
+                                  for fraction in PERCENTILES}
+        return {
+            'agents': self.agents,
+            'rejected': self.rejected,
+            'probe_ms': latency(self.probe_ms),
+            'http_ms': latency(self.http_ms),
+            'requests': sum(self.http_ms),
+            'errors': dict(zip(ERROR_KINDS, self.errors.tolist())),
+            'errors_per_1000_requests': _percentiles(self.error_rates),
+            'retries': dict(_percentiles(self.retries), total=sum(self.retries)),
+            'journal': dict(_percentiles(self.journal),
+                            agents_with_backlog=sum(1 for depth in self.journal if depth)),
+            'cpu_s_per_hour': _percentiles(self.cpu_per_hour),
+            'rss_mb': _percentiles(self.rss_mb),
+        }
+
+
+def read_jsonl(paths):
+    """(agent, received, summary) from heartbeat payloads or {'agent', 'received', 'telemetry'} lines"""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(entry, dict) or not isinstance(entry.get('telemetry'), dict):
+                    continue
+                agent = entry.get('agent') or (entry.get('email'), entry.get('mac_address'))
+                received = entry.get('received') or entry.get('heartbeat_time') or 0
+                yield json.dumps(agent, sort_keys=True), received, entry['telemetry']
+
+
+def read_db(path):
+    """(agent, received, summary) rows of a reference server database"""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for user_id, mac, received, summary in db.execute(
+                "SELECT userId, macAddress, receivedAt, summary FROM agentTelemetry"):
+            try:
+                yield f"{user_id}/{mac}", received, json.loads(summary)
+            except ValueError:
+                continue
+    finally:
+        db.close()
+
+
+def aggregate(entries):
+    """Fleet report from the latest summary of each agent"""
+    latest = {}
+    for agent, received, summary in entries:
+        key = (received, summary.get('seq', 0) if isinstance(summary, dict) else 0)
+        if agent not in latest or key >= latest[agent][0]:
+            latest[agent] = (key, summary)
+    fleet = FleetAggregate()
+    for _, summary in latest.values():
+        fleet.add(summary)
+    return fleet.report()
+
+
+def describe(summary):
+    """One summary with its histograms turned into percentiles"""
+    summary = decode(summary)
+    readable = {key: value for key, value in summary.items() if key not in ('probe_ms', 'http_ms', 'errors')}
+    for name in ('probe_ms', 'http_ms'):
+        readable[name] = {f"p{round(fraction * 100)}": histogram_percentile(summary[name], fraction)
+                          for fraction in PERCENTILES}
+        readable[name]['count'] = sum(summary[name])
+    readable['errors'] = dict(zip(ERROR_KINDS, summary['errors']))
+    return readable
+
+
+# ===== Benchmark =====
+
+def _synthetic_summary(rng):
+    """Summary of a plausible agent after a working day"""
+    telemetry = AgentTelemetry()
+    for _ in range(rng.randint(200, 1200)):
+        telemetry.record_probe(rng.lognormvariate(-3.5, 1.0))
+    for _ in range(rng.randint(200, 600)):
+        error = rng.choice(ERROR_KINDS[:2]) if rng.random() < 0.01 else None
+        telemetry.record_request(rng.lognormvariate(-2.5, 0.8), 500 if rng.random() < 0.002 else 200, error)
+    summary = telemetry.summary(retries=rng.randint(0, 5), journal=int(rng.random() < 0.02))
+    summary.update(uptime_s=rng.randint(3600, 36000), cpu_s=round(rng.uniform(2, 60), 1),
+                   rss_mb=round(rng.uniform(30, 90), 1))
+    return summary
+
+
+def run_benchmark(agents=5000, seed=0):
+    """Agent-side cost per recorded request, summary size, and time to merge a fleet"""
+    telemetry = AgentTelemetry()
+    calls = 200000
+    started = time.perf_counter()
+    for index in range(calls):
+        telemetry.record_request(0.05, 200)
+    record_ns = (time.perf_counter() - started) / calls * 1e9
+
+    rng = random.Random(seed)
+    summaries = [_synthetic_summary(rng) for _ in range(min(agents, 200))]
+    lines = [json.dumps({'agent': index, 'received': index, 'telemetry': summaries[index % len(summaries)]})
+             for index in range(agents)]
+    sizes = sorted(len(json.dumps(summary, separators=(',', ':'))) for summary in summaries)
+
+    started = time.perf_counter()
+    fleet = aggregate((entry['agent'], entry['received'], entry['telemetry'])
+                      for entry in map(json.loads, lines))
+    merge_s = time.perf_counter() - started
+    return {
+        'record_request_ns': round(record_ns),
+        'summary_bytes': {'p50': sizes[len(sizes) // 2], 'max': sizes[-1]},
+        'agents': agents,
+        'aggregate_s': round(merge_s, 3),
+        'fleet': fleet,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent fleet telemetry")
+    parser.add_argument('--bench', action='store_true', help="Agent cost, summary size and fleet merge time")
+    parser.add_argument('--agents', type=int, default=5000)
+    subparsers = parser.add_subparsers(dest='command')
+    aggregate_parser = subparsers.add_parser('aggregate', help="Fleet percentiles from summaries")
+    aggregate_parser.add_argument('files', nargs='*', help="JSONL files of heartbeat payloads or exports")
+    aggregate_parser.add_argument('--db', help="Reference server database (table agentTelemetry)")
+    decode_parser = subparsers.add_parser('decode', help="Show one summary with percentiles")
+    decode_parser.add_argument('summary', help="Summary JSON, or - to read it from stdin")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.agents), indent=2))
+    elif args.command == 'aggregate':
+        if not args.files and not args.db:
+            aggregate_parser.error("give JSONL files or --db")
+        entries = list(read_jsonl(args.files))
+        if args.db:
+            entries.extend(read_db(args.db))
+        print(json.dumps(aggregate(entries), indent=2))
+    elif args.command == 'decode':
+        text = sys.stdin.read() if args.summary == '-' else args.summary
+        try:
+            print(json.dumps(describe(text), indent=2))
+        except ValueError as e:
+            print(f"Cannot decode: {e}")
+            return 1
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
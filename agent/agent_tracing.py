@@ -0,0 +1,352 @@
+"""
+Lightweight tracing for the Office Agent.
+
+Spans around network checks, probes and API calls are written one per line to
+~/.office_agent_traces.jsonl in the OpenTelemetry OTLP/JSON span layout
+(traceId, spanId, parentSpanId, startTimeUnixNano, attributes, ...), so they can
+be loaded into any OTLP-aware tool. Outgoing requests carry a W3C `traceparent`
+header, and the backend logs it with each request line.
+
+Tracing is off by default; enable it with the `tracing` tunable:
+    {"tracing": true}      in ~/.office_agent_tunables.json
+
+Print per-cycle latency waterfalls:
+    python agent_tracing.py --last 5
+    python agent_tracing.py --server-log ../backend/logs/combined.log
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+from collections import OrderedDict
+
+TRACES_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_traces.jsonl')
+MAX_TRACE_BYTES = 5 * 1024 * 1024   # rotate to .1 beyond this size
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _plain_value(value):
+    for key in ('stringValue', 'boolValue', 'doubleValue'):
+        if key in value:
+            return value[key]
+    if 'intValue' in value:
+        return int(value['intValue'])
+    return None
+
+
+class Span:
+    """One timed operation; use through Tracer.span()"""
+
+    __slots__ = ('tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_id',
+                 'start_ns', 'attributes', 'status', 'message')
+
+    def __init__(self, tracer, name, kind, trace_id, parent_id, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.message = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.status = STATUS_ERROR
+            self.message = f"{exc_type.__name__}: {exc}"
+        self.tracer._pop(self)
+        return False
+
+    def to_otlp(self, end_ns):
+        record = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)}
+                           for key, value in self.attributes.items()],
+            'status': {'code': self.status},
+        }
+        if self.parent_id:
+            record['parentSpanId'] = self.parent_id
+        if self.message:
+            record['status']['message'] = self.message
+        return record
+
+
+class _NoSpan:
+    """Stand-in returned while tracing is disabled"""
+
+    traceparent = None
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """Creates spans, tracks the active span per thread and exports finished spans"""
+
+    def __init__(self, path=TRACES_FILE, enabled=None, max_bytes=MAX_TRACE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._enabled = enabled or (lambda: False)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def configure(self, enabled=None, path=None):
+        if enabled is not None:
+            self._enabled = enabled
+        if path is not None:
+            self.close()
+            self.path = path
+
+    @property
+    def enabled(self):
+        try:
+            return bool(self._enabled())
+        except Exception:
+            return False
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def span(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        """Context manager timing a block; nested spans share the trace of their parent"""
+        if not self.enabled:
+            return NO_SPAN
+        parent = self.current()
+        trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        return Span(self, name, kind, trace_id, parent.span_id if parent else None, attributes)
+
+    def annotate(self, **attributes):
+        """Add attributes to the active span, if any"""
+        span = self.current()
+        if span is not None:
+            span.set(**attributes)
+
+    def headers(self):
+        """W3C trace context headers for an outgoing request (None when not tracing)"""
+        span = self.current()
+        return {'traceparent': span.traceparent} if span is not None else None
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        self._export(span.to_otlp(time.time_ns()), flush=not stack)
+
+    def _export(self, record, flush):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._rotate_if_needed()
+                    self._file = open(self.path, 'a')
+                self._file.write(line)
+                if flush:
+                    self._file.flush()
+                    if self._file.tell() > self.max_bytes:
+                        self._file.close()
+                        self._file = None
+            except OSError:
+                self._file = None  # Tracing must never break the agent
+
+    def _rotate_if_needed(self):
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Process-wide tracer; desktop_agent_fixed enables it from the `tracing` tunable
+TRACER = Tracer()
+
+
+def traced(name, kind=SPAN_KIND_INTERNAL):
+    """Decorator running the function inside a span"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+            with TRACER.span(name, kind):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ===== Viewer =====
+
+TRACEPARENT_RE = re.compile(r' 00-(?P<trace>[0-9a-f]{32})-(?P<span>[0-9a-f]{16})-[0-9a-f]{2}')
+RESPONSE_TIME_RE = re.compile(r' (?P<ms>\d+(?:\.\d+)?)$')
+
+
+def read_traces(path, last=10, trace_id=None):
+    """Group exported spans by trace, keeping only the newest `last` traces"""
+    traces = OrderedDict()
+    for filename in (path + '.1', path):
+        if not os.path.exists(filename):
+            continue
+        with open(filename) as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                if trace_id and span.get('traceId') != trace_id:
+                    continue
+                spans = traces.get(span['traceId'])
+                if spans is None:
+                    spans = traces[span['traceId']] = []
+                    while len(traces) > last:
+                        traces.popitem(last=False)
+                spans.append(span)
+    return traces
+
+
+def read_server_times(path):
+    """Map the client span id in each request's traceparent to the server's response time (ms)"""
+    times = {}
+    with open(path, errors='replace') as f:
+        for line in f:
+            match = TRACEPARENT_RE.search(line)
+            if not match:
+                continue
+            # The response time is the field just before the traceparent
+            timing = RESPONSE_TIME_RE.search(line[:match.start()])
+            if timing:
+                times[match.group('span')] = float(timing.group('ms'))
+    return times
+
+
+def render_waterfall(spans, server_times=None, width=40):
+    """Text waterfall of one trace, children indented under their parents"""
+    server_times = server_times or {}
+    by_id = {span['spanId']: span for span in spans}
+    children = {}
+    roots = []
+    for span in spans:
+        parent = span.get('parentSpanId')
+        if parent and parent in by_id:
+            children.setdefault(parent, []).append(span)
+        else:
+            roots.append(span)
+
+    start = min(int(span['startTimeUnixNano']) for span in spans)
+    end = max(int(span['endTimeUnixNano']) for span in spans)
+    total = max(end - start, 1)
+
+    lines = [f"trace {spans[0]['traceId']}  "
+             f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start / 1e9))}  "
+             f"{total / 1e6:.1f} ms"]
+
+    def bar(span_start, span_end):
+        left = int((span_start - start) / total * width)
+        length = max(1, int(round((span_end - span_start) / total * width)))
+        return ' ' * left + '#' * min(length, width - left)
+
+    def walk(span, depth):
+        span_start = int(span['startTimeUnixNano'])
+        span_end = int(span['endTimeUnixNano'])
+        attributes = {a['key']: _plain_value(a['value']) for a in span.get('attributes', [])}
+        notes = ' '.join(f"{key}={value}" for key, value in attributes.items())
+        if span.get('status', {}).get('code') == STATUS_ERROR:
+            notes = f"ERROR {span['status'].get('message', '')} {notes}"
+        duration_ms = (span_end - span_start) / 1e6
+        lines.append(f"  {'  ' * depth + span['name']:<36} |{bar(span_start, span_end):<{width}}| "
+                     f"{duration_ms:8.1f} ms  {notes}".rstrip())
+        server_ms = server_times.get(span['spanId'])
+        if server_ms is not None:
+            lines.append(f"  {'  ' * (depth + 1) + 'server':<36} |{'':<{width}}| {server_ms:8.1f} ms  "
+                         f"wire+queue={max(duration_ms - server_ms, 0):.1f} ms")
+        for child in sorted(children.get(span['spanId'], []), key=lambda s: int(s['startTimeUnixNano'])):
+            walk(child, depth + 1)
+
+    for root in sorted(roots, key=lambda s: int(s['startTimeUnixNano'])):
+        walk(root, 0)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show Office Agent trace waterfalls")
+    parser.add_argument('--file', default=TRACES_FILE, help="Span file (JSONL)")
+    parser.add_argument('--last', type=int, default=10, help="Number of most recent traces")
+    parser.add_argument('--trace', help="Show only this trace id")
+    parser.add_argument('--server-log', help="Backend log with traceparent request lines, "
+                                             "to split wire time from server time")
+    args = parser.parse_args(argv)
+
+    traces = read_traces(args.file, args.last, args.trace)
+    if not traces:
+        print(f"No traces in {args.file} (is the 'tracing' tunable enabled?)")
+        return 1
+    server_times = read_server_times(args.server_log) if args.server_log else {}
+    for spans in traces.values():
+        print(render_waterfall(spans, server_times))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
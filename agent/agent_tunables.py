@@ -0,0 +1,359 @@
+"""
+Runtime tunables for the Office Agent.
+
+Values such as the API URL, network check interval and heartbeat cadence
+come from three layers, lowest priority first:
+
+    built-in defaults  <  values pushed by the server  <  local tunables file
+
+The local file (~/.office_agent_tunables.json, next to the credentials file)
+is watched with inotify on Linux and directory change notifications on
+Windows, falling back to mtime polling, and changes are applied to the
+running agent without a restart. Every value is validated; invalid entries
+are logged and ignored. FILE_ONLY_TUNABLES (the API endpoints and the
+https-only update_url) are never taken from the server.
+
+Example file:
+    {"check_interval": 60, "heartbeat_cycles": 2}
+"""
+
+import os
+import sys
+import json
+import struct
+import select
+import threading
+
+TUNABLES_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_tunables.json')
+
+POLL_INTERVAL = 5  # seconds between mtime checks when no native watcher is available
+
+
+def _url(value):
+    value = str(value).rstrip('/')
+    if not value.startswith(('http://', 'https://')):
+        raise ValueError("must start with http:// or https://")
+    return value
+
+
+def _url_list(value):
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError("must be a list of URLs")
+    return tuple(_url(item.strip()) for item in value)
+
+
+def _optional_https_url(value):
+    if not str(value).strip():
+        return ''
+    value = _url(value)
+    if not value.startswith('https://'):
+        raise ValueError("must start with https://")
+    return value
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError("must be true or false")
+
+
+# name -> (converter, default, minimum, maximum)
+TUNABLE_SPECS = {
+    'api_base_url': (_url, 'http://localhost:9600/api/desktop', None, None),
+    'api_endpoints': (_url_list, (), None, None),    # equivalent base URLs, preferred first
+    'endpoint_probe_interval': (float, 300.0, 10.0, 86400.0),  # seconds between endpoint probes
+    'check_interval': (float, 30.0, 1.0, 3600.0),    # seconds between network checks
+    'heartbeat_cycles': (int, 4, 1, 1000),           # network checks per heartbeat
+    'request_timeout': (float, 10.0, 0.5, 300.0),    # seconds per API request
+    'login_timeout': (float, 8.0, 0.5, 120.0),       # seconds per login request
+    'tracing': (_bool, False, None, None),            # write spans (see agent_tracing.py)
+    'shutdown_deadline': (float, 0.5, 0.1, 10.0),    # seconds for the final disconnect/logout
+    'battery_interval_factor': (float, 2.0, 1.0, 20.0),      # check interval stretch on battery
+    'low_battery_interval_factor': (float, 4.0, 1.0, 60.0),  # ... at low battery or in power saver
+    'low_battery_percent': (int, 20, 0, 100),
+    'battery_heartbeat_cap': (float, 240.0, 30.0, 3600.0),   # stay under the server's 5-minute cleanup
+    'idle_threshold': (float, 900.0, 0.0, 86400.0),  # seconds without input counted as away; 0: lock only
+    'update_url': (_optional_https_url, '', None, None),  # delta update directory; empty disables updates
+    'update_check_interval': (float, 21600.0, 300.0, 604800.0),  # seconds between update checks
+    'outbound_rate': (float, 5.0, 0.1, 1000.0),      # requests per second from the outbound queue
+    'link_debounce': (int, 2, 1, 20),                # network checks a link change must last
+    'telemetry_heartbeats': (int, 15, 0, 10000),     # heartbeats per telemetry summary; 0: never
+}
+
+# Only the local tunables file may set these: a server response must not redirect where code
+# comes from, or where the password and bearer token are sent
+FILE_ONLY_TUNABLES = frozenset({'update_url', 'api_base_url', 'api_endpoints'})
+
+
+def log(message):
+    """Log through the agent's logger when it is available"""
+    try:
+        from desktop_agent_fixed import log_to_file
+        log_to_file(message)
+    except Exception:
+        pass
+
+
+class Tunables:
+    """Validated, layered, thread-safe runtime settings"""
+
+    def __init__(self, specs=None, defaults=None):
+        self._specs = dict(specs or TUNABLE_SPECS)
+        self._lock = threading.Lock()
+        self._defaults = {name: spec[1] for name, spec in self._specs.items()}
+        self._defaults.update(defaults or {})
+        self._server = {}
+        self._file = {}
+        self._values = dict(self._defaults)
+        self._listeners = []
+
+    def __getattr__(self, name):
+        values = self.__dict__.get('_values')
+        if values is not None and name in values:
+            return values[name]
+        raise AttributeError(name)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def subscribe(self, callback):
+        """Call callback(changed_dict) after every effective change"""
+        self._listeners.append(callback)
+
+    def validate(self, mapping, source):
+        """Return the valid subset of mapping, logging anything rejected"""
+        valid = {}
+        if not isinstance(mapping, dict):
+            log(f"Tunables from {source} ignored: expected a JSON object")
+            return valid
+        for name, raw in mapping.items():
+            spec = self._specs.get(name)
+            if spec is None:
+                log(f"Unknown tunable '{name}' from {source} ignored")
+                continue
+            if source == 'server' and name in FILE_ONLY_TUNABLES:
+                log(f"Tunable '{name}' can only be set in the tunables file; server value ignored")
+                continue
+            converter, _, minimum, maximum = spec
+            try:
+                value = converter(raw)
+                if minimum is not None and value < minimum:
+                    raise ValueError(f"below minimum {minimum}")
+                if maximum is not None and value > maximum:
+                    raise ValueError(f"above maximum {maximum}")
+            except (TypeError, ValueError) as e:
+                log(f"Invalid tunable {name}={raw!r} from {source}: {str(e)}")
+                continue
+            valid[name] = value
+        return valid
+
+    def apply_server(self, mapping):
+        """Apply values pushed by the server (overridden by the local file)"""
+        with self._lock:
+            self._server = self.validate(mapping, 'server')
+        return self._recompute()
+
+    def apply_file(self, mapping):
+        """Apply values from the local tunables file"""
+        with self._lock:
+            self._file = self.validate(mapping, 'file')
+        return self._recompute()
+
+    def load_file(self, path=TUNABLES_FILE):
+        """(Re)load the local tunables file; a missing file clears the file layer"""
+        if not os.path.exists(path):
+            return self.apply_file({})
+        try:
+            with open(path) as f:
+                mapping = json.load(f)
+        except (OSError, ValueError) as e:
+            # Keep the current values while the file is half-written or malformed
+            log(f"Could not read tunables file {path}: {str(e)}")
+            return {}
+        return self.apply_file(mapping)
+
+    def _recompute(self):
+        with self._lock:
+            values = dict(self._defaults)
+            values.update(self._server)
+            values.update(self._file)
+            changed = {name: value for name, value in values.items()
+                       if self._values.get(name) != value}
+            self._values = values
+        if changed:
+            log(f"Tunables changed: {changed}")
+            for callback in list(self._listeners):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    log(f"Tunables listener failed: {str(e)}")
+        return changed
+
+
+class TunablesWatcher:
+    """Reload a tunables file whenever it changes on disk"""
+
+    def __init__(self, tunables, path=TUNABLES_FILE, poll_interval=POLL_INTERVAL):
+        self.tunables = tunables
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.filename = os.path.basename(path)
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._stop_event = threading.Event()
+        self._wake = None           # stop() wakes a blocked watcher through this (pipe fd / win32 event)
+        self._thread = None
+
+    def start(self):
+        self.tunables.load_file(self.path)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='TunablesWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        wake = self._wake
+        if wake is None:
+            return
+        try:
+            if sys.platform == 'win32':
+                import win32event
+                win32event.SetEvent(wake)
+            else:
+                os.write(wake, b'x')
+        except Exception:
+            pass  # The watcher already exited and closed it
+
+    def _run(self):
+        watchers = []
+        if sys.platform.startswith('linux'):
+            watchers.append(self._watch_inotify)
+        elif sys.platform == 'win32':
+            watchers.append(self._watch_windows)
+        watchers.append(self._watch_polling)
+
+        for watcher in watchers:
+            try:
+                watcher()
+                return
+            except Exception as e:
+                log(f"Tunables watcher {watcher.__name__} unavailable: {str(e)}")
+
+    def _reload(self):
+        # Editors often write in several steps; give them a moment to finish
+        self._stop_event.wait(0.2)
+        self.tunables.load_file(self.path)
+
+    def _watch_inotify(self):
+        """Linux: block on inotify events for the file (in-place writes) and for its name in
+        the directory (created, replaced by an editor's atomic save, removed). Other files in
+        the directory, such as the agent's own log, do not wake the thread."""
+        import ctypes
+        import ctypes.util
+
+        IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO = 0x002, 0x008, 0x080
+        IN_CREATE, IN_DELETE, IN_MOVED_FROM = 0x100, 0x200, 0x040
+        IN_CLOEXEC = 0o2000000
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            # Name events only: writes to other files in the directory are not reported
+            directory_watch = libc.inotify_add_watch(fd, self.directory.encode(),
+                                                     IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM)
+            if directory_watch < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            path = os.path.abspath(self.path).encode()
+            file_mask = IN_MODIFY | IN_CLOSE_WRITE
+            file_watch = libc.inotify_add_watch(fd, path, file_mask)  # -1 until the file exists
+            self.mode = 'inotify'
+            header = struct.Struct('iIII')
+            target = self.filename.encode()
+            wake_read, self._wake = os.pipe()
+
+            # No timeout: the thread sleeps until the file changes or stop() writes to the pipe
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([fd, wake_read], [], [])
+                if wake_read in readable:
+                    break
+                data = os.read(fd, 4096)
+                offset = 0
+                relevant = replaced = False
+                while offset + header.size <= len(data):
+                    watch, _, _, length = header.unpack_from(data, offset)
+                    name = data[offset + header.size:offset + header.size + length].rstrip(b'\0')
+                    offset += header.size + length
+                    if watch == directory_watch and name == target:
+                        relevant = replaced = True
+                    elif watch == file_watch:
+                        relevant = True
+                if replaced:
+                    # A new file (or inode) under our name: move the file watch to it
+                    file_watch = libc.inotify_add_watch(fd, path, file_mask)
+                if relevant:
+                    self._reload()
+        finally:
+            os.close(fd)
+            if self._wake is not None:
+                wake, self._wake = self._wake, None
+                os.close(wake_read)
+                os.close(wake)
+
+    def _watch_windows(self):
+        """Windows: wait on a directory change notification handle"""
+        import win32file
+        import win32event
+        import win32con
+
+        handle = win32file.FindFirstChangeNotification(
+            self.directory, False,
+            win32con.FILE_NOTIFY_CHANGE_LAST_WRITE | win32con.FILE_NOTIFY_CHANGE_FILE_NAME)
+        self.mode = 'win32'
+        self._wake = win32event.CreateEvent(None, True, False, None)
+        try:
+            last = self._stat()
+            # No timeout: the thread sleeps until the directory changes or stop() sets the event
+            while not self._stop_event.is_set():
+                result = win32event.WaitForMultipleObjects([handle, self._wake], False,
+                                                           win32event.INFINITE)
+                if result == win32con.WAIT_OBJECT_0:
+                    # The notification covers the whole directory; only reload for our file
+                    current = self._stat()
+                    if current != last:
+                        last = current
+                        self._reload()
+                    win32file.FindNextChangeNotification(handle)
+                else:
+                    break  # The stop event
+        finally:
+            win32file.FindCloseChangeNotification(handle)
+            wake, self._wake = self._wake, None
+            wake.Close()
+
+    def _watch_polling(self):
+        """Fallback: compare mtime/size every poll_interval seconds"""
+        self.mode = 'polling'
+        last = self._stat()
+        while not self._stop_event.wait(self.poll_interval):
+            current = self._stat()
+            if current != last:
+                last = current
+                self.tunables.load_file(self.path)
+
+    def _stat(self):
+        try:
+            info = os.stat(self.path)
+            return info.st_mtime_ns, info.st_size
+        except OSError:
+            return None
@@ -0,0 +1,716 @@
+"""
+Delta self-update for the Office Agent bundle.
+
+A release is published (build machine) as a manifest plus content-addressed files:
+
+    <updates>/latest.json                  {"version": "1.0.3"}
+    <updates>/manifests/<version>.json     size, sha256 and chunk list of every bundled file
+    <updates>/files/<sha256>               file contents, fetched with HTTP Range requests
+
+latest.json and every manifest carry an Ed25519 signature (<name>.sig, hex).
+The agent only accepts them when the signature verifies against the public key
+pinned into its build (update_key.py, written by build_installer_final.py
+--signing-key); a build without a pinned key never updates. Versions and file
+names from a manifest are checked before they become paths.
+
+Files are split into content-defined chunks (gear rolling hash; 16-256 KB,
+about 80 KB on average), so an edit or an insertion only changes the chunks
+around it, not everything after it. The agent rebuilds each changed file from
+chunks it already has in its installed version plus the byte ranges it is
+missing, verifies every file against the manifest and stages the new tree
+under ~/.office_agent_updates/versions/<version>.
+
+Nothing changes in the running installation. On the next start the installed
+executable (the launcher, see launch_current_version) re-verifies the staged
+tree, atomically repoints current.json to it and runs it. A version that does
+not report a healthy start (mark_healthy) within MAX_PENDING_STARTS launches
+is rolled back.
+
+    python agent_updater.py keygen update_signing_key.pem   # prints the public key to pin
+    python agent_updater.py publish dist/OfficeAgent --version 1.0.3 --out updates/ --key update_signing_key.pem
+    python agent_updater.py serve updates/ --port 9800    # plain-HTTP stand-in (update_url needs https)
+    python agent_updater.py --bench                       # bytes transferred per update
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import unquote, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agent_tunables import log
+
+try:
+    from update_key import PUBLIC_KEY as UPDATE_PUBLIC_KEY  # Pinned by the build
+except ImportError:
+    UPDATE_PUBLIC_KEY = ''  # Running from source: no key, no updates
+
+UPDATES_DIR = os.path.join(os.path.expanduser('~'), '.office_agent_updates')
+BUNDLE_MANIFEST = 'update_manifest.json'   # a bundle's own manifest, written by publish()
+MAX_PENDING_STARTS = 3
+REQUEST_TIMEOUT = 30
+VERSION_PATTERN = re.compile(r'[0-9A-Za-z._-]+')
+SIGNATURE_SUFFIX = '.sig'
+
+# Content-defined chunking: a cut where the top CHUNK_BITS of the gear hash are zero
+CHUNK_MIN = 16 * 1024
+CHUNK_MAX = 256 * 1024
+CHUNK_BITS = 16
+CHUNK_MASK = ((1 << CHUNK_BITS) - 1) << (64 - CHUNK_BITS)
+_gear_random = random.Random(0x0ff1ce)
+GEAR = tuple(_gear_random.getrandbits(64) for _ in range(256))
+
+
+class UpdateError(Exception):
+    pass
+
+
+def _cut_point(data, start, end):
+    """End of the chunk starting at start"""
+    if end - start <= CHUNK_MIN:
+        return end
+    limit = min(end, start + CHUNK_MAX)
+    gear, mask, h = GEAR, CHUNK_MASK, 0
+    for i in range(start + CHUNK_MIN, limit):
+        h = ((h << 1) + gear[data[i]]) & 0xFFFFFFFFFFFFFFFF
+        if not h & mask:
+            return i + 1
+    return limit
+
+
+def chunk_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def split_chunks(data):
+    """[[length, hash], ...] for the content-defined chunks of data"""
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = _cut_point(data, start, len(data))
+        chunks.append([end - start, chunk_hash(data[start:end])])
+        start = end
+    return chunks
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def check_version(version):
+    """version if it is safe to use as a directory name, else UpdateError"""
+    if not isinstance(version, str) or not VERSION_PATTERN.fullmatch(version) or '..' in version:
+        raise UpdateError(f"Invalid version {version!r}")
+    return version
+
+
+def bundle_path(base, relative):
+    """Path of a manifest file name under base; UpdateError for names that could leave it"""
+    if not isinstance(relative, str) or ':' in relative or relative.startswith(('/', '\\')):
+        raise UpdateError(f"Invalid file name {relative!r} in manifest")
+    parts = relative.replace('\\', '/').split('/')
+    if any(part in ('', '.', '..') for part in parts):
+        raise UpdateError(f"Invalid file name {relative!r} in manifest")
+    base = os.path.abspath(base)
+    path = os.path.normpath(os.path.join(base, *parts))
+    if not path.startswith(base + os.sep):
+        raise UpdateError(f"Invalid file name {relative!r} in manifest")
+    return path
+
+
+# ===== Signatures =====
+
+def generate_signing_key(path):
+    """Write a new Ed25519 private key (PEM) to path; returns the public key to pin, as hex"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    private_key = Ed25519PrivateKey.generate()
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+    return public_key_hex(private_key)
+
+
+def load_signing_key(path):
+    from cryptography.hazmat.primitives import serialization
+
+    with open(path, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+def public_key_hex(private_key):
+    from cryptography.hazmat.primitives import serialization
+
+    return private_key.public_key().public_bytes(serialization.Encoding.Raw,
+                                                 serialization.PublicFormat.Raw).hex()
+
+
+def verify_signature(public_key, data, signature):
+    """Check a hex Ed25519 signature of data against a hex public key; UpdateError if it fails"""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+    try:
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key)).verify(
+            bytes.fromhex(signature.strip()), data)
+    except (InvalidSignature, ValueError):
+        raise UpdateError("Signature does not match the pinned update key")
+
+
+def _write_signed(path, data, private_key):
+    """_write_json plus a detached signature of the exact bytes written"""
+    _write_json(path, data)
+    with open(path, 'rb') as f:
+        signature = private_key.sign(f.read()).hex()
+    with open(path + SIGNATURE_SUFFIX + '.tmp', 'w') as f:
+        f.write(signature)
+    os.replace(path + SIGNATURE_SUFFIX + '.tmp', path + SIGNATURE_SUFFIX)
+
+
+def _bundle_files(app_dir):
+    """(relative posix path, absolute path) of every file in a bundle, sorted"""
+    for root, dirs, names in os.walk(app_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, app_dir).replace(os.sep, '/')
+            if relative != BUNDLE_MANIFEST:
+                yield relative, path
+
+
+# ===== Publishing (build machine) =====
+
+def build_manifest(app_dir, version):
+    """Size, sha256 and chunk list of every file in a built bundle"""
+    files = {}
+    for relative, path in _bundle_files(app_dir):
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(),
+                 'chunks': split_chunks(data)}
+        if os.name != 'nt' and os.access(path, os.X_OK):
+            entry['executable'] = True
+        files[relative] = entry
+    return {'version': version, 'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'files': files}
+
+
+def publish(app_dir, version, out_dir, key_file):
+    """Add a built bundle to an update directory and make it the latest version, signing
+    the manifest and latest.json with the private key in key_file.
+    Also writes the manifest into the bundle, so installed builds know their chunk map."""
+    check_version(version)
+    private_key = load_signing_key(key_file)
+    manifest = build_manifest(app_dir, version)
+    files_dir = os.path.join(out_dir, 'files')
+    manifests_dir = os.path.join(out_dir, 'manifests')
+    os.makedirs(files_dir, exist_ok=True)
+    os.makedirs(manifests_dir, exist_ok=True)
+
+    for relative, path in _bundle_files(app_dir):
+        target = os.path.join(files_dir, manifest['files'][relative]['sha256'])
+        if not os.path.exists(target):  # Content-addressed: unchanged files are stored once
+            shutil.copyfile(path, target + '.tmp')
+            os.replace(target + '.tmp', target)
+
+    _write_signed(os.path.join(manifests_dir, f"{version}.json"), manifest, private_key)
+    _write_json(os.path.join(app_dir, BUNDLE_MANIFEST), manifest)
+    _write_signed(os.path.join(out_dir, 'latest.json'), {'version': version}, private_key)
+    return manifest
+
+
+# ===== Downloading and staging (agent) =====
+
+class Updater:
+    """Checks for a newer published version and stages it for the next start"""
+
+    def __init__(self, tunables=None, install_dir=None, root=UPDATES_DIR, base_url=None,
+                 session=None, on_staged=None, public_key=None):
+        import requests
+
+        self.tunables = tunables
+        self.install_dir = install_dir or os.path.dirname(os.path.abspath(sys.executable))
+        self.root = root
+        self._base_url = base_url
+        self.session = session or requests.Session()
+        self.on_staged = on_staged
+        self.public_key = public_key if public_key is not None else UPDATE_PUBLIC_KEY
+        self.stats = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        url = self._base_url or (self.tunables.update_url if self.tunables else '')
+        return url.rstrip('/')
+
+    def installed_manifest(self):
+        return _read_json(os.path.join(self.install_dir, BUNDLE_MANIFEST))
+
+    def _get(self, path, headers=None):
+        response = self.session.get(f"{self.base_url}/{path}", headers=headers, timeout=REQUEST_TIMEOUT)
+        self.stats['requests'] += 1
+        self.stats['bytes_downloaded'] += len(response.content)
+        if response.status_code not in (200, 206):
+            raise UpdateError(f"GET {path}: HTTP {response.status_code}")
+        return response
+
+    def _get_signed(self, path):
+        """JSON document at path, after checking its signature against the pinned key"""
+        data = self._get(path).content
+        verify_signature(self.public_key, data, self._get(path + SIGNATURE_SUFFIX).text)
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise UpdateError(f"GET {path}: not JSON")
+
+    def check(self):
+        """Stage the published version if it is new; returns the staged version or None"""
+        installed = self.installed_manifest()
+        if installed is None or not self.base_url or not self.public_key:
+            return None  # Running from source, updates are switched off, or no key is pinned
+        self.stats = {'requests': 0, 'bytes_downloaded': 0}
+        latest = self._get_signed('latest.json').get('version')
+        staged = _read_json(os.path.join(self.root, 'staged.json')) or {}
+        if not latest or latest == installed['version'] or latest == staged.get('version'):
+            return None
+        self.stage(check_version(latest), installed)
+        return latest
+
+    def _local_chunks(self, installed):
+        """Chunks of installed files that still match their manifest: hash -> (path, offset, length)"""
+        chunks = {}
+        files = {}
+        for relative, entry in installed['files'].items():
+            path = os.path.join(self.install_dir, *relative.split('/'))
+            try:
+                if os.path.getsize(path) != entry['size'] or file_sha256(path) != entry['sha256']:
+                    continue  # Modified locally; do not trust its chunks
+            except OSError:
+                continue
+            files[entry['sha256']] = path
+            offset = 0
+            for length, digest in entry['chunks']:
+                chunks.setdefault(digest, (path, offset, length))
+                offset += length
+        return chunks, files
+
+    def stage(self, version, installed=None):
+        """Download and verify a version into versions/<version> and mark it staged"""
+        started = time.perf_counter()
+        check_version(version)
+        installed = installed or self.installed_manifest()
+        if self.stats is None:
+            self.stats = {'requests': 0, 'bytes_downloaded': 0}
+        self.stats.update({'version': version, 'bytes_reused': 0, 'files_copied': 0,
+                           'files_rebuilt': 0, 'files_refetched': 0})
+        manifest = self._get_signed(f"manifests/{version}.json")
+        if manifest.get('version') != version:
+            raise UpdateError(f"Manifest for {version} is signed for {manifest.get('version')!r}")
+        chunks, files = self._local_chunks(installed) if installed else ({}, {})
+
+        versions_dir = os.path.join(self.root, 'versions')
+        target = os.path.join(versions_dir, version)
+        partial = target + '.partial'
+        shutil.rmtree(partial, ignore_errors=True)
+        for relative, entry in manifest['files'].items():
+            destination = bundle_path(partial, relative)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if entry['sha256'] in files:
+                shutil.copyfile(files[entry['sha256']], destination)
+                self.stats['files_copied'] += 1
+                self.stats['bytes_reused'] += entry['size']
+            else:
+                self._rebuild(entry, destination, chunks)
+                self.stats['files_rebuilt'] += 1
+                if file_sha256(destination) != entry['sha256']:
+                    # A chunk hash collision or a bad range: take the whole file
+                    self.stats['files_refetched'] += 1
+                    with open(destination, 'wb') as f:
+                        f.write(self._get(f"files/{entry['sha256']}").content)
+                    if file_sha256(destination) != entry['sha256']:
+                        shutil.rmtree(partial, ignore_errors=True)
+                        raise UpdateError(f"{relative} does not match the manifest")
+            if entry.get('executable'):
+                os.chmod(destination, 0o755)
+
+        _write_json(os.path.join(partial, BUNDLE_MANIFEST), manifest)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(partial, target)
+        _write_json(os.path.join(self.root, 'staged.json'), {'version': version})
+        self.stats['bundle_bytes'] = sum(entry['size'] for entry in manifest['files'].values())
+        self.stats['seconds'] = round(time.perf_counter() - started, 3)
+        log(f"Update {version} staged: {self.stats}")
+        return self.stats
+
+    def _rebuild(self, entry, destination, chunks):
+        """Write a file from local chunks plus one Range request per run of missing chunks"""
+        runs = []   # (offset, length, local source or None)
+        offset = 0
+        for length, digest in entry['chunks']:
+            source = chunks.get(digest)
+            if source is None and runs and runs[-1][2] is None:
+                runs[-1] = (runs[-1][0], runs[-1][1] + length, None)
+            else:
+                runs.append((offset, length, source))
+            offset += length
+
+        with open(destination, 'wb') as out:
+            for offset, length, source in runs:
+                if source is None:
+                    response = self._get(f"files/{entry['sha256']}",
+                                         {'Range': f"bytes={offset}-{offset + length - 1}"})
+                    data = response.content
+                    if response.status_code == 200:
+                        data = data[offset:offset + length]  # Server ignored the Range header
+                    out.write(data)
+                else:
+                    path, source_offset, _ = source
+                    with open(path, 'rb') as f:
+                        f.seek(source_offset)
+                        out.write(f.read(length))
+                    self.stats['bytes_reused'] += length
+
+    def start(self):
+        """Check every update_check_interval seconds in the background"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='AgentUpdater', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                version = self.check()
+                if version and self.on_staged:
+                    self.on_staged(version)
+            except Exception as e:
+                log(f"Update check failed: {str(e)}")
+            time.sleep(self.tunables.update_check_interval)
+
+
+# ===== Swap-in on start (launcher) =====
+
+def verify_version(version_dir):
+    """The manifest of a staged tree if every file in it matches, else None"""
+    manifest = _read_json(os.path.join(version_dir, BUNDLE_MANIFEST))
+    if not manifest:
+        return None
+    for relative, entry in manifest['files'].items():
+        try:
+            path = bundle_path(version_dir, relative)
+            if os.path.getsize(path) != entry['size'] or file_sha256(path) != entry['sha256']:
+                return None
+        except (OSError, UpdateError):
+            return None
+    return manifest
+
+
+def apply_staged(root=UPDATES_DIR):
+    """Point current.json at the staged version after re-verifying it; returns that version"""
+    staged_file = os.path.join(root, 'staged.json')
+    staged = _read_json(staged_file)
+    if not staged:
+        return None
+    os.remove(staged_file)  # One attempt per staging
+    version = staged.get('version')
+    try:
+        check_version(version)
+    except UpdateError:
+        log(f"Staged update {version!r} has an invalid version; not applied")
+        return None
+    if not verify_version(os.path.join(root, 'versions', version)):
+        log(f"Staged update {version} failed verification; not applied")
+        return None
+    current = _read_json(os.path.join(root, 'current.json')) or {}
+    _write_json(os.path.join(root, 'current.json'),
+                {'version': version, 'previous': current.get('version'), 'pending_starts': 0})
+    log(f"Update {version} applied")
+    return version
+
+
+def choose_executable(installed_exe, root=UPDATES_DIR):
+    """Executable to start: the current update, or installed_exe. Counts starts until
+    mark_healthy(); after MAX_PENDING_STARTS unconfirmed starts the previous version is used."""
+    apply_staged(root)
+    current_file = os.path.join(root, 'current.json')
+    current = _read_json(current_file)
+    if not current or not current.get('version'):
+        return installed_exe
+    if current.get('pending_starts', 0) >= MAX_PENDING_STARTS:
+        log(f"Update {current['version']} never started cleanly; rolling back to "
+            f"{current.get('previous') or 'the installed version'}")
+        current = {'version': current.get('previous'), 'previous': None, 'pending_starts': 0}
+        _write_json(current_file, current)
+        if not current['version']:
+            return installed_exe
+
+    exe = os.path.join(root, 'versions', current['version'], os.path.basename(installed_exe))
+    if not os.path.exists(exe):
+        return installed_exe
+    current['pending_starts'] = current.get('pending_starts', 0) + 1
+    _write_json(current_file, current)
+    return exe
+
+
+def mark_healthy(root=UPDATES_DIR):
+    """Confirm the running update started cleanly (call after the first successful login)"""
+    current_file = os.path.join(root, 'current.json')
+    current = _read_json(current_file)
+    if current and current.get('pending_starts'):
+        current['pending_starts'] = 0
+        _write_json(current_file, current)
+
+
+def launch_current_version(root=UPDATES_DIR):
+    """In the installed build: run the current update instead, if there is one (frozen builds only)"""
+    if not getattr(sys, 'frozen', False):
+        return
+    own_exe = os.path.abspath(sys.executable)
+    versions_dir = os.path.abspath(os.path.join(root, 'versions'))
+    if own_exe.startswith(versions_dir + os.sep):
+        return  # Already running an update
+    exe = choose_executable(own_exe, root)
+    if exe != own_exe:
+        subprocess.Popen([exe] + sys.argv[1:], cwd=os.path.dirname(exe), close_fds=True)
+        sys.exit(0)
+
+
+# ===== Local update server stand-in =====
+
+class UpdateServer:
+    """Static file server for an update directory, with single-range Range support"""
+
+    def __init__(self, directory, host='127.0.0.1', port=0):
+        server = self
+        self.directory = os.path.abspath(directory)
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        class Handler(UpdateHandler):
+            pass
+
+        Handler.server_state = server
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, name='UpdateServer', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, sent):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+
+
+class UpdateHandler(BaseHTTPRequestHandler):
+    server_state = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        state = self.server_state
+        relative = os.path.normpath(unquote(urlparse(self.path).path)).lstrip('/\\')
+        path = os.path.join(state.directory, relative)
+        if not path.startswith(state.directory + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+
+        self.send_response(206 if match else 200)
+        if match:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        state.count(len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ===== Benchmark =====
+
+def _write_bundle(app_dir, files):
+    shutil.rmtree(app_dir, ignore_errors=True)
+    for relative, data in files.items():
+        path = os.path.join(app_dir, *relative.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def synthetic_builds(seed=7):
+    """A PyInstaller-like bundle (~19 MB) and two successors: a small code fix, which edits
+    and shifts bytes in the executable's embedded archive, and a Qt library upgrade"""
+    rng = random.Random(seed)
+    base = {
+        'OfficeAgent.exe': rng.randbytes(3 * 1024 * 1024),
+        '_internal/base_library.zip': rng.randbytes(1024 * 1024),
+        '_internal/python311.dll': rng.randbytes(4 * 1024 * 1024),
+        '_internal/PyQt5/Qt5/bin/Qt5Core.dll': rng.randbytes(5 * 1024 * 1024),
+        '_internal/PyQt5/Qt5/bin/Qt5Widgets.dll': rng.randbytes(4 * 1024 * 1024),
+        '_internal/PyQt5/Qt5/bin/Qt5Gui.dll': rng.randbytes(2 * 1024 * 1024),
+        '_internal/icon.ico': rng.randbytes(20 * 1024),
+    }
+    # Code fix: a recompiled module inside the archive, slightly longer than before
+    exe = base['OfficeAgent.exe']
+    middle = len(exe) * 2 // 3
+    code_fix = dict(base)
+    code_fix['OfficeAgent.exe'] = exe[:middle] + rng.randbytes(1400) + exe[middle + 1200:]
+    library_upgrade = dict(code_fix)
+    library_upgrade['_internal/PyQt5/Qt5/bin/Qt5Core.dll'] = rng.randbytes(5 * 1024 * 1024)
+    return [('1.0.0', base), ('1.0.1', code_fix), ('1.0.2', library_upgrade)]
+
+
+def run_benchmark():
+    """Publish three builds, then update an installed 1.0.0 step by step through a local server"""
+    work = tempfile.mkdtemp(prefix='agent-updater-bench-')
+    updates = os.path.join(work, 'updates')
+    builds = synthetic_builds()
+    results = {'updates': []}
+    try:
+        key_file = os.path.join(work, 'signing_key.pem')
+        public_key = generate_signing_key(key_file)
+        started = time.perf_counter()
+        for version, files in builds:
+            _write_bundle(os.path.join(work, 'build', version), files)
+            publish(os.path.join(work, 'build', version), version, updates, key_file)
+        results['publish_seconds'] = round(time.perf_counter() - started, 2)
+
+        # The installer put 1.0.0 in place
+        install_dir = os.path.join(work, 'install')
+        shutil.copytree(os.path.join(work, 'build', '1.0.0'), install_dir)
+        root = os.path.join(work, 'agent_updates')
+        server = UpdateServer(updates).start()
+
+        for (previous, previous_files), (version, files) in zip(builds, builds[1:]):
+            _write_signed(os.path.join(updates, 'latest.json'), {'version': version},
+                          load_signing_key(key_file))
+            updater = Updater(install_dir=install_dir, root=root, base_url=server.url, public_key=public_key)
+            staged = updater.check()
+            stats = updater.stats
+            changed = sum(len(data) for name, data in files.items() if previous_files.get(name) != data)
+
+            # Next start: swap in, and check the tree is exactly the new build
+            switched = apply_staged(root)
+            version_dir = os.path.join(root, 'versions', version)
+            identical = all(open(os.path.join(version_dir, *name.split('/')), 'rb').read() == data
+                            for name, data in files.items())
+            results['updates'].append({
+                'from': previous, 'to': staged, 'switched_to': switched, 'identical': identical,
+                'bundle_bytes': stats['bundle_bytes'], 'changed_file_bytes': changed,
+                'bytes_downloaded': stats['bytes_downloaded'], 'requests': stats['requests'],
+                'bytes_reused': stats['bytes_reused'], 'seconds': stats['seconds'],
+            })
+            install_dir = version_dir  # The update now runs from here
+        server.stop()
+
+        # A version that never starts cleanly is rolled back
+        exe = os.path.join(work, 'install', 'OfficeAgent.exe')
+        launched = [os.path.relpath(choose_executable(exe, root), work) for _ in range(MAX_PENDING_STARTS + 1)]
+        results['launches_without_mark_healthy'] = launched
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent delta updates")
+    parser.add_argument('--bench', action='store_true', help="Measure bytes transferred per update")
+    subparsers = parser.add_subparsers(dest='command')
+    keygen_parser = subparsers.add_parser('keygen', help="Create an update signing key")
+    keygen_parser.add_argument('key_file', help="Where to write the private key (PEM)")
+    publish_parser = subparsers.add_parser('publish', help="Publish a built bundle")
+    publish_parser.add_argument('app_dir')
+    publish_parser.add_argument('--version', required=True)
+    publish_parser.add_argument('--out', required=True, help="Update directory to publish into")
+    publish_parser.add_argument('--key', required=True, help="Private signing key (PEM, see keygen)")
+    serve_parser = subparsers.add_parser('serve', help="Serve an update directory")
+    serve_parser.add_argument('directory')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=9800)
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(), indent=2))
+    elif args.command == 'keygen':
+        print(f"Public key (pass the private key to build_installer_final.py --signing-key): "
+              f"{generate_signing_key(args.key_file)}")
+    elif args.command == 'publish':
+        manifest = publish(args.app_dir, args.version, args.out, args.key)
+        print(f"Published {args.version}: {len(manifest['files'])} files, "
+              f"{sum(len(entry['chunks']) for entry in manifest['files'].values())} chunks")
+    elif args.command == 'serve':
+        server = UpdateServer(args.directory, args.host, args.port).start()
+        print(f"Serving {args.directory} at {server.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
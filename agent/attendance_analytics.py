@@ -0,0 +1,384 @@
+"""
+Presence vs. booking analytics over exported attendance data.
+
+Turns AttendanceRecord connection intervals into real office hours and checks
+them against confirmed Bookings:
+
+    - intervals are split at midnight and clipped to working hours
+    - overlapping intervals (reconnects, two devices) are merged per user and day
+    - each booked day is "attended" or a "no_show"; presence without a booking
+      is "unbooked"
+    - per-user hours percentiles and booking compliance, plus company totals
+
+Everything runs as NumPy/pandas array operations (sorts, grouped running
+maxima, reduceat/bincount and hash joins), with no Python loop over records,
+so a year of company data takes seconds.
+
+Inputs are the attendance_sync.py cache or CSV exports of the attendanceRecords
+and bookings tables (e.g. psql \\copy ... TO 'file.csv' CSV HEADER):
+    python attendance_analytics.py --db attendance.db --bookings bookings.csv -o report.csv
+    python attendance_analytics.py --attendance attendanceRecords.csv --bookings bookings.csv \\
+        --tz-offset +05:30 --work-hours 09:00-18:00 --daily daily.csv
+    python attendance_analytics.py --bench --users 2000
+
+Needs numpy and pandas (pip install -r requirements-tools.txt); the agent does not.
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    sys.exit("attendance_analytics.py needs numpy and pandas: pip install -r requirements-tools.txt")
+
+from workload_profile import parse_tz_offset
+
+DAY = 86400
+WORK_HOURS = '09:00-18:00'
+MIN_PRESENCE_MINUTES = 30     # less than this on a booked day counts as a no-show
+IST_OFFSET = 19800
+
+ATTENDED = 'attended'
+NO_SHOW = 'no_show'
+UNBOOKED = 'unbooked'
+
+
+def _column(frame, *names):
+    for name in names:
+        if name in frame.columns:
+            return frame[name]
+    raise KeyError(f"None of the columns {names} in export (have {list(frame.columns)})")
+
+
+def _epoch_seconds(values):
+    """Timestamps (strings or datetimes, any offset) -> int64 epoch seconds, -1 where missing"""
+    parsed = pd.to_datetime(values, utc=True, errors='coerce', format='ISO8601')
+    seconds = (parsed - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    return seconds.fillna(-1).astype(np.int64).to_numpy()
+
+
+def load_attendance_csv(path):
+    """attendanceRecords export -> DataFrame(user_id, start, end) in epoch seconds (end -1 if open)"""
+    frame = pd.read_csv(path)
+    return pd.DataFrame({
+        'user_id': _column(frame, 'userId', 'user_id').astype(np.int64).to_numpy(),
+        'start': _epoch_seconds(_column(frame, 'connectionStartTime', 'start')),
+        'end': _epoch_seconds(_column(frame, 'connectionEndTime', 'end')),
+    })
+
+
+def load_attendance_db(path):
+    """attendance_sync.py cache -> DataFrame(user_id, start, end)"""
+    conn = sqlite3.connect(path)
+    try:
+        frame = pd.read_sql_query('SELECT user_id, start_ts AS start, COALESCE(end_ts, -1) AS "end" '
+                                  'FROM attendance', conn)
+    finally:
+        conn.close()
+    return frame.astype(np.int64)
+
+
+def load_bookings_csv(path):
+    """bookings export -> DataFrame(user_id, day) of confirmed bookings, day = local days since 1970-01-01"""
+    frame = pd.read_csv(path)
+    if 'status' in frame.columns:
+        frame = frame[frame['status'].fillna('confirmed') == 'confirmed']
+    dates = pd.to_datetime(_column(frame, 'bookingDate', 'booking_date', 'date'), errors='coerce',
+                           format='ISO8601')
+    valid = ~dates.isna()
+    return pd.DataFrame({
+        'user_id': _column(frame, 'userId', 'user_id')[valid].astype(np.int64).to_numpy(),
+        'day': ((dates[valid] - pd.Timestamp(0)) // pd.Timedelta(days=1)).astype(np.int64).to_numpy(),
+    })
+
+
+def parse_work_hours(value):
+    """'09:00-18:00' -> (start, end) seconds into the local day"""
+    start, end = value.split('-')
+    to_seconds = lambda text: int(text.split(':')[0]) * 3600 + int(text.split(':')[1]) * 60
+    start, end = to_seconds(start), to_seconds(end)
+    if not 0 <= start < end <= DAY:
+        raise ValueError(f"Invalid working hours {value}")
+    return start, end
+
+
+def daily_presence(attendance, utc_offset=IST_OFFSET, work_hours=(9 * 3600, 18 * 3600), now=None):
+    """Merged in-office seconds per user and local day, within working hours.
+
+    Returns DataFrame(user_id, day, seconds, first_in, last_out); first_in/last_out
+    are seconds into the local day. Open records end at `now` or the end of the day
+    they started, whichever comes first."""
+    work_start, work_end = work_hours
+    user = attendance['user_id'].to_numpy(np.int64)
+    start = attendance['start'].to_numpy(np.int64)
+    end = attendance['end'].to_numpy(np.int64)
+    known_start = start >= 0
+    start = start + utc_offset
+    now_local = int(now if now is not None else time.time()) + utc_offset
+    open_end = np.minimum(now_local, (start // DAY + 1) * DAY)
+    end = np.where(end < 0, open_end, end + utc_offset)
+
+    valid = known_start & (end > start)
+    user, start, end = user[valid], start[valid], end[valid]
+
+    # Split intervals that cross midnight into one piece per local day
+    first_day = start // DAY
+    pieces = (end - 1) // DAY - first_day + 1
+    source = np.repeat(np.arange(len(start)), pieces)
+    piece_number = np.arange(len(source)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    day = first_day[source] + piece_number
+    day_base = day * DAY
+
+    # Clip to working hours, as seconds into the day
+    piece_start = np.maximum(start[source], day_base + work_start) - day_base
+    piece_end = np.minimum(end[source], day_base + work_end) - day_base
+    keep = piece_end > piece_start
+    user, day = user[source][keep], day[keep]
+    piece_start, piece_end = piece_start[keep], piece_end[keep]
+    if not len(user):
+        return pd.DataFrame({'user_id': [], 'day': [], 'seconds': [], 'first_in': [], 'last_out': []})
+
+    # Sort by (user, day, start) and number the (user, day) groups
+    order = np.lexsort((piece_start, day, user))
+    user, day, piece_start, piece_end = user[order], day[order], piece_start[order], piece_end[order]
+    group_change = np.empty(len(user), dtype=bool)
+    group_change[0] = True
+    group_change[1:] = (user[1:] != user[:-1]) | (day[1:] != day[:-1])
+    group = np.cumsum(group_change) - 1
+
+    # Running max of interval ends within each group: offsetting every group above
+    # the previous one lets a single maximum.accumulate restart at group boundaries
+    stride = DAY + 1
+    running_end = np.maximum.accumulate(group * stride + piece_end) - group * stride
+    previous_end = np.empty_like(running_end)
+    previous_end[0] = -1
+    previous_end[1:] = running_end[:-1]
+    new_segment = group_change | (piece_start > previous_end)
+
+    # Union length = sum over merged segments of (max end - first start)
+    segment_index = np.flatnonzero(new_segment)
+    segment_length = np.maximum.reduceat(piece_end, segment_index) - piece_start[segment_index]
+    groups = group[-1] + 1
+    seconds = np.bincount(group[segment_index], weights=segment_length, minlength=groups)
+
+    group_index = np.flatnonzero(group_change)
+    return pd.DataFrame({
+        'user_id': user[group_index],
+        'day': day[group_index],
+        'seconds': seconds.astype(np.int64),
+        'first_in': piece_start[group_index],
+        'last_out': np.maximum.reduceat(piece_end, group_index),
+    })
+
+
+def presence_vs_bookings(daily, bookings, min_presence=MIN_PRESENCE_MINUTES * 60):
+    """Outer join of daily presence and confirmed bookings with an outcome per user-day"""
+    booked = bookings.drop_duplicates(['user_id', 'day']).assign(booked=True)
+    joined = daily.merge(booked, on=['user_id', 'day'], how='outer')
+    joined['booked'] = joined['booked'].fillna(False).astype(bool)
+    joined['seconds'] = joined['seconds'].fillna(0).astype(np.int64)
+    present = joined['seconds'].to_numpy() >= min_presence
+    is_booked = joined['booked'].to_numpy()
+    joined['present'] = present
+    joined['outcome'] = np.select([is_booked & present, is_booked & ~present, ~is_booked & present],
+                                  [ATTENDED, NO_SHOW, UNBOOKED], default='')
+    joined = joined[joined['outcome'] != '']
+    return joined.sort_values(['user_id', 'day'], kind='stable').reset_index(drop=True)
+
+
+def user_report(joined):
+    """Per-user days, hours percentiles and booking compliance"""
+    outcomes = pd.crosstab(joined['user_id'], joined['outcome'])
+    for outcome in (ATTENDED, NO_SHOW, UNBOOKED):
+        if outcome not in outcomes.columns:
+            outcomes[outcome] = 0
+    report = outcomes[[ATTENDED, NO_SHOW, UNBOOKED]].copy()
+    report['booked_days'] = report[ATTENDED] + report[NO_SHOW]
+    report['present_days'] = report[ATTENDED] + report[UNBOOKED]
+    booked_days = report['booked_days'].to_numpy()
+    report['compliance'] = np.round(np.divide(report[ATTENDED].to_numpy(), booked_days,
+                                              out=np.full(len(report), np.nan), where=booked_days > 0), 4)
+
+    hours = joined.loc[joined['present'], ['user_id', 'seconds']]
+    hours = hours.assign(hours=hours['seconds'] / 3600.0).groupby('user_id')['hours']
+    quantiles = hours.quantile([0.5, 0.9]).unstack()
+    report['hours_mean'] = hours.mean().round(2)
+    report['hours_p50'] = quantiles[0.5].round(2) if 0.5 in quantiles else np.nan
+    report['hours_p90'] = quantiles[0.9].round(2) if 0.9 in quantiles else np.nan
+    report['hours_total'] = hours.sum().round(1)
+    report.columns.name = None
+    return report.reset_index()
+
+
+def company_summary(joined, report):
+    """Company-wide compliance and hours distribution"""
+    counts = joined['outcome'].value_counts()
+    attended, no_shows, unbooked = (int(counts.get(name, 0)) for name in (ATTENDED, NO_SHOW, UNBOOKED))
+    present_hours = joined.loc[joined['present'], 'seconds'].to_numpy() / 3600.0
+    percentiles = np.percentile(present_hours, [10, 50, 90]) if len(present_hours) else [None] * 3
+    compliance = report['compliance'].dropna()
+    return {
+        'users': int(len(report)),
+        'booked_days': attended + no_shows,
+        'attended': attended,
+        'no_shows': no_shows,
+        'unbooked_presence_days': unbooked,
+        'compliance_rate': round(attended / (attended + no_shows), 4) if attended + no_shows else None,
+        'users_below_80pct_compliance': int((compliance < 0.8).sum()),
+        'daily_hours_p10_p50_p90': [round(float(value), 2) if value is not None else None
+                                    for value in percentiles],
+    }
+
+
+# ===== Benchmark =====
+
+def synthetic_year(users=2000, days=365, start_day=None, seed=11):
+    """Attendance intervals and bookings for a company, generated with array operations.
+    Present days have a main session plus overlapping reconnects; most office days are booked."""
+    rng = np.random.default_rng(seed)
+    start_day = start_day if start_day is not None else int(np.datetime64('2025-01-01', 'D').astype(np.int64))
+    day = np.arange(start_day, start_day + days)
+    weekday = (day + 3) % 7                      # 1970-01-01 was a Thursday
+    workdays = day[weekday < 5]
+
+    user_grid = np.repeat(np.arange(1, users + 1), len(workdays))
+    day_grid = np.tile(workdays, users)
+    booked = rng.random(len(day_grid)) < 0.7
+    present = np.where(booked, rng.random(len(day_grid)) < 0.92, rng.random(len(day_grid)) < 0.3)
+    bookings = pd.DataFrame({'user_id': user_grid[booked], 'day': day_grid[booked]})
+
+    user_present, day_present = user_grid[present], day_grid[present]
+    count = len(user_present)
+    arrive = 9 * 3600 + rng.normal(0, 1800, count).astype(np.int64)
+    leave = 18 * 3600 + rng.normal(0, 2700, count).astype(np.int64)
+
+    # 0-3 extra records per day overlapping the main session (reconnects, a second device)
+    extra = rng.integers(0, 4, count)
+    extra_source = np.repeat(np.arange(count), extra)
+    span = leave[extra_source] - arrive[extra_source]
+    extra_start = arrive[extra_source] + (rng.random(len(extra_source)) * span).astype(np.int64)
+    extra_end = extra_start + rng.integers(600, 4 * 3600, len(extra_source))
+
+    user_id = np.concatenate([user_present, user_present[extra_source]])
+    local_day = np.concatenate([day_present, day_present[extra_source]])
+    local_start = np.concatenate([arrive, extra_start]) + local_day * DAY
+    local_end = np.concatenate([leave, extra_end]) + local_day * DAY
+    attendance = pd.DataFrame({'user_id': user_id, 'start': local_start - IST_OFFSET,
+                               'end': local_end - IST_OFFSET})
+    return attendance.sample(frac=1.0, random_state=seed).reset_index(drop=True), bookings
+
+
+def _reference_seconds(attendance, user_id, utc_offset, work_hours):
+    """Plain-Python union for one user, used to check the vectorized version"""
+    work_start, work_end = work_hours
+    by_day = {}
+    for start, end in attendance.loc[attendance['user_id'] == user_id, ['start', 'end']].itertuples(index=False):
+        start, end = start + utc_offset, end + utc_offset
+        day = start // DAY
+        while day * DAY < end:
+            lo, hi = max(start, day * DAY + work_start), min(end, day * DAY + work_end)
+            if hi > lo:
+                by_day.setdefault(day, []).append((lo, hi))
+            day += 1
+    result = {}
+    for day, spans in by_day.items():
+        total, current_start, current_end = 0, None, None
+        for lo, hi in sorted(spans):
+            if current_end is None or lo > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = lo, hi
+            else:
+                current_end = max(current_end, hi)
+        result[day] = total + current_end - current_start
+    return result
+
+
+def run_benchmark(users=2000, days=365, check_users=25):
+    """A year of synthetic company data through the whole pipeline, timed per stage"""
+    timings = {}
+    started = time.perf_counter()
+    attendance, bookings = synthetic_year(users, days)
+    timings['generate_s'] = round(time.perf_counter() - started, 2)
+
+    work_hours = parse_work_hours(WORK_HOURS)
+    stage = time.perf_counter()
+    daily = daily_presence(attendance, IST_OFFSET, work_hours)
+    timings['interval_union_s'] = round(time.perf_counter() - stage, 2)
+
+    stage = time.perf_counter()
+    joined = presence_vs_bookings(daily, bookings)
+    timings['booking_join_s'] = round(time.perf_counter() - stage, 2)
+
+    stage = time.perf_counter()
+    report = user_report(joined)
+    summary = company_summary(joined, report)
+    timings['reports_s'] = round(time.perf_counter() - stage, 2)
+    timings['pipeline_total_s'] = round(time.perf_counter() - started - timings['generate_s'], 2)
+
+    mismatches = 0
+    indexed = daily.set_index(['user_id', 'day'])['seconds']
+    for user_id in np.linspace(1, users, min(check_users, users)).astype(int):
+        for day, seconds in _reference_seconds(attendance, user_id, IST_OFFSET, work_hours).items():
+            if seconds and indexed.get((user_id, day), 0) != seconds:
+                mismatches += 1
+
+    return {
+        'users': users,
+        'days': days,
+        'attendance_records': len(attendance),
+        'bookings': len(bookings),
+        'user_days': len(daily),
+        'timings': timings,
+        'records_per_s': int(len(attendance) / max(timings['pipeline_total_s'], 1e-6)),
+        'checked_users': min(check_users, users),
+        'mismatches_vs_reference': mismatches,
+        'summary': summary,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Presence vs. booking analytics")
+    parser.add_argument('--db', help="attendance_sync.py cache")
+    parser.add_argument('--attendance', help="attendanceRecords CSV export")
+    parser.add_argument('--bookings', help="bookings CSV export")
+    parser.add_argument('--tz-offset', default='+05:30', help="Office timezone (default: +05:30)")
+    parser.add_argument('--work-hours', default=WORK_HOURS, help=f"Counted hours (default: {WORK_HOURS})")
+    parser.add_argument('--min-minutes', type=int, default=MIN_PRESENCE_MINUTES,
+                        help="Minimum presence on a booked day to count as attended")
+    parser.add_argument('-o', '--output', help="Per-user report CSV")
+    parser.add_argument('--daily', help="Per user-day outcomes CSV")
+    parser.add_argument('--bench', action='store_true', help="Benchmark a synthetic year")
+    parser.add_argument('--users', type=int, default=2000, help="Benchmark company size")
+    parser.add_argument('--days', type=int, default=365, help="Benchmark period")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.users, args.days), indent=2))
+        return 0
+    if not (args.db or args.attendance):
+        parser.error("--db or --attendance is required")
+
+    attendance = load_attendance_db(args.db) if args.db else load_attendance_csv(args.attendance)
+    bookings = load_bookings_csv(args.bookings) if args.bookings else pd.DataFrame({'user_id': [], 'day': []})
+    utc_offset = int(pd.Timestamp.now(tz=parse_tz_offset(args.tz_offset)).utcoffset().total_seconds())
+
+    daily = daily_presence(attendance, utc_offset, parse_work_hours(args.work_hours))
+    joined = presence_vs_bookings(daily, bookings.astype(np.int64), args.min_minutes * 60)
+    report = user_report(joined)
+
+    if args.output:
+        report.to_csv(args.output, index=False)
+    if args.daily:
+        joined.assign(date=pd.to_datetime(joined['day'], unit='D').dt.date).to_csv(args.daily, index=False)
+    print(json.dumps(company_summary(joined, report), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
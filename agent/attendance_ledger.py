@@ -0,0 +1,287 @@
+"""
+Local attendance ledger for the Office Agent.
+
+Connection sessions derived from OfficeAgent.check_network transitions are kept
+in an append-only binary file (one fixed-size record per open/close event, plus
+a checkpoint every few minutes while a session is open, so a crash loses at most
+that much of it) and in two parallel float arrays in memory. Running totals for the current day and
+week are maintained incrementally, so the tray can show today's hours without a
+server call, and each finished day can be uploaded as a single summary.
+"""
+
+import os
+import json
+import time
+import struct
+from array import array
+from datetime import datetime, date, timedelta
+
+from agent_tunables import log
+
+LEDGER_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_ledger')
+
+# One record per event: kind (1 = open, 2 = close, 3 = still open) + unix timestamp
+RECORD = struct.Struct('<Bd')
+EVENT_OPEN = 1
+EVENT_CLOSE = 2
+EVENT_CHECKPOINT = 3
+
+CHECKPOINT_INTERVAL = 300  # seconds between checkpoints of an open session
+
+RETENTION_DAYS = 42  # history kept when the file is compacted at startup
+
+
+def _day_start(timestamp):
+    day = datetime.fromtimestamp(timestamp).date()
+    return datetime(day.year, day.month, day.day).timestamp()
+
+
+def _week_start(timestamp):
+    day = datetime.fromtimestamp(timestamp).date()
+    monday = day - timedelta(days=day.weekday())
+    return datetime(monday.year, monday.month, monday.day).timestamp()
+
+
+def _days_later(window_start, days):
+    """Local midnight `days` calendar days after a local midnight (23 or 25 hours on DST days)"""
+    return (datetime.fromtimestamp(window_start) + timedelta(days=days)).timestamp()
+
+
+def _overlap(start, end, window_start, window_end):
+    return max(0.0, min(end, window_end) - max(start, window_start))
+
+
+def format_duration(seconds):
+    """Format seconds as '3h 05m'"""
+    minutes = int(seconds) // 60
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+class AttendanceLedger:
+    """Append-only record of local connection sessions with O(1) day/week totals"""
+
+    def __init__(self, path=LEDGER_FILE, clock=None):
+        self.path = path
+        self.upload_state_path = path + '.uploaded' if path else None
+        self.clock = clock or time
+        self.starts = array('d')
+        self.ends = array('d')
+        self.open_start = None
+        self.open_ssid = None
+        self._checkpoint_at = None
+
+        self._day_start = None
+        self._day_end = None
+        self._day_closed = 0.0
+        self._week_start = None
+        self._week_end = None
+        self._week_closed = 0.0
+
+        try:
+            self._load()
+        except OSError as e:
+            # Read-only or roaming profile, or a file held by antivirus: keep the ledger in memory
+            log(f"Attendance ledger {self.path} unavailable, not persisting: {str(e)}")
+            self.path = None
+
+    # ----- persistence -----
+
+    def _load(self):
+        """Rebuild the session arrays from the event file, compacting old history"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        usable = len(data) - len(data) % RECORD.size  # ignore a torn last record
+        needs_rewrite = usable != len(data)
+        last_seen = None
+        for kind, timestamp in RECORD.iter_unpack(data[:usable]):
+            if kind == EVENT_OPEN and self.open_start is None:
+                self.open_start = last_seen = timestamp
+            elif kind == EVENT_CHECKPOINT and self.open_start is not None:
+                last_seen = max(last_seen, timestamp)
+            elif kind == EVENT_CLOSE and self.open_start is not None:
+                self.starts.append(self.open_start)
+                self.ends.append(max(timestamp, self.open_start))
+                self.open_start = None
+
+        # A session left open by a crash or power loss ends at its last checkpoint
+        if self.open_start is not None:
+            self.starts.append(self.open_start)
+            self.ends.append(last_seen)
+            self.open_start = None
+            needs_rewrite = True
+
+        self._compact(needs_rewrite)
+
+    def _compact(self, force=False):
+        """Rewrite the file with only the retained sessions"""
+        cutoff = self.clock.time() - RETENTION_DAYS * 86400
+        keep = [i for i in range(len(self.starts)) if self.ends[i] >= cutoff]
+        if len(keep) == len(self.starts) and not force:
+            return
+        self.starts = array('d', (self.starts[i] for i in keep))
+        self.ends = array('d', (self.ends[i] for i in keep))
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for start, end in zip(self.starts, self.ends):
+                f.write(RECORD.pack(EVENT_OPEN, start))
+                f.write(RECORD.pack(EVENT_CLOSE, end))
+        os.replace(temp_path, self.path)
+
+    def _append(self, kind, timestamp):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(RECORD.pack(kind, timestamp))
+        except OSError:
+            pass  # The ledger is a convenience; never break the agent over it
+
+    # ----- recording -----
+
+    def open(self, ssid=None, timestamp=None):
+        """Start a session (no-op if one is already open)"""
+        if self.open_start is not None:
+            return
+        self.open_start = self.clock.time() if timestamp is None else timestamp
+        self.open_ssid = ssid
+        self._checkpoint_at = self.open_start
+        self._append(EVENT_OPEN, self.open_start)
+
+    def checkpoint(self, timestamp=None):
+        """Record that the open session is still running (at most every CHECKPOINT_INTERVAL);
+        a session a crash leaves open is recovered up to its last checkpoint"""
+        if self.open_start is None:
+            return
+        now = self.clock.time() if timestamp is None else timestamp
+        if now - self._checkpoint_at < CHECKPOINT_INTERVAL:
+            return
+        self._checkpoint_at = now
+        self._append(EVENT_CHECKPOINT, now)
+
+    def close(self, timestamp=None):
+        """End the open session (no-op if none is open)"""
+        if self.open_start is None:
+            return
+        end = max(self.clock.time() if timestamp is None else timestamp, self.open_start)
+        start = self.open_start
+        self.open_start = None
+        self.open_ssid = None
+        self._append(EVENT_CLOSE, end)
+
+        self._roll(end)  # before appending, so a rollover recount doesn't include this session
+        self.starts.append(start)
+        self.ends.append(end)
+        self._day_closed += _overlap(start, end, self._day_start, self._day_end)
+        self._week_closed += _overlap(start, end, self._week_start, self._week_end)
+
+    # ----- aggregates -----
+
+    def _roll(self, now):
+        """Recompute closed totals when the day or week changes (once per day)"""
+        day_start = _day_start(now)
+        week_start = _week_start(now)
+        if day_start == self._day_start and week_start == self._week_start:
+            return
+        self._day_start = day_start
+        self._day_end = _days_later(day_start, 1)
+        self._week_start = week_start
+        self._week_end = _days_later(week_start, 7)
+        self._day_closed = self._closed_between(day_start, self._day_end)
+        self._week_closed = self._closed_between(week_start, self._week_end)
+
+    def _closed_between(self, window_start, window_end):
+        """Sum of closed session time inside a window, scanning back from the newest"""
+        total = 0.0
+        for i in range(len(self.starts) - 1, -1, -1):
+            if self.ends[i] < window_start:
+                break
+            total += _overlap(self.starts[i], self.ends[i], window_start, window_end)
+        return total
+
+    def totals(self, now=None):
+        """(today_seconds, week_seconds) including the currently open session"""
+        now = self.clock.time() if now is None else now
+        self._roll(now)
+        today = self._day_closed
+        week = self._week_closed
+        if self.open_start is not None:
+            today += _overlap(self.open_start, now, self._day_start, self._day_end)
+            week += _overlap(self.open_start, now, self._week_start, self._week_end)
+        return today, week
+
+    def summary_text(self, now=None):
+        today, week = self.totals(now)
+        return f"Today: {format_duration(today)} | Week: {format_duration(week)}"
+
+    # ----- daily summaries -----
+
+    def daily_summary(self, day):
+        """Summary of one calendar day (a datetime.date)"""
+        window_start = datetime(day.year, day.month, day.day).timestamp()
+        window_end = _days_later(window_start, 1)
+        seconds = 0.0
+        sessions = 0
+        first_seen = None
+        last_seen = None
+        for start, end in zip(self.starts, self.ends):
+            overlap = _overlap(start, end, window_start, window_end)
+            if overlap <= 0:
+                continue
+            sessions += 1
+            seconds += overlap
+            clipped_start = max(start, window_start)
+            clipped_end = min(end, window_end)
+            first_seen = clipped_start if first_seen is None else min(first_seen, clipped_start)
+            last_seen = clipped_end if last_seen is None else max(last_seen, clipped_end)
+        return {
+            'date': day.isoformat(),
+            'sessions': sessions,
+            'total_seconds': int(seconds),
+            'first_seen': int(first_seen) if first_seen else None,
+            'last_seen': int(last_seen) if last_seen else None,
+        }
+
+    def pending_summaries(self, now=None):
+        """Summaries for completed days with activity that have not been uploaded yet
+        (a session running past midnight counts towards every day it touches)"""
+        now = self.clock.time() if now is None else now
+        today = datetime.fromtimestamp(now).date()
+        last_uploaded = self._last_uploaded()
+        days = set()
+        for start, end in zip(self.starts, self.ends):
+            day = datetime.fromtimestamp(start).date()
+            last_day = datetime.fromtimestamp(end).date()
+            while day <= last_day:
+                days.add(day)
+                day += timedelta(days=1)
+        days = sorted(days)
+        summaries = []
+        for day in days:
+            if day >= today or (last_uploaded and day <= last_uploaded):
+                continue
+            summary = self.daily_summary(day)
+            if summary['sessions']:
+                summaries.append(summary)
+        return summaries
+
+    def mark_uploaded(self, day_iso):
+        """Remember that summaries up to and including day_iso were uploaded"""
+        if not self.upload_state_path:
+            return
+        try:
+            with open(self.upload_state_path, 'w') as f:
+                json.dump({'last_uploaded': day_iso}, f)
+        except OSError:
+            pass
+
+    def _last_uploaded(self):
+        if not self.upload_state_path:
+            return None
+        try:
+            with open(self.upload_state_path) as f:
+                return date.fromisoformat(json.load(f)['last_uploaded'])
+        except (OSError, ValueError, KeyError):
+            return None
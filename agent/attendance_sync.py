@@ -0,0 +1,402 @@
+"""
+Incremental attendance-history sync into a local SQLite cache.
+
+Reporting scripts used to pull the whole of /api/desktop/attendance-history on
+every run. This tool keeps a local copy instead and only asks the server for
+what changed since the stored cursor:
+
+    - each sync pins an upper bound (endDate) so offsets stay stable while
+      pages are fetched concurrently, and records that bound as the cursor
+    - the next sync starts from the cursor minus a small overlap, or from the
+      oldest record still open locally (connections close after they start),
+      and upserts by record id, so re-fetched rows are updated, not duplicated
+    - the cursor only moves once every page is stored
+
+Records live in one table with covering indexes on (start, user) and
+(user, start), so month reports are answered from the indexes alone: the
+month query walks the users table and range-searches the per-user index once
+per user, which yields rows already grouped by user without relying on
+ANALYZE statistics. Records without a user are not reported.
+
+Usage:
+    python attendance_sync.py --login admin sync --db attendance.db
+    python attendance_sync.py month 2025-04 --db attendance.db --tz-offset +05:30 --format csv
+    python attendance_sync.py --bench --users 2000 --days 30
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from admin_cli import AdminClient, add_auth_arguments, authenticate
+from workload_profile import parse_tz_offset
+
+DEFAULT_DB = 'attendance.db'
+PAGE_SIZE = 1000
+SYNC_WORKERS = 4
+CURSOR_OVERLAP = 15 * 60          # seconds re-read behind the cursor (server/client clock skew)
+REOPEN_WINDOW = 2 * 24 * 3600     # open records younger than this are re-read until they close
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    email TEXT,
+    username TEXT,
+    full_name TEXT,
+    department TEXT
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER,
+    duration REAL,
+    is_active INTEGER NOT NULL,
+    ssid TEXT,
+    ip_address TEXT,
+    mac_address TEXT,
+    computer_name TEXT
+);
+CREATE INDEX IF NOT EXISTS attendance_by_start ON attendance (start_ts, user_id, end_ts, duration);
+CREATE INDEX IF NOT EXISTS attendance_by_user ON attendance (user_id, start_ts, end_ts, duration);
+CREATE INDEX IF NOT EXISTS attendance_open ON attendance (start_ts) WHERE is_active = 1;
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+MONTH_QUERY = """
+SELECT u.id AS user_id, u.email, u.full_name, u.department,
+       COUNT(DISTINCT (a.start_ts + :offset) / 86400) AS days,
+       ROUND(SUM(COALESCE(a.duration, a.end_ts - a.start_ts, 0)) / 3600.0, 2) AS hours,
+       COUNT(*) AS sessions,
+       MIN(a.start_ts) AS first_start
+FROM users AS u
+JOIN attendance AS a INDEXED BY attendance_by_user
+  ON a.user_id = u.id AND a.start_ts >= :start AND a.start_ts < :end
+WHERE 1 {user_filter}
+GROUP BY u.id
+ORDER BY u.email
+"""
+
+
+def _epoch(value):
+    """ISO timestamp from the API -> epoch seconds (None stays None)"""
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class AttendanceStore:
+    """SQLite cache of attendance records plus the sync cursor"""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def get_state(self, key):
+        row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def resume_from(self, overlap=CURSOR_OVERLAP, reopen_window=REOPEN_WINDOW):
+        """Start of the next incremental sync, None when a full sync is needed"""
+        cursor = self.get_state('cursor')
+        if cursor is None:
+            return None
+        cursor = int(cursor)
+        oldest_open = self.conn.execute(
+            'SELECT MIN(start_ts) FROM attendance WHERE is_active = 1 AND start_ts >= ?',
+            (cursor - reopen_window,)).fetchone()[0]
+        since = cursor - overlap
+        return min(since, oldest_open) if oldest_open is not None else since
+
+    def upsert(self, records):
+        users = {}
+        rows = []
+        for record in records:
+            user = record.get('user') or {}
+            if user.get('id') is not None:
+                users[user['id']] = (user['id'], user.get('email'), user.get('username'),
+                                     user.get('fullName'), user.get('department'))
+            rows.append((record['id'], user.get('id') or 0, _epoch(record['connectionStartTime']),
+                         _epoch(record.get('connectionEndTime')), record.get('connectionDuration'),
+                         1 if record.get('isActive') else 0, record.get('ssid'), record.get('ipAddress'),
+                         record.get('macAddress'), record.get('computerName')))
+        self.conn.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)', users.values())
+        self.conn.executemany('INSERT OR REPLACE INTO attendance VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+
+    def month_summary(self, month, tz=None, user=None):
+        """Per-user days present, hours connected and sessions for 'YYYY-MM' in the office timezone"""
+        tz = tz or parse_tz_offset('local')
+        year, number = (int(part) for part in month.split('-'))
+        start = datetime(year, number, 1, tzinfo=tz)
+        end = datetime(year + number // 12, number % 12 + 1, 1, tzinfo=tz)
+        params = {'offset': int(start.utcoffset().total_seconds()),
+                  'start': int(start.timestamp()), 'end': int(end.timestamp())}
+        user_filter = ''
+        if user is not None:
+            if str(user).isdigit():
+                user_filter, params['user_id'] = 'AND u.id = :user_id', int(user)
+            else:
+                user_filter = 'AND u.email = :email'
+                params['email'] = user
+        cursor = self.conn.execute(MONTH_QUERY.format(user_filter=user_filter), params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self):
+        self.conn.close()
+
+
+def sync(client, store, page_size=PAGE_SIZE, workers=SYNC_WORKERS, full=False, now=None):
+    """Fetch records newer than the cursor and upsert them; returns the summary dict"""
+    started = time.monotonic()
+    bytes_before = client.bytes_received
+    until = int(now if now is not None else time.time())
+    since = None if full else store.resume_from()
+
+    query = {'limit': page_size, 'endDate': _iso(until)}
+    if since is not None:
+        query['startDate'] = _iso(since)
+
+    def fetch(offset):
+        status, body = client.attendance_history(dict(query, offset=offset))
+        if status != 200 or not isinstance(body, dict) or not body.get('success'):
+            message = body.get('message') if isinstance(body, dict) else None
+            raise RuntimeError(f"attendance-history offset {offset}: {message or f'HTTP {status}'}")
+        return body['data']
+
+    with store.conn:  # One transaction: the cursor only moves if every page is stored
+        first = fetch(0)
+        total = first['total']
+        stored = store.upsert(first['records'])
+        pages = 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, offset) for offset in range(page_size, total, page_size)]
+            for future in as_completed(futures):
+                stored += store.upsert(future.result()['records'])
+                pages += 1
+        store.set_state('cursor', until)
+        store.set_state('synced_at', _iso(int(time.time())))
+
+    return {
+        'mode': 'full' if since is None else 'incremental',
+        'since': _iso(since) if since is not None else None,
+        'until': _iso(until),
+        'server_total': total,
+        'records': stored,
+        'pages': pages,
+        'bytes': client.bytes_received - bytes_before,
+        'elapsed_s': round(time.monotonic() - started, 2),
+        'local_records': store.count(),
+    }
+
+
+# ===== Benchmark =====
+
+def synthetic_history(users=2000, days=30, end=None, seed=7, tz=None, first_id=1):
+    """Records shaped like getAttendanceHistory's output, newest first.
+    Each working day a user has one or two connections between ~09:00 and ~18:00."""
+    rng = random.Random(seed)
+    tz = tz or timezone(timedelta(hours=5, minutes=30))
+    end = end or datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    records = []
+    for day_index in range(days, 0, -1):
+        day = end - timedelta(days=day_index)
+        if day.weekday() >= 5:
+            continue
+        for user_id in range(1, users + 1):
+            if rng.random() < 0.1:
+                continue  # Leave, travel, working from home
+            arrive = day + timedelta(hours=9, minutes=rng.gauss(0, 35))
+            leave = day + timedelta(hours=18, minutes=rng.gauss(0, 45))
+            spans = [(arrive, leave)]
+            if rng.random() < 0.4:
+                lunch = day + timedelta(hours=13, minutes=rng.gauss(0, 20))
+                spans = [(arrive, lunch), (lunch + timedelta(minutes=rng.uniform(20, 60)), leave)]
+            for start, finish in spans:
+                records.append((start, finish, user_id))
+    records.sort(key=lambda item: item[0])
+    formatted = []
+    for index, (start, finish, user_id) in enumerate(records, first_id):
+        formatted.append(_history_record(index, user_id, start, finish))
+    formatted.reverse()
+    return formatted
+
+
+def _history_record(record_id, user_id, start, finish):
+    duration = (finish - start).total_seconds() if finish else None
+    return {
+        'id': record_id,
+        'user': {'id': user_id, 'username': f"user{user_id}", 'email': f"user{user_id}@office.local",
+                 'fullName': f"User {user_id}", 'department': f"Dept {user_id % 12}"},
+        'ssid': 'GIGLABZ_5G',
+        'ipAddress': f"192.168.{user_id // 250}.{user_id % 250 + 2}",
+        'macAddress': '02:00:00:%02x:%02x:%02x' % ((user_id >> 16) & 0xff, (user_id >> 8) & 0xff, user_id & 0xff),
+        'computerName': f"PC-{user_id:05d}",
+        'connectionStartTime': _iso(int(start.timestamp())),
+        'connectionEndTime': _iso(int(finish.timestamp())) if finish else None,
+        'connectionDuration': duration,
+        'isActive': finish is None,
+    }
+
+
+def run_benchmark(users=2000, days=30, page_size=PAGE_SIZE, workers=SYNC_WORKERS, runs=20):
+    """Full sync, a nightly incremental sync and month queries against fault_proxy's stand-in"""
+    import tempfile
+    from fault_proxy import FaultProxy
+
+    # Fixed dates keep runs comparable: the first sync runs at midnight after Tuesday 29 April,
+    # the nightly one a day later
+    tz = timezone(timedelta(hours=5, minutes=30))
+    today = datetime(2025, 4, 30, tzinfo=tz)
+    yesterday = today - timedelta(days=1)
+    history = synthetic_history(users, days, today, tz=tz)
+
+    # Yesterday's records are still open on the server during the first sync
+    closed = {}
+    for record in history:
+        if _epoch(record['connectionStartTime']) < yesterday.timestamp():
+            break
+        closed[record['id']] = dict(record)
+        record.update(connectionEndTime=None, connectionDuration=None, isActive=True)
+
+    proxy = FaultProxy().start()
+    directory = tempfile.mkdtemp(prefix='attendance-bench-')
+    store = AttendanceStore(os.path.join(directory, 'attendance.db'))
+    try:
+        proxy.backend.history = history
+        client = AdminClient(proxy.url, workers=workers, rate=0)
+        success, message = client.sign_in('admin@bench.local', 'bench')
+        if not success:
+            raise RuntimeError(message)
+
+        full = sync(client, store, page_size, workers, now=today.timestamp())
+
+        # Overnight: yesterday's connections close and today's day is added
+        with proxy.backend_lock:
+            for record in history:
+                if record['id'] in closed:
+                    record.update(closed[record['id']])
+            next_day = synthetic_history(users, 1, today + timedelta(days=1), seed=8, tz=tz,
+                                         first_id=len(history) + 1)
+            proxy.backend.history = next_day + history
+        incremental = sync(client, store, page_size, workers, now=(today + timedelta(days=1)).timestamp())
+
+        still_open = store.conn.execute('SELECT COUNT(*) FROM attendance WHERE is_active = 1').fetchone()[0]
+        month = yesterday.strftime('%Y-%m')
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            rows = store.month_summary(month, tz)
+            timings.append((time.perf_counter() - started) * 1000)
+        single = time.perf_counter()
+        store.month_summary(month, tz, user='user42@office.local')
+        single_ms = (time.perf_counter() - single) * 1000
+        plan = [row[-1] for row in store.conn.execute(
+            'EXPLAIN QUERY PLAN ' + MONTH_QUERY.format(user_filter=''),
+            {'offset': 0, 'start': 0, 'end': 0})]
+        timings.sort()
+        return {
+            'users': users,
+            'days': days,
+            'server_records': len(proxy.backend.history),
+            'full_sync': full,
+            'incremental_sync': incremental,
+            'open_records_after_incremental': still_open,
+            'month_query': {
+                'month': month,
+                'rows': len(rows),
+                'records_in_month': sum(row['sessions'] for row in rows),
+                'median_ms': round(timings[len(timings) // 2], 2),
+                'max_ms': round(timings[-1], 2),
+                'single_user_ms': round(single_ms, 3),
+                'plan': plan,
+            },
+        }
+    finally:
+        store.close()
+        proxy.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental attendance-history cache")
+    add_auth_arguments(parser)
+    parser.add_argument('--bench', action='store_true', help="Benchmark sync and month queries")
+    parser.add_argument('--users', type=int, default=2000, help="Benchmark office size")
+    parser.add_argument('--days', type=int, default=30, help="Benchmark history length")
+    subcommands = parser.add_subparsers(dest='command')
+
+    sync_parser = subcommands.add_parser('sync', help="Fetch new and changed records")
+    sync_parser.add_argument('--db', default=DEFAULT_DB)
+    sync_parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    sync_parser.add_argument('--workers', type=int, default=SYNC_WORKERS, help="Pages fetched concurrently")
+    sync_parser.add_argument('--full', action='store_true', help="Ignore the cursor and re-read everything")
+
+    month_parser = subcommands.add_parser('month', help="Per-user attendance for one month, from the cache")
+    month_parser.add_argument('month', help="YYYY-MM")
+    month_parser.add_argument('--db', default=DEFAULT_DB)
+    month_parser.add_argument('--tz-offset', default='local', help="Office timezone, e.g. +05:30")
+    month_parser.add_argument('--user', help="Only this email or user id")
+    month_parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.users, args.days), indent=2))
+        return 0
+    if not args.command:
+        parser.print_help()
+        return 2
+
+    store = AttendanceStore(args.db)
+    try:
+        if args.command == 'month':
+            rows = store.month_summary(args.month, parse_tz_offset(args.tz_offset), args.user)
+            if args.format == 'csv':
+                writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]) if rows else ['user_id'])
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    sys.stdout.write(json.dumps(row) + '\n')
+            return 0
+
+        client = AdminClient(args.api, workers=args.workers, rate=0)
+        if not authenticate(client, args):
+            return 1
+        try:
+            summary = sync(client, store, args.page_size, args.workers, args.full)
+        except RuntimeError as e:
+            print(f"Sync failed, cursor unchanged: {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(summary, indent=2))
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
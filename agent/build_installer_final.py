@@ -1,10 +1,16 @@
 import os
 import sys
+import json
+import argparse
 import subprocess
 import shutil
-import winreg
 import time
 
+try:
+    import winreg
+except ImportError:
+    winreg = None  # Not on Windows - the installer step will be skipped
+
 # Create startupinfo object to hide console windows in subprocesses
 startupinfo = None
 if hasattr(subprocess, 'STARTUPINFO'):
@@ -16,27 +22,55 @@ if hasattr(subprocess, 'STARTUPINFO'):
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 DIST_DIR = os.path.join(CURRENT_DIR, 'dist')
 BUILD_DIR = os.path.join(CURRENT_DIR, 'build')
+REPORTS_DIR = os.path.join(CURRENT_DIR, 'build_reports')
 ICON_FILE = os.path.join(CURRENT_DIR, 'icon.ico')
+UPDATE_KEY_MODULE = os.path.join(CURRENT_DIR, 'update_key.py')
 
-# Ensure icon exists
-if not os.path.exists(ICON_FILE):
-    print(f"Creating empty icon file at {ICON_FILE}")
-    with open(ICON_FILE, 'w') as f:
-        f.write("")  # Create empty file
+# Qt modules the tray agent never imports (it uses QtCore, QtGui, QtWidgets and, for the
+# logind shutdown hook on Linux, QtDBus)
+QT_EXCLUDES = [
+    'PyQt5.QtBluetooth', 'PyQt5.QtDesigner', 'PyQt5.QtHelp',
+    'PyQt5.QtLocation', 'PyQt5.QtMultimedia', 'PyQt5.QtMultimediaWidgets',
+    'PyQt5.QtNetwork', 'PyQt5.QtNfc', 'PyQt5.QtOpenGL', 'PyQt5.QtPositioning',
+    'PyQt5.QtPrintSupport', 'PyQt5.QtQml', 'PyQt5.QtQuick', 'PyQt5.QtQuick3D',
+    'PyQt5.QtQuickWidgets', 'PyQt5.QtRemoteObjects', 'PyQt5.QtSensors',
+    'PyQt5.QtSerialPort', 'PyQt5.QtSql', 'PyQt5.QtSvg', 'PyQt5.QtTest',
+    'PyQt5.QtTextToSpeech', 'PyQt5.QtWebChannel', 'PyQt5.QtWebEngine',
+    'PyQt5.QtWebEngineCore', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebSockets',
+    'PyQt5.QtXml', 'PyQt5.QtXmlPatterns', 'PyQt5.uic',
+]
 
-def build_exe():
-    """Build the executable using PyInstaller"""
-    try:
-        # Clean previous builds
-        if os.path.exists(DIST_DIR):
-            shutil.rmtree(DIST_DIR)
-        if os.path.exists(BUILD_DIR):
-            shutil.rmtree(BUILD_DIR)
-        
-        # Create the wrapper file
-        wrapper_file = os.path.join(CURRENT_DIR, 'office_agent_wrapper.py')
-        with open(wrapper_file, 'w') as f:
-            f.write('''"""
+# Standard library / third-party packages that are never used at runtime
+MODULE_EXCLUDES = [
+    'tkinter', 'unittest', 'pydoc', 'doctest', 'pdb', 'lib2to3', 'distutils',
+    'setuptools', 'pip', 'numpy', 'pandas', 'IPython',
+]
+
+# Qt plugin directories the tray icon actually needs; everything else is stripped
+QT_PLUGINS_KEEP = {
+    'platforms': None,                         # qwindows / qxcb - required to start
+    'styles': None,                            # native look for the menu
+    'imageformats': {'qico', 'libqico'},       # only the .ico loader for the tray icon
+}
+
+# Build profiles. 'default' reproduces the historic spec; 'size' is trimmed for a
+# small download and a fast launch (no UPX, which has to decompress on every start).
+BUILD_PROFILES = {
+    'default': {
+        'excludes': [],
+        'upx': True,
+        'optimize': 0,
+        'strip_qt': False,
+    },
+    'size': {
+        'excludes': QT_EXCLUDES + MODULE_EXCLUDES,
+        'upx': False,
+        'optimize': 2,
+        'strip_qt': True,
+    },
+}
+
+WRAPPER_SOURCE = '''"""
 This is a wrapper script that ensures no console windows appear when running the Office Agent.
 PyInstaller will use this as the entry point instead of system_tray_agent_fixed.py directly.
 """
@@ -52,10 +86,10 @@ if sys.platform == 'win32':
         # Try to detach from console
         kernel32 = ctypes.WinDLL('kernel32')
         user32 = ctypes.WinDLL('user32')
-        
+
         # Try to detach from console
         kernel32.FreeConsole()
-        
+
         # Hide console window if it exists
         hwnd = kernel32.GetConsoleWindow()
         if hwnd != 0:
@@ -67,7 +101,7 @@ if sys.platform == 'win32':
     try:
         import win32process
         import win32api
-        win32process.SetPriorityClass(win32api.GetCurrentProcess(), 
+        win32process.SetPriorityClass(win32api.GetCurrentProcess(),
                                     win32process.BELOW_NORMAL_PRIORITY_CLASS)
     except Exception:
         pass
@@ -78,15 +112,29 @@ os.environ["PYTHONNOUSERSITE"] = "1"
 if sys.platform == 'win32':
     os.environ["OFFICE_AGENT_HIDE_WINDOWS"] = "1"
 
+# Startup probe used by the build benchmark: load everything, then exit without a tray icon
+if '--startup-probe' in sys.argv:
+    import system_tray_agent_fixed
+    sys.exit(0)
+
+# Diagnostics bundle for the helpdesk; runs in this build, without counting as a start of a staged update
+if '--selftest' in sys.argv:
+    from agent_selftest import main as selftest
+    sys.exit(selftest(sys.argv[1:]))
+
+# Run the current delta update instead of this installed build, if there is one
+try:
+    from agent_updater import launch_current_version
+    launch_current_version()
+except Exception:
+    pass
+
 # Now import and run the actual application
 from system_tray_agent_fixed import main
 main()
-''')
+'''
 
-        # Create a special PyInstaller spec file that sets process flags
-        spec_file = os.path.join(CURRENT_DIR, 'office_agent.spec')
-        with open(spec_file, 'w') as f:
-            f.write('''# -*- mode: python ; coding: utf-8 -*-
+SPEC_TEMPLATE = '''# -*- mode: python ; coding: utf-8 -*-
 
 import sys
 
@@ -97,10 +145,11 @@ a = Analysis(
     datas=[('icon.ico', '.')],
     hiddenimports=['win32timezone', 'win32process', 'win32api', 'wmi'],
     hookspath=[],
-    hooksconfig={},
+    hooksconfig={{}},
     runtime_hooks=[],
-    excludes=[],
+    excludes={excludes},
     noarchive=False,
+    optimize={optimize},
 )
 
 pyz = PYZ(a.pure)
@@ -114,7 +163,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx={upx},
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -132,23 +181,232 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx={upx},
     upx_exclude=[],
     name='OfficeAgent',
-)''')
+)'''
+
+# Ensure icon exists
+if not os.path.exists(ICON_FILE):
+    print(f"Creating empty icon file at {ICON_FILE}")
+    with open(ICON_FILE, 'w') as f:
+        f.write("")  # Create empty file
+
+def render_spec(profile='default'):
+    """Render the PyInstaller spec for a build profile"""
+    settings = BUILD_PROFILES[profile]
+    return SPEC_TEMPLATE.format(
+        excludes=repr(settings['excludes']),
+        optimize=settings['optimize'],
+        upx=settings['upx'],
+    )
+
+def write_update_key(signing_key=None):
+    """Pin the update signing key's public half into the build ('' disables delta updates)"""
+    public_key = ''
+    if signing_key:
+        from agent_updater import load_signing_key, public_key_hex
+        public_key = public_key_hex(load_signing_key(signing_key))
+    with open(UPDATE_KEY_MODULE, 'w') as f:
+        f.write("# Generated by build_installer_final.py: public key updates must be signed with\n")
+        f.write(f"PUBLIC_KEY = {public_key!r}\n")
+    return public_key
+
+def build_exe(profile='default', signing_key=None):
+    """Build the executable using PyInstaller"""
+    try:
+        # Clean previous builds
+        if os.path.exists(DIST_DIR):
+            shutil.rmtree(DIST_DIR)
+        if os.path.exists(BUILD_DIR):
+            shutil.rmtree(BUILD_DIR)
+
+        # Create the wrapper file
+        wrapper_file = os.path.join(CURRENT_DIR, 'office_agent_wrapper.py')
+        with open(wrapper_file, 'w') as f:
+            f.write(WRAPPER_SOURCE)
+
+        if not write_update_key(signing_key):
+            print("No --signing-key: this build will not accept delta updates")
+
+        # Create a special PyInstaller spec file that sets process flags
+        spec_file = os.path.join(CURRENT_DIR, 'office_agent.spec')
+        with open(spec_file, 'w') as f:
+            f.write(render_spec(profile))
 
         # Run PyInstaller with the spec file
+        print(f"Building with profile: {profile}")
         subprocess.check_call([
             'pyinstaller',
             '--clean',
             spec_file
-        ], startupinfo=startupinfo, creationflags=CREATE_NO_WINDOW if startupinfo else 0)
-        
+        ], cwd=CURRENT_DIR, startupinfo=startupinfo, creationflags=CREATE_NO_WINDOW if startupinfo else 0)
+
+        if BUILD_PROFILES[profile]['strip_qt']:
+            removed = strip_qt_payload(os.path.join(DIST_DIR, 'OfficeAgent'))
+            print(f"Stripped {removed / 1024 / 1024:.1f} MB of unused Qt plugins and translations")
+
         return True
     except Exception as e:
         print(f"Error building executable: {str(e)}")
         return False
 
+def strip_qt_payload(app_dir):
+    """Delete Qt plugins and translations the tray agent never loads. Returns bytes removed."""
+    removed = 0
+    for root, dirs, files in os.walk(app_dir):
+        parent = os.path.basename(root)
+        if parent not in ('Qt5', 'Qt'):
+            continue
+        for name in list(dirs):
+            path = os.path.join(root, name)
+            if name == 'translations':
+                removed += _tree_size(path)
+                shutil.rmtree(path)
+                dirs.remove(name)
+            elif name == 'plugins':
+                removed += _strip_plugins(path)
+    return removed
+
+def _strip_plugins(plugins_dir):
+    """Keep only the plugin groups listed in QT_PLUGINS_KEEP"""
+    removed = 0
+    for group in os.listdir(plugins_dir):
+        group_path = os.path.join(plugins_dir, group)
+        if group not in QT_PLUGINS_KEEP:
+            removed += _tree_size(group_path)
+            shutil.rmtree(group_path)
+            continue
+        allowed = QT_PLUGINS_KEEP[group]
+        if allowed is None:
+            continue
+        for plugin in os.listdir(group_path):
+            if os.path.splitext(plugin)[0] not in allowed:
+                plugin_path = os.path.join(group_path, plugin)
+                removed += os.path.getsize(plugin_path)
+                os.remove(plugin_path)
+    return removed
+
+def _tree_size(path):
+    """Total size in bytes of all files below path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def largest_bundled_modules(app_dir, top=25):
+    """List the largest bundled binaries/data files and pure-Python modules"""
+    entries = []
+    for root, _, files in os.walk(app_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            entries.append((os.path.relpath(path, app_dir), os.path.getsize(path)))
+
+    # Pure-Python modules live compressed inside the PYZ archive
+    for root, _, files in os.walk(BUILD_DIR):
+        for name in files:
+            if not name.endswith('.pyz'):
+                continue
+            try:
+                from PyInstaller.archive.readers import ZlibArchiveReader
+                archive = ZlibArchiveReader(os.path.join(root, name))
+                for module, info in archive.toc.items():
+                    entries.append((f"pyz:{module}", info[-1]))
+            except Exception as e:
+                print(f"Could not read PYZ archive {name}: {str(e)}")
+
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return [{'name': name, 'bytes': size} for name, size in entries[:top]]
+
+def measure_startup(exe_path, runs=5):
+    """Measure wall-clock start time and peak RSS of the frozen binary (Linux only)"""
+    if not sys.platform.startswith('linux'):
+        print("Startup benchmark is only available on Linux, skipping")
+        return None
+
+    # Best effort at a truly cold first run; needs root, silently skipped otherwise
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+    except OSError:
+        pass
+
+    timings = []
+    peak_rss_kb = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([exe_path, '--startup-probe'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        timings.append(time.perf_counter() - started)
+        peak_rss_kb.append(usage.ru_maxrss)  # kilobytes on Linux
+        if os.waitstatus_to_exitcode(status) != 0:
+            print(f"Startup probe exited with status {os.waitstatus_to_exitcode(status)}")
+
+    warm = sorted(timings[1:]) or timings
+    return {
+        'runs': runs,
+        'cold_start_seconds': round(timings[0], 4),
+        'warm_start_median_seconds': round(warm[len(warm) // 2], 4),
+        'peak_rss_mb': round(max(peak_rss_kb) / 1024, 1),
+    }
+
+def write_build_report(profile, benchmark=True):
+    """Write the size/startup report for the last build and flag regressions"""
+    app_dir = os.path.join(DIST_DIR, 'OfficeAgent')
+    exe_name = 'OfficeAgent.exe' if sys.platform == 'win32' else 'OfficeAgent'
+
+    report = {
+        'profile': profile,
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': sys.platform,
+        'total_bytes': _tree_size(app_dir),
+        'file_count': sum(len(files) for _, _, files in os.walk(app_dir)),
+        'largest': largest_bundled_modules(app_dir),
+        'startup': measure_startup(os.path.join(app_dir, exe_name)) if benchmark else None,
+    }
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    report_file = os.path.join(REPORTS_DIR, f"{profile}-{sys.platform}.json")
+    previous = None
+    if os.path.exists(report_file):
+        with open(report_file) as f:
+            previous = json.load(f)
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Bundle size: {report['total_bytes'] / 1024 / 1024:.1f} MB in {report['file_count']} files")
+    for entry in report['largest'][:10]:
+        print(f"  {entry['bytes'] / 1024:10.0f} KB  {entry['name']}")
+    if report['startup']:
+        print(f"Cold start: {report['startup']['cold_start_seconds']}s, "
+              f"warm start: {report['startup']['warm_start_median_seconds']}s, "
+              f"peak RSS: {report['startup']['peak_rss_mb']} MB")
+
+    for warning in compare_reports(previous, report):
+        print(f"REGRESSION: {warning}")
+    print(f"Build report written to {report_file}")
+    return report
+
+def compare_reports(previous, current, tolerance=0.10):
+    """Return human-readable regressions of current against the previous build"""
+    if not previous:
+        return []
+    warnings = []
+    checks = [('bundle size', previous.get('total_bytes'), current.get('total_bytes'))]
+    if previous.get('startup') and current.get('startup'):
+        for key in ('cold_start_seconds', 'warm_start_median_seconds', 'peak_rss_mb'):
+            checks.append((key, previous['startup'].get(key), current['startup'].get(key)))
+    for label, before, after in checks:
+        if before and after and after > before * (1 + tolerance):
+            warnings.append(f"{label} grew from {before} to {after}")
+    return warnings
+
 def build_installer():
     """Build the installer using NSIS"""
     try:
@@ -157,6 +415,8 @@ def build_installer():
             nsis_path = None
             # Try to find NSIS installation from registry
             try:
+                if winreg is None:
+                    raise OSError("Windows registry is not available on this platform")
                 with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\NSIS") as key:
                     nsis_path = winreg.QueryValueEx(key, "")[0]
                 nsis_path = os.path.join(nsis_path, "makensis.exe")
@@ -296,13 +556,38 @@ SectionEnd
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Office Agent executable and installer")
+    parser.add_argument('--profile', choices=sorted(BUILD_PROFILES), default='default',
+                        help="PyInstaller build profile ('size' trims Qt and skips UPX)")
+    parser.add_argument('--no-benchmark', action='store_true',
+                        help="Skip the startup time / RSS measurement")
+    parser.add_argument('--skip-installer', action='store_true',
+                        help="Only build the executable")
+    parser.add_argument('--publish', metavar='DIR',
+                        help="Also publish the build to this update directory (see agent_updater.py)")
+    parser.add_argument('--version', default='1.0.0', help="Version to publish the build as")
+    parser.add_argument('--signing-key', metavar='PEM',
+                        help="Update signing key (agent_updater.py keygen); its public key is pinned into the build")
+    args = parser.parse_args()
+    if args.publish and not args.signing_key:
+        parser.error("--publish needs --signing-key")
+
     print("Building Office Agent executable...")
-    if build_exe():
+    if build_exe(args.profile, args.signing_key):
         print("Successfully built executable.")
+        write_build_report(args.profile, benchmark=not args.no_benchmark)
+        if args.publish:
+            # Before the installer, so installed builds carry their manifest for delta updates
+            from agent_updater import publish
+            manifest = publish(os.path.join(DIST_DIR, 'OfficeAgent'), args.version, args.publish,
+                               args.signing_key)
+            print(f"Published {args.version} to {args.publish} ({len(manifest['files'])} files)")
+        if args.skip_installer:
+            sys.exit(0)
         print("Building installer...")
         if build_installer():
             print("Successfully built installer.")
         else:
             print("Failed to build installer.")
     else:
-        print("Failed to build executable.")
\ No newline at end of file
+        print("Failed to build executable.")
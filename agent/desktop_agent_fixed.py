@@ -88,14 +88,189 @@ if 'log_to_file' not in globals():
 
 # Constants
 CONFIG_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_config')
-# API_BASE_URL = 'http://192.168.1.8:9600/api/desktop'  # Replace with your server URL
 API_BASE_URL = 'http://localhost:9600/api/desktop'  # Replace with your server URL
-# API_BASE_URL = 'https://gbooking.giglabz.co.in/api/desktop'  # Replace with your server URL
+# Equivalent URLs for the server, preferred first; the fastest reachable one is used
+# (see endpoint_selector.py). Empty means API_BASE_URL only.
+API_ENDPOINTS = []
+# API_ENDPOINTS = ['http://192.168.1.8:9600/api/desktop', 'https://gbooking.giglabz.co.in/api/desktop']
+
+# Runtime tunables (API URL, loop timing); API_BASE_URL above is only the default.
+# See agent_tunables.py for the override file and live reloading.
+from agent_tunables import Tunables, TunablesWatcher
+TUNABLES = Tunables(defaults={'api_base_url': API_BASE_URL, 'api_endpoints': API_ENDPOINTS})
+
+# Span tracing of checks, probes and API calls, switched by the `tracing` tunable
+from agent_tracing import TRACER, traced, SPAN_KIND_CLIENT
+TRACER.configure(enabled=lambda: TUNABLES.tracing)
+
+# Local address on the route to the (preferred) API server, cached until the network changes
+from route_resolver import RouteResolver
+ROUTE_RESOLVER = RouteResolver(lambda: (TUNABLES.api_endpoints or (TUNABLES.api_base_url,))[0])
+
+# Choice among equivalent API endpoints (LAN / public), with failover
+from endpoint_selector import EndpointSelector
+
+from office_network_policy import OFFSITE, OFFSITE_DROP, OFFSITE_THIN
+
+# Deadline-bound final disconnect/logout, journaled for replay when they do not finish
+from shutdown_pipeline import ShutdownPipeline, install_signal_handlers
+from startup_pipeline import StartupPipeline, resolve_host, preconnect
+
+# Event POSTs in priority order from one sender; heartbeats coalesce under backpressure
+from outbound_queue import OutboundQueue
+
+# Latency histograms and error counts, summarised on every Nth heartbeat
+from agent_telemetry import AgentTelemetry
+
+# Timers falling due within this fraction of the check interval run in the same wakeup
+COALESCE_FRACTION = 0.25
+
+# Seconds before daily summaries are offered again to a server without /daily-summary (404)
+SUMMARY_UNSUPPORTED_BACKOFF = 6 * 3600
+
+# Seconds before an SSID probe command (netsh, PowerShell, nmcli, ...) is abandoned
+PROBE_TIMEOUT = 5
+
+# Server messages meaning the desktop session is gone and a new login is needed: the
+# inactive-session cleanup ended it, or another login on this device replaced its token (401)
+SESSION_LOST_MESSAGES = ("No active session found", "Desktop session not found")
+
+# Windows WLAN API bindings, declared once on first use and reused for every probe
+_WLAN_API = None
+
+def _load_wlan_api():
+    """Load wlanapi.dll and declare the structures used for SSID lookup"""
+    global _WLAN_API
+    if _WLAN_API is not None:
+        return _WLAN_API
+    
+    import ctypes
+    from ctypes import Structure, POINTER, c_wchar, c_ubyte, c_void_p
+    from ctypes.wintypes import DWORD, WORD, BYTE, ULONG, BOOL, HANDLE
+    
+    class GUID(Structure):
+        _fields_ = [("Data1", DWORD), ("Data2", WORD), ("Data3", WORD), ("Data4", BYTE * 8)]
+    
+    class WLAN_INTERFACE_INFO(Structure):
+        _fields_ = [
+            ("InterfaceGuid", GUID),
+            ("strInterfaceDescription", c_wchar * 256),
+            ("isState", DWORD)
+        ]
+    
+    class WLAN_INTERFACE_INFO_LIST(Structure):
+        _fields_ = [
+            ("dwNumberOfItems", DWORD),
+            ("dwIndex", DWORD),
+            ("InterfaceInfo", WLAN_INTERFACE_INFO * 1)
+        ]
+    
+    class DOT11_SSID(Structure):
+        _fields_ = [("uSSIDLength", ULONG), ("ucSSID", c_ubyte * 32)]
+    
+    class WLAN_ASSOCIATION_ATTRIBUTES(Structure):
+        _fields_ = [
+            ("dot11Ssid", DOT11_SSID),
+            ("dot11BssType", DWORD),
+            ("dot11Bssid", c_ubyte * 6),
+            ("dot11PhyType", DWORD),
+            ("uDot11PhyIndex", ULONG),
+            ("wlanSignalQuality", ULONG),
+            ("ulRxRate", ULONG),
+            ("ulTxRate", ULONG)
+        ]
+    
+    class WLAN_SECURITY_ATTRIBUTES(Structure):
+        _fields_ = [
+            ("bSecurityEnabled", BOOL),
+            ("bOneXEnabled", BOOL),
+            ("dot11AuthAlgorithm", DWORD),
+            ("dot11CipherAlgorithm", DWORD)
+        ]
+    
+    class WLAN_CONNECTION_ATTRIBUTES(Structure):
+        _fields_ = [
+            ("isState", DWORD),
+            ("wlanConnectionMode", DWORD),
+            ("strProfileName", c_wchar * 256),
+            ("wlanAssociationAttributes", WLAN_ASSOCIATION_ATTRIBUTES),
+            ("wlanSecurityAttributes", WLAN_SECURITY_ATTRIBUTES)
+        ]
+    
+    wlanapi = ctypes.windll.LoadLibrary('wlanapi.dll')
+    wlanapi.WlanOpenHandle.argtypes = [DWORD, c_void_p, POINTER(DWORD), POINTER(HANDLE)]
+    wlanapi.WlanEnumInterfaces.argtypes = [HANDLE, c_void_p, POINTER(POINTER(WLAN_INTERFACE_INFO_LIST))]
+    wlanapi.WlanQueryInterface.argtypes = [HANDLE, POINTER(GUID), DWORD, c_void_p,
+                                           POINTER(DWORD), POINTER(c_void_p), c_void_p]
+    wlanapi.WlanFreeMemory.argtypes = [c_void_p]
+    wlanapi.WlanCloseHandle.argtypes = [HANDLE, c_void_p]
+    
+    _WLAN_API = {
+        'dll': wlanapi,
+        'ctypes': ctypes,
+        'DWORD': DWORD,
+        'HANDLE': HANDLE,
+        'c_void_p': c_void_p,
+        'INTERFACE_INFO': WLAN_INTERFACE_INFO,
+        'INTERFACE_INFO_LIST': WLAN_INTERFACE_INFO_LIST,
+        'CONNECTION_ATTRIBUTES': WLAN_CONNECTION_ATTRIBUTES,
+    }
+    return _WLAN_API
+
+def _get_ssid_wlanapi():
+    """Return the SSID of the first connected WLAN interface, or None"""
+    api = _load_wlan_api()
+    ctypes = api['ctypes']
+    wlanapi = api['dll']
+    byref = ctypes.byref
+    
+    handle = api['HANDLE']()
+    negotiated_version = api['DWORD']()
+    if wlanapi.WlanOpenHandle(2, None, byref(negotiated_version), byref(handle)) != 0:
+        return None
+    
+    interfaces = ctypes.POINTER(api['INTERFACE_INFO_LIST'])()
+    try:
+        if wlanapi.WlanEnumInterfaces(handle, None, byref(interfaces)) != 0 or not interfaces:
+            return None
+        
+        items = ctypes.cast(interfaces.contents.InterfaceInfo,
+                            ctypes.POINTER(api['INTERFACE_INFO']))
+        for i in range(interfaces.contents.dwNumberOfItems):
+            data_size = api['DWORD']()
+            data = api['c_void_p']()
+            result = wlanapi.WlanQueryInterface(
+                handle,
+                byref(items[i].InterfaceGuid),
+                7,  # wlan_intf_opcode_current_connection
+                None,
+                byref(data_size),
+                byref(data),
+                None
+            )
+            if result != 0 or not data.value:
+                continue
+            try:
+                conn_info = ctypes.cast(data, ctypes.POINTER(api['CONNECTION_ATTRIBUTES'])).contents
+                if conn_info.isState == 1:  # wlan_interface_state_connected
+                    dot11_ssid = conn_info.wlanAssociationAttributes.dot11Ssid
+                    if dot11_ssid.uSSIDLength > 0:
+                        raw = bytes(dot11_ssid.ucSSID[:dot11_ssid.uSSIDLength])
+                        return raw.decode('utf-8', errors='replace')
+            finally:
+                wlanapi.WlanFreeMemory(data)
+        return None
+    finally:
+        if interfaces:
+            wlanapi.WlanFreeMemory(interfaces)
+        wlanapi.WlanCloseHandle(handle, None)
+
 
 class NetworkMonitor:
     """Class to monitor network connection and get network details"""
     
     @staticmethod
+    @traced('probe.get_mac_address')
     def get_mac_address():
         """Get the MAC address of the machine"""
         mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff)
@@ -103,23 +278,56 @@ class NetworkMonitor:
         return mac
     
     @staticmethod
+    @traced('probe.get_computer_name')
     def get_computer_name():
         """Get the computer hostname"""
         return socket.gethostname()
     
     @staticmethod
+    @traced('probe.get_ip_address')
     def get_ip_address():
-        """Get the IP address of the machine"""
+        """Get the IP address of the machine on the route to the API server"""
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
+            return ROUTE_RESOLVER.local_address()
         except Exception:
             return "127.0.0.1"  # Return localhost if can't determine IP
     
     @staticmethod
+    @traced('probe.get_current_bssid')
+    def get_current_bssid():
+        """Get the MAC address of the connected access point (None if unavailable)"""
+        try:
+            if sys.platform == 'win32':
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                output = subprocess.check_output(
+                    ['netsh', 'wlan', 'show', 'interfaces'],
+                    startupinfo=startupinfo,
+                    creationflags=0x08000000,
+                    stderr=subprocess.STDOUT,
+                    timeout=PROBE_TIMEOUT
+                ).decode('utf-8', errors='ignore')
+                for line in output.split('\n'):
+                    if 'BSSID' in line and ':' in line:
+                        return line.split(':', 1)[1].strip().lower() or None
+            elif sys.platform == 'darwin':
+                output = subprocess.check_output(
+                    ['/System/Library/PrivateFrameworks/Apple80211.framework/Resources/airport', '-I'],
+                    timeout=PROBE_TIMEOUT
+                ).decode('utf-8')
+                for line in output.split('\n'):
+                    if ' BSSID:' in line:
+                        return line.split(':', 1)[1].strip().lower() or None
+            elif sys.platform.startswith('linux'):
+                output = subprocess.check_output(['iwgetid', '-a', '-r'],
+                                                 timeout=PROBE_TIMEOUT).decode('utf-8').strip()
+                return output.lower() or None
+        except Exception as e:
+            log_to_file(f"BSSID detection failed: {str(e)}")
+        return None
+    
+    @staticmethod
+    @traced('probe.get_current_ssid')
     def get_current_ssid():
         """Get the current SSID using methods that don't show console windows"""
         ssid = "Unknown"
@@ -139,7 +347,8 @@ class NetworkMonitor:
                         ['netsh', 'wlan', 'show', 'interfaces'], 
                         startupinfo=startupinfo,
                         creationflags=create_no_window,
-                        stderr=subprocess.STDOUT
+                        stderr=subprocess.STDOUT,
+                        timeout=PROBE_TIMEOUT
                     ).decode('utf-8', errors='ignore')
                     
                     # Parse the output to find SSID
@@ -154,6 +363,7 @@ class NetworkMonitor:
                     
                     log_to_file(f"SSID detected via netsh: {ssid}")
                     if ssid != "Unknown":
+                        TRACER.annotate(ssid_source='netsh')
                         return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection via netsh failed: {str(e)}")
@@ -168,6 +378,7 @@ class NetworkMonitor:
                         if network.ProfileName:
                             ssid = network.ProfileName
                             log_to_file(f"SSID detected via WMI MSFT_WlanConnection: {ssid}")
+                            TRACER.annotate(ssid_source='wmi')
                             return ssid
                             
                     # Alternative WMI approach
@@ -177,6 +388,7 @@ class NetworkMonitor:
                                 connection_id = nic.NetConnectionID
                                 if connection_id:
                                     log_to_file(f"SSID detected via Win32_NetworkAdapter: {connection_id}")
+                                    TRACER.annotate(ssid_source='wmi_adapter')
                                     return connection_id
                 except Exception as e:
                     log_to_file(f"SSID detection via WMI failed: {str(e)}")
@@ -193,85 +405,25 @@ class NetworkMonitor:
                         ['powershell', '-Command', ps_command],
                         startupinfo=startupinfo,
                         creationflags=create_no_window,
-                        stderr=subprocess.STDOUT
+                        stderr=subprocess.STDOUT,
+                        timeout=PROBE_TIMEOUT
                     ).decode('utf-8', errors='ignore').strip()
                     
                     if output and output != "":
                         ssid = output
                         log_to_file(f"SSID detected via PowerShell: {ssid}")
+                        TRACER.annotate(ssid_source='powershell')
                         return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection via PowerShell failed: {str(e)}")
                 
                 # Method 4: Use the Windows API directly (no subprocess)
                 try:
-                    import ctypes
-                    from ctypes import windll, byref, Structure, POINTER, WINFUNCTYPE
-                    from ctypes.wintypes import DWORD, HANDLE, BOOL
-                    
-                    class WLAN_INTERFACE_INFO_LIST(Structure):
-                        pass
-                    
-                    wlanapi = windll.LoadLibrary('wlanapi.dll')
-                    
-                    # Open handle to WLAN API
-                    handle = HANDLE()
-                    client_version = DWORD()
-                    negotiated_version = DWORD()
-                    wlanapi.WlanOpenHandle(2, None, byref(client_version), byref(handle))
-                    
-                    # Enumerate interfaces
-                    interfaces = POINTER(WLAN_INTERFACE_INFO_LIST)()
-                    wlanapi.WlanEnumInterfaces(handle, None, byref(interfaces))
-                    
-                    # Get connection info for first interface with "connected" status (1)
-                    if interfaces and interfaces.contents.dwNumberOfItems > 0:
-                        from ctypes.wintypes import BYTE, UINT
-                        
-                        class DOT11_MAC_ADDRESS(Structure):
-                            _fields_ = [("ucDot11MacAddress", BYTE * 6)]
-                        
-                        class DOT11_SSID(Structure):
-                            _fields_ = [
-                                ("uSSIDLength", UINT),
-                                ("ucSSID", BYTE * 32)
-                            ]
-                        
-                        class WLAN_CONNECTION_ATTRIBUTES(Structure):
-                            _fields_ = [
-                                ("isState", UINT),
-                                ("wlanConnectionMode", UINT),
-                                ("strProfileName", ctypes.c_wchar * 256),
-                                ("dot11Ssid", DOT11_SSID),
-                                ("dot11BssType", UINT),
-                                ("dot11BssidList", DOT11_MAC_ADDRESS),
-                                ("wlanSignalQuality", UINT),
-                                ("rxRate", UINT),
-                                ("txRate", UINT)
-                            ]
-                        
-                        conn_info = POINTER(WLAN_CONNECTION_ATTRIBUTES)()
-                        for i in range(interfaces.contents.dwNumberOfItems):
-                            interface_guid = interfaces.contents.InterfaceInfo[i].InterfaceGuid
-                            wlanapi.WlanQueryInterface(
-                                handle,
-                                byref(interface_guid),
-                                7,  # wlan_intf_opcode_current_connection
-                                None,
-                                byref(client_version),
-                                byref(conn_info),
-                                None
-                            )
-                            if conn_info and conn_info.contents.isState == 1:  # connected
-                                ssid_bytes = conn_info.contents.dot11Ssid.ucSSID
-                                ssid_len = conn_info.contents.dot11Ssid.uSSIDLength
-                                if ssid_len > 0:
-                                    ssid = "".join(chr(ssid_bytes[i]) for i in range(ssid_len))
-                                    log_to_file(f"SSID detected via Windows API: {ssid}")
-                                    return ssid
-                    
-                    # Clean up
-                    wlanapi.WlanCloseHandle(handle, None)
+                    ssid = _get_ssid_wlanapi() or "Unknown"
+                    if ssid != "Unknown":
+                        log_to_file(f"SSID detected via Windows API: {ssid}")
+                        TRACER.annotate(ssid_source='wlanapi')
+                        return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection via Windows API failed: {str(e)}")
             
@@ -280,12 +432,14 @@ class NetworkMonitor:
                 try:
                     # Method 1: Using airport command
                     output = subprocess.check_output(
-                        ['/System/Library/PrivateFrameworks/Apple80211.framework/Resources/airport', '-I']
+                        ['/System/Library/PrivateFrameworks/Apple80211.framework/Resources/airport', '-I'],
+                        timeout=PROBE_TIMEOUT
                     ).decode('utf-8')
                     for line in output.split('\n'):
                         if ' SSID:' in line:
                             ssid = line.split(':')[1].strip()
                             log_to_file(f"SSID detected via airport command: {ssid}")
+                            TRACER.annotate(ssid_source='airport')
                             return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection on macOS failed: {str(e)}")
@@ -294,10 +448,11 @@ class NetworkMonitor:
             elif sys.platform.startswith('linux'):
                 try:
                     # Method 1: Using iwgetid
-                    output = subprocess.check_output(['iwgetid', '-r']).decode('utf-8').strip()
+                    output = subprocess.check_output(['iwgetid', '-r'], timeout=PROBE_TIMEOUT).decode('utf-8').strip()
                     if output:
                         ssid = output
                         log_to_file(f"SSID detected via iwgetid: {ssid}")
+                        TRACER.annotate(ssid_source='iwgetid')
                         return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection via iwgetid failed: {str(e)}")
@@ -305,17 +460,20 @@ class NetworkMonitor:
                 try:
                     # Method 2: Using nmcli (NetworkManager)
                     output = subprocess.check_output(
-                        ['nmcli', '-t', '-f', 'active,ssid', 'dev', 'wifi']
+                        ['nmcli', '-t', '-f', 'active,ssid', 'dev', 'wifi'],
+                        timeout=PROBE_TIMEOUT
                     ).decode('utf-8')
                     for line in output.split('\n'):
                         if line.startswith('yes:'):
                             ssid = line.split(':')[1]
                             log_to_file(f"SSID detected via nmcli: {ssid}")
+                            TRACER.annotate(ssid_source='nmcli')
                             return ssid
                 except Exception as e:
                     log_to_file(f"SSID detection via nmcli failed: {str(e)}")
             
             log_to_file(f"All SSID detection methods failed, returning: {ssid}")
+            TRACER.annotate(ssid_source='none')
             return ssid
                 
         except Exception as outer_e:
@@ -326,46 +484,161 @@ class NetworkMonitor:
 class ApiClient:
     """Class to handle API communication with the server"""
     
-    def __init__(self):
+    def __init__(self, clock=None, network=None, tunables=None):
         self.access_token = None
         self.user_data = None
+        self.mac_address = None  # as sent with the last login, reused by the shutdown disconnect
         self.session = requests.Session()
         self.connected = False
         self.connection_start_time = None
         self.last_heartbeat_time = None
+        
+        # Time source and network probes (replaceable for simulation)
+        self.clock = clock or time
+        self.network = network or NetworkMonitor
+        self.tunables = tunables or TUNABLES
+        
+        # Fastest reachable of the configured endpoints (just api_base_url by default)
+        self.endpoints = EndpointSelector(self.tunables)
+        
+        # Events and summaries go through the outbound queue (sent inline until it is started)
+        self.outbound = OutboundQueue(self._deliver, self.tunables)
+        self._session_lost = False  # a queued heartbeat found no session on the server
+        
+        # Fleet telemetry (see agent_telemetry.py); attached to every Nth heartbeat
+        self.telemetry = AgentTelemetry(self.clock)
+        self._heartbeats = 0
     
-    def login(self, email, password):
-        """Authenticate with the server"""
+    @property
+    def base_url(self):
+        """Current API base URL (may change at runtime via tunables or endpoint failover)"""
+        return self.endpoints.current()
+    
+    def _apply_server_tunables(self, response_data):
+        """Apply tunables the server attached to a response, if any"""
+        data = response_data.get('data')
+        if isinstance(data, dict) and isinstance(data.get('tunables'), dict):
+            self.tunables.apply_server(data['tunables'])
+    
+    def _request(self, method, path, **kwargs):
+        """Send to the current endpoint; if it cannot be reached, resend once on the next one
+        
+        Only connection failures fail over: the request never reached the server, so sending
+        it again is safe. The session (and its Authorization header) is shared by all endpoints.
+        """
+        base_url = self.base_url
+        started = time.perf_counter()
+        try:
+            try:
+                response = self.session.request(method, f"{base_url}{path}", **kwargs)
+            except requests.exceptions.ConnectionError:
+                fallback = self.endpoints.report_failure(base_url)
+                if fallback == base_url:
+                    raise
+                print(f"API endpoint {base_url} unreachable, failing over to {fallback}")
+                self.telemetry.record_failover()
+                response = self.session.request(method, f"{fallback}{path}", **kwargs)
+        except requests.exceptions.Timeout:
+            self.telemetry.record_request(time.perf_counter() - started, error='timeout')
+            raise
+        except requests.exceptions.RequestException:
+            self.telemetry.record_request(time.perf_counter() - started, error='connection')
+            raise
+        self.telemetry.record_request(time.perf_counter() - started, response.status_code)
+        return response
+    
+    def _post(self, path, payload=None, timeout=None, headers=None):
+        """POST to the API with the configured timeout, traced as a client span"""
+        with TRACER.span(f"POST {path}", SPAN_KIND_CLIENT, **{'http.method': 'POST'}) as span:
+            request_headers = dict(TRACER.headers() or {})
+            request_headers.update(headers or {})
+            response = self._request('POST', path, json=payload,
+                                     timeout=timeout or self.tunables.request_timeout,
+                                     headers=request_headers or None)
+            span.set(**{'http.status_code': response.status_code})
+            return response
+    
+    def post_as(self, path, payload, token, timeout=None):
+        """POST with an explicit token and timeout (shutdown and journal replay); returns (status, message)"""
+        try:
+            response = self._post(path, payload, timeout=timeout,
+                                  headers={'Authorization': f"Bearer {token}"})
+            try:
+                message = response.json().get('message', '')
+            except ValueError:
+                message = ''
+            return response.status_code, message
+        except Exception as e:
+            return 0, str(e)
+    
+    def _deliver(self, item):
+        """Send one outbound item with the token it was queued under; returns (status, response JSON)"""
+        response = self._post(item.path, item.payload, headers={'Authorization': f"Bearer {item.token}"})
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {}
+    
+    def _send_event(self, kind, payload, path="/track-connection", key=None):
+        """Queue an event and wait for the server's answer up to request_timeout
+        
+        Returns the answered item, or None when the event is still queued (or was journaled);
+        it is then delivered later and never dropped.
+        """
+        item = self.outbound.submit(kind, path, payload, self.access_token, key=key)
+        if not item.wait(self.tunables.request_timeout) or item.dropped:
+            return None
+        if item.error:
+            raise requests.exceptions.RequestException(item.error)
+        return item
+    
+    def reset(self):
+        """Forget the logged-in user but keep the HTTP session and its connection pool"""
+        self.outbound.clear()
+        self._session_lost = False
+        self.access_token = None
+        self.user_data = None
+        self.session.headers.pop('Authorization', None)
+        self.connected = False
+        self.connection_start_time = None
+        self.last_heartbeat_time = None
+    
+    @traced('api.login')
+    def login(self, email, password, timeout=None, mac_address=None, ssid=None):
+        """Authenticate with the server (probes the MAC address and SSID unless given)"""
         try:
             payload = {
                 "email": email,
                 "password": password,
-                "macAddress": NetworkMonitor.get_mac_address(),
-                "ssid": NetworkMonitor.get_current_ssid()
+                "macAddress": mac_address or self.network.get_mac_address(),
+                "ssid": ssid or self.network.get_current_ssid()
             }
             
-            response = self.session.post(f"{API_BASE_URL}/login", json=payload)
+            response = self._post("/login", payload, timeout=timeout)
             response_data = response.json()
             
             if response.status_code == 200 and response_data.get('success'):
                 self.access_token = response_data['data']['accessToken']
                 self.user_data = response_data['data']
+                self.mac_address = payload['macAddress']
                 self.session.headers.update({
                     'Authorization': f"Bearer {self.access_token}"
                 })
+                self._apply_server_tunables(response_data)
                 return True, response_data['message']
             else:
                 return False, response_data.get('message', 'Login failed')
         except Exception as e:
             return False, f"Login error: {str(e)}"
     
+    @traced('api.logout')
     def logout(self):
         """Logout from the server"""
         if not self.access_token:
             return True, "Not logged in"
         
         try:
-            response = self.session.post(f"{API_BASE_URL}/logout")
+            response = self._post("/logout", self.logout_payload())
             response_data = response.json()
             
             if response.status_code == 200 and response_data.get('success'):
@@ -378,97 +651,229 @@ class ApiClient:
         except Exception as e:
             return False, f"Logout error: {str(e)}"
     
-    def track_connection(self, is_connect=True):
-        """Record connection/disconnection events"""
+    @traced('api.track_connection')
+    def track_connection(self, is_connect=True, ssid=None):
+        """Record connection/disconnection events (probes the SSID unless given)"""
         if not self.access_token:
             return False, "Not authenticated"
         
         try:
-            current_time = int(time.time())
+            current_time = int(self.clock.time())
             formatted_time = datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')
             
             if is_connect:
                 payload = {
                     "event_type": "connect",
-                    "ssid": NetworkMonitor.get_current_ssid(),
+                    "ssid": ssid or self.network.get_current_ssid(),
                     "email": self.user_data['email'],
-                    "ip_address": NetworkMonitor.get_ip_address(),
-                    "mac_address": NetworkMonitor.get_mac_address(),
-                    "computer_name": NetworkMonitor.get_computer_name(),
+                    "ip_address": self.network.get_ip_address(),
+                    "mac_address": self.network.get_mac_address(),
+                    "computer_name": self.network.get_computer_name(),
                     "connection_start_time": current_time,
                     "connection_start_time_formatted": formatted_time
                 }
                 self.connection_start_time = current_time
                 self.connected = True
             else:
-                # Calculate duration
-                duration = 0
-                if self.connection_start_time:
-                    duration = current_time - self.connection_start_time
-                
-                # Format duration as HH:MM:SS
-                hours, remainder = divmod(duration, 3600)
-                minutes, seconds = divmod(remainder, 60)
-                duration_formatted = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
-                
-                payload = {
-                    "event_type": "disconnect",
-                    "ssid": NetworkMonitor.get_current_ssid(),
-                    "email": self.user_data['email'],
-                    "mac_address": NetworkMonitor.get_mac_address(),
-                    "connection_duration": duration,
-                    "connection_duration_formatted": duration_formatted
-                }
+                payload = self.disconnect_payload(ssid)
                 self.connected = False
             
-            response = self.session.post(f"{API_BASE_URL}/track-connection", json=payload)
-            response_data = response.json()
+            item = self._send_event(payload['event_type'], payload)
+            if item is None:
+                return True, "Queued for delivery"
             
-            if response.status_code == 200 and response_data.get('success'):
-                return True, response_data['message']
+            if item.status == 200 and item.data.get('success'):
+                return True, item.data['message']
             else:
-                return False, response_data.get('message', 'Tracking failed')
+                return False, item.data.get('message', 'Tracking failed')
         except Exception as e:
             return False, f"Tracking error: {str(e)}"
     
+    def disconnect_payload(self, ssid=None):
+        """Body of a disconnect event for the current connection, stamped with the current time.
+        Probes the SSID unless given; the MAC address sent at login is reused."""
+        current_time = int(self.clock.time())
+        
+        # Calculate duration
+        duration = 0
+        if self.connection_start_time:
+            duration = current_time - self.connection_start_time
+        
+        # Format duration as HH:MM:SS
+        hours, remainder = divmod(duration, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        duration_formatted = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
+        
+        return {
+            "event_type": "disconnect",
+            "ssid": ssid or self.network.get_current_ssid(),
+            "email": self.user_data['email'],
+            "mac_address": self.mac_address or self.network.get_mac_address(),
+            "connection_duration": duration,
+            "connection_duration_formatted": duration_formatted,
+            # Lets the server keep the real end time when the disconnect is replayed later
+            "disconnect_time": current_time
+        }
+    
+    def logout_payload(self):
+        """Body of a logout request, stamped with the current time"""
+        return {"logout_time": int(self.clock.time())}
+    
+    @traced('api.fetch_network_policy')
+    def fetch_network_policy(self, etag=None):
+        """Fetch the office network policy; returns (status, policy, etag), status 304 if unchanged"""
+        if not self.access_token:
+            return 0, None, None
+        
+        try:
+            headers = dict(TRACER.headers() or {})
+            if etag:
+                headers['If-None-Match'] = etag
+            response = self._request('GET', "/network-policy", headers=headers,
+                                     timeout=self.tunables.request_timeout)
+            if response.status_code != 200:
+                return response.status_code, None, None
+            response_data = response.json()
+            return 200, response_data.get('data'), response.headers.get('ETag')
+        except Exception as e:
+            print(f"Network policy error: {str(e)}")
+            return 0, None, None
+    
+    @traced('api.send_daily_summary')
+    def send_daily_summary(self, summary):
+        """Upload one day's locally computed attendance summary"""
+        if not self.access_token:
+            return False, "Not authenticated"
+        
+        try:
+            payload = dict(summary)
+            payload.update({
+                "email": self.user_data['email'],
+                "mac_address": self.network.get_mac_address()
+            })
+            
+            # Still queued: upload again later (a newer upload of the day replaces the queued one)
+            item = self._send_event('summary', payload, path="/daily-summary", key=summary.get('date'))
+            if item is None:
+                return False, "Summary upload queued"
+            
+            if item.status == 200 and item.data.get('success'):
+                return True, item.data['message']
+            elif item.status == 404:
+                return False, "Daily summary endpoint not found"
+            else:
+                return False, item.data.get('message', 'Summary upload failed')
+        except Exception as e:
+            return False, f"Summary upload error: {str(e)}"
+    
+    @traced('api.send_idle')
+    def send_idle(self, idle_since, locked=False):
+        """Report the user away since idle_since; ends the connection until the next connect"""
+        if not self.connected:
+            return False, "Not connected"
+        
+        try:
+            payload = {
+                "event_type": "idle",
+                "ssid": self.network.get_current_ssid(),
+                "email": self.user_data['email'],
+                "mac_address": self.network.get_mac_address(),
+                "idle_since": int(idle_since),
+                "reason": "locked" if locked else "idle"
+            }
+            self.connected = False
+            
+            item = self._send_event('idle', payload)
+            if item is None:
+                return True, "Queued for delivery"
+            
+            if item.status == 200 and item.data.get('success'):
+                return True, item.data['message']
+            else:
+                return False, item.data.get('message', 'Idle report failed')
+        except Exception as e:
+            return False, f"Idle report error: {str(e)}"
+    
+    @traced('api.send_heartbeat')
     def send_heartbeat(self):
-        """Send heartbeat to server to confirm connection is still active"""
+        """Send heartbeat to server to confirm connection is still active
+        
+        With the outbound queue running this returns at once ("Heartbeat queued"); a
+        missing session reported for a queued heartbeat is returned by the next call.
+        """
         if not self.connected:
             return False, "Not connected"
+        
+        if self._session_lost:
+            self._session_lost = False
+            return False, "Session not found"
             
         try:
-            current_time = int(time.time())
+            current_time = int(self.clock.time())
             formatted_time = datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')
             
             payload = {
                 "event_type": "heartbeat",
-                "ssid": NetworkMonitor.get_current_ssid(),
+                "ssid": self.network.get_current_ssid(),
                 "email": self.user_data['email'],
-                "ip_address": NetworkMonitor.get_ip_address(),
-                "mac_address": NetworkMonitor.get_mac_address(),
-                "computer_name": NetworkMonitor.get_computer_name(),
+                "ip_address": self.network.get_ip_address(),
+                "mac_address": self.network.get_mac_address(),
+                "computer_name": self.network.get_computer_name(),
                 "heartbeat_time": current_time,
                 "heartbeat_time_formatted": formatted_time
             }
             
-            response = self.session.post(f"{API_BASE_URL}/track-connection", json=payload)
-            response_data = response.json()
+            # Fleet telemetry on the first and then every Nth heartbeat (0 turns it off)
+            every = self.tunables.telemetry_heartbeats
+            if every and self._heartbeats % every == 0:
+                payload["telemetry"] = self.telemetry_summary()
+            self._heartbeats += 1
             
-            if response.status_code == 200 and response_data.get('success'):
-                self.last_heartbeat_time = current_time
-                print(f"Heartbeat sent successfully at {formatted_time}")
-                return True, response_data['message']
-            else:
-                print(f"Heartbeat failed: {response_data.get('message', 'Unknown error')}")
-                
-                # If server cannot find the session, try to reconnect
-                if "No active session found" in response_data.get('message', ''):
-                    print("Session not found on server, attempting to reconnect...")
-                    return False, "Session not found"
-                
-                return False, response_data.get('message', 'Heartbeat failed')
+            item = self.outbound.submit('heartbeat', "/track-connection", payload, self.access_token,
+                                        on_done=self._heartbeat_done)
+            if not item.done.is_set():
+                return True, "Heartbeat queued"
+            
+            # Sent inline
+            self._session_lost = False
+            if item.error:
+                return False, f"Heartbeat error: {item.error}"
+            return item.outcome or (False, "Heartbeat failed")
         except Exception as e:
             return False, f"Heartbeat error: {str(e)}"
+    
+    def telemetry_summary(self):
+        """Versioned telemetry summary with the current retry, journal and queue counts"""
+        journal = self.outbound.journal
+        try:
+            journal_depth = len(journal.pending()) if journal is not None else 0
+        except Exception:
+            journal_depth = 0
+        return self.telemetry.summary(retries=self.outbound.counters['retried'], journal=journal_depth,
+                                      queue=self.outbound.metrics()['depth'])
+    
+    def _heartbeat_done(self, item):
+        """Handle the server's answer to a heartbeat; returns (success, message)"""
+        if item.error:
+            print(f"Heartbeat error: {item.error}")
+            return False, f"Heartbeat error: {item.error}"
+        
+        response_data = item.data
+        if item.status == 200 and response_data.get('success'):
+            self.last_heartbeat_time = item.payload['heartbeat_time']
+            self._apply_server_tunables(response_data)
+            print(f"Heartbeat sent successfully at {item.payload['heartbeat_time_formatted']}")
+            return True, response_data['message']
+        else:
+            print(f"Heartbeat failed: {response_data.get('message', 'Unknown error')}")
+            
+            # If server cannot find the session, try to reconnect
+            if any(text in response_data.get('message', '') for text in SESSION_LOST_MESSAGES):
+                print("Session not found on server, attempting to reconnect...")
+                self._session_lost = True
+                return False, "Session not found"
+            
+            return False, response_data.get('message', 'Heartbeat failed')
 
 
 class ConfigManager:
@@ -528,17 +933,88 @@ class ConfigManager:
 class OfficeAgent:
     """Main agent class for monitoring network and tracking attendance"""
     
-    def __init__(self, email=None, password=None):
+    def __init__(self, email=None, password=None, clock=None, network=None, ledger=None,
+                 tunables=None, policy_store=None, shutdown_journal=None, power_monitor=None,
+                 activity_monitor=None, link_monitor=None):
+        # Time source and network probes (replaceable for simulation)
+        self.clock = clock or time
+        self.network = network or NetworkMonitor
+        self.platform = sys.platform
+        self.tunables = tunables or TUNABLES
+        
         # API client
-        self.api_client = ApiClient()
+        self.api_client = ApiClient(clock=self.clock, network=self.network, tunables=self.tunables)
         
         # Store credentials
         self.email = email
         self.password = password
         
-        # Current status
+        # Current status; clearing is_running wakes the loop (see _wait_until)
+        self._wake = threading.Event()
         self.is_running = False
         self.previous_ssid = "Unknown"
+        self._last_probe = None  # (time, local IP) of the last SSID probe
+        self._network_key = None  # (SSID, local IP) at the last check
+        
+        # Optional local attendance ledger (see attendance_ledger.py)
+        self.ledger = ledger
+        self._summaries_uploaded_for = None
+        self._summaries_retry_at = 0
+        
+        # Optional office network policy (see office_network_policy.py)
+        self.policy_store = policy_store
+        self.network_class = None
+        
+        # Optional journal of shutdown requests that did not finish (see shutdown_pipeline.py);
+        # also takes queued events that cannot stay in the outbound queue
+        self.shutdown_journal = shutdown_journal
+        self.api_client.outbound.journal = shutdown_journal
+        
+        # Optional power source monitor; stretches the loop on battery (see power_state.py)
+        self.power_monitor = power_monitor
+        self.power_state = None
+        
+        # Optional user activity monitor; pauses heartbeats while locked/idle (see user_activity.py)
+        self.activity_monitor = activity_monitor
+        self.away_since = None
+        
+        # Optional link state monitor; real connects/disconnects on Windows/Linux (see link_state.py)
+        self.link_monitor = link_monitor
+        self._link_ssid = None  # SSID of the reported connection, None while unknown
+        
+        # Step timings of the last authenticate() (see startup_pipeline.py)
+        self.startup_report = None
+        self._checked_at_startup = False
+        
+        # Re-plan the loop's deadline as soon as a tunable changes
+        self.tunables.subscribe(lambda changed: self.wake())
+    
+    @property
+    def is_running(self):
+        return self._running
+    
+    @is_running.setter
+    def is_running(self, value):
+        self._running = bool(value)
+        if not value:
+            self._wake.set()
+    
+    def wake(self):
+        """Interrupt the loop's wait so it re-evaluates its deadlines"""
+        self._wake.set()
+    
+    def reset(self):
+        """Return to the logged-out state, reusing the existing API client"""
+        self.is_running = False
+        self.email = None
+        self.password = None
+        self.previous_ssid = "Unknown"
+        self._last_probe = None
+        self.away_since = None
+        self._link_ssid = None
+        if self.ledger:
+            self.ledger.close()
+        self.api_client.reset()
         
     def initialize(self, gui_get_credentials=None):
         """Initialize the agent
@@ -547,6 +1023,16 @@ class OfficeAgent:
             gui_get_credentials: Optional function to get credentials via GUI
                                 Should return (email, password) tuple or (None, None) if canceled
         """
+        if not self.resolve_credentials(gui_get_credentials):
+            return False
+        success, message = self.authenticate()
+        return success
+    
+    def resolve_credentials(self, gui_get_credentials=None):
+        """Find credentials (given, saved or from the GUI); no network access
+        
+        Returns True when an email and password are available.
+        """
         # If no credentials provided, try to load from config
         if not self.email or not self.password:
             self.email, self.password = ConfigManager.load_credentials()
@@ -564,45 +1050,304 @@ class OfficeAgent:
         if not self.email or not self.password:
             print("No credentials available")
             return False
+        return True
+    
+    def authenticate(self, cancelled=None, on_progress=None):
+        """Log in and report the first connect; safe to run off the GUI thread
         
-        # Authenticate
-        try:
+        Runs as a dependency graph (see startup_pipeline.py): identity, the SSID probe, DNS
+        and the pre-connect to the API host overlap, and the one SSID probe feeds both the
+        login and the first connect. Timings end up in self.startup_report.
+        
+        Args:
+            cancelled: Optional threading.Event; once set, steps not yet started are skipped
+                       and a login that completes anyway is undone
+            on_progress: Optional callback receiving short status strings for a UI
+        Returns (success, message).
+        """
+        statuses = {'journal': "Status: Contacting server...", 'login': "Status: Signing in..."}
+        
+        def on_step(name):
+            if on_progress and name in statuses:
+                on_progress(statuses[name])
+        
+        def credentials(results):
+            if not self.resolve_credentials():
+                raise ValueError("No credentials available")
+            return self.email
+        
+        def login(results):
             print(f"Attempting to login with email: {self.email}")
-            print(f"API URL: {API_BASE_URL}")
-            success, message = self.api_client.login(self.email, self.password)
-            
+            print(f"API URL: {self.api_client.base_url}")
+            # Authenticate (bounded by login_timeout per request)
+            success, message = self.api_client.login(
+                self.email, self.password, timeout=self.tunables.login_timeout,
+                mac_address=results['identity'], ssid=results['ssid'])
+            if not success:
+                raise ValueError(message)
+            return message
+        
+        def connect(results):
+            self.check_network(results['ssid'])
+            self._checked_at_startup = True
+            return self.api_client.connected
+        
+        url = self.api_client.base_url
+        pipeline = StartupPipeline(cancelled, on_step)
+        pipeline.add('credentials', credentials)
+        pipeline.add('identity', lambda results: self.network.get_mac_address())
+        pipeline.add('ssid', lambda results: self._probe_ssid())
+        # DNS and the pre-connect only warm caches; a failure must not block the login
+        pipeline.add('dns', self._warmup(lambda results: resolve_host(url)))
+        pipeline.add('route', lambda results: self.network.get_ip_address(), deps=['dns'])
+        pipeline.add('preconnect', self._warmup(lambda results: preconnect(self.api_client.session, url)),
+                     deps=['dns'])
+        # Deliver the disconnect/logout of an earlier shutdown first, with its own token
+        pipeline.add('journal', lambda results: self.replay_shutdown_journal(), deps=['preconnect'])
+        pipeline.add('login', login, deps=['credentials', 'identity', 'ssid', 'journal'])
+        pipeline.add('policy', lambda results: self.refresh_policy(), deps=['login'])
+        pipeline.add('connect', connect, deps=['policy', 'ssid', 'route'])
+        
+        pipeline.run()
+        self.startup_report = pipeline.report()
+        print(f"Startup: {self.startup_report}")
+        
+        success = 'login' in pipeline.results
+        if cancelled is not None and cancelled.is_set():
             if success:
-                print(f"Successfully logged in: {message}")
-                # Save credentials for next time
-                try:
-                    ConfigManager.save_credentials(self.email, self.password)
-                    print(f"Credentials saved to {CONFIG_FILE}")
-                except Exception as config_error:
-                    print(f"Warning: Could not save credentials: {str(config_error)}")
-                return True
+                # Nobody is waiting for this session any more
+                self.api_client.logout()
+                self.api_client.reset()
+            if self.ledger:
+                self.ledger.close()  # The connect step may already have opened a session
+            self._checked_at_startup = False
+            print("Login cancelled")
+            return False, "Login cancelled"
+        
+        if success:
+            message = pipeline.results['login']
+            print(f"Successfully logged in: {message}")
+            # Save credentials for next time
+            try:
+                ConfigManager.save_credentials(self.email, self.password)
+                print(f"Credentials saved to {CONFIG_FILE}")
+            except Exception as config_error:
+                print(f"Warning: Could not save credentials: {str(config_error)}")
+        else:
+            message = pipeline.errors.get('credentials') or pipeline.errors.get('login', 'Login failed')
+            print(f"Login failed: {message}")
+        return success, message
+    
+    @staticmethod
+    def _warmup(function):
+        """Wrap a cache-warming step so a failure is logged instead of failing its dependents"""
+        def run(results):
+            try:
+                return function(results)
+            except Exception as e:
+                print(f"Startup warm-up failed: {str(e)}")
+                return None
+        return run
+    
+    @traced('agent.recover_session')
+    def recover_session(self):
+        """Log in again and reconnect after the server dropped our desktop session"""
+        if not self.email or not self.password:
+            return False, "No credentials available"
+        
+        success, message = self.api_client.login(self.email, self.password)
+        if not success:
+            return False, message
+        return self.api_client.track_connection(is_connect=True)
+    
+    def replay_shutdown_journal(self):
+        """Resend shutdown requests that did not finish last time"""
+        if not self.shutdown_journal:
+            return
+        try:
+            self.shutdown_journal.replay(self.api_client)
+        except Exception as e:
+            print(f"Error replaying shutdown journal: {str(e)}")
+    
+    def track_connection(self, is_connect=True, ssid=None):
+        """Report a connect/disconnect to the server and record it in the local ledger"""
+        if self.ledger:
+            if is_connect:
+                self.ledger.open()
             else:
-                print(f"Login failed: {message}")
-                return False
+                self.ledger.close()
+        return self.api_client.track_connection(is_connect=is_connect, ssid=ssid)
+    
+    def refresh_policy(self, force=False):
+        """Revalidate the office network policy with the server when due"""
+        if not self.policy_store or not self.api_client.access_token:
+            return
+        try:
+            if self.policy_store.refresh(self.api_client, force=force):
+                print(f"Office network policy updated: {self.policy_store.policy.data}")
         except Exception as e:
-            print(f"Authentication error: {str(e)}")
-            raise
+            print(f"Error refreshing network policy: {str(e)}")
+    
+    def classify_network(self, ssid):
+        """OFFICE/OFFSITE for the current network, or None when no policy is loaded"""
+        policy = self.policy_store.policy if self.policy_store else None
+        if policy is None:
+            return None
+        bssid = None
+        if policy.uses_bssid and hasattr(self.network, 'get_current_bssid'):
+            bssid = self.network.get_current_bssid()
+        return policy.classify(ssid, self.network.get_ip_address(), bssid)
+    
+    def _suppress_offsite(self):
+        """True when the policy says not to report anything from the current network"""
+        return (self.network_class == OFFSITE
+                and self.policy_store.policy.offsite_action == OFFSITE_DROP)
+    
+    def _heartbeat_cycles(self):
+        """Network checks per heartbeat; far fewer heartbeats off-site when thinning"""
+        if self.network_class == OFFSITE and self.policy_store.policy.offsite_action == OFFSITE_THIN:
+            return max(self.tunables.heartbeat_cycles, self.policy_store.policy.offsite_heartbeat_cycles)
+        return self.tunables.heartbeat_cycles
+    
+    def _on_battery(self):
+        return self.power_state is not None and self.power_state.on_battery
+    
+    def _cycle_intervals(self):
+        """Seconds between network checks and between heartbeats for the current power source
+        
+        On battery both stretch by the power factor, but a stretched heartbeat stays
+        under battery_heartbeat_cap so the server does not clean up the session.
+        """
+        if self.power_monitor:
+            state = self.power_monitor.state()
+            if repr(state) != repr(self.power_state):
+                print(f"Power source: {state}")
+            self.power_state = state
+        factor = self.power_state.interval_factor(self.tunables) if self.power_state else 1.0
+        
+        check_interval = self.tunables.check_interval
+        heartbeat_interval = check_interval * self._heartbeat_cycles()
+        stretched = heartbeat_interval * factor
+        if stretched > heartbeat_interval:
+            heartbeat_interval = max(heartbeat_interval, min(stretched, self.tunables.battery_heartbeat_cap))
+        return check_interval * factor, heartbeat_interval
+    
+    def _probe_ssid(self):
+        """Current SSID; on battery the probe is skipped while the local address is unchanged
+        and the last probe is younger than one (unstretched) heartbeat interval"""
+        now = self.clock.time()
+        if self._on_battery() and self._last_probe is not None:
+            probed_at, ip_address = self._last_probe
+            max_age = self.tunables.check_interval * self.tunables.heartbeat_cycles
+            if now - probed_at < max_age and self.network.get_ip_address() == ip_address:
+                return self.previous_ssid
+        started = time.perf_counter()
+        ssid = self.network.get_current_ssid()
+        self.api_client.telemetry.record_probe(time.perf_counter() - started)
+        self._last_probe = (now, self.network.get_ip_address())
+        return ssid
+    
+    def _wait_until(self, deadline):
+        """Sleep until the deadline, a stop or a wake() call, whichever comes first"""
+        remaining = deadline - self.clock.time()
+        if remaining <= 0:
+            return
+        if self.clock is time:
+            self._wake.wait(remaining)
+        else:
+            self.clock.sleep(remaining)  # Virtual clock (simulation)
+    
+    def upload_daily_summaries(self):
+        """Upload summaries of finished days from the local ledger (once per day)"""
+        if not self.ledger or not self.api_client.access_token:
+            return
+        
+        now = self.clock.time()
+        today = datetime.fromtimestamp(now).date()
+        if self._summaries_uploaded_for == today or now < self._summaries_retry_at:
+            return
+        
+        for summary in self.ledger.pending_summaries():
+            success, message = self.api_client.send_daily_summary(summary)
+            if not success:
+                print(f"Daily summary upload failed: {message}")
+                if message == "Daily summary endpoint not found":
+                    # Older server: don't retry on every heartbeat
+                    self._summaries_retry_at = now + SUMMARY_UNSUPPORTED_BACKOFF
+                return
+            self.ledger.mark_uploaded(summary['date'])
+        self._summaries_uploaded_for = today
     
-    def check_network(self):
-        """Check network status and handle connections/disconnections"""
+    def check_activity(self, on_status=None):
+        """Pause reporting while the session is locked or idle; returns True while away
+        
+        Going away sends one "idle" event (the server closes the open record at the time
+        input stopped) instead of heartbeats; coming back reports a fresh connect.
+        """
+        if not self.activity_monitor:
+            return False
+        
+        state = self.activity_monitor.state()
+        away = state.is_away(self.tunables)
+        if away and self.away_since is None:
+            self.away_since = self.clock.time() - (state.idle_seconds or 0)
+            print(f"User away ({state}), pausing heartbeats")
+            if self.api_client.connected:
+                if self.ledger:
+                    self.ledger.close(self.away_since)
+                success, message = self.api_client.send_idle(self.away_since, state.locked)
+                if not success and "Invalid event type" in message:
+                    # Server without idle support: end the record with a plain disconnect
+                    self.api_client.connected = True
+                    success, message = self.api_client.track_connection(is_connect=False)
+                print(f"Idle reported: {message}")
+            if on_status:
+                on_status("Status: Paused (away)")
+        elif not away and self.away_since is not None:
+            print(f"User back after {int(self.clock.time() - self.away_since)}s, resuming")
+            self.away_since = None
+            self.previous_ssid = "Unknown"  # Report the current network as a new connection
+            if on_status:
+                on_status("Status: Running")
+        return away
+    
+    @traced('agent.check_network')
+    def check_network(self, current_ssid=None):
+        """Check network status and handle connections/disconnections
+        
+        Args:
+            current_ssid: SSID probed by the caller (startup); probed here when None
+        """
         try:
-            current_ssid = NetworkMonitor.get_current_ssid()
+            if current_ssid is None:
+                current_ssid = self._probe_ssid()
             
             # Print current status
             print(f"Current network: {current_ssid}")
             
-            # For Windows Subsystem for Linux (WSL) or when can't detect network properly
+            # On a network change, re-pick the API endpoint (the LAN path on arriving at the office)
+            network_key = (current_ssid, self.network.get_ip_address())
+            if self._network_key is not None and network_key != self._network_key:
+                self.api_client.endpoints.network_changed()
+            self._network_key = network_key
+            
+            # Classify against the office network policy (None without a policy)
+            self.network_class = self.classify_network(current_ssid)
+            suppress = self._suppress_offsite()
+            
+            # The SSID probe is unreliable on Windows/Linux (wired, WSL): follow the link state
+            if (self.platform == 'win32' or 'linux' in self.platform.lower()) and self.link_monitor:
+                self._reconcile_link(current_ssid, suppress)
+            
+            # Without a link monitor (WSL or when can't detect network properly)
             # Just assume we're connected to make the agent work
-            if sys.platform == 'win32' or 'linux' in sys.platform.lower():
-                # If we previously weren't connected, try to connect now
-                if self.previous_ssid == "Unknown" and not self.api_client.connected:
+            elif self.platform == 'win32' or 'linux' in self.platform.lower():
+                # Whenever no connection is reported, try to connect now (also on returning
+                # from an unreported off-site network, or when the session began off-site)
+                if not self.api_client.connected and not suppress:
                     print("Forcing connection in Windows/Linux environment")
                     try:
-                        success, message = self.api_client.track_connection(is_connect=True)
+                        success, message = self.track_connection(is_connect=True, ssid=current_ssid)
                         if success:
                             print(f"Forced connection: {message}")
                             self.api_client.connected = True
@@ -615,35 +1360,47 @@ class OfficeAgent:
             else:
                 # Handle connections
                 if current_ssid != "Unknown" and self.previous_ssid == "Unknown":
-                    success, message = self.api_client.track_connection(is_connect=True)
-                    if success:
-                        print(f"Connected to {current_ssid}: {message}")
+                    if suppress:
+                        print(f"Off-site network {current_ssid}: connection not reported")
                     else:
-                        print(f"Connection tracking failed: {message}")
+                        success, message = self.track_connection(is_connect=True, ssid=current_ssid)
+                        if success:
+                            print(f"Connected to {current_ssid}: {message}")
+                        else:
+                            print(f"Connection tracking failed: {message}")
                 
-                # Handle disconnections
+                # Handle disconnections (none to report if the connection was never reported)
                 elif current_ssid == "Unknown" and self.previous_ssid != "Unknown":
-                    success, message = self.api_client.track_connection(is_connect=False)
-                    if success:
-                        print(f"Disconnected from {self.previous_ssid}: {message}")
-                    else:
-                        print(f"Disconnection tracking failed: {message}")
+                    if not suppress or self.api_client.connected:
+                        success, message = self.track_connection(is_connect=False)
+                        if success:
+                            print(f"Disconnected from {self.previous_ssid}: {message}")
+                        else:
+                            print(f"Disconnection tracking failed: {message}")
                 
                 # Handle SSID changes (when connected to a different network)
                 elif current_ssid != "Unknown" and self.previous_ssid != "Unknown" and current_ssid != self.previous_ssid:
                     # First disconnect from previous network
-                    success, message = self.api_client.track_connection(is_connect=False)
+                    success, message = self.track_connection(is_connect=False)
                     if success:
                         print(f"Disconnected from {self.previous_ssid}: {message}")
                     else:
                         print(f"Disconnection tracking failed: {message}")
                     
                     # Then connect to new network
-                    success, message = self.api_client.track_connection(is_connect=True)
-                    if success:
-                        print(f"Connected to {current_ssid}: {message}")
+                    if suppress:
+                        print(f"Off-site network {current_ssid}: connection not reported")
                     else:
-                        print(f"Connection tracking failed: {message}")
+                        success, message = self.track_connection(is_connect=True, ssid=current_ssid)
+                        if success:
+                            print(f"Connected to {current_ssid}: {message}")
+                        else:
+                            print(f"Connection tracking failed: {message}")
+            
+            # Close a connection still open after moving to an unreported off-site network
+            if suppress and self.api_client.connected:
+                success, message = self.track_connection(is_connect=False)
+                print(f"Disconnected on leaving the office network: {message}")
             
             # Update previous SSID
             self.previous_ssid = current_ssid
@@ -651,6 +1408,44 @@ class OfficeAgent:
         except Exception as e:
             print(f"Error in check_network: {str(e)}")
     
+    def _reconcile_link(self, current_ssid, suppress):
+        """Bring the reported connection in line with the debounced link state
+        
+        Link down closes the open record, link up opens one, and a move between two
+        known SSIDs closes and reopens it. An SSID that turns "Unknown" while the link
+        stays up is a probe failure and reports nothing.
+        """
+        link = self.link_monitor.update(current_ssid, self.tunables.link_debounce)
+        
+        if link.up and self.api_client.connected and link.ssid and self._link_ssid \
+                and link.ssid != self._link_ssid:
+            success, message = self.track_connection(is_connect=False)
+            if success:
+                print(f"Disconnected from {self._link_ssid}: {message}")
+            else:
+                print(f"Disconnection tracking failed: {message}")
+        
+        if not link.up and self.api_client.connected:
+            success, message = self.track_connection(is_connect=False)
+            if success:
+                print(f"Link down, disconnected: {message}")
+            else:
+                print(f"Disconnection tracking failed: {message}")
+        elif link.up and not self.api_client.connected:
+            if suppress:
+                print(f"Off-site network {current_ssid}: connection not reported")
+            else:
+                success, message = self.track_connection(is_connect=True, ssid=current_ssid)
+                if success:
+                    print(f"Link up ({link}), connected: {message}")
+                else:
+                    print(f"Connection tracking failed: {message}")
+        
+        if not link.up:
+            self._link_ssid = None
+        elif link.ssid:
+            self._link_ssid = link.ssid
+    
     def run(self):
         """Run the agent in a loop"""
         if not self.initialize():
@@ -658,76 +1453,127 @@ class OfficeAgent:
             return
         
         self.is_running = True
-        heartbeat_counter = 0
         
-        # Set up signal handling for proper termination
-        import signal
-        
-        def signal_handler(sig, frame):
-            print("\nStopping Office Agent...")
-            self.stop()
+        # Stop with a bounded final disconnect on Ctrl+C, SIGTERM (OS shutdown) and console close
+        def on_session_end(reason):
+            print(f"\nStopping Office Agent ({reason})...")
+            self.stop(reason=reason)
             sys.exit(0)
         
-        # Register the signal handler for SIGINT (Ctrl+C)
-        signal.signal(signal.SIGINT, signal_handler)
+        install_signal_handlers(on_session_end)
         
         print("Office Agent is running. Press Ctrl+C to exit.")
         
-        # Initial network check
-        self.check_network()
-        
         try:
-            while self.is_running:
-                # Use shorter sleep intervals to check for interruption more frequently
-                for _ in range(6):  # 6 x 5 seconds = 30 seconds
-                    time.sleep(5)
-                    if not self.is_running:
-                        break
-                        
+            self.run_loop()
+        except KeyboardInterrupt:
+            print("\nStopping Office Agent via KeyboardInterrupt...")
+            self.stop()
+    
+    def run_loop(self, on_status=None):
+        """Network check / heartbeat loop; runs until is_running is cleared
+        
+        Args:
+            on_status: Optional callback receiving short status strings for a UI
+        """
+        # Initial policy revalidation and network check, unless authenticate() just did both
+        if not self._checked_at_startup:
+            self.refresh_policy()
+            self.check_network()
+        self._checked_at_startup = False
+        last_check = last_heartbeat = self.clock.time()
+        
+        while self.is_running:
+            try:
+                # One wakeup per deadline: the earlier of the next check and the next heartbeat.
+                # Stops and tunable changes interrupt the wait and the deadlines are re-planned.
+                self._wake.clear()
                 if not self.is_running:
                     break
+                check_interval, heartbeat_interval = self._cycle_intervals()
+                next_check = last_check + check_interval
+                next_heartbeat = last_heartbeat + heartbeat_interval
+                self._wait_until(min(next_check, next_heartbeat))
                 
-                # Check network
-                self.check_network()
+                if not self.is_running:
+                    break
+                now = self.clock.time()
+                slack = check_interval * COALESCE_FRACTION
+                check_due = now + slack >= next_check
+                heartbeat_due = now + slack >= next_heartbeat
+                if not check_due and not heartbeat_due:
+                    continue  # Woken early
                 
-                # Send heartbeat every 2 minutes (4 cycles)
-                heartbeat_counter += 1
-                if heartbeat_counter >= 4:
-                    if self.api_client.connected:
-                        success, message = self.api_client.send_heartbeat()
-                        if not success and message == "Session not found":
-                            # Force reconnect
-                            self.api_client.track_connection(is_connect=True)
+                # One trace per cycle: network check, heartbeat and summary uploads
+                with TRACER.span('agent.cycle'):
+                    # Check network (not while the user is away)
+                    if check_due:
+                        if not self.check_activity(on_status):
+                            self.check_network()
+                        last_check = now
                     
-                    heartbeat_counter = 0
-                
-        except KeyboardInterrupt:
-            print("\nStopping Office Agent via KeyboardInterrupt...")
-            self.stop()
+                    # Send heartbeat every heartbeat interval (2 minutes by default)
+                    if heartbeat_due:
+                        if self.api_client.connected:
+                            success, message = self.api_client.send_heartbeat()
+                            if not success and message == "Session not found":
+                                # Force reconnect; if the server dropped the whole desktop
+                                # session (e.g. inactive-session cleanup), log in again first
+                                success, message = self.api_client.track_connection(is_connect=True)
+                                if not success and any(text in message for text in SESSION_LOST_MESSAGES):
+                                    success, message = self.recover_session()
+                                print(f"Forced reconnection due to session not found: {message}")
+                                if on_status and success:
+                                    on_status("Status: Reconnected")
+                        
+                        if self.ledger:
+                            self.ledger.checkpoint()  # Bounds what a crash can lose of the open session
+                        last_heartbeat = now
+                        outbound = self.api_client.outbound.metrics()
+                        if outbound['depth']:
+                            print(f"Outbound queue backlog: {outbound}")
+                        if self.away_since is None:
+                            self.upload_daily_summaries()
+                            self.refresh_policy()
+                            self.replay_shutdown_journal()
+            except Exception as e:
+                print(f"Error in agent loop iteration: {str(e)}")
+                # Continue running despite errors in a single iteration
+                self._wait_until(self.clock.time() + self.tunables.check_interval)
+                last_check = last_heartbeat = self.clock.time()
     
-    def stop(self):
-        """Properly stop the agent"""
-        self.is_running = False
-        
-        # Disconnect if connected
-        if self.api_client.connected:
-            success, message = self.api_client.track_connection(is_connect=False)
-            if success:
-                print(f"Disconnected: {message}")
-            else:
-                print(f"Failed to disconnect: {message}")
-            
-        # Logout
-        success, message = self.api_client.logout()
-        if success:
-            print(f"Logged out: {message}")
-        else:
-            print(f"Failed to logout: {message}")
+    def stop(self, reason='stop', deadline=None):
+        """Stop the agent: final disconnect and logout, concurrently and within the shutdown deadline
         
+        Requests that do not finish in time stay in the shutdown journal for the next start.
+        Returns the pipeline's result dict.
+        """
+        result = ShutdownPipeline(self, self.shutdown_journal, deadline).run(reason)
+        print(f"Disconnect: {result['disconnect']}, logout: {result['logout']} "
+              f"({result['elapsed_s']:.2f}s, {result.get('journaled', 0)} journaled)")
         print("Office Agent stopped.")
+        return result
 
 
 if __name__ == "__main__":
+    if '--selftest' in sys.argv:
+        from agent_selftest import main as selftest
+        sys.exit(selftest(sys.argv[1:]))
+    
+    from attendance_ledger import AttendanceLedger
+    from office_network_policy import PolicyStore
+    from shutdown_pipeline import ShutdownJournal
+    from power_state import PowerMonitor
+    from user_activity import ActivityMonitor
+    from link_state import LinkMonitor
+    
+    # Pick up tunables from the local file and follow later edits
+    TunablesWatcher(TUNABLES).start()
+    
     # Create and run the agent
-    agent = OfficeAgent()
+    agent = OfficeAgent(ledger=AttendanceLedger(), policy_store=PolicyStore(),
+                        shutdown_journal=ShutdownJournal(), power_monitor=PowerMonitor(),
+                        activity_monitor=ActivityMonitor(), link_monitor=LinkMonitor())
+    agent.api_client.endpoints.start()
+    agent.api_client.outbound.start()
     agent.run()
\ No newline at end of file
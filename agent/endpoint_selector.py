@@ -0,0 +1,243 @@
+"""
+API endpoint selection for the Office Agent.
+
+The same server is often reachable under several base URLs: the office LAN
+address and the public hostname. List them, in order of preference, in the
+`api_endpoints` tunable and the agent uses the fastest reachable one instead of
+hairpinning through the public URL from inside the office:
+
+    {"api_endpoints": ["http://192.168.1.8:9600/api/desktop",
+                       "https://gbooking.giglabz.co.in/api/desktop"]}
+
+Endpoints are health-probed by TCP connect time, in the background every
+`endpoint_probe_interval` seconds and right away when the network changes.
+The client sticks to its endpoint and only moves when
+
+    - a request cannot reach it (ApiClient fails over and resends the request,
+      with the same session and Authorization header, to the next endpoint)
+    - another healthy endpoint is at least twice as fast
+    - the network changed, in which case the fastest endpoint wins outright
+
+With a single endpoint (the default: api_base_url alone) nothing is probed.
+
+Failover benchmark (LAN endpoint lost mid-session, then back):
+    python endpoint_selector.py --bench
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from urllib.parse import urlparse
+
+from agent_tunables import log
+
+PROBE_TIMEOUT = 1.5       # seconds per TCP connect probe
+SWITCH_RATIO = 0.5        # a healthy endpoint this much faster replaces the current one...
+SWITCH_MIN_GAIN = 0.005   # ...when it also saves at least this many seconds
+
+
+def tcp_probe(url, timeout=PROBE_TIMEOUT):
+    """Seconds to open a TCP connection to the endpoint's host, None when unreachable"""
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    started = time.perf_counter()
+    try:
+        sock = socket.create_connection((parsed.hostname, port), timeout)
+    except OSError:
+        return None
+    sock.close()
+    return time.perf_counter() - started
+
+
+class EndpointSelector:
+    """Sticky choice among equivalent API base URLs, with health probing and failover"""
+
+    def __init__(self, tunables, probe=None):
+        self.tunables = tunables
+        self.probe = probe or tcp_probe
+        self.latency = {}   # url -> seconds at the last probe, None when it failed
+        self.switches = 0
+        self._current = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def endpoints(self):
+        return list(self.tunables.api_endpoints) or [self.tunables.api_base_url]
+
+    def current(self):
+        """Base URL to use for the next request"""
+        endpoints = self.endpoints()
+        if len(endpoints) == 1:
+            return endpoints[0]
+        with self._lock:
+            if self._current in endpoints:
+                return self._current
+        # First use, or the endpoint list changed: measure instead of guessing
+        self.probe_all(reselect=True)
+        with self._lock:
+            return self._current or endpoints[0]
+
+    def probe_all(self, reselect=False):
+        """Probe every endpoint concurrently and update the choice"""
+        endpoints = self.endpoints()
+        results = {}
+
+        def measure(url):
+            results[url] = self.probe(url, PROBE_TIMEOUT)
+
+        threads = [threading.Thread(target=measure, args=(url,), daemon=True) for url in endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(PROBE_TIMEOUT + 1)
+
+        with self._lock:
+            self.latency = {url: results.get(url) for url in endpoints}
+            self._select(self._choose(endpoints, reselect))
+        return dict(self.latency)
+
+    def _choose(self, endpoints, reselect):
+        current = self._current if self._current in endpoints else None
+        healthy = [url for url in endpoints if self.latency.get(url) is not None]
+        if not healthy:
+            return current or endpoints[0]
+        best = min(healthy, key=lambda url: (self.latency[url], endpoints.index(url)))
+        if reselect or current not in healthy:
+            return best
+        gain = self.latency[current] - self.latency[best]
+        if self.latency[best] <= self.latency[current] * SWITCH_RATIO and gain >= SWITCH_MIN_GAIN:
+            return best
+        return current
+
+    def _select(self, url):
+        if url != self._current:
+            if self._current is not None:
+                self.switches += 1
+            log(f"API endpoint: {url} (probed: {self.latency})")
+            self._current = url
+
+    def report_failure(self, url):
+        """A request could not reach url; returns the endpoint to retry on (url itself when none)"""
+        endpoints = self.endpoints()
+        if len(endpoints) == 1:
+            return url
+        with self._lock:
+            self.latency[url] = None
+            if self._current not in (url, None):
+                return self._current  # Another request already failed over
+            others = [other for other in endpoints if other != url]
+            healthy = sorted((other for other in others if self.latency.get(other) is not None),
+                             key=lambda other: self.latency[other])
+            self._select((healthy or others)[0])
+            fallback = self._current
+        self._wake.set()  # Re-probe soon so a recovered endpoint is noticed
+        return fallback
+
+    def network_changed(self):
+        """Re-pick from scratch after a network change (e.g. the LAN path on arriving at the office)"""
+        if len(self.endpoints()) > 1:
+            self.probe_all(reselect=True)
+
+    def start(self):
+        """Probe in the background every endpoint_probe_interval seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='EndpointProbe', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                if len(self.endpoints()) > 1:
+                    self.probe_all()
+            except Exception as e:
+                log(f"Endpoint probe failed: {str(e)}")
+            self._wake.wait(self.tunables.endpoint_probe_interval)
+            self._wake.clear()
+
+
+# ===== Benchmark =====
+
+def run_benchmark(heartbeats=20, lan_rtt=0.001, public_rtt=0.040):
+    """Two endpoints for one backend; the LAN one goes away mid-session and comes back.
+    The public endpoint's extra round-trip time is added to its probe (both run locally)."""
+    from desktop_agent_fixed import ApiClient
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+    from fault_proxy import FaultProxy, StaticNetwork
+
+    lan = FaultProxy().start()
+    public = FaultProxy().start()
+    public.backend, public.backend_lock = lan.backend, lan.backend_lock
+    lan_port = lan.server.server_address[1]
+    # Two proxies over one backend stand in for the LAN and public paths to one server
+    lan_url, public_url = lan.url, public.url
+    extra = {lan_url: lan_rtt, public_url: public_rtt}
+
+    def probe(url, timeout):
+        latency = tcp_probe(url, timeout)
+        return None if latency is None else latency + extra[url]
+
+    def name(url):
+        return 'lan' if url == lan_url else 'public'
+
+    tunables = Tunables(defaults={'api_endpoints': [public_url, lan_url]})
+    client = ApiClient(network=StaticNetwork(0), tunables=tunables)
+    client.endpoints = EndpointSelector(tunables, probe=probe)
+    report = {}
+    with quiet_agent():
+        client.login('failover@bench.local', 'bench')
+        client.track_connection(is_connect=True)
+        report['initial_endpoint'] = name(client.base_url)
+
+        # LAN path goes away (e.g. switch reboot); heartbeats must keep working.
+        # Connections already open are reset, new ones refused.
+        lan.script.set_mode('reset')
+        lan.stop()
+        proxies = [lan, public]
+        started = time.perf_counter()
+        failed = sum(0 if client.send_heartbeat()[0] else 1 for _ in range(heartbeats))
+        report['endpoint_after_lan_loss'] = name(client.base_url)
+        report['heartbeats_failed'] = failed
+        report['heartbeats_sent'] = heartbeats
+        report['time_for_heartbeats_s'] = round(time.perf_counter() - started, 3)
+
+        # LAN back; the next network change moves the agent onto it again
+        lan = FaultProxy(port=lan_port).start()
+        lan.backend, lan.backend_lock = public.backend, public.backend_lock
+        proxies.append(lan)
+        client.endpoints.network_changed()
+        report['endpoint_after_network_change'] = name(client.base_url)
+        report['heartbeat_after_return'] = client.send_heartbeat()[0]
+        client.logout()
+
+    report['logins'] = sum(1 for proxy in proxies for r in proxy.requests if r[2].endswith('/login'))
+    report['requests_by_endpoint'] = {'lan': sum(len(proxy.requests) for proxy in proxies if proxy is not public),
+                                      'public': len(public.requests)}
+    report['switches'] = client.endpoints.switches
+    lan.stop()
+    public.stop()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent API endpoint selection")
+    parser.add_argument('--bench', action='store_true', help="Run the failover benchmark")
+    parser.add_argument('endpoints', nargs='*', help="Endpoints to probe once")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(), indent=2))
+        return 0
+    for url in args.endpoints:
+        latency = tcp_probe(url)
+        print(f"{url}: {'unreachable' if latency is None else f'{latency * 1000:.1f} ms'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Fault-injecting HTTP stand-in for /api/desktop/* and an agent recovery benchmark.
+
+The proxy answers like desktop.controller.js (using the simulator's in-process
+backend) or forwards to a real server with --upstream, and injects faults:
+
+    ok          normal responses
+    latency     responses delayed by --latency seconds
+    error       HTTP 5xx bursts
+    reset       TCP connection resets (RST) before any response
+    no_session  server forgets every desktop session, so the agent sees
+                "No active session found for this device"
+    slowloris   response body dribbled out one byte at a time
+
+Run the proxy on its own:
+    python fault_proxy.py --port 9700 --script outage.json
+
+Benchmark real ApiClient/OfficeAgent loops through each fault (the agent cadence
+is scaled down to 1 s checks; recovery lag is also reported in check intervals):
+    python fault_proxy.py --bench --agents 50
+"""
+
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAULT_MODES = ('ok', 'latency', 'error', 'reset', 'no_session', 'slowloris')
+
+
+class FaultScript:
+    """Sequence of (duration, mode, options) phases, timed from start()"""
+
+    def __init__(self, phases=None):
+        self.phases = phases or [{'duration': None, 'mode': 'ok'}]
+        self.started = None
+        self._lock = threading.Lock()
+        self._override = None
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def start(self):
+        self.started = time.monotonic()
+
+    def set_mode(self, mode, **options):
+        """Override the script with a fixed phase (used by the benchmark)"""
+        with self._lock:
+            self._override = dict(options, mode=mode) if mode else None
+
+    def current(self):
+        with self._lock:
+            if self._override:
+                return self._override
+        elapsed = time.monotonic() - (self.started or time.monotonic())
+        for phase in self.phases:
+            duration = phase.get('duration')
+            if duration is None or elapsed < duration:
+                return phase
+            elapsed -= duration
+        return {'mode': 'ok'}
+
+
+class FaultProxy:
+    """Threaded HTTP server injecting faults in front of a desktop API backend"""
+
+    def __init__(self, host='127.0.0.1', port=0, script=None, upstream=None):
+        from agent_simulator import SimulatedBackend
+
+        self.script = script or FaultScript()
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.backend = SimulatedBackend(keep_log=False)
+        self.backend_lock = threading.Lock()
+        self.requests = []      # (time, agent email, path, event_type, mode, status)
+        self.requests_lock = threading.Lock()
+        self._wiped_phase = None
+
+        proxy = self
+
+        class Handler(FaultHandler):
+            pass
+
+        Handler.proxy = proxy
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/desktop"
+
+    def start(self):
+        self.script.start()
+        self._thread = threading.Thread(target=self.server.serve_forever, name='FaultProxy')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record(self, agent, path, event_type, mode, status):
+        with self.requests_lock:
+            self.requests.append((time.monotonic(), agent, path, event_type, mode, status))
+
+    def wipe_sessions_once(self, phase):
+        """Forget all desktop sessions once per no_session phase"""
+        with self.backend_lock:
+            if self._wiped_phase is not phase:
+                self._wiped_phase = phase
+                self.backend.sessions.clear()
+                self.backend.active_records.clear()
+
+    def respond(self, method, path, headers, payload):
+        """Status and JSON body from the upstream server or the in-process backend"""
+        if self.upstream:
+            return self._forward(method, path, headers, payload)
+        with self.backend_lock:
+            response = self.backend.handle(0, time.time(), True, method, path, headers, payload)
+        return response.status_code, response.json()
+
+    def _forward(self, method, path, headers, payload):
+        base = self.upstream[:-len('/api/desktop')] if self.upstream.endswith('/api/desktop') else self.upstream
+        body = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(base + path, data=body, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if headers.get('Authorization'):
+            request.add_header('Authorization', headers['Authorization'])
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'{}')
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            return 502, {'success': False, 'message': f"Upstream unavailable: {str(e)}"}
+
+
+class FaultHandler(BaseHTTPRequestHandler):
+    """Request handler applying the proxy's current fault phase"""
+
+    proxy = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = None
+        event_type = (payload or {}).get('event_type')
+        agent = (payload or {}).get('email')
+
+        phase = self.proxy.script.current()
+        mode = phase.get('mode', 'ok')
+
+        if mode == 'reset':
+            self.proxy.record(agent, self.path, event_type, mode, 0)
+            self._reset_connection()
+            return
+        if mode == 'error':
+            status = phase.get('status', 503)
+            self.proxy.record(agent, self.path, event_type, mode, status)
+            self._send_json(status, {'success': False, 'message': 'Internal server error'})
+            return
+        if mode == 'latency':
+            time.sleep(phase.get('latency', 2.0))
+        if mode == 'no_session':
+            self.proxy.wipe_sessions_once(phase)
+
+        status, body = self.proxy.respond(method, self.path, dict(self.headers), payload)
+        self.proxy.record(agent, self.path, event_type, mode, status)
+        if mode == 'slowloris':
+            self._send_json(status, body, drip_interval=phase.get('interval', 0.5))
+        else:
+            self._send_json(status, body)
+
+    def _send_json(self, status, body, drip_interval=None):
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if drip_interval is None:
+                self.wfile.write(data)
+                return
+            for i in range(len(data)):
+                self.wfile.write(data[i:i + 1])
+                self.wfile.flush()
+                time.sleep(drip_interval)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client gave up (e.g. its timeout fired)
+
+    def _reset_connection(self):
+        """Abort the TCP connection so the client sees ECONNRESET"""
+        self.close_connection = True
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+        except OSError:
+            pass
+
+    def finish(self):
+        try:
+            super().finish()
+        except (OSError, ValueError):
+            pass  # Socket already reset or closed by the client
+
+
+# ===== Recovery benchmark =====
+
+class StaticNetwork:
+    """Network probes that always report the office network"""
+
+    def __init__(self, agent_id):
+        self.mac_address = '02:00:01:%02x:%02x:%02x' % (
+            (agent_id >> 16) & 0xff, (agent_id >> 8) & 0xff, agent_id & 0xff)
+        self.computer_name = f"BENCH-{agent_id:05d}"
+
+    def get_current_ssid(self):
+        return 'GIGLABZ_5G'
+
+    def get_ip_address(self):
+        return '192.168.100.50'
+
+    def get_mac_address(self):
+        return self.mac_address
+
+    def get_computer_name(self):
+        return self.computer_name
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_scenario(mode, agents=20, warmup=6.0, outage=8.0, recovery=16.0,
+                 check_interval=1.0, heartbeat_cycles=4, request_timeout=2.0, **options):
+    """Drive agent loops through one fault and measure recovery"""
+    from desktop_agent_fixed import OfficeAgent
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+
+    proxy = FaultProxy().start()
+    agent_list = []
+    threads = []
+    try:
+        with quiet_agent():
+            for agent_id in range(agents):
+                tunables = Tunables()
+                tunables.apply_file({
+                    'api_base_url': proxy.url,
+                    'check_interval': check_interval,
+                    'heartbeat_cycles': heartbeat_cycles,
+                    'request_timeout': request_timeout,
+                })
+                agent = OfficeAgent(f"bench{agent_id}@sim.local", 'simulated',
+                                    network=StaticNetwork(agent_id), tunables=tunables)
+                agent.platform = 'linux'
+                agent.api_client.login(agent.email, agent.password)
+                agent.is_running = True
+                thread = threading.Thread(target=agent.run_loop, daemon=True)
+                thread.start()
+                agent_list.append(agent)
+                threads.append(thread)
+
+            time.sleep(warmup)
+            outage_start = time.monotonic()
+            proxy.script.set_mode(mode, **options)
+            time.sleep(outage)
+            outage_end = time.monotonic()
+            proxy.script.set_mode(None)
+            time.sleep(recovery)
+
+            for agent in agent_list:
+                agent.is_running = False
+            for thread in threads:
+                thread.join(request_timeout + check_interval + 1)
+    finally:
+        proxy.stop()
+
+    return analyze(proxy.requests, agents, outage_start, outage_end, warmup,
+                   check_interval)
+
+
+def analyze(requests_log, agents, outage_start, outage_end, warmup, check_interval):
+    """Time-to-recover, outage traffic and reconnect spike from the proxy's request log"""
+    during = [r for r in requests_log if outage_start <= r[0] < outage_end]
+    after = [r for r in requests_log if r[0] >= outage_end]
+    before = [r for r in requests_log if outage_start - warmup / 2 <= r[0] < outage_start]
+
+    # Per agent: the first degraded request opens its outage, the next successful
+    # track-connection closes it. Recovery lag is how long after the fault ended that took.
+    failed_at = {}
+    recovered_at = {}
+    for when, agent, path, _, mode, status in requests_log:
+        if when < outage_start or agent in recovered_at:
+            continue
+        degraded = mode in ('latency', 'error', 'reset', 'slowloris') or status >= 400
+        if degraded:
+            failed_at.setdefault(agent, when)
+        elif agent in failed_at and path.endswith('/track-connection') and status == 200:
+            recovered_at[agent] = when
+    downtime = [recovered_at[a] - failed_at[a] for a in recovered_at]
+    lag = [max(0.0, recovered_at[a] - outage_end) for a in recovered_at]
+
+    def per_second(entries, start, end):
+        buckets = {}
+        for entry in entries:
+            if start <= entry[0] < end:
+                key = int(entry[0] - start)
+                buckets[key] = buckets.get(key, 0) + 1
+        return buckets
+
+    baseline_window = max(warmup / 2, 1e-9)
+    baseline_rate = len(before) / baseline_window
+    spike_buckets = per_second(after, outage_end, outage_end + 10 * check_interval)
+    spike_peak = max(spike_buckets.values()) if spike_buckets else 0
+
+    return {
+        'affected_agents': len(failed_at),
+        'unrecovered_agents': len(failed_at) - len(recovered_at),
+        'requests_during_outage': len(during),
+        'requests_during_outage_per_agent': round(len(during) / agents, 2),
+        'downtime_p50_s': _round(_percentile(downtime, 0.5)),
+        'recovery_lag_p50_s': _round(_percentile(lag, 0.5)),
+        'recovery_lag_max_s': _round(max(lag) if lag else None),
+        # In network-check intervals, comparable with the agent's real 30 s cadence
+        'recovery_lag_max_checks': _round(max(lag) if lag else None, 1.0 / check_interval),
+        'baseline_requests_per_s': round(baseline_rate, 2),
+        'reconnect_spike_peak_per_s': spike_peak,
+        'reconnect_spike_ratio': round(spike_peak / baseline_rate, 2) if baseline_rate else None,
+        'logins': sum(1 for r in during + after if r[2].endswith('/login')),
+    }
+
+
+def _round(value, scale=1.0):
+    return None if value is None else round(value * scale, 2)
+
+
+def run_benchmark(agents=20, modes=None, **kwargs):
+    results = {}
+    for mode in modes or ('error', 'reset', 'latency', 'no_session', 'slowloris'):
+        options = {}
+        if mode == 'latency':
+            options['latency'] = 3.0   # longer than the benchmark's request timeout
+        if mode == 'slowloris':
+            options['interval'] = 0.2
+        print(f"Running scenario: {mode} ({agents} agents)...", file=sys.stderr)
+        results[mode] = run_scenario(mode, agents=agents, **dict(kwargs, **options))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fault-injecting stand-in for /api/desktop")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9700)
+    parser.add_argument('--script', help="JSON list of phases: {duration, mode, ...options}")
+    parser.add_argument('--upstream', help="Forward to this API base URL instead of the built-in backend")
+    parser.add_argument('--bench', action='store_true', help="Run the recovery benchmark")
+    parser.add_argument('--agents', type=int, default=20, help="Agents per benchmark scenario")
+    parser.add_argument('--modes', help="Comma-separated fault modes to benchmark")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        modes = args.modes.split(',') if args.modes else None
+        print(json.dumps(run_benchmark(args.agents, modes), indent=2))
+        return 0
+
+    script = FaultScript.from_file(args.script) if args.script else FaultScript()
+    proxy = FaultProxy(args.host, args.port, script, args.upstream).start()
+    print(f"Fault proxy listening on {proxy.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        proxy.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
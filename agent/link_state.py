@@ -0,0 +1,352 @@
+"""
+Link state for the Office Agent on Windows and Linux.
+
+The SSID probe is unreliable on these platforms: it reports "Unknown" on wired
+machines and under WSL, and netsh / nmcli occasionally fail for a check while
+Wi-Fi is fine. The agent therefore used to force a single connect and never
+report a disconnect, leaving the attendance record open through every outage.
+
+With a LinkMonitor, connects and disconnects follow the operating system's
+view of the link instead (see OfficeAgent._reconcile_link):
+
+    Linux    interface of the default route (rtnetlink, else /proc/net/route) and
+             its operstate / carrier in /sys/class/net
+    Windows  GetBestInterface for the default route and the interface's
+             operational status from GetIfEntry
+
+The link is up while either the OS says so or an SSID is joined. The SSID only
+identifies the network: a change between two known SSIDs is a move (disconnect
+then connect), while a known SSID turning "Unknown" with the link still up is a
+probe failure and reports nothing. A change has to be seen on `link_debounce`
+consecutive network checks before it is reported, so short Wi-Fi drops do not
+split the day into many records.
+
+    python link_state.py              # current link state of this machine
+    python link_state.py --bench      # event counts on recorded network timelines
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+
+from route_resolver import FALLBACK_TARGET, netlink_route_source, proc_route_interface
+
+SYS_CLASS_NET = '/sys/class/net'
+
+# operstate values of an interface that cannot carry traffic (RFC 2863)
+LINUX_DOWN_STATES = ('down', 'lowerlayerdown', 'notpresent', 'dormant')
+
+# INTERNAL_IF_OPER_STATUS of MIB_IFROW
+IF_OPER_STATUS_CONNECTED = 4
+IF_OPER_STATUS_OPERATIONAL = 5
+
+# Transitions shorter than this are flaps when counting the ideal events of a timeline
+FLAP_SECONDS = 60
+
+
+class LinkState:
+    """Link up/down, the joined SSID when known (None: wired, WSL or probe failure)"""
+
+    def __init__(self, up, ssid=None, interface=None):
+        self.up = bool(up)
+        self.ssid = ssid
+        self.interface = interface
+
+    def differs(self, other):
+        """True for a change worth reporting: up/down, or a move between two known SSIDs"""
+        if self.up != other.up:
+            return True
+        return self.up and bool(self.ssid and other.ssid) and self.ssid != other.ssid
+
+    def __repr__(self):
+        details = ''.join(f" {value}" for value in (self.ssid, self.interface) if value)
+        return f"LinkState({'up' if self.up else 'down'}{details})"
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def linux_link_state(target_ip=FALLBACK_TARGET):
+    """Default route interface and its operstate/carrier; down without a route"""
+    interface = None
+    try:
+        _, index = netlink_route_source(target_ip)
+        interface = socket.if_indextoname(index) if index else None
+    except OSError as e:
+        if e.errno == 101:  # ENETUNREACH: no route at all
+            return LinkState(False)
+    except Exception:
+        pass
+    if interface is None:
+        try:
+            interface = proc_route_interface(target_ip)
+        except (OSError, StopIteration):
+            return None
+        if interface is None:
+            return LinkState(False)
+
+    # Virtual interfaces (WSL, VPN, some USB adapters) report "unknown" and no carrier file
+    operstate = _read(os.path.join(SYS_CLASS_NET, interface, 'operstate'))
+    carrier = _read(os.path.join(SYS_CLASS_NET, interface, 'carrier'))
+    up = operstate not in LINUX_DOWN_STATES and carrier != '0'
+    return LinkState(up, interface=interface)
+
+
+def windows_link_state(target_ip=FALLBACK_TARGET):
+    """Best interface for the default route and its operational status; down without a route"""
+    import ctypes
+    from ctypes import wintypes
+
+    class MIB_IFROW(ctypes.Structure):
+        _fields_ = [('wszName', wintypes.WCHAR * 256), ('dwIndex', wintypes.DWORD),
+                    ('dwType', wintypes.DWORD), ('dwMtu', wintypes.DWORD),
+                    ('dwSpeed', wintypes.DWORD), ('dwPhysAddrLen', wintypes.DWORD),
+                    ('bPhysAddr', ctypes.c_ubyte * 8), ('dwAdminStatus', wintypes.DWORD),
+                    ('dwOperStatus', wintypes.DWORD), ('dwLastChange', wintypes.DWORD),
+                    ('counters', wintypes.DWORD * 12), ('dwDescrLen', wintypes.DWORD),
+                    ('bDescr', ctypes.c_ubyte * 256)]
+
+    iphlpapi = ctypes.windll.iphlpapi
+    index = wintypes.DWORD()
+    address = struct.unpack('<I', socket.inet_aton(target_ip))[0]  # IPAddr, network byte order
+    if iphlpapi.GetBestInterface(wintypes.DWORD(address), ctypes.byref(index)) != 0:
+        return LinkState(False)
+    row = MIB_IFROW()
+    row.dwIndex = index.value
+    if iphlpapi.GetIfEntry(ctypes.byref(row)) != 0:
+        return LinkState(True, interface=str(index.value))  # Routed; trust the route
+    up = row.dwOperStatus in (IF_OPER_STATUS_CONNECTED, IF_OPER_STATUS_OPERATIONAL)
+    return LinkState(up, interface=bytes(row.bDescr[:row.dwDescrLen]).rstrip(b'\0').decode(
+        'ascii', errors='replace') or str(index.value))
+
+
+def system_link_state():
+    """Link state of this machine, None when it cannot be determined"""
+    try:
+        if sys.platform.startswith('linux'):
+            return linux_link_state()
+        if sys.platform == 'win32':
+            return windows_link_state()
+    except Exception:
+        pass
+    return None
+
+
+class LinkMonitor:
+    """Debounced link state; the agent calls update() once per network check"""
+
+    def __init__(self, source=None):
+        self.source = source or system_link_state
+        self.state = None
+        self.transitions = 0
+        self._pending = None
+        self._pending_count = 0
+
+    def reading(self, ssid):
+        """Undebounced state: the OS link (up when unknown) combined with the probed SSID"""
+        try:
+            link = self.source()
+        except Exception:
+            link = None
+        known = ssid if ssid and ssid != "Unknown" else None
+        if link is None:
+            return LinkState(True, known)  # Cannot tell; assume connected as before
+        return LinkState(link.up or known is not None, known, link.interface)
+
+    def update(self, ssid, debounce=1):
+        """Stable state after this check; changes need `debounce` consecutive readings"""
+        reading = self.reading(ssid)
+        if self.state is None:
+            self.state = reading  # First reading: nothing to debounce against
+            return self.state
+
+        if not reading.differs(self.state):
+            self._pending = None
+            self._pending_count = 0
+            if reading.up and reading.ssid:
+                self.state.ssid = reading.ssid  # Learn the SSID of a connection begun without one
+            return self.state
+
+        if self._pending is not None and not reading.differs(self._pending):
+            self._pending_count += 1
+        else:
+            self._pending = reading
+            self._pending_count = 1
+        if self._pending_count >= debounce:
+            self.state = reading
+            self.transitions += 1
+            self._pending = None
+            self._pending_count = 0
+        return self.state
+
+
+# ===== Benchmark =====
+
+# Recorded days (shapes taken from agent logs): Wi-Fi with drops, a roam and probe
+# failures, and a wired / WSL machine that never sees an SSID
+FLAKY_WIFI_TIMELINE = {
+    'start': '08:30',
+    'end': '18:30',
+    'events': [
+        {'at': '09:00', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '10:15:00', 'ssid': 'Unknown'},
+        {'at': '10:15:20', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '10:40', 'ssid': 'Unknown', 'link': 'up', 'ip': '192.168.100.23'},
+        {'at': '10:41', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '11:30', 'ssid': 'GIGLABZ_2G', 'ip': '192.168.101.40'},
+        {'at': '12:30', 'ssid': 'Unknown'},
+        {'at': '13:10', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '14:05:00', 'ssid': 'Unknown'},
+        {'at': '14:05:15', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '15:20', 'ssid': 'Unknown', 'link': 'up', 'ip': '192.168.100.23'},
+        {'at': '15:22', 'ssid': 'GIGLABZ_5G', 'ip': '192.168.100.23'},
+        {'at': '17:45', 'ssid': 'Unknown'},
+    ],
+}
+
+WIRED_TIMELINE = {
+    'start': '08:30',
+    'end': '18:30',
+    'events': [
+        {'at': '08:55', 'link': 'up', 'ip': '172.20.0.5'},
+        {'at': '12:30', 'link': 'down'},
+        {'at': '13:20', 'link': 'up', 'ip': '172.20.0.5'},
+        {'at': '15:00:00', 'link': 'down'},
+        {'at': '15:00:20', 'link': 'up', 'ip': '172.20.0.5'},
+        {'at': '17:50', 'link': 'down'},
+    ],
+}
+
+
+def _recording_backend():
+    """SimulatedBackend that also keeps every attendance record's (start, end)"""
+    from agent_simulator import SimulatedBackend
+
+    class RecordingBackend(SimulatedBackend):
+        def __init__(self):
+            super().__init__()
+            self.records = []   # (start, end) of closed records
+            self.open = {}      # (email, mac) -> start of the open record
+
+        def _close(self, key, end):
+            start = self.open.pop(key, None)
+            if start is not None:
+                self.records.append((start, max(start, end)))
+
+        def _dispatch(self, now, path, headers, payload):
+            status, body = super()._dispatch(now, path, headers, payload)
+            if status != 200:
+                return status, body
+            if path.endswith('/track-connection'):
+                key = (payload.get('email'), payload.get('mac_address'))
+                event_type = payload.get('event_type')
+                if event_type == 'connect':
+                    self._close(key, now)
+                    self.open[key] = now
+                elif event_type == 'heartbeat':
+                    self.open.setdefault(key, now)
+                elif event_type == 'idle':
+                    self._close(key, payload.get('idle_since', now))
+                elif event_type == 'disconnect':
+                    self._close(key, payload.get('disconnect_time', now))
+            elif path.endswith('/logout'):
+                for key in list(self.open):
+                    self._close(key, payload.get('logout_time', now))
+            return status, body
+
+    return RecordingBackend()
+
+
+def _link_segments(timeline):
+    """[(start, end, up, ssid or None)] at one-second resolution, flaps merged away"""
+    segments = []
+    for second in range(int(timeline.start), int(timeline.end)):
+        state = timeline.state_at(second)
+        key = (state['link'], state['ssid'] if state['ssid'] != 'Unknown' else None)
+        if segments and tuple(segments[-1][2:]) == key:
+            segments[-1][1] = second + 1
+        else:
+            segments.append([second, second + 1, key[0], key[1]])
+
+    # Drop short segments and SSID probe failures (unknown SSID while the link stays up)
+    merged = []
+    for segment in segments:
+        if segment[1] - segment[0] < FLAP_SECONDS and merged:
+            merged[-1][1] = segment[1]
+            continue
+        if merged and merged[-1][2] == segment[2] and (
+                not segment[2] or not segment[3] or not merged[-1][3] or segment[3] == merged[-1][3]):
+            merged[-1][1] = segment[1]
+            merged[-1][3] = merged[-1][3] or segment[3]
+            continue
+        merged.append(list(segment))
+    return segments, merged
+
+
+def _overlap(intervals, periods):
+    return sum(max(0, min(end, period_end) - max(start, period_start))
+               for start, end in intervals for period_start, period_end in periods)
+
+
+def run_benchmark():
+    """Server-side records per day: SSID compares, forced connect and link state"""
+    from agent_simulator import DEFAULT_TIMELINE, NetworkTimeline, simulate_agent, quiet_agent
+    from agent_tunables import TUNABLE_SPECS
+
+    variants = {
+        'ssid_compare': ('darwin', False),   # The macOS path, for reference
+        'forced_connect': ('linux', False),  # Windows/Linux before
+        'link_state': ('linux', True),       # Windows/Linux with a LinkMonitor
+    }
+    results = {}
+    with quiet_agent():
+        for name, data in (('office_day', DEFAULT_TIMELINE), ('flaky_wifi', FLAKY_WIFI_TIMELINE),
+                           ('wired_wsl', WIRED_TIMELINE)):
+            timeline = NetworkTimeline.from_dict(data)
+            raw, ideal = _link_segments(timeline)
+            down = [(start, end) for start, end, up, _ in raw if not up]
+            up = [(start, end) for start, end, up, _ in raw if up]
+            ideal_records = sum(1 for segment in ideal if segment[2])
+            day = {'link_changes': sum(1 for a, b in zip(raw, raw[1:]) if a[2] != b[2]),
+                   'ideal_records': ideal_records, 'link_down_s': sum(e - s for s, e in down)}
+            for variant, (platform, link) in variants.items():
+                backend = _recording_backend()
+                simulate_agent(NetworkTimeline.from_dict(data), backend, platform=platform, link=link)
+                events = [entry[4] for entry in backend.log if entry[4] in ('connect', 'disconnect')]
+                records = [(start, end) for start, end in backend.records]
+                day[variant] = {
+                    'connects': events.count('connect'),
+                    'disconnects': events.count('disconnect'),
+                    'records': len(records),
+                    'extra_records': max(0, len(records) - ideal_records),
+                    'offline_s_in_records': _overlap(records, down),
+                    'online_s_missing': sum(e - s for s, e in up) - _overlap(records, up),
+                }
+            results[name] = day
+    return {'check_interval_s': TUNABLE_SPECS['check_interval'][1],
+            'link_debounce': TUNABLE_SPECS['link_debounce'][1], 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent link state")
+    parser.add_argument('--bench', action='store_true',
+                        help="Compare transition handling on recorded network timelines")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(), indent=2))
+    else:
+        print(system_link_state())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Memory watchdog for the long-running Office Agent tray process.
+
+Samples RSS periodically and asks the application to restart itself when RSS
+crosses a ceiling. tracemalloc costs something on every allocation, so it only
+runs while a leak report is being collected: once RSS has grown by
+LEAK_REPORT_GROWTH_MB (or on request_report()), tracing starts with a baseline
+snapshot, and SNAPSHOT_EVERY samples later the top allocation growth is logged
+and tracing stops again.
+
+The module also contains a soak test that runs the real agent loop for
+simulated weeks on the virtual clock and checks that traced memory stays flat:
+
+    python memory_watchdog.py --soak-weeks 4
+"""
+
+import os
+import gc
+import sys
+import time
+import argparse
+import threading
+import tracemalloc
+from collections import deque
+
+from desktop_agent_fixed import log_to_file
+
+# Defaults for the tray agent
+MEMORY_SAMPLE_INTERVAL = 300      # seconds between samples
+SNAPSHOT_EVERY = 12               # samples a leak report traces before logging (an hour)
+LEAK_REPORT_GROWTH_MB = 50        # RSS growth since the first sample that starts a leak report
+RSS_LIMIT_MB = 300                # restart the agent above this resident size
+TRACEMALLOC_FRAMES = 1            # one frame keeps tracing overhead low
+
+
+def current_rss_bytes(pid=None):
+    """Resident set size of this process, or of process pid, in bytes (0 if it cannot be determined)"""
+    try:
+        if sys.platform.startswith('linux'):
+            with open(f"/proc/{pid or 'self'}/statm") as f:
+                resident_pages = int(f.read().split()[1])
+            return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            kernel32.OpenProcess.restype = wintypes.HANDLE
+            if pid:
+                handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+                if not handle:
+                    return 0
+            else:
+                handle = kernel32.GetCurrentProcess()
+            try:
+                if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                    return counters.WorkingSetSize
+            finally:
+                if pid:
+                    kernel32.CloseHandle(handle)
+            return 0
+
+        if pid:
+            import subprocess
+            output = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True,
+                                    text=True, timeout=2).stdout.strip()
+            return int(output) * 1024 if output.isdigit() else 0
+
+        # macOS / other: peak RSS is the best cheap approximation (bytes on macOS)
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return 0
+
+
+def relaunch_command():
+    """Command line that starts a fresh copy of the running application"""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable] + sys.argv[1:]
+    return [sys.executable, os.path.abspath(sys.argv[0])] + sys.argv[1:]
+
+
+class MemoryWatchdog:
+    """Background sampler of RSS and tracemalloc statistics with an RSS ceiling"""
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL, snapshot_every=SNAPSHOT_EVERY,
+                 rss_limit_mb=RSS_LIMIT_MB, on_limit=None, top=10, history=288):
+        self.interval = interval
+        self.snapshot_every = snapshot_every
+        self.rss_limit = rss_limit_mb * 1024 * 1024 if rss_limit_mb else None
+        self.on_limit = on_limit
+        self.top = top
+        self.samples = deque(maxlen=history)  # last day at the default interval
+        self.baseline = None
+        self.limit_reached = False
+        self.report_at_rss = None         # RSS that starts the next leak report
+        self._report_due = None           # sample count at which the running report is logged
+        self._started_tracing = False
+        self._sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the sampling thread (tracing only runs during leak reports)"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='MemoryWatchdog')
+        self._thread.daemon = True
+        self._thread.start()
+        log_to_file(f"Memory watchdog started (interval {self.interval}s, "
+                    f"limit {self.rss_limit // (1024 * 1024) if self.rss_limit else 'none'} MB)")
+
+    def stop(self):
+        """Stop the sampling thread and any tracing it started"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(1)
+        self._end_tracing()
+
+    def request_report(self):
+        """Trace allocations for the next snapshot_every samples, then log their growth"""
+        if self._report_due is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+        self.baseline = tracemalloc.take_snapshot()
+        self._report_due = self._sample_count + max(self.snapshot_every, 1)
+        log_to_file("Memory watchdog: tracing allocations for a leak report")
+
+    def _end_tracing(self):
+        self._report_due = None
+        self.baseline = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                log_to_file(f"Memory watchdog sample failed: {str(e)}")
+
+    def sample(self):
+        """Record one sample, log allocation growth periodically and enforce the ceiling"""
+        traced_current, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        sample = {
+            'time': time.time(),
+            'rss': current_rss_bytes(),
+            'traced': traced_current,
+            'traced_peak': traced_peak,
+        }
+        self.samples.append(sample)
+        self._sample_count += 1
+
+        if self._report_due is not None and self._sample_count >= self._report_due:
+            self.log_top_allocations()
+            self._end_tracing()
+        elif self.snapshot_every and sample['rss']:
+            # Growth since the first sample (or the last report) starts a leak report
+            if self.report_at_rss is None:
+                self.report_at_rss = sample['rss'] + LEAK_REPORT_GROWTH_MB * 1024 * 1024
+            elif sample['rss'] >= self.report_at_rss:
+                self.report_at_rss = sample['rss'] + LEAK_REPORT_GROWTH_MB * 1024 * 1024
+                self.request_report()
+
+        if self.rss_limit and sample['rss'] > self.rss_limit and not self.limit_reached:
+            self.limit_reached = True
+            log_to_file(f"Memory watchdog: RSS {sample['rss'] // (1024 * 1024)} MB exceeds "
+                        f"limit {self.rss_limit // (1024 * 1024)} MB, requesting restart")
+            if tracemalloc.is_tracing():
+                self.log_top_allocations()
+            if self.on_limit:
+                self.on_limit()
+        return sample
+
+    def top_allocations(self):
+        """Largest allocation growth by source line since the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        if self.baseline is None:
+            stats = snapshot.statistics('lineno')
+        else:
+            stats = snapshot.compare_to(self.baseline, 'lineno')
+        return stats[:self.top]
+
+    def log_top_allocations(self):
+        """Write the top allocation growth to the agent log"""
+        latest = self.samples[-1] if self.samples else None
+        if latest:
+            log_to_file(f"Memory: RSS {latest['rss'] / 1024 / 1024:.1f} MB, "
+                        f"traced {latest['traced'] / 1024:.0f} KB (peak {latest['traced_peak'] / 1024:.0f} KB)")
+        for stat in self.top_allocations():
+            log_to_file(f"  {stat}")
+
+
+def run_soak(weeks=4, tolerance_kb=256, warmup_days=2):
+    """Run the agent loop for simulated weeks with stubbed probes; True if memory stays flat"""
+    import agent_simulator as sim
+    from desktop_agent_fixed import OfficeAgent
+
+    day_seconds = 24 * 3600
+    days = weeks * 7
+    template = sim.NetworkTimeline.from_dict(sim.DEFAULT_TIMELINE)
+    events = [dict(event, at=event['at'] + day * day_seconds)
+              for day in range(days) for event in template.events]
+    start = template.start
+    timeline = sim.NetworkTimeline(start, start + days * day_seconds, events)
+
+    clock = sim.VirtualClock(start, None, timeline.suspends())
+    network = sim.SimulatedNetwork(timeline, clock)
+    backend = sim.SimulatedBackend(keep_log=False)
+    email, password = 'soak@sim.local', 'simulated'
+    agent = OfficeAgent(email, password, clock=clock, network=network)
+    agent.api_client.session = sim.SimulatedSession(backend, timeline, clock, 0)
+    clock.on_expire = lambda: setattr(agent, 'is_running', False)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    watchdog = MemoryWatchdog(snapshot_every=0, rss_limit_mb=None)
+    watchdog.baseline = tracemalloc.take_snapshot()
+
+    traced = []
+    try:
+        with sim.quiet_agent():
+            agent.api_client.login(email, password)
+            for day in range(days):
+                clock.end = start + (day + 1) * day_seconds
+                agent.is_running = True
+                agent.run_loop()
+
+                # Log out and back in weekly, as users do from the tray menu
+                if (day + 1) % 7 == 0:
+                    agent.stop()
+                    agent.reset()
+                    agent.email, agent.password = email, password
+                    agent.api_client.login(email, password)
+
+                gc.collect()
+                traced.append(watchdog.sample()['traced'])
+                print(f"day {day + 1:3d}: traced {traced[-1] / 1024:8.1f} KB, "
+                      f"requests so far {backend.request_count}")
+        growth = traced[-1] - traced[min(warmup_days, len(traced)) - 1]
+        print(f"Traced memory growth after warm-up: {growth / 1024:.1f} KB "
+              f"(tolerance {tolerance_kb} KB) over {days} simulated days")
+        if growth > tolerance_kb * 1024:
+            for stat in watchdog.top_allocations():
+                print(f"  {stat}")
+            return False
+        return True
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Office Agent memory soak test")
+    parser.add_argument('--soak-weeks', type=int, default=4, help="Simulated weeks to run")
+    parser.add_argument('--tolerance-kb', type=int, default=256,
+                        help="Allowed traced-memory growth after warm-up")
+    args = parser.parse_args()
+    sys.exit(0 if run_soak(args.soak_weeks, args.tolerance_kb) else 1)
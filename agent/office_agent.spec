@@ -13,6 +13,7 @@ a = Analysis(
     runtime_hooks=[],
     excludes=[],
     noarchive=False,
+    optimize=0,
 )
 
 pyz = PYZ(a.pure)
@@ -0,0 +1,116 @@
+"""
+Office network policy for the Office Agent.
+
+The server publishes which networks count as the office (SSIDs, optional access
+point BSSIDs and CIDR ranges) at GET /api/desktop/network-policy. The agent
+caches it in ~/.office_agent_network_policy.json, revalidates it with ETags,
+and classifies each network check so that traffic from home and other
+off-site networks can be dropped or thinned (see OfficeAgent.check_network).
+
+Without a policy (never fetched, older server) nothing is suppressed.
+"""
+
+import os
+import json
+import time
+import ipaddress
+
+POLICY_FILE = os.path.join(os.path.expanduser('~'), '.office_agent_network_policy.json')
+POLICY_REFRESH_INTERVAL = 6 * 3600   # seconds between revalidations
+
+OFFICE = 'office'
+OFFSITE = 'offsite'
+
+OFFSITE_DROP = 'drop'
+OFFSITE_THIN = 'thin'
+
+
+class NetworkPolicy:
+    """Classifier built from one published policy"""
+
+    def __init__(self, data):
+        self.data = data
+        self.ssids = frozenset(data.get('ssids') or [])
+        self.bssids = frozenset(b.lower() for b in data.get('bssids') or [])
+        self.networks = []
+        for cidr in data.get('cidrs') or []:
+            try:
+                self.networks.append(ipaddress.ip_network(cidr, strict=False))
+            except ValueError:
+                pass  # Ignore malformed ranges rather than the whole policy
+        action = data.get('offsite_action')
+        self.offsite_action = action if action in (OFFSITE_DROP, OFFSITE_THIN) else OFFSITE_DROP
+        try:
+            self.offsite_heartbeat_cycles = max(1, int(data.get('offsite_heartbeat_cycles') or 20))
+        except (TypeError, ValueError):
+            self.offsite_heartbeat_cycles = 20
+
+    @property
+    def uses_bssid(self):
+        return bool(self.bssids)
+
+    def classify(self, ssid, ip_address=None, bssid=None):
+        """OFFICE when the network matches the policy the server checks in with, else OFFSITE"""
+        if ssid not in self.ssids:
+            return OFFSITE
+        if self.bssids and bssid and bssid.lower() not in self.bssids:
+            return OFFSITE  # Same SSID broadcast somewhere else
+        if self.networks:
+            try:
+                address = ipaddress.ip_address(ip_address)
+            except ValueError:
+                return OFFSITE
+            if not any(address in network for network in self.networks):
+                return OFFSITE
+        return OFFICE
+
+
+class PolicyStore:
+    """Current policy plus its ETag, persisted to disk and refreshed from the server"""
+
+    def __init__(self, path=POLICY_FILE, clock=None, refresh_interval=POLICY_REFRESH_INTERVAL):
+        self.path = path
+        self.clock = clock or time
+        self.refresh_interval = refresh_interval
+        self.policy = None
+        self.etag = None
+        self.checked_at = None
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            self.policy = NetworkPolicy(cached['policy'])
+            self.etag = cached.get('etag')
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.policy = None
+
+    def _save(self, data):
+        if not self.path:
+            return
+        try:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({'etag': self.etag, 'policy': data}, f)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    def refresh_due(self):
+        return self.checked_at is None or self.clock.time() - self.checked_at >= self.refresh_interval
+
+    def refresh(self, api_client, force=False):
+        """Revalidate with the server; returns True if the policy changed"""
+        if not force and not self.refresh_due():
+            return False
+        self.checked_at = self.clock.time()
+        status, data, etag = api_client.fetch_network_policy(self.etag)
+        if status == 304 or status != 200 or not isinstance(data, dict):
+            return False  # Unchanged, or the server has no policy endpoint: keep what we have
+        self.policy = NetworkPolicy(data)
+        self.etag = etag
+        self._save(data)
+        return True
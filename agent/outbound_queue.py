@@ -0,0 +1,398 @@
+"""
+Priority outbound event queue for the Office Agent.
+
+Event POSTs used to be sent inline by whichever loop produced them, so during a
+slow-server period a heartbeat stuck in a 10 s request held up the connect or
+disconnect behind it (and the next network check). ApiClient now hands
+/track-connection events and daily summaries to one OutboundQueue:
+
+    critical   connect, disconnect, idle      never dropped; retried with backoff;
+                                              written to the shutdown journal (the
+                                              whole class, in order) when the queue
+                                              is full, and when it is stopped, also
+                                              one in flight that does not get through
+    normal     daily summaries                retried a few times; a newer upload of the
+                                              same day replaces a queued one; dropped
+                                              when full (the ledger uploads them again)
+    latest     heartbeats                     only the newest is kept; a queued one
+                                              is replaced by the next and dropped
+                                              when a critical event is queued
+
+A single sender thread drains the queue, highest class first and in order
+within a class, at most `outbound_rate` requests per second. The queue is
+bounded by item count and payload bytes. metrics() reports depth, bytes and
+oldest age per class plus sent/dropped/coalesced/spilled counters.
+
+Callers of critical events wait for the server's answer up to request_timeout
+(and are told the event is queued when it takes longer); heartbeats return at
+once. Until start() is called every item is sent inline on the caller's
+thread, exactly as before (simulation, tools, the self-test).
+
+Login, logout, the network policy and journal replay are not queued: they are
+request/response exchanges the caller needs the answer to.
+
+Compare inline sending and the queue against a slow server:
+    python outbound_queue.py --bench
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+
+from shutdown_pipeline import _is_final
+
+CRITICAL, NORMAL, LATEST = 0, 1, 2
+CLASS_NAMES = {CRITICAL: 'critical', NORMAL: 'normal', LATEST: 'latest'}
+PRIORITIES = {'connect': CRITICAL, 'disconnect': CRITICAL, 'idle': CRITICAL,
+              'summary': NORMAL, 'heartbeat': LATEST}
+
+MAX_ITEMS = 256                 # queued items, all classes
+MAX_BYTES = 256 * 1024          # queued payload bytes (JSON), all classes
+NORMAL_ATTEMPTS = 3             # sends of a normal item before it is given up
+RETRY_BACKOFF = (1.0, 60.0)     # first and longest wait after a failed send
+
+
+class OutboundItem:
+    """One queued request; wait() for its result when the caller needs it"""
+
+    def __init__(self, kind, path, payload, token, on_done=None, key=None):
+        self.kind = kind
+        self.key = key              # a newer item with the same kind and key replaces this one
+        self.priority = PRIORITIES[kind]
+        self.path = path
+        self.payload = payload
+        self.token = token
+        self.on_done = on_done      # called with the item once the server answered
+        self.size = len(json.dumps(payload, default=str))
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+        self.status = None          # HTTP status; 0 when the request failed
+        self.data = None            # response JSON
+        self.error = None           # exception text when the request failed
+        self.dropped = None         # reason when it was never sent
+        self.outcome = None         # what on_done returned
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """True once sent, dropped or spilled"""
+        return self.done.wait(timeout)
+
+
+class OutboundQueue:
+    """Bounded priority queue of outbound requests with a single rate-limited sender"""
+
+    def __init__(self, send, tunables=None, journal=None, max_items=MAX_ITEMS, max_bytes=MAX_BYTES):
+        self.send = send            # send(item) -> (status, response JSON); may raise
+        self.tunables = tunables
+        self.journal = journal      # where critical items go when they cannot stay queued
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._queues = {priority: deque() for priority in CLASS_NAMES}
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._thread = None         # the sender; a replaced or stopped sender exits
+        self._not_before = 0.0      # monotonic time of the next allowed send
+        self.in_flight = None
+        self._stop_journal = None   # where stop() sends a critical item still in flight
+        self.counters = {'sent': 0, 'failed': 0, 'retried': 0, 'dropped': 0,
+                         'coalesced': 0, 'superseded': 0, 'spilled': 0, 'max_depth': 0}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def submit(self, kind, path, payload, token, on_done=None, key=None):
+        """Queue a request (or send it inline while the sender is not running); returns the item
+
+        A queued item of the same kind and key (e.g. the same day's summary) is replaced.
+        """
+        item = OutboundItem(kind, path, payload, token, on_done, key)
+        if not self.running:
+            self._attempt(item)
+            self._finish(item)
+            return item
+
+        with self._cond:
+            if item.priority == CRITICAL:
+                # Heartbeats stamped before a connection change would arrive after it
+                self._drop_class(LATEST, 'superseded')
+            elif item.priority == LATEST:
+                self._drop_class(LATEST, 'coalesced')
+            if key is not None:
+                for queued in list(self._queues[item.priority]):
+                    if queued.kind == kind and queued.key == key:
+                        self._remove(queued, 'coalesced')
+            self._queues[item.priority].append(item)
+            self._bytes += item.size
+            self._enforce_bounds()
+            self.counters['max_depth'] = max(self.counters['max_depth'], self._depth())
+            self._cond.notify()
+        return item
+
+    def _depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _remove(self, item, reason):
+        self._queues[item.priority].remove(item)
+        self._bytes -= item.size
+        item.dropped = reason
+        self.counters[reason] += 1
+        item.done.set()
+
+    def _drop_class(self, priority, reason):
+        for item in list(self._queues[priority]):
+            self._remove(item, reason)
+
+    def _enforce_bounds(self):
+        """Drop the oldest heartbeats, then summaries; spill the critical class to the journal"""
+        for priority in (LATEST, NORMAL, CRITICAL):
+            queue = self._queues[priority]
+            while queue and (self._depth() > self.max_items or self._bytes > self.max_bytes):
+                if priority == CRITICAL:
+                    if self.journal is None:
+                        return  # Never dropped: stay over the bound rather than lose an event
+                    # All of them, oldest first: spilling only some would let newer events
+                    # reach the server before older ones replayed from the journal
+                    for item in list(queue):
+                        self._spill(item)
+                else:
+                    self._remove(queue[0], 'dropped')
+
+    def _spill(self, item):
+        self.journal.add(item.path, item.payload, item.token)
+        self._remove(item, 'spilled')
+        print(f"Outbound queue: {item.kind} written to the shutdown journal")
+
+    def _attempt(self, item):
+        """Send once; records the status and response (status 0 when it raised)"""
+        item.attempts += 1
+        try:
+            item.status, item.data = self.send(item)
+            item.error = None
+        except Exception as e:
+            item.status, item.data, item.error = 0, {}, str(e)
+
+    def _finish(self, item):
+        self.counters['sent' if item.status else 'failed'] += 1
+        if item.on_done:
+            try:
+                item.outcome = item.on_done(item)
+            except Exception as e:
+                print(f"Outbound {item.kind} handler error: {str(e)}")
+        item.done.set()
+
+    def _retry_delay(self, item):
+        """Backoff before resending a failed item, None when it is finished"""
+        if _is_final(item.status) or not self.running:
+            return None
+        if item.priority == LATEST or (item.priority == NORMAL and item.attempts >= NORMAL_ATTEMPTS):
+            return None
+        first, longest = RETRY_BACKOFF
+        return min(first * 2 ** (item.attempts - 1), longest)
+
+    def _interval(self):
+        rate = self.tunables.outbound_rate if self.tunables is not None else 0
+        return 1.0 / rate if rate else 0.0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._thread is not threading.current_thread():
+                        return
+                    if self._depth():
+                        delay = self._not_before - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                queue = next(self._queues[priority] for priority in sorted(self._queues)
+                             if self._queues[priority])
+                item = queue.popleft()
+                self._bytes -= item.size
+                self.in_flight = item
+
+            self._attempt(item)
+            delay = self._retry_delay(item)
+
+            with self._cond:
+                self.in_flight = None
+                if (delay is None and item.priority == CRITICAL and not _is_final(item.status)
+                        and self._stop_journal is not None and not self.running):
+                    # Stopped while this event was on the wire and it did not get through
+                    self._stop_journal.add(item.path, item.payload, item.token)
+                    self.counters['spilled'] += 1
+                self._not_before = time.monotonic() + self._interval()
+                if delay is not None:
+                    # Back at the head of its class, so events keep their order
+                    self._queues[item.priority].appendleft(item)
+                    self._bytes += item.size
+                    self.counters['retried'] += 1
+                    self._not_before = time.monotonic() + delay
+                    continue
+            self._finish(item)
+
+    def start(self):
+        """Send from a background thread from now on"""
+        with self._cond:
+            if self.running:
+                return self
+            self._stop_journal = None
+            self._thread = threading.Thread(target=self._run, name='OutboundSender', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, journal=None):
+        """Stop the sender without waiting for a request in flight; queued critical items go to
+        the journal (given, or the queue's own) and everything else is dropped. A critical
+        request in flight goes to the same journal if it ends without a final status.
+        Returns the number of queued items journaled."""
+        journal = journal or self.journal
+        with self._cond:
+            self._thread = None
+            self._stop_journal = journal
+            self._cond.notify_all()
+            spilled = 0
+            for priority in sorted(self._queues):
+                for item in list(self._queues[priority]):
+                    if priority == CRITICAL and journal is not None:
+                        journal.add(item.path, item.payload, item.token)
+                        self._remove(item, 'spilled')
+                        spilled += 1
+                    else:
+                        self._remove(item, 'dropped')
+            return spilled
+
+    def clear(self):
+        """Forget queued items (logged out); critical ones are journaled when possible"""
+        with self._cond:
+            for priority in sorted(self._queues):
+                for item in list(self._queues[priority]):
+                    if priority == CRITICAL and self.journal is not None:
+                        self._spill(item)
+                    else:
+                        self._remove(item, 'dropped')
+
+    def metrics(self):
+        """Depth, bytes and oldest age per class, the request in flight and the counters"""
+        with self._cond:
+            now = time.monotonic()
+            classes = {}
+            for priority, queue in self._queues.items():
+                classes[CLASS_NAMES[priority]] = {
+                    'depth': len(queue),
+                    'bytes': sum(item.size for item in queue),
+                    'oldest_age_s': round(now - queue[0].queued_at, 3) if queue else 0.0,
+                }
+            return {
+                'running': self.running,
+                'depth': self._depth(),
+                'bytes': self._bytes,
+                'in_flight': self.in_flight.kind if self.in_flight else None,
+                'classes': classes,
+                'counters': dict(self.counters),
+            }
+
+
+# ===== Benchmark =====
+
+class ChangingNetwork:
+    """StaticNetwork whose SSID drops out every `period` seconds for half a period"""
+
+    def __init__(self, network, period):
+        self.network = network
+        self.period = period
+        self.started = time.monotonic()
+        self.changes = []   # (monotonic time, 'connect' | 'disconnect')
+        self._lock = threading.Lock()
+
+    def get_current_ssid(self):
+        elapsed = time.monotonic() - self.started
+        connected = int(elapsed / (self.period / 2)) % 2 == 0
+        with self._lock:
+            change_at = self.started + int(elapsed / (self.period / 2)) * (self.period / 2)
+            kind = 'connect' if connected else 'disconnect'
+            if change_at > self.started and (not self.changes or self.changes[-1][0] != change_at):
+                self.changes.append((change_at, kind))
+        return self.network.get_current_ssid() if connected else 'Unknown'
+
+    def __getattr__(self, name):
+        return getattr(self.network, name)
+
+
+def run_benchmark(duration=20.0, latency=1.5, period=4.0):
+    """Slow server (latency > heartbeat interval): event delivery lag and request counts,
+    inline sending vs the queue"""
+    from desktop_agent_fixed import OfficeAgent
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+    from fault_proxy import FaultProxy, StaticNetwork
+
+    results = {}
+    with quiet_agent():
+        for variant in ('inline', 'queued'):
+            proxy = FaultProxy().start()
+            tunables = Tunables(defaults={'api_base_url': proxy.url, 'check_interval': 1.0,
+                                          'heartbeat_cycles': 1, 'request_timeout': 30.0})
+            agent = OfficeAgent(f"{variant}@bench.local", 'bench', network=StaticNetwork(0),
+                                tunables=tunables)
+            agent.platform = 'darwin'  # Normal SSID transition handling
+            agent.api_client.login(agent.email, agent.password)
+            proxy.script.set_mode('latency', latency=latency)
+            network = agent.network = agent.api_client.network = ChangingNetwork(agent.network, period)
+            if variant == 'queued':
+                agent.api_client.outbound.start()
+
+            agent.is_running = True
+            loop = threading.Thread(target=agent.run_loop, daemon=True)
+            loop.start()
+            time.sleep(duration)
+            agent.is_running = False
+            loop.join(latency * 4)
+            metrics = agent.api_client.outbound.metrics()
+            agent.api_client.outbound.stop()
+            proxy.stop()
+
+            # Server-side arrival of each connect/disconnect after the SSID changed
+            events = [(at, event) for at, _, path, event, _, status in proxy.requests
+                      if event in ('connect', 'disconnect')]
+            lags = []
+            for changed_at, kind in network.changes:
+                arrived = [at for at, event in events if event == kind and at >= changed_at]
+                if arrived:
+                    lags.append(arrived[0] - changed_at)
+            lags.sort()
+            heartbeats = sum(1 for entry in proxy.requests if entry[3] == 'heartbeat')
+            results[variant] = {
+                'network_changes': len(network.changes),
+                'events_delivered': len(lags),
+                'event_lag_p50_s': round(lags[len(lags) // 2], 2) if lags else None,
+                'event_lag_max_s': round(lags[-1], 2) if lags else None,
+                'heartbeat_requests': heartbeats,
+                'queue': {key: metrics['counters'][key] for key in ('max_depth', 'coalesced', 'superseded')},
+            }
+    return {'duration_s': duration, 'server_latency_s': latency, 'heartbeat_interval_s': 1.0,
+            'ssid_change_every_s': period / 2, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent outbound queue")
+    parser.add_argument('--bench', action='store_true', help="Compare inline sending and the queue")
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--latency', type=float, default=1.5, help="Server latency per request")
+    parser.add_argument('--period', type=float, default=4.0, help="Seconds per connect/disconnect cycle")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.duration, args.latency, args.period), indent=2))
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
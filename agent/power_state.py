@@ -0,0 +1,192 @@
+"""
+Power source detection for the Office Agent.
+
+On battery the agent stretches its network-check interval (and with it the
+heartbeat) and skips SSID probes that cannot have changed, so the CPU can stay
+in deep idle states between its, now fewer, wakeups. See OfficeAgent.run_loop.
+
+Sources, picked by platform:
+    Linux    /sys/class/power_supply (mains/battery), /sys/firmware/acpi/platform_profile
+             (power saver), falling back to logind's OnExternalPower
+    Windows  GetSystemPowerStatus (AC line, battery percent, battery saver)
+    macOS    pmset -g batt
+Anything else reports AC, i.e. the normal cadence.
+
+Measure wakeups per hour on a simulated day:
+    python agent_simulator.py --power ac|battery|low
+"""
+
+import os
+import sys
+import subprocess
+import time
+
+POWER_SUPPLY_DIR = '/sys/class/power_supply'
+PLATFORM_PROFILE = '/sys/firmware/acpi/platform_profile'
+POWER_REFRESH_INTERVAL = 60   # seconds a reading is reused
+
+
+class PowerState:
+    """One reading of the power source"""
+
+    def __init__(self, on_battery=False, percent=None, saver=False):
+        self.on_battery = on_battery
+        self.percent = percent
+        self.saver = saver
+
+    def interval_factor(self, tunables):
+        """How much to stretch the check interval for this power source"""
+        if not self.on_battery:
+            return 1.0
+        if self.saver or (self.percent is not None and self.percent <= tunables.low_battery_percent):
+            return tunables.low_battery_interval_factor
+        return tunables.battery_interval_factor
+
+    def __repr__(self):
+        source = 'battery' if self.on_battery else 'ac'
+        percent = f" {self.percent}%" if self.percent is not None else ''
+        return f"PowerState({source}{percent}{' saver' if self.saver else ''})"
+
+
+AC = PowerState()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def linux_power_state(root=POWER_SUPPLY_DIR):
+    """Power state from sysfs; None when the kernel exposes no power supplies"""
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return None
+
+    mains_online = None
+    has_battery = False
+    discharging = False
+    percents = []
+    for name in names:
+        supply = os.path.join(root, name)
+        kind = _read(os.path.join(supply, 'type'))
+        if kind in ('Mains', 'USB', 'USB_C', 'USB_PD'):
+            online = _read(os.path.join(supply, 'online'))
+            if online is not None:
+                mains_online = bool(mains_online) or online == '1'
+        elif kind == 'Battery':
+            if _read(os.path.join(supply, 'scope')) == 'Device':
+                continue  # Mouse or headset battery, not the system's
+            has_battery = True
+            if _read(os.path.join(supply, 'status')) == 'Discharging':
+                discharging = True
+            capacity = _read(os.path.join(supply, 'capacity'))
+            if capacity and capacity.isdigit():
+                percents.append(int(capacity))
+
+    if mains_online is None and not has_battery:
+        return None
+    if not has_battery:
+        on_battery = False  # Desktop: an offline USB-C/PD port is not a battery
+    else:
+        on_battery = not mains_online if mains_online is not None else discharging
+    saver = _read(PLATFORM_PROFILE) == 'low-power'
+    return PowerState(on_battery, min(percents) if percents else None, saver)
+
+
+def logind_power_state():
+    """Power state from systemd-logind (OnExternalPower, systemd 246+)"""
+    try:
+        output = subprocess.run(
+            ['busctl', 'get-property', 'org.freedesktop.login1', '/org/freedesktop/login1',
+             'org.freedesktop.login1.Manager', 'OnExternalPower'],
+            capture_output=True, text=True, timeout=2).stdout.split()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if len(output) == 2 and output[0] == 'b':
+        return PowerState(on_battery=output[1] == 'false')
+    return None
+
+
+def windows_power_state():
+    """Power state from GetSystemPowerStatus"""
+    import ctypes
+    from ctypes import wintypes
+
+    class SYSTEM_POWER_STATUS(ctypes.Structure):
+        # Unsigned: BatteryFlag 128 (no battery) and the 255 'unknown' values must not go negative
+        _fields_ = [('ACLineStatus', ctypes.c_ubyte), ('BatteryFlag', ctypes.c_ubyte),
+                    ('BatteryLifePercent', ctypes.c_ubyte), ('SystemStatusFlag', ctypes.c_ubyte),
+                    ('BatteryLifeTime', wintypes.DWORD), ('BatteryFullLifeTime', wintypes.DWORD)]
+
+    status = SYSTEM_POWER_STATUS()
+    if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)):
+        return None
+    if status.BatteryFlag & 128:
+        return AC  # No system battery
+    percent = status.BatteryLifePercent if status.BatteryLifePercent <= 100 else None
+    return PowerState(status.ACLineStatus == 0, percent, bool(status.SystemStatusFlag & 1))
+
+
+def macos_power_state():
+    """Power state from pmset"""
+    try:
+        output = subprocess.run(['pmset', '-g', 'batt'], capture_output=True, text=True,
+                                timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    percent = None
+    for word in output.split():
+        if word.endswith('%;') and word[:-2].isdigit():
+            percent = int(word[:-2])
+            break
+    return PowerState("'Battery Power'" in output, percent)
+
+
+def system_power_state():
+    """Power state of this machine, AC when it cannot be determined"""
+    try:
+        if sys.platform.startswith('linux'):
+            return linux_power_state() or logind_power_state() or AC
+        if sys.platform == 'win32':
+            return windows_power_state() or AC
+        if sys.platform == 'darwin':
+            return macos_power_state() or AC
+    except Exception:
+        pass
+    return AC
+
+
+class PowerMonitor:
+    """Cached power state the agent loop consults once per cycle"""
+
+    def __init__(self, source=None, clock=None, refresh_interval=POWER_REFRESH_INTERVAL):
+        self.source = source or system_power_state
+        self.clock = clock or time
+        self.refresh_interval = refresh_interval
+        self._state = None
+        self._read_at = None
+
+    def state(self):
+        now = self.clock.time()
+        if self._state is None or now - self._read_at >= self.refresh_interval:
+            self._state = self.source() or AC
+            self._read_at = now
+        return self._state
+
+
+class StaticPowerSource:
+    """Fixed power state (simulation)"""
+
+    def __init__(self, on_battery=False, percent=None, saver=False):
+        self.power_state = PowerState(on_battery, percent, saver)
+
+    def __call__(self):
+        return self.power_state
+
+
+if __name__ == "__main__":
+    print(system_power_state())
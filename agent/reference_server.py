@@ -0,0 +1,925 @@
+"""
+Lightweight reference server for the desktop API (/api/desktop/*).
+
+Speaks /login, /logout and /track-connection exactly like
+backend/controllers/desktop.controller.js (same validation, status codes,
+messages and JWTs; /daily-summary and /network-policy too), for small sites
+and for local performance work, without the Node backend. Python standard
+library only:
+
+    asyncio         HTTP/1.1 with keep-alive, one coroutine per connection
+    SQLite (WAL)    tables and columns named like the Sequelize models (users,
+                    desktopSessions, attendanceRecords); one writer thread
+
+What makes it cheap under bursts:
+
+    - active desktop sessions are indexed in memory by (user, MAC) and by token,
+      with their open attendance record, so a heartbeat needs no query at all
+    - heartbeats (and the auth middleware's lastActivityAt touch) only mark the
+      session dirty; dirty sessions are written in one bulk transaction every
+      `flush_interval` seconds (or once FLUSH_MAX are pending). A crash loses
+      at most that much lastActivityAt progress, never an event
+    - connect, disconnect, idle, login and logout are written through at once
+    - telemetry summaries carried by heartbeats (see agent_telemetry.py) are kept
+      per device, latest only, and written with the same bulk flush
+
+Sessions without activity for SESSION_TIMEOUT (idle ones: 12 hours) are closed
+in the background, like the backend's inactive-session cleanup.
+
+    python reference_server.py add-user alice@example.com secret --name "Alice"
+    python reference_server.py serve --port 9600 --db desktop_api.sqlite
+    python reference_server.py --bench          # agent ApiClients: write-through vs bulk
+
+Tokens are HS256 JWTs signed with $JWT_SECRET (same default as
+backend/config/auth.config.js). With that well-known default the server only
+listens on loopback; serving on another address requires setting $JWT_SECRET. Passwords are PBKDF2 hashes; bcrypt hashes from
+the Node backend's users table are accepted when the bcrypt package is installed.
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import base64
+import shutil
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import ipaddress
+import tempfile
+import threading
+from http import HTTPStatus
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+API_PREFIX = '/api/desktop'
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
+READ_TIMEOUT = 60.0             # seconds a client may take to send the next line or body (idle keep-alive too)
+PBKDF2_ITERATIONS = 200000
+FLUSH_INTERVAL = 1.0            # seconds between bulk lastActivityAt writes; 0 writes through
+FLUSH_MAX = 1000                # pending sessions that trigger an early flush
+SESSION_TIMEOUT = 10 * 60       # seconds without activity before a session is cleaned up
+IDLE_SESSION_TIMEOUT = 12 * 3600
+CLEANUP_INTERVAL = 60
+USER_CACHE_SECONDS = 60
+MAX_BODY = 1024 * 1024
+MAX_TELEMETRY = 4096            # bytes of a heartbeat's telemetry summary that are kept
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL, fullName TEXT NOT NULL, isActive INTEGER DEFAULT 1,
+    createdAt TEXT NOT NULL, updatedAt TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS desktopSessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, userId INTEGER NOT NULL, macAddress TEXT NOT NULL,
+    ssid TEXT NOT NULL, token TEXT NOT NULL, isActive INTEGER DEFAULT 1, lastActivityAt TEXT NOT NULL,
+    idleSince TEXT, createdAt TEXT NOT NULL, updatedAt TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS attendanceRecords (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, userId INTEGER NOT NULL, ssid TEXT NOT NULL,
+    ipAddress TEXT NOT NULL, macAddress TEXT NOT NULL, computerName TEXT,
+    connectionStartTime TEXT NOT NULL, connectionEndTime TEXT, connectionDuration REAL,
+    isActive INTEGER DEFAULT 1, createdAt TEXT NOT NULL, updatedAt TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS dailySummaries (
+    userId INTEGER NOT NULL, date TEXT NOT NULL, sessions INTEGER, totalSeconds REAL,
+    firstSeen TEXT, lastSeen TEXT, macAddress TEXT, updatedAt TEXT NOT NULL,
+    PRIMARY KEY (userId, date));
+CREATE TABLE IF NOT EXISTS agentTelemetry (
+    userId INTEGER NOT NULL, macAddress TEXT NOT NULL, receivedAt TEXT NOT NULL, summary TEXT NOT NULL,
+    PRIMARY KEY (userId, macAddress));
+CREATE INDEX IF NOT EXISTS desktop_sessions_active ON desktopSessions (isActive, userId);
+CREATE INDEX IF NOT EXISTS attendance_records_active ON attendanceRecords (isActive, userId, macAddress);
+"""
+
+
+def _sql_time(epoch):
+    """Epoch seconds as Sequelize stores DATE columns in SQLite"""
+    if epoch is None:
+        return None
+    moment = datetime.fromtimestamp(epoch, timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S.') + f"{moment.microsecond // 1000:03d} +00:00"
+
+
+def _epoch(text):
+    if not text:
+        return None
+    return datetime.strptime(text[:23], '%Y-%m-%d %H:%M:%S.%f').replace(tzinfo=timezone.utc).timestamp()
+
+
+def reported_time(epoch_seconds, not_before, now):
+    """Time reported by the agent if it lies between not_before and now, otherwise now
+    (reportedTime in desktop.controller.js)"""
+    try:
+        reported = float(epoch_seconds)
+    except (TypeError, ValueError):
+        return now
+    if not epoch_seconds or reported > now or (not_before is not None and reported < not_before):
+        return now
+    return reported
+
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+
+def verify_password(password, stored):
+    if stored.startswith('pbkdf2_sha256$'):
+        _, iterations, salt, digest = stored.split('$')
+        computed = hashlib.pbkdf2_hmac('sha256', password.encode(), base64.b64decode(salt), int(iterations))
+        return hmac.compare_digest(computed, base64.b64decode(digest))
+    if stored.startswith(('$2a$', '$2b$', '$2y$')):
+        import bcrypt  # Only needed for users created by the Node backend
+        return bcrypt.checkpw(password.encode(), stored.encode())
+    return False
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64url_decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def jwt_sign(claims, secret):
+    header = _b64url(json.dumps({'alg': 'HS256', 'typ': 'JWT'}, separators=(',', ':')).encode())
+    payload = _b64url(json.dumps(claims, separators=(',', ':')).encode())
+    signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64url(signature)}"
+
+
+def jwt_verify(token, secret):
+    """Claims of a valid HS256 token, None otherwise"""
+    try:
+        header, payload, signature = token.split('.')
+        expected = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        if json.loads(_b64url_decode(header)).get('alg') != 'HS256':
+            return None
+        claims = json.loads(_b64url_decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if 'exp' in claims and claims['exp'] < time.time():
+        return None
+    return claims
+
+
+class ApiError(Exception):
+    """An error response: status and JSON body"""
+
+    def __init__(self, status, message, envelope=True):
+        super().__init__(message)
+        self.status = status
+        # The auth middleware answers {message} only; controllers use {success, message}
+        self.body = {'success': False, 'message': message} if envelope else {'message': message}
+
+
+class SessionState:
+    """An active desktop session, with its open attendance record"""
+
+    __slots__ = ('id', 'user_id', 'mac', 'token', 'last_activity', 'idle_since',
+                 'record_id', 'record_start')
+
+    def __init__(self, id, user_id, mac, token, last_activity, idle_since=None,
+                 record_id=None, record_start=None):
+        self.id = id
+        self.user_id = user_id
+        self.mac = mac
+        self.token = token
+        self.last_activity = last_activity
+        self.idle_since = idle_since
+        self.record_id = record_id
+        self.record_start = record_start
+
+
+class Store:
+    """SQLite database in WAL mode; every method runs on the server's single writer thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self.db.executescript(SCHEMA)
+        self.transactions = 0
+
+    def close(self):
+        self.db.close()
+
+    def _write(self, statements):
+        """Run [(sql, params)] in one transaction; returns the last row id"""
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        self.transactions += 1
+        return cursor.lastrowid
+
+    def add_user(self, email, password, full_name=None, username=None, iterations=PBKDF2_ITERATIONS):
+        now = _sql_time(time.time())
+        return self._write([(
+            "INSERT INTO users (username, email, password, fullName, isActive, createdAt, updatedAt) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?)",
+            (username or email.split('@')[0], email, hash_password(password, iterations),
+             full_name or email, now, now))])
+
+    def user_by_email(self, email):
+        row = self.db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return dict(row) if row else None
+
+    def user_exists(self, user_id):
+        return self.db.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is not None
+
+    def active_sessions(self):
+        """SessionStates of all active sessions with their newest open record"""
+        states = []
+        for row in self.db.execute("SELECT * FROM desktopSessions WHERE isActive = 1"):
+            record = self.db.execute(
+                "SELECT id, connectionStartTime FROM attendanceRecords WHERE userId = ? AND macAddress = ? "
+                "AND isActive = 1 ORDER BY connectionStartTime DESC LIMIT 1",
+                (row['userId'], row['macAddress'])).fetchone()
+            states.append(SessionState(row['id'], row['userId'], row['macAddress'], row['token'],
+                                       _epoch(row['lastActivityAt']), _epoch(row['idleSince']),
+                                       record['id'] if record else None,
+                                       _epoch(record['connectionStartTime']) if record else None))
+        return states
+
+    def create_session(self, user_id, mac, ssid, token, now):
+        stamp = _sql_time(now)
+        return self._write([(
+            "INSERT INTO desktopSessions (userId, macAddress, ssid, token, isActive, lastActivityAt, "
+            "createdAt, updatedAt) VALUES (?, ?, ?, ?, 1, ?, ?, ?)",
+            (user_id, mac, ssid, token, stamp, stamp, stamp))])
+
+    def update_session_token(self, session_id, token, now):
+        stamp = _sql_time(now)
+        self._write([("UPDATE desktopSessions SET token = ?, lastActivityAt = ?, updatedAt = ? WHERE id = ?",
+                      (token, stamp, stamp, session_id))])
+
+    def _close_record(self, record_id, end, duration, now):
+        return ("UPDATE attendanceRecords SET connectionEndTime = ?, connectionDuration = ?, isActive = 0, "
+                "updatedAt = ? WHERE id = ?", (_sql_time(end), duration, _sql_time(now), record_id))
+
+    def _touch_session(self, session_id, last_activity, idle_since, now):
+        return ("UPDATE desktopSessions SET lastActivityAt = ?, idleSince = ?, updatedAt = ? WHERE id = ?",
+                (_sql_time(last_activity), _sql_time(idle_since), _sql_time(now), session_id))
+
+    def open_record(self, state, ssid, ip_address, computer_name, start, now):
+        """New attendance record, plus the session's activity, in one transaction; returns its id"""
+        stamp = _sql_time(now)
+        return self._write([
+            self._touch_session(state.id, now, None, now),
+            ("INSERT INTO attendanceRecords (userId, ssid, ipAddress, macAddress, computerName, "
+             "connectionStartTime, isActive, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)",
+             (state.user_id, ssid, ip_address, state.mac, computer_name, _sql_time(start), stamp, stamp)),
+        ])
+
+    def close_record(self, record_id, end, duration, now):
+        self._write([self._close_record(record_id, end, duration, now)])
+
+    def set_idle(self, state, record_id, idle_time, duration, now):
+        statements = [self._touch_session(state.id, now, idle_time, now)]
+        if record_id is not None:
+            statements.append(self._close_record(record_id, idle_time, duration, now))
+        self._write(statements)
+
+    def end_session(self, session_id, record_id, end, duration, now):
+        """Deactivate a session (logout, cleanup) and close its open record"""
+        statements = [("UPDATE desktopSessions SET isActive = 0, updatedAt = ? WHERE id = ?",
+                       (_sql_time(now), session_id))]
+        if record_id is not None:
+            statements.append(self._close_record(record_id, end, duration, now))
+        self._write(statements)
+
+    def flush_activity(self, rows):
+        """Bulk lastActivityAt/idleSince update: rows of (session id, last activity, idle since)"""
+        now = _sql_time(time.time())
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany(
+                "UPDATE desktopSessions SET lastActivityAt = ?, idleSince = ?, updatedAt = ? WHERE id = ?",
+                [(_sql_time(last), _sql_time(idle), now, session_id) for session_id, last, idle in rows])
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        self.transactions += 1
+
+    def upsert_telemetry(self, rows):
+        """Latest telemetry summary per device: rows of (user id, MAC, received at, summary JSON)"""
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany(
+                "INSERT INTO agentTelemetry (userId, macAddress, receivedAt, summary) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (userId, macAddress) DO UPDATE SET receivedAt = excluded.receivedAt, "
+                "summary = excluded.summary",
+                [(user_id, mac, _sql_time(received), summary) for user_id, mac, received, summary in rows])
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        self.transactions += 1
+
+    def upsert_summary(self, user_id, summary):
+        self._write([(
+            "INSERT INTO dailySummaries (userId, date, sessions, totalSeconds, firstSeen, lastSeen, "
+            "macAddress, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (userId, date) DO UPDATE SET "
+            "sessions = excluded.sessions, totalSeconds = excluded.totalSeconds, firstSeen = excluded.firstSeen, "
+            "lastSeen = excluded.lastSeen, macAddress = excluded.macAddress, updatedAt = excluded.updatedAt",
+            (user_id, summary['date'], summary['sessions'], summary['totalSeconds'],
+             _sql_time(summary['firstSeen']), _sql_time(summary['lastSeen']), summary['macAddress'],
+             _sql_time(time.time())))])
+
+
+class ReferenceServer:
+    """asyncio HTTP server for the desktop API over a Store"""
+
+    def __init__(self, db_path, host='127.0.0.1', port=9600, secret=JWT_SECRET,
+                 flush_interval=FLUSH_INTERVAL, policy=None):
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.flush_interval = flush_interval
+        self.policy = policy            # office network policy served at /network-policy, if any
+        self.store = None
+        self.sessions = {}              # (user id, MAC) -> SessionState
+        self.by_token = {}              # token -> SessionState
+        self._users = {}                # email -> (user row, loaded at)
+        self._dirty = {}                # session id -> SessionState with unwritten activity
+        self._telemetry = {}            # (user id, MAC) -> (received at, summary JSON) not yet written
+        self._flush_now = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ReferenceDB')
+        self._server = None
+        self._tasks = []
+        self._connections = set()       # tasks serving keep-alive connections
+        self._loop = None
+        self._thread = None
+        self.stats = {'requests': 0, 'heartbeats': 0, 'flushes': 0, 'rows_flushed': 0, 'cleaned_up': 0,
+                      'telemetry': 0}
+
+    # ----- lifecycle -----
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._flush_now = asyncio.Event()
+        self.store = await self._db(Store, self.db_path)
+        for state in await self._db(lambda: self.store.active_sessions()):
+            self._index(state)
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._tasks = [asyncio.ensure_future(self._cleanup_loop())]
+        if self.flush_interval:
+            self._tasks.append(asyncio.ensure_future(self._flush_loop()))
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for task in self._tasks + list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._connections, return_exceptions=True)
+        await self._flush()
+        await self._db(self.store.close)
+        self._executor.shutdown(wait=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def start_in_thread(self):
+        """Run on a background event loop (benchmarks); returns once listening"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='ReferenceServer', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _db(self, function, *args):
+        return await self._loop.run_in_executor(self._executor, function, *args)
+
+    # ----- in-memory index -----
+
+    def _index(self, state):
+        self.sessions[(state.user_id, state.mac)] = state
+        self.by_token[state.token] = state
+
+    def _unindex(self, state):
+        self.sessions.pop((state.user_id, state.mac), None)
+        if self.by_token.get(state.token) is state:
+            del self.by_token[state.token]
+        self._dirty.pop(state.id, None)
+
+    async def _user(self, email):
+        cached = self._users.get(email)
+        if cached and time.time() - cached[1] < USER_CACHE_SECONDS:
+            return cached[0]
+        user = await self._db(self.store.user_by_email, email)
+        self._users[email] = (user, time.time())
+        return user
+
+    async def _touch(self, state, now):
+        """Record activity: buffered for the next bulk flush, or written at once"""
+        state.last_activity = now
+        state.idle_since = None
+        if not self.flush_interval:
+            await self._db(self.store.flush_activity, [(state.id, now, None)])
+            return
+        self._dirty[state.id] = state
+        if len(self._dirty) >= FLUSH_MAX:
+            self._flush_now.set()
+
+    async def _keep_telemetry(self, state, summary, now):
+        """Keep the latest telemetry summary of a device; written with the next flush"""
+        text = json.dumps(summary, separators=(',', ':'))
+        if len(text) > MAX_TELEMETRY:
+            return
+        self.stats['telemetry'] += 1
+        self._telemetry[(state.user_id, state.mac)] = (now, text)
+        if not self.flush_interval:
+            await self._flush()
+
+    async def _flush(self):
+        if self._telemetry:
+            rows = [(user_id, mac, received, text)
+                    for (user_id, mac), (received, text) in self._telemetry.items()]
+            self._telemetry = {}
+            await self._db(self.store.upsert_telemetry, rows)
+        if not self._dirty:
+            return
+        rows = [(state.id, state.last_activity, state.idle_since) for state in self._dirty.values()]
+        self._dirty = {}
+        await self._db(self.store.flush_activity, rows)
+        self.stats['flushes'] += 1
+        self.stats['rows_flushed'] += len(rows)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                print(f"Activity flush failed: {str(e)}")
+
+    async def _cleanup_loop(self):
+        """Close sessions without activity (idle ones after IDLE_SESSION_TIMEOUT)"""
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            now = time.time()
+            for state in list(self.sessions.values()):
+                if state.idle_since is not None:
+                    stale = state.idle_since < now - IDLE_SESSION_TIMEOUT
+                else:
+                    stale = state.last_activity < now - SESSION_TIMEOUT
+                if stale:
+                    await self._end_session(state, now, now)
+                    self.stats['cleaned_up'] += 1
+
+    async def _end_session(self, state, end, now):
+        self._unindex(state)
+        duration = end - state.record_start if state.record_id is not None else None
+        await self._db(self.store.end_session, state.id, state.record_id, end, duration, now)
+
+    # ----- HTTP -----
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                    if not request_line:
+                        break
+                    headers = {}
+                    while True:
+                        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # A request or header line longer than the stream limit (64 KB)
+                    self._respond(writer, 431, {'success': False, 'message': 'Header line too long'}, False)
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    self._respond(writer, 400, {'success': False, 'message': 'Bad request'}, False)
+                    break
+                if length > MAX_BODY:
+                    self._respond(writer, 413, {'success': False, 'message': 'Payload too large'}, False)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b''
+
+                status, response = await self.dispatch(method, target, headers, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                self._respond(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, asyncio.CancelledError):
+            pass  # Client went away or stalled, or the server is closing
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, body, keep_alive):
+        data = json.dumps(body).encode() if body is not None else b''
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + data)
+
+    async def dispatch(self, method, target, headers, body):
+        """(status, JSON body) for one request"""
+        self.stats['requests'] += 1
+        path = target.split('?', 1)[0]
+        if not path.startswith(API_PREFIX + '/'):
+            return 404, {'success': False, 'message': 'Not found'}
+        route = (method, path[len(API_PREFIX):])
+        handler = {
+            ('POST', '/login'): self.login,
+            ('POST', '/logout'): self.logout,
+            ('POST', '/track-connection'): self.track_connection,
+            ('POST', '/daily-summary'): self.daily_summary,
+            ('GET', '/network-policy'): self.network_policy,
+        }.get(route)
+        if handler is None:
+            return 404, {'success': False, 'message': 'Not found'}
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                payload = {}
+        except ValueError:
+            return 400, {'success': False, 'message': 'Bad request'}
+        try:
+            if route == ('POST', '/login'):
+                return await handler(payload)
+            user_id, state = await self._authenticate(headers)
+            return await handler(user_id, state, payload)
+        except ApiError as e:
+            return e.status, e.body
+        except Exception as e:
+            print(f"Error handling {method} {path}: {str(e)}")
+            return 500, {'success': False, 'message': 'Internal server error'}
+
+    async def _authenticate(self, headers):
+        """authJwt.verifyToken: (user id, desktop session or None)"""
+        token = headers.get('x-access-token') or headers.get('authorization')
+        if token and token.startswith('Bearer '):
+            token = token[7:]
+        if not token:
+            raise ApiError(403, "No token provided!", envelope=False)
+        claims = jwt_verify(token, self.secret)
+        if claims is None:
+            raise ApiError(401, "Unauthorized!", envelope=False)
+        state = None
+        if claims.get('isDesktopClient'):
+            state = self.by_token.get(token)
+            if state is None or state.user_id != claims.get('id'):
+                raise ApiError(401, "Desktop session not found or has been logged out", envelope=False)
+            await self._touch(state, time.time())
+        elif not await self._db(self.store.user_exists, claims.get('id')):
+            raise ApiError(404, "User not found", envelope=False)
+        return claims.get('id'), state
+
+    @staticmethod
+    def _success(message, data=None):
+        return 200, {'success': True, 'message': message, 'data': data if data is not None else {}}
+
+    # ----- controllers -----
+
+    async def login(self, payload):
+        email, password = payload.get('email'), payload.get('password')
+        mac, ssid = payload.get('macAddress'), payload.get('ssid')
+        if not email or not password or not mac or not ssid:
+            raise ApiError(400, "Email, password, MAC address, and SSID are required")
+
+        user = await self._user(email)
+        if not user:
+            raise ApiError(401, "User not found")
+        if not user['isActive']:
+            raise ApiError(401, "Account is inactive")
+        # Hashing is slow on purpose; keep it off the event loop and the database thread
+        if not await self._loop.run_in_executor(None, verify_password, password, user['password']):
+            raise ApiError(401, "Invalid password")
+
+        existing = next((state for state in self.sessions.values() if state.user_id == user['id']), None)
+        if existing and existing.mac != mac:
+            raise ApiError(400, "User already registered with a different device")
+
+        now = time.time()
+        token = jwt_sign({'id': user['id'], 'isDesktopClient': True, 'iat': int(now)}, self.secret)
+        if existing:
+            await self._db(self.store.update_session_token, existing.id, token, now)
+            self.by_token.pop(existing.token, None)
+            existing.token = token
+            existing.last_activity = now
+            self.by_token[token] = existing
+        else:
+            session_id = await self._db(self.store.create_session, user['id'], mac, ssid, token, now)
+            self._index(SessionState(session_id, user['id'], mac, token, now))
+
+        return self._success("Login successful", {
+            'id': user['id'], 'username': user['username'], 'email': user['email'],
+            'fullName': user['fullName'], 'accessToken': token,
+        })
+
+    async def logout(self, user_id, state, payload):
+        session = state or next((s for s in self.sessions.values() if s.user_id == user_id), None)
+        if session:
+            now = time.time()
+            end = reported_time(payload.get('logout_time'), session.record_start, now)
+            await self._end_session(session, end, now)
+        return self._success("Logout successful")
+
+    async def track_connection(self, user_id, auth_state, payload):
+        event_type, ssid = payload.get('event_type'), payload.get('ssid')
+        email, mac = payload.get('email'), payload.get('mac_address')
+        if not event_type or not ssid or not email or not mac:
+            raise ApiError(400, "Event type, SSID, email, and MAC address are required")
+
+        user = await self._user(email)
+        if not user:
+            raise ApiError(401, "User not found")
+        state = self.sessions.get((user['id'], mac))
+        if state is None:
+            raise ApiError(400, "No active session found for this device")
+
+        now = time.time()
+        if event_type == 'connect':
+            try:
+                start = float(payload.get('connection_start_time'))
+            except (TypeError, ValueError):
+                start = now
+            state.record_id = await self._db(self.store.open_record, state, ssid,
+                                             payload.get('ip_address') or '', payload.get('computer_name'),
+                                             start, now)
+            state.record_start = start
+            state.last_activity, state.idle_since = now, None
+            self._dirty.pop(state.id, None)
+            return self._success("Connection recorded successfully", {'recordId': state.record_id})
+
+        if event_type == 'heartbeat':
+            self.stats['heartbeats'] += 1
+            if state.record_id is None:
+                # No active connection found, create a new one
+                state.record_id = await self._db(self.store.open_record, state, ssid,
+                                                 payload.get('ip_address') or '', payload.get('computer_name'),
+                                                 now, now)
+                state.record_start = now
+                state.last_activity, state.idle_since = now, None
+            else:
+                await self._touch(state, now)
+            if isinstance(payload.get('telemetry'), dict):
+                await self._keep_telemetry(state, payload['telemetry'], now)
+            return self._success("Heartbeat recorded successfully")
+
+        if event_type == 'disconnect':
+            if state.record_id is None:
+                raise ApiError(400, "No active connection found to disconnect")
+            record_id = state.record_id
+            end = reported_time(payload.get('disconnect_time'), state.record_start, now)
+            await self._db(self.store.close_record, record_id, end, payload.get('connection_duration'), now)
+            state.record_id = state.record_start = None
+            return self._success("Disconnection recorded successfully", {
+                'recordId': record_id, 'duration': payload.get('connection_duration_formatted')})
+
+        if event_type == 'idle':
+            record_id = state.record_id
+            idle_time = reported_time(payload.get('idle_since'), state.record_start, now)
+            duration = idle_time - state.record_start if record_id is not None else None
+            await self._db(self.store.set_idle, state, record_id, idle_time, duration, now)
+            state.record_id = state.record_start = None
+            state.last_activity, state.idle_since = now, idle_time
+            self._dirty.pop(state.id, None)
+            return self._success("Idle recorded successfully", {'recordId': record_id})
+
+        raise ApiError(400, "Invalid event type")
+
+    async def daily_summary(self, user_id, state, payload):
+        date = payload.get('date')
+        if not isinstance(date, str) or len(date) != 10 or payload.get('total_seconds') is None:
+            raise ApiError(400, "Date (YYYY-MM-DD) and total seconds are required")
+        try:
+            datetime.strptime(date, '%Y-%m-%d')
+            total_seconds = float(payload['total_seconds'])
+        except (TypeError, ValueError):
+            raise ApiError(400, "Date (YYYY-MM-DD) and total seconds are required")
+        if not 0 <= total_seconds <= 86400:
+            raise ApiError(400, "Total seconds must be between 0 and 86400")
+        summary = {
+            'date': date, 'sessions': int(payload.get('sessions') or 0), 'totalSeconds': total_seconds,
+            'firstSeen': payload.get('first_seen') or None, 'lastSeen': payload.get('last_seen') or None,
+            'macAddress': payload.get('mac_address'),
+        }
+        await self._db(self.store.upsert_summary, user_id, summary)
+        return self._success("Daily summary recorded successfully", {'date': date, 'totalSeconds': total_seconds})
+
+    async def network_policy(self, user_id, state, payload):
+        if self.policy is None:
+            raise ApiError(404, "Not found")
+        return self._success("Network policy", self.policy)
+
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # A hostname or '' (all interfaces)
+
+
+def serve(db_path, host, port, flush_interval, policy=None):
+    """Run until interrupted; prints the URL when listening and a stats line on exit"""
+    async def run():
+        server = await ReferenceServer(db_path, host, port, flush_interval=flush_interval,
+                                       policy=policy).start()
+        print(f"Desktop API at {server.url} ({db_path}, {len(server.sessions)} active sessions)", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+            stats = dict(server.stats, write_transactions=server.store.transactions,
+                         cpu_s=round(time.process_time(), 3))
+            print(f"Stats: {json.dumps(stats)}", flush=True)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+# ===== Benchmark =====
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _bench_worker(url, agent_ids, duration):
+    """One client process: an agent ApiClient per id sending heartbeats back to back"""
+    from desktop_agent_fixed import ApiClient
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+    from fault_proxy import StaticNetwork
+
+    tunables = Tunables(defaults={'api_base_url': url})
+    latencies, failures = [], []
+    clients = {}
+    with quiet_agent():
+        for agent_id in agent_ids:
+            client = ApiClient(network=StaticNetwork(agent_id), tunables=tunables)
+            if client.login(f"user{agent_id}@bench.local", 'bench')[0] and client.track_connection()[0]:
+                clients[agent_id] = client
+            else:
+                failures.append('login')
+
+        def run(client):
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                success, message = client.send_heartbeat()
+                latencies.append(time.perf_counter() - started)
+                if not success:
+                    failures.append(message)
+            client.track_connection(is_connect=False)
+            client.logout()
+
+        threads = [threading.Thread(target=run, args=(client,), daemon=True) for client in clients.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies, len(failures)
+
+
+def run_benchmark(agents=50, duration=10.0, processes=None):
+    """Heartbeat throughput of agent ApiClients (in `processes` client processes) against the
+    server in its own process: write-through vs bulk flush. POSIX only (stops the server with SIGINT)."""
+    import signal
+    import subprocess
+    import multiprocessing
+
+    processes = processes or min(4, os.cpu_count() or 1)
+    directory = tempfile.mkdtemp(prefix='reference-bench-')
+    results = {}
+    for variant, flush_interval in (('write_through', 0), ('bulk', FLUSH_INTERVAL)):
+        db_path = os.path.join(directory, f"{variant}.sqlite")
+        store = Store(db_path)
+        for agent_id in range(agents):
+            store.add_user(f"user{agent_id}@bench.local", 'bench', iterations=1000)
+        store.close()
+
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--db', db_path,
+                                   '--host', '127.0.0.1', '--port', '0', '--flush-interval', str(flush_interval)],
+                                  stdout=subprocess.PIPE, text=True)
+        url = server.stdout.readline().split()[3]
+        started = time.monotonic()
+        with multiprocessing.Pool(processes) as pool:
+            outcomes = pool.starmap(_bench_worker, [(url, range(index, agents, processes), duration)
+                                                    for index in range(processes)])
+        elapsed = time.monotonic() - started
+        server.send_signal(signal.SIGINT)
+        output, _ = server.communicate(timeout=30)
+        stats = json.loads(next(line for line in output.splitlines() if line.startswith('Stats: '))[7:])
+
+        latencies = [latency for worker_latencies, _ in outcomes for latency in worker_latencies]
+        results[variant] = {
+            'heartbeats_per_s': round(len(latencies) / elapsed),
+            'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 2),
+            'latency_p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+            'failures': sum(failures for _, failures in outcomes),
+            'server_cpu_us_per_request': round(stats['cpu_s'] / stats['requests'] * 1e6, 1),
+            'write_transactions': stats['write_transactions'],
+            'bulk_flushes': stats['flushes'],
+            'rows_per_flush': round(stats['rows_flushed'] / stats['flushes'], 1) if stats['flushes'] else None,
+        }
+    shutil.rmtree(directory, ignore_errors=True)
+    return {'agents': agents, 'client_processes': processes, 'duration_s': duration, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Desktop API reference server")
+    parser.add_argument('--bench', action='store_true', help="Heartbeat throughput, write-through vs bulk")
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--processes', type=int, help="Client processes (default: up to 4)")
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help="Run the server")
+    serve_parser.add_argument('--db', default='desktop_api.sqlite')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help="Listen address; other than loopback only with $JWT_SECRET set")
+    serve_parser.add_argument('--port', type=int, default=9600)
+    serve_parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL,
+                              help="Seconds between bulk activity writes (0: write through)")
+    serve_parser.add_argument('--policy', help="JSON file with the office network policy")
+    user_parser = subparsers.add_parser('add-user', help="Create a user")
+    user_parser.add_argument('email')
+    user_parser.add_argument('password')
+    user_parser.add_argument('--name')
+    user_parser.add_argument('--db', default='desktop_api.sqlite')
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.agents, args.duration, args.processes), indent=2))
+    elif args.command == 'serve':
+        if not _is_loopback(args.host) and 'JWT_SECRET' not in os.environ:
+            parser.error(f"refusing to serve on {args.host} with the default JWT secret; set $JWT_SECRET")
+        policy = None
+        if args.policy:
+            with open(args.policy) as f:
+                policy = json.load(f)
+        serve(args.db, args.host, args.port, args.flush_interval, policy)
+    elif args.command == 'add-user':
+        store = Store(args.db)
+        try:
+            user_id = store.add_user(args.email, args.password, args.name)
+        except sqlite3.IntegrityError:
+            print(f"User {args.email} already exists")
+            return 1
+        finally:
+            store.close()
+        print(f"Created user {user_id}: {args.email}")
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
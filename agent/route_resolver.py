@@ -0,0 +1,281 @@
+"""
+Local address resolution for the Office Agent.
+
+Finds the address this machine uses to reach the API server by asking the
+routing table rather than opening a socket to 8.8.8.8 on every probe. That
+gives the right answer on isolated office VLANs without an Internet route, and
+on multi-homed or VPN machines where the office route is not the default one.
+
+    Linux    rtnetlink RTM_GETROUTE (honours policy routing, like `ip route get`),
+             falling back to /proc/net/route + SIOCGIFADDR
+    other    UDP connect() towards the API host (no packets are sent)
+
+The answer is cached until the kernel reports an address, link or route change
+(rtnetlink multicast on Linux, NotifyAddrChange on Windows) or, where no change
+notification is available, for CACHE_TTL seconds.
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import threading
+from urllib.parse import urlparse
+
+CACHE_TTL = 60          # seconds, only used without change notifications
+FALLBACK_TARGET = '8.8.8.8'
+LOOPBACK_ADDRESS = '127.0.0.1'
+
+# rtnetlink constants (linux/rtnetlink.h)
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 1
+RTA_DST = 1
+RTA_OIF = 4
+RTA_PREFSRC = 7
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+RTMSG = struct.Struct('=BBBBBBBBI')
+RTATTR = struct.Struct('=HH')
+
+SIOCGIFADDR = 0x8915
+RTF_UP = 0x1
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def netlink_route_source(target_ip):
+    """(source address, interface index) the kernel would use to reach target_ip"""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        sock.settimeout(1.0)
+        sock.bind((0, 0))
+        attribute = RTATTR.pack(RTATTR.size + 4, RTA_DST) + socket.inet_aton(target_ip)
+        body = RTMSG.pack(socket.AF_INET, 32, 0, 0, 0, 0, 0, 0, 0) + attribute
+        sequence = int(time.time()) & 0xffffffff
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), RTM_GETROUTE,
+                                    NLM_F_REQUEST, sequence, 0) + body)
+        data = sock.recv(65536)
+    finally:
+        sock.close()
+
+    length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data)
+    if message_type == NLMSG_ERROR:
+        error = -struct.unpack_from('=i', data, NLMSG_HEADER.size)[0]
+        raise OSError(error, os.strerror(error))
+    if message_type != RTM_NEWROUTE:
+        raise OSError(f"Unexpected netlink reply type {message_type}")
+
+    source = None
+    interface = None
+    offset = NLMSG_HEADER.size + RTMSG.size
+    while offset + RTATTR.size <= length:
+        attr_length, attr_type = RTATTR.unpack_from(data, offset)
+        if attr_length < RTATTR.size:
+            break
+        value = data[offset + RTATTR.size:offset + attr_length]
+        if attr_type == RTA_PREFSRC:
+            source = socket.inet_ntoa(value)
+        elif attr_type == RTA_OIF:
+            interface = struct.unpack('=I', value)[0]
+        offset += _align(attr_length)
+    return source, interface
+
+
+def interface_address(name):
+    """Primary IPv4 address of a network interface (Linux ioctl)"""
+    import fcntl
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        request = struct.pack('256s', name[:15].encode())
+        return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+    finally:
+        sock.close()
+
+
+def proc_route_interface(target_ip, path='/proc/net/route'):
+    """Interface of the longest-prefix, lowest-metric route in /proc/net/route"""
+    target = struct.unpack('<I', socket.inet_aton(target_ip))[0]
+    best = None
+    with open(path) as f:
+        next(f)  # header
+        for line in f:
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            destination, flags, metric, mask = (int(fields[1], 16), int(fields[3], 16),
+                                                int(fields[6]), int(fields[7], 16))
+            if not flags & RTF_UP or target & mask != destination:
+                continue
+            key = (bin(mask).count('1'), -metric)
+            if best is None or key > best[0]:
+                best = (key, fields[0])
+    return best[1] if best else None
+
+
+def udp_source(target_ip):
+    """Source address chosen by the OS for a datagram to target_ip (sends nothing)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((target_ip, 80))
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+class _NetlinkChanges:
+    """Non-blocking rtnetlink subscription; changed() drains pending notifications"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        self.sock.setblocking(False)
+
+    def changed(self):
+        changed = False
+        while True:
+            try:
+                if not self.sock.recv(65536):
+                    return changed
+                changed = True
+            except BlockingIOError:
+                return changed
+            except OSError:
+                return True  # ENOBUFS: notifications were lost, assume a change
+
+    def close(self):
+        self.sock.close()
+
+
+class _WindowsAddrChanges:
+    """NotifyAddrChange with an overlapped event, polled without blocking"""
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+
+        class OVERLAPPED(ctypes.Structure):
+            _fields_ = [('Internal', ctypes.c_void_p), ('InternalHigh', ctypes.c_void_p),
+                        ('Offset', wintypes.DWORD), ('OffsetHigh', wintypes.DWORD),
+                        ('hEvent', wintypes.HANDLE)]
+
+        self.ctypes = ctypes
+        self.kernel32 = ctypes.windll.kernel32
+        self.iphlpapi = ctypes.windll.iphlpapi
+        self.kernel32.CreateEventW.restype = wintypes.HANDLE
+        self.overlapped = OVERLAPPED()
+        self.overlapped.hEvent = self.kernel32.CreateEventW(None, False, False, None)
+        self.handle = wintypes.HANDLE()
+        self._arm()
+
+    def _arm(self):
+        result = self.iphlpapi.NotifyAddrChange(self.ctypes.byref(self.handle),
+                                                self.ctypes.byref(self.overlapped))
+        if result not in (0, 997):  # NO_ERROR, ERROR_IO_PENDING
+            raise OSError(result, "NotifyAddrChange failed")
+
+    def changed(self):
+        if self.kernel32.WaitForSingleObject(self.overlapped.hEvent, 0) != 0:
+            return False
+        self._arm()
+        return True
+
+    def close(self):
+        self.iphlpapi.CancelIPChangeNotify(self.ctypes.byref(self.overlapped))
+        self.kernel32.CloseHandle(self.overlapped.hEvent)
+
+
+class RouteResolver:
+    """Cached local address on the route towards the API host"""
+
+    def __init__(self, target_url, platform=None, clock=None, ttl=CACHE_TTL):
+        # target_url may be a callable so runtime changes to the API URL are followed
+        self._target_url = target_url if callable(target_url) else (lambda: target_url)
+        self.platform = platform or sys.platform
+        self.clock = clock or time
+        self.ttl = ttl
+        self.method = None
+        self._lock = threading.Lock()
+        self._cached = None
+        self._cached_for = None
+        self._cached_at = 0.0
+        self._changes = None
+        self._changes_failed = False
+        self._url_host = (None, None)
+        self.lookups = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._cached = None
+
+    def _notifier(self):
+        if self._changes is None and not self._changes_failed:
+            try:
+                if self.platform.startswith('linux'):
+                    self._changes = _NetlinkChanges()
+                elif self.platform == 'win32':
+                    self._changes = _WindowsAddrChanges()
+            except Exception:
+                self._changes_failed = True  # Fall back to the TTL
+        return self._changes
+
+    def _target_ip(self, host):
+        try:
+            infos = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+            target = infos[0][4][0]
+        except (OSError, IndexError):
+            return FALLBACK_TARGET
+        # A server on this machine says nothing about our network; use the default route
+        return FALLBACK_TARGET if target.startswith('127.') else target
+
+    def local_address(self):
+        """Address on the route to the API host; cached until the network changes"""
+        url = self._target_url()
+        if self._url_host[0] != url:
+            self._url_host = (url, urlparse(url).hostname or 'localhost')
+        host = self._url_host[1]
+        notifier = self._notifier()
+        with self._lock:
+            changed = notifier.changed() if notifier else False
+            fresh = (notifier is not None or self.clock.time() - self._cached_at < self.ttl)
+            if self._cached and self._cached_for == host and fresh and not changed:
+                return self._cached
+
+            address = self._resolve(self._target_ip(host))
+            self.lookups += 1
+            self._cached = address if address != LOOPBACK_ADDRESS else None
+            self._cached_for = host
+            self._cached_at = self.clock.time()
+            return address
+
+    def _resolve(self, target_ip):
+        if self.platform.startswith('linux'):
+            try:
+                source, interface = netlink_route_source(target_ip)
+                if not source and interface:
+                    source = interface_address(socket.if_indextoname(interface))
+                if source:
+                    self.method = 'rtnetlink'
+                    return source
+            except Exception:
+                pass
+            try:
+                interface = proc_route_interface(target_ip)
+                if interface:
+                    self.method = 'proc'
+                    return interface_address(interface)
+            except Exception:
+                pass
+        try:
+            self.method = 'udp'
+            return udp_source(target_ip)
+        except OSError:
+            self.method = None
+            return LOOPBACK_ADDRESS
@@ -0,0 +1,316 @@
+"""
+Bounded-time shutdown for the Office Agent.
+
+Stopping the agent used to POST the final disconnect and then the logout one
+after the other with no deadline, on the caller's thread (the Qt main thread
+for the tray). Now:
+
+    1. the disconnect and logout are written to a journal (fsync'd) first
+    2. both requests run concurrently on worker threads
+    3. the caller waits at most `shutdown_deadline` seconds (tunable, 0.5 s)
+    4. whatever did not get a definite answer stays in the journal and is
+       replayed, in order and with the original token and times, next start
+
+The server closes the open attendance record on logout as well, so the
+disconnect counts as recorded if either request succeeds.
+
+OS session-end hooks: install_signal_handlers() covers SIGTERM/SIGINT (and
+SIGBREAK/SIGHUP where they exist); the tray adds logind PrepareForShutdown and
+WM_QUERYENDSESSION (see system_tray_agent_fixed.py).
+
+Measure exit time and disconnect delivery through fault_proxy.py:
+    python shutdown_pipeline.py --bench
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+
+SHUTDOWN_JOURNAL = os.path.join(os.path.expanduser('~'), '.office_agent_shutdown_journal.jsonl')
+JOURNAL_MAX_AGE = 7 * 24 * 3600   # older entries are dropped instead of replayed
+
+
+class ShutdownJournal:
+    """Write-ahead log of shutdown requests not yet confirmed by the server"""
+
+    def __init__(self, path=SHUTDOWN_JOURNAL, clock=None, max_age=JOURNAL_MAX_AGE):
+        self.path = path
+        self.clock = clock or time
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._memory = []  # Used when path is None (simulation)
+
+    def _read(self):
+        if not self.path:
+            return list(self._memory)
+        if not os.path.exists(self.path):
+            return []
+        entries, done = [], set()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from a killed process
+                    if 'done' in record:
+                        done.add(record['done'])
+                    elif 'id' in record:
+                        entries.append(record)
+        except OSError:
+            return []
+        return [entry for entry in entries if entry['id'] not in done]
+
+    def _write_line(self, record, sync):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def add(self, path, payload, token):
+        """Journal a request before sending it; returns the entry"""
+        entry = {'id': os.urandom(6).hex(), 'path': path, 'payload': payload, 'token': token,
+                 'at': int(self.clock.time())}
+        with self._lock:
+            if not self.path:
+                self._memory.append(entry)
+                return entry
+            try:
+                self._write_line(entry, sync=True)
+            except OSError as e:
+                print(f"Could not journal {path}: {str(e)}")
+        return entry
+
+    def complete(self, entry):
+        with self._lock:
+            if not self.path:
+                self._memory = [item for item in self._memory if item['id'] != entry['id']]
+                return
+            try:
+                self._write_line({'done': entry['id']}, sync=False)
+            except OSError:
+                pass  # Replaying a finished request is harmless: the server rejects it
+
+    def pending(self):
+        with self._lock:
+            return self._read()
+
+    def _rewrite(self, entries):
+        if not self.path:
+            self._memory = list(entries)
+            return
+        try:
+            if not entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + '\n')
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    def replay(self, api_client, timeout=None, quiet=False):
+        """Resend journaled requests in order; stops at the first one the server did not answer.
+        Returns the number of entries settled (sent, or rejected by the server for good)."""
+        with self._lock:
+            entries = self._read()
+            if not entries:
+                return 0
+            now = self.clock.time()
+            settled = 0
+            remaining = []
+            for index, entry in enumerate(entries):
+                if now - entry.get('at', 0) > self.max_age:
+                    settled += 1
+                    continue
+                status, message = api_client.post_as(entry['path'], entry['payload'], entry['token'], timeout)
+                if _is_final(status):
+                    if not quiet:
+                        print(f"Replayed {entry['path']} from shutdown journal: {status} {message}")
+                    settled += 1
+                    continue
+                remaining = entries[index:]
+                break
+            self._rewrite(remaining)
+            return settled
+
+
+def _is_final(status):
+    """2xx, or a 4xx the server will keep returning (session gone, record already closed)"""
+    return 200 <= status < 300 or (400 <= status < 500 and status not in (408, 429))
+
+
+class ShutdownPipeline:
+    """Final disconnect + logout under a hard deadline; runs at most once per instance"""
+
+    def __init__(self, agent, journal=None, deadline=None):
+        self.agent = agent
+        self.journal = journal or getattr(agent, 'shutdown_journal', None) or ShutdownJournal(path=None)
+        self.deadline = deadline
+        self.result = None
+        self._lock = threading.Lock()
+
+    def run(self, reason='stop'):
+        with self._lock:
+            if self.result is None:
+                self.result = self._run(reason)
+            return self.result
+
+    def _run(self, reason):
+        started = time.monotonic()
+        agent = self.agent
+        client = agent.api_client
+        deadline = self.deadline if self.deadline is not None else agent.tunables.shutdown_deadline
+        agent.is_running = False
+
+        # Events still waiting in the outbound queue go to the journal ahead of the disconnect
+        outbound = getattr(client, 'outbound', None)
+        if outbound is not None:
+            outbound.stop(self.journal)
+
+        token = client.access_token
+        if not token:
+            return {'reason': reason, 'elapsed_s': 0.0, 'disconnect': 'not_connected', 'logout': 'not_logged_in'}
+
+        requests = {}
+        if client.connected:
+            if agent.ledger:
+                agent.ledger.close()
+            # The last network the agent saw: an SSID probe here can take seconds (PROBE_TIMEOUT)
+            ssid = agent._link_ssid or agent.previous_ssid
+            requests['disconnect'] = self.journal.add('/track-connection', client.disconnect_payload(ssid), token)
+        requests['logout'] = self.journal.add('/logout', client.logout_payload(), token)
+
+        outcomes = {name: 'timeout' for name in requests}
+        finished = {name: threading.Event() for name in requests}
+
+        def send(name, entry):
+            remaining = max(deadline - (time.monotonic() - started), 0.05)
+            status, message = client.post_as(entry['path'], entry['payload'], token, remaining)
+            if 200 <= status < 300:
+                outcomes[name] = 'ok'
+                self.journal.complete(entry)
+            elif _is_final(status):
+                outcomes[name] = f"rejected: {message}"
+                self.journal.complete(entry)
+            else:
+                outcomes[name] = f"failed: {message}"
+            finished[name].set()
+
+        for name, entry in requests.items():
+            worker = threading.Thread(target=send, args=(name, entry), name=f"shutdown-{name}")
+            worker.daemon = True
+            worker.start()
+
+        for name in requests:
+            finished[name].wait(max(deadline - (time.monotonic() - started), 0))
+
+        # Logout closes the open record on the server, so the disconnect is recorded either way
+        if 'disconnect' in requests and outcomes['disconnect'] != 'ok' and outcomes['logout'] == 'ok':
+            self.journal.complete(requests['disconnect'])
+            outcomes['disconnect'] = 'closed_by_logout'
+
+        client.reset()
+        result = {'reason': reason, 'elapsed_s': round(time.monotonic() - started, 3)}
+        result.update(outcomes)
+        if 'disconnect' not in requests:
+            result['disconnect'] = 'not_connected'
+        result['journaled'] = len(self.journal.pending())
+        return result
+
+
+def install_signal_handlers(on_session_end):
+    """Call on_session_end(reason) on SIGTERM/SIGINT/SIGHUP/SIGBREAK (main thread only)"""
+    installed = []
+    for name in ('SIGTERM', 'SIGINT', 'SIGHUP', 'SIGBREAK'):
+        signal_number = getattr(signal, name, None)
+        if signal_number is None:
+            continue
+        try:
+            signal.signal(signal_number, lambda number, frame, name=name: on_session_end(name))
+            installed.append(name)
+        except (ValueError, OSError):
+            pass  # Not the main thread, or not supported here
+    return installed
+
+
+# ===== Benchmark =====
+
+def run_benchmark(modes=('ok', 'latency', 'error', 'reset', 'slowloris'), agents=10, deadline=0.5):
+    """Stop agents while the server misbehaves; report exit time and where each disconnect ended up"""
+    import tempfile
+    from desktop_agent_fixed import OfficeAgent
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+    from fault_proxy import FaultProxy, FaultScript, StaticNetwork
+
+    results = {}
+    directory = tempfile.mkdtemp(prefix='shutdown-bench-')
+    for mode in modes:
+        proxy = FaultProxy(script=FaultScript([{'mode': 'ok'}])).start()
+        elapsed, recorded_now, journaled = [], 0, 0
+        with quiet_agent():
+            stopped = []
+            for agent_id in range(agents):
+                tunables = Tunables(defaults={'api_base_url': proxy.url})
+                journal = ShutdownJournal(os.path.join(directory, f"{mode}-{agent_id}.jsonl"))
+                agent = OfficeAgent(f"user{agent_id}@bench.local", 'bench', network=StaticNetwork(agent_id),
+                                    tunables=tunables, shutdown_journal=journal)
+                agent.api_client.login(agent.email, agent.password)
+                agent.track_connection(is_connect=True)
+                stopped.append(agent)
+
+            proxy.script.set_mode(mode, latency=5.0, interval=0.5)
+            for agent in stopped:
+                result = agent.stop(deadline=deadline)
+                elapsed.append(result['elapsed_s'])
+                journaled += 1 if result['journaled'] else 0
+
+            proxy.script.set_mode(None)
+            time.sleep(0.2)
+            with proxy.backend_lock:
+                recorded_now = agents - len(proxy.backend.active_records)
+
+            # Next start: replay what the journal kept
+            for agent in stopped:
+                agent.shutdown_journal.replay(agent.api_client, timeout=2.0, quiet=True)
+            with proxy.backend_lock:
+                recorded_after_replay = agents - len(proxy.backend.active_records)
+        proxy.stop()
+        elapsed.sort()
+        results[mode] = {
+            'exit_p50_s': elapsed[len(elapsed) // 2],
+            'exit_max_s': elapsed[-1],
+            'disconnects_recorded_at_exit': recorded_now,
+            'agents_with_journal': journaled,
+            'disconnects_recorded_after_replay': recorded_after_replay,
+        }
+    return {'agents': agents, 'deadline_s': deadline, 'modes': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent shutdown pipeline")
+    parser.add_argument('--bench', action='store_true', help="Benchmark exit time under server faults")
+    parser.add_argument('--agents', type=int, default=10)
+    parser.add_argument('--deadline', type=float, default=0.5)
+    parser.add_argument('--journal', default=SHUTDOWN_JOURNAL, help="Show pending journal entries")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(agents=args.agents, deadline=args.deadline), indent=2))
+        return 0
+    for entry in ShutdownJournal(args.journal).pending():
+        print(json.dumps({key: value for key, value in entry.items() if key != 'token'}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
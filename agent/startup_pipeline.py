@@ -0,0 +1,221 @@
+"""
+Concurrent startup for the Office Agent.
+
+Startup used to run one step after the other: load credentials, read the MAC
+address, probe the SSID (inside the login payload), log in, then probe the SSID
+again in the first network check and send connect. OfficeAgent.authenticate now
+builds a dependency graph and runs every step as soon as the steps it needs are
+done:
+
+    credentials ──────────────────────────────┐
+    identity (MAC address) ───────────────────┤
+    ssid probe ───────────────────────────────┼─> login ─> policy ─> connect
+    dns ─┬─> preconnect ─> journal replay ────┘                        ^
+         └─> route (local IP) ─────────────────────────────────────────┘
+                                              (ssid feeds login and connect)
+
+Identity, the SSID probe, DNS resolution and the TCP (and TLS) pre-connect of
+the API host overlap; the one SSID probe feeds both the login and the first
+connect event. The time from the start of the graph until the server has
+acknowledged the first connect is reported as `time_to_first_connect_s`.
+
+Compare with the previous sequential order, with realistic probe latencies:
+    python startup_pipeline.py --bench
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import threading
+from urllib.parse import urlparse
+
+PRECONNECT_TIMEOUT = 5  # seconds; the pre-connect only warms the pool
+
+
+class StartupPipeline:
+    """Runs named steps on threads, each as soon as the steps it depends on are done"""
+
+    def __init__(self, cancelled=None, on_step=None):
+        self.cancelled = cancelled
+        self.on_step = on_step      # called with a step's name when it starts
+        self.steps = {}             # name -> (function(results), dependencies)
+        self.results = {}
+        self.errors = {}
+        self.timings = {}           # name -> (start, end) seconds since run() began
+        self.elapsed = None
+
+    def add(self, name, function, deps=()):
+        """Add a step; function receives the results dict of the steps run so far"""
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"{name} depends on unknown step {dep}")
+        self.steps[name] = (function, tuple(deps))
+        return self
+
+    def run(self):
+        """Run every step; returns once all of them finished, failed or were skipped"""
+        started = time.perf_counter()
+        finished = {name: threading.Event() for name in self.steps}
+
+        def execute(name):
+            function, deps = self.steps[name]
+            try:
+                for dep in deps:
+                    finished[dep].wait()
+                failed = [dep for dep in deps if dep in self.errors]
+                if failed:
+                    self.errors[name] = f"skipped: {failed[0]} failed"
+                elif self.cancelled is not None and self.cancelled.is_set():
+                    self.errors[name] = "cancelled"
+                else:
+                    begin = time.perf_counter() - started
+                    if self.on_step:
+                        self.on_step(name)
+                    try:
+                        self.results[name] = function(self.results)
+                    except Exception as e:
+                        self.errors[name] = str(e) or e.__class__.__name__
+                    self.timings[name] = (round(begin, 4), round(time.perf_counter() - started, 4))
+            finally:
+                finished[name].set()
+
+        threads = [threading.Thread(target=execute, args=(name,), name=f"startup-{name}", daemon=True)
+                   for name in self.steps]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = round(time.perf_counter() - started, 4)
+        return self
+
+    def report(self, first_connect='connect'):
+        """Step timings and errors, plus the time until the first connect was acknowledged"""
+        connected = first_connect in self.timings and first_connect not in self.errors \
+            and self.results.get(first_connect)
+        return {
+            'time_to_first_connect_s': self.timings[first_connect][1] if connected else None,
+            'elapsed_s': self.elapsed,
+            'steps': {name: list(self.timings[name]) for name in self.steps if name in self.timings},
+            'errors': dict(self.errors),
+        }
+
+
+def resolve_host(url):
+    """Resolve the API host (fills the resolver cache for the route lookup and the connect)"""
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    return sorted({info[4][0] for info in socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)})
+
+
+def preconnect(session, url, timeout=PRECONNECT_TIMEOUT):
+    """Open a keep-alive connection (TCP, and TLS for https) in the session's pool for url,
+    so the login request does not pay for the handshake. Returns False when not possible.
+    The connection is made by a HEAD request and handed back to the pool once answered."""
+    adapter = session.get_adapter(url) if hasattr(session, 'get_adapter') else None
+    if adapter is None or not hasattr(adapter, 'poolmanager'):
+        return False  # Not a requests.Session (simulation)
+    pool = adapter.poolmanager.connection_from_url(url)
+    response = pool.urlopen('HEAD', urlparse(url).path or '/', retries=False, redirect=False,
+                            timeout=timeout, preload_content=False)
+    response.drain_conn()
+    response.release_conn()
+    return True
+
+
+# ===== Benchmark =====
+
+class SlowNetwork:
+    """Network probes with the latencies they have on a real machine (netsh/iwgetid ~250 ms)"""
+
+    def __init__(self, network, ssid_delay=0.25, mac_delay=0.01, name_delay=0.005):
+        self.network = network
+        self.ssid_delay = ssid_delay
+        self.mac_delay = mac_delay
+        self.name_delay = name_delay
+        self.ssid_probes = 0
+
+    def get_current_ssid(self):
+        self.ssid_probes += 1
+        time.sleep(self.ssid_delay)
+        return self.network.get_current_ssid()
+
+    def get_mac_address(self):
+        time.sleep(self.mac_delay)
+        return self.network.get_mac_address()
+
+    def get_computer_name(self):
+        time.sleep(self.name_delay)
+        return self.network.get_computer_name()
+
+    def get_ip_address(self):
+        return self.network.get_ip_address()
+
+
+def run_benchmark(runs=5, ssid_delay=0.25, server_latency=0.05):
+    """Time to the first acknowledged connect: previous sequential order vs the startup graph"""
+    import tempfile
+    import desktop_agent_fixed
+    from desktop_agent_fixed import OfficeAgent
+    from agent_tunables import Tunables
+    from agent_simulator import quiet_agent
+    from fault_proxy import FaultProxy, StaticNetwork
+
+    proxy = FaultProxy().start()
+    proxy.script.set_mode('latency', latency=server_latency)
+    results = {}
+    saved_config = desktop_agent_fixed.CONFIG_FILE
+    config_dir = tempfile.mkdtemp(prefix='startup-bench-')
+    desktop_agent_fixed.CONFIG_FILE = os.path.join(config_dir, 'config')  # Not the user's saved login
+    with quiet_agent():
+        for variant in ('sequential', 'pipeline'):
+            times, probes = [], []
+            for run in range(runs):
+                network = SlowNetwork(StaticNetwork(run), ssid_delay)
+                agent = OfficeAgent(f"startup{run}@bench.local", 'bench', network=network,
+                                    tunables=Tunables(defaults={'api_base_url': proxy.url}))
+                agent.platform = 'darwin'  # Normal SSID transition handling
+                started = time.perf_counter()
+                if variant == 'sequential':
+                    # Previous order: login (probing inside the payload), then the first check
+                    agent.resolve_credentials()
+                    agent.api_client.login(agent.email, agent.password)
+                    agent.check_network()
+                    times.append(time.perf_counter() - started)
+                else:
+                    agent.authenticate()
+                    times.append(agent.startup_report['time_to_first_connect_s'])
+                probes.append(network.ssid_probes)
+                agent.stop(deadline=1.0)
+            times.sort()
+            results[variant] = {'time_to_first_connect_p50_s': round(times[len(times) // 2], 3),
+                                'time_to_first_connect_max_s': round(times[-1], 3),
+                                'ssid_probes': probes[0]}
+            if variant == 'pipeline':
+                results[variant]['steps'] = agent.startup_report['steps']
+    proxy.stop()
+    desktop_agent_fixed.CONFIG_FILE = saved_config
+    shutil.rmtree(config_dir, ignore_errors=True)
+    return {'runs': runs, 'ssid_probe_s': ssid_delay, 'server_latency_s': server_latency, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Office Agent startup pipeline")
+    parser.add_argument('--bench', action='store_true', help="Compare startup orders")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ssid-delay', type=float, default=0.25, help="Seconds per SSID probe")
+    parser.add_argument('--latency', type=float, default=0.05, help="Server latency per request")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.runs, args.ssid_delay, args.latency), indent=2))
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
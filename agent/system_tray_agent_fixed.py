@@ -41,13 +41,19 @@ else:
 
 # Import desktop agent module
 try:
-    from desktop_agent_fixed import OfficeAgent, ConfigManager, NetworkMonitor
+    from desktop_agent_fixed import OfficeAgent, ConfigManager, NetworkMonitor, TUNABLES
     log_to_file("Successfully imported desktop_agent_fixed module")
 except ImportError:
     try:
         # Fallback to original module if fixed version not available
         from desktop_agent import OfficeAgent, ConfigManager, NetworkMonitor
         log_to_file("Using original desktop_agent module")
+        try:
+            from desktop_agent import TUNABLES
+        except ImportError:
+            # The original module predates runtime tunables; use the built-in defaults
+            from agent_tunables import Tunables
+            TUNABLES = Tunables()
     except Exception as e:
         log_to_file(f"CRITICAL ERROR: Could not import agent modules: {str(e)}\n{traceback.format_exc()}")
         # Show error dialog before exiting if possible
@@ -61,6 +67,78 @@ except ImportError:
             error_dialog.exec_()
         sys.exit(1)
 
+from memory_watchdog import MemoryWatchdog, relaunch_command
+from attendance_ledger import AttendanceLedger
+from office_network_policy import PolicyStore
+from agent_tunables import TunablesWatcher
+from shutdown_pipeline import ShutdownJournal, install_signal_handlers
+from power_state import PowerMonitor
+from user_activity import ActivityMonitor
+from link_state import LinkMonitor
+from agent_updater import Updater, mark_healthy
+
+LOCK_FILE = os.path.join(os.path.expanduser('~'), '.office_agent.lock')
+
+LOGIND_SERVICE = 'org.freedesktop.login1'
+LOGIND_PATH = '/org/freedesktop/login1'
+LOGIND_MANAGER = 'org.freedesktop.login1.Manager'
+
+
+class LogindShutdownHook(QtCore.QObject):
+    """Holds a logind delay inhibitor and runs a callback on PrepareForShutdown (Linux)"""
+    
+    def __init__(self, on_shutdown, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.on_shutdown = on_shutdown
+        self.inhibitor_fd = None
+        self.manager = None
+        try:
+            from PyQt5 import QtDBus
+            self.QtDBus = QtDBus
+            bus = QtDBus.QDBusConnection.systemBus()
+            if not bus.isConnected():
+                log_to_file("System D-Bus not available; no logind shutdown hook")
+                return
+            self.manager = QtDBus.QDBusInterface(LOGIND_SERVICE, LOGIND_PATH, LOGIND_MANAGER, bus)
+            self.take_inhibitor()
+            if not bus.connect(LOGIND_SERVICE, LOGIND_PATH, LOGIND_MANAGER, 'PrepareForShutdown',
+                               self.prepare_for_shutdown):
+                log_to_file("Could not subscribe to logind PrepareForShutdown")
+        except Exception as e:
+            log_to_file(f"logind shutdown hook unavailable: {str(e)}")
+    
+    def take_inhibitor(self):
+        """Ask logind to delay shutdown until we release the lock (bounded by InhibitDelayMaxSec)"""
+        if self.manager is None or self.inhibitor_fd is not None:
+            return
+        reply = self.manager.call('Inhibit', 'shutdown', 'Office Agent',
+                                  'Recording the final disconnect', 'delay')
+        arguments = reply.arguments()
+        if reply.type() != self.QtDBus.QDBusMessage.ReplyMessage or not arguments:
+            log_to_file(f"logind refused a delay inhibitor: {reply.errorMessage()}")
+            return
+        descriptor = arguments[0]
+        number = descriptor.fileDescriptor() if hasattr(descriptor, 'fileDescriptor') else int(descriptor)
+        # Keep our own copy; the lock is released when every copy is closed
+        self.inhibitor_fd = os.dup(number)
+        del descriptor, arguments
+    
+    def release(self):
+        if self.inhibitor_fd is not None:
+            try:
+                os.close(self.inhibitor_fd)
+            except OSError:
+                pass
+            self.inhibitor_fd = None
+    
+    @QtCore.pyqtSlot(bool)
+    def prepare_for_shutdown(self, starting):
+        if starting:
+            self.on_shutdown()
+            self.release()
+        else:
+            self.take_inhibitor()  # Shutdown was cancelled; be ready for the next one
+
 class LoginDialog(QtWidgets.QDialog):
     """Dialog for collecting login credentials"""
     
@@ -113,6 +191,9 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
     
     # Define signals for thread-safe UI updates
     status_signal = QtCore.pyqtSignal(str)
+    restart_signal = QtCore.pyqtSignal()
+    login_finished_signal = QtCore.pyqtSignal(object, bool, str)  # (attempt, success, message)
+    update_staged_signal = QtCore.pyqtSignal(str)
     
     def __init__(self, parent=None):
         QtWidgets.QSystemTrayIcon.__init__(self, parent)
@@ -130,6 +211,10 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             self.status_action = self.menu.addAction("Status: Initializing...")
             self.status_action.setEnabled(False)
             
+            # Today's / this week's hours from the local ledger (no server call)
+            self.hours_action = self.menu.addAction("Today: 0h 00m | Week: 0h 00m")
+            self.hours_action.setEnabled(False)
+            
             self.menu.addSeparator()
             
             # Add control actions
@@ -139,6 +224,11 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             self.stop_action = self.menu.addAction("Stop Monitoring")
             self.stop_action.triggered.connect(self.stop_monitoring)
             
+            # Only shown while signing in
+            self.cancel_login_action = self.menu.addAction("Cancel Sign-in")
+            self.cancel_login_action.triggered.connect(self.cancel_login)
+            self.cancel_login_action.setVisible(False)
+            
             self.menu.addSeparator()
             
             # Add logout and exit options
@@ -153,6 +243,9 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             
             # Set up signals
             self.status_signal.connect(self.update_status)
+            self.restart_signal.connect(self.restart_app)
+            self.login_finished_signal.connect(self.on_login_finished)
+            self.update_staged_signal.connect(self.on_update_staged)
             
             # Show the icon
             self.show()
@@ -160,13 +253,38 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             # Set tooltip
             self.setToolTip("Office Agent")
             
+            # Load runtime tunables and apply later edits of the file live
+            self.tunables_watcher = TunablesWatcher(TUNABLES)
+            self.tunables_watcher.start()
+            
             # Initialize the agent
-            self.agent = OfficeAgent()
+            self.agent = OfficeAgent(ledger=AttendanceLedger(), policy_store=PolicyStore(),
+                                     shutdown_journal=ShutdownJournal(), power_monitor=PowerMonitor(),
+                                     activity_monitor=ActivityMonitor(), link_monitor=LinkMonitor())
+            self.agent.api_client.endpoints.start()  # Background probing of LAN/public endpoints
             self.agent_thread = None
-            
-            # Auto-start the agent
+            self.login_thread = None
+            self.login_cancel = None  # threading.Event of the current sign-in attempt
+            self.shutdown_result = None
+            
+            # Refresh the hours line once a minute
+            self.update_hours()
+            self.hours_timer = QtCore.QTimer(self)
+            self.hours_timer.timeout.connect(self.update_hours)
+            self.hours_timer.start(60 * 1000)
+            
+            # Watch memory for the lifetime of the process; restart on the Qt thread
+            self.memory_watchdog = MemoryWatchdog(on_limit=self.restart_signal.emit)
+            self.memory_watchdog.start()
+            
+            # Download new versions in the background (when update_url is set); used from the next start
+            self.updater = Updater(TUNABLES, on_staged=self.update_staged_signal.emit)
+            self.updater.start()
+            
+            # Auto-start the agent once the event loop runs, so the tray responds at once;
+            # the login itself happens on a worker thread (see initialize_agent)
             log_to_file("Starting automatic initialization")
-            self.initialize_agent()
+            QtCore.QTimer.singleShot(0, self.initialize_agent)
             
             # Make sure agent can find us
             self.activated.connect(self.on_tray_activated)
@@ -178,6 +296,16 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             log_to_file(f"Error in SystemTrayAgent.__init__: {str(e)}\n{traceback.format_exc()}")
             self.show_error("Initialization Error", f"Error initializing application: {str(e)}")
     
+    def on_update_staged(self, version):
+        """Tell the user a downloaded update is ready"""
+        log_to_file(f"Update {version} staged")
+        self.showMessage(
+            "Office Agent",
+            f"Version {version} has been downloaded and will be used from the next start",
+            QtWidgets.QSystemTrayIcon.Information,
+            3000
+        )
+    
     def on_tray_activated(self, reason):
         """Handle tray icon activation (click)"""
         if reason == QtWidgets.QSystemTrayIcon.DoubleClick:
@@ -191,7 +319,8 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
                 self.showMessage(
                     "Office Agent - Connected",
                     f"Connected to network: {self.agent.previous_ssid}\n"
-                    f"Last heartbeat: {time.strftime('%H:%M:%S', time.localtime(self.agent.api_client.last_heartbeat_time or 0))}", 
+                    f"Last heartbeat: {time.strftime('%H:%M:%S', time.localtime(self.agent.api_client.last_heartbeat_time or 0))}\n"
+                    f"{self.agent.ledger.summary_text()}", 
                     QtWidgets.QSystemTrayIcon.Information, 
                     3000
                 )
@@ -229,23 +358,68 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             return None, None
     
     def initialize_agent(self):
-        """Initialize and start the agent"""
+        """Resolve credentials on the GUI thread, then sign in on a worker thread"""
         try:
-            # Initialize the agent
-            if not self.agent.initialize(self.get_gui_credentials):
-                self.update_status("Status: Initialization failed")
-                self.showMessage(
-                    "Office Agent", 
-                    "Failed to initialize agent. Please check your credentials.", 
-                    QtWidgets.QSystemTrayIcon.Critical, 
-                    3000
-                )
-                log_to_file("Agent initialization failed")
+            if self.login_thread and self.login_thread.is_alive():
+                log_to_file("Sign-in already in progress")
+                if self.login_cancel and self.login_cancel.is_set():
+                    self.update_status("Status: Finishing cancelled sign-in...")
                 return
-                
+            
+            # Saved credentials or the login dialog; no network access here
+            if not self.agent.resolve_credentials(self.get_gui_credentials):
+                self.login_failed("No credentials")
+                return
+            
+            self.update_status("Status: Signing in...")
+            self.start_action.setEnabled(False)
+            self.cancel_login_action.setVisible(True)
+            
+            self.login_cancel = threading.Event()
+            self.login_thread = threading.Thread(target=self.run_login, args=(self.login_cancel,),
+                                                 name='AgentLogin')
+            self.login_thread.daemon = True
+            self.login_thread.start()
+            
+        except Exception as e:
+            log_to_file(f"Error in initialize_agent: {str(e)}\n{traceback.format_exc()}")
+            self.update_status("Status: Error initializing")
+            self.show_error("Initialization Error", str(e))
+    
+    def run_login(self, attempt):
+        """Sign-in worker; reports progress and the result through signals"""
+        try:
+            success, message = self.agent.authenticate(cancelled=attempt,
+                                                       on_progress=self.status_signal.emit)
+            log_to_file(f"Startup: {self.agent.startup_report}")
+        except Exception as e:
+            log_to_file(f"Error in login worker: {str(e)}\n{traceback.format_exc()}")
+            success, message = False, str(e)
+        self.login_finished_signal.emit(attempt, success, message)
+    
+    def on_login_finished(self, attempt, success, message):
+        """Finish a sign-in attempt on the GUI thread"""
+        try:
+            if attempt is not self.login_cancel:
+                return  # Superseded
+            self.cancel_login_action.setVisible(False)
+            
+            if attempt.is_set():
+                # Already shown as cancelled; allow a new attempt now the old one is done
+                log_to_file("Sign-in cancelled")
+                self.start_action.setEnabled(True)
+                return
+            
+            if not success:
+                self.login_failed(message)
+                return
+            
             # Set status
             self.update_status("Status: Running")
             
+            # This version works: keep it instead of rolling back on the next start
+            mark_healthy()
+            
             # Start the agent thread
             self.start_agent_thread()
             
@@ -262,10 +436,30 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             )
             
         except Exception as e:
-            log_to_file(f"Error in initialize_agent: {str(e)}\n{traceback.format_exc()}")
+            log_to_file(f"Error in on_login_finished: {str(e)}\n{traceback.format_exc()}")
             self.update_status("Status: Error initializing")
             self.show_error("Initialization Error", str(e))
     
+    def login_failed(self, message):
+        """Show a failed sign-in and allow another attempt"""
+        self.update_status("Status: Initialization failed")
+        self.start_action.setEnabled(True)
+        self.showMessage(
+            "Office Agent", 
+            "Failed to initialize agent. Please check your credentials.", 
+            QtWidgets.QSystemTrayIcon.Critical, 
+            3000
+        )
+        log_to_file(f"Agent initialization failed: {message}")
+    
+    def cancel_login(self):
+        """Stop waiting for the current sign-in; the worker undoes a login that still completes"""
+        if self.login_cancel:
+            self.login_cancel.set()
+        log_to_file("User cancelled sign-in")
+        self.cancel_login_action.setVisible(False)
+        self.update_status("Status: Sign-in cancelled")
+    
     def start_agent_thread(self):
         """Start the agent in a separate thread"""
         try:
@@ -274,6 +468,7 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
                 return
                 
             log_to_file("Starting agent thread")
+            self.agent.api_client.outbound.start()  # Events and heartbeats from a single sender
             self.agent.is_running = True
             self.agent_thread = threading.Thread(target=self.run_agent_loop)
             self.agent_thread.daemon = True
@@ -287,42 +482,7 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
         """The main agent loop running in a thread"""
         try:
             log_to_file("Agent loop started")
-            heartbeat_counter = 0
-            
-            # Initial network check
-            self.agent.check_network()
-            
-            while self.agent.is_running:
-                try:
-                    # Use shorter sleep intervals
-                    for _ in range(6):  # 6 x 5 seconds = 30 seconds
-                        time.sleep(5)
-                        if not self.agent.is_running:
-                            break
-                            
-                    if not self.agent.is_running:
-                        break
-                    
-                    # Check network status
-                    self.agent.check_network()
-                    
-                    # Send heartbeat every 2 minutes (4 cycles)
-                    heartbeat_counter += 1
-                    if heartbeat_counter >= 4:
-                        if self.agent.api_client.connected:
-                            success, message = self.agent.api_client.send_heartbeat()
-                            if not success and message == "Session not found":
-                                # Force reconnect
-                                self.agent.api_client.track_connection(is_connect=True)
-                                log_to_file("Forced reconnection due to session not found")
-                                self.status_signal.emit("Status: Reconnected")
-                        
-                        heartbeat_counter = 0
-                except Exception as inner_e:
-                    log_to_file(f"Error in agent loop iteration: {str(inner_e)}")
-                    # Continue running despite errors in a single iteration
-                    time.sleep(30)
-            
+            self.agent.run_loop(on_status=self.status_signal.emit)
             log_to_file("Agent loop exited normally")
         except Exception as e:
             log_to_file(f"Critical error in agent thread: {str(e)}\n{traceback.format_exc()}")
@@ -340,8 +500,9 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
                     self.start_agent_thread()
                     self.update_status("Status: Running")
                 else:
-                    # Need to reinitialize
+                    # Need to reinitialize; the sign-in worker updates the menu when done
                     self.initialize_agent()
+                    return
                 
                 self.start_action.setEnabled(False)
                 self.stop_action.setEnabled(True)
@@ -404,6 +565,11 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
         try:
             log_to_file("User initiated logout")
             
+            # Abandon a sign-in still in progress (the worker logs it out if it completes)
+            if self.login_cancel:
+                self.login_cancel.set()
+                self.cancel_login_action.setVisible(False)
+            
             # Stop the agent if running
             if self.agent.is_running:
                 self.agent.is_running = False
@@ -412,10 +578,9 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
                 if self.agent_thread and self.agent_thread.is_alive():
                     self.agent_thread.join(0.1)  # Short timeout
             
-            # Disconnect and logout from API
-            if hasattr(self.agent, 'api_client') and self.agent.api_client.connected:
-                self.agent.api_client.track_connection(is_connect=False)
-                self.agent.api_client.logout()
+            # Disconnect and logout from API (concurrently, within the shutdown deadline)
+            if hasattr(self.agent, 'api_client') and self.agent.api_client.access_token:
+                self.agent.stop(reason='logout')
             
             # Clear credentials
             ConfigManager.clear_credentials()
@@ -427,21 +592,34 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             self.start_action.setEnabled(True)
             self.stop_action.setEnabled(False)
             
-            # Reset the agent
-            self.agent = OfficeAgent()
+            # Reset the agent (keeps the existing HTTP session instead of leaking a new one)
+            self.agent.reset()
             
         except Exception as e:
             log_to_file(f"Error in logout: {str(e)}\n{traceback.format_exc()}")
             self.show_error("Logout Error", f"Error during logout: {str(e)}")
 
+    def restart_app(self):
+        """Cleanly stop the agent and start a fresh process (used by the memory watchdog)"""
+        try:
+            log_to_file("Restarting Office Agent to release memory")
+            self.shutdown('restart')
+            
+            # Release the single-instance lock so the new process can start
+            if os.path.exists(LOCK_FILE):
+                os.remove(LOCK_FILE)
+            subprocess.Popen(relaunch_command(), close_fds=True)
+        except Exception as e:
+            log_to_file(f"Error in restart_app: {str(e)}\n{traceback.format_exc()}")
+        QtWidgets.QApplication.quit()
+
     def exit_app(self):
         """Exit the application"""
         try:
             log_to_file("User initiated exit")
             
-            # Stop the agent and clean up
-            if self.agent.is_running:
-                self.agent.stop()  # This handles disconnection and logout
+            # Final disconnect and logout, bounded by the shutdown deadline
+            self.shutdown('exit')
             
             # Exit the application
             QtWidgets.QApplication.quit()
@@ -451,6 +629,49 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
             # Force quit even if there was an error
             QtWidgets.QApplication.quit()
     
+    def shutdown(self, reason):
+        """Stop the agent once, whichever of exit, restart or OS session end comes first"""
+        if self.shutdown_result is not None:
+            return self.shutdown_result
+        try:
+            self.memory_watchdog.stop()
+            if self.login_cancel:
+                self.login_cancel.set()
+            self.shutdown_result = self.agent.stop(reason=reason)
+            log_to_file(f"Shutdown ({reason}): {self.shutdown_result}")
+        except Exception as e:
+            self.shutdown_result = {'reason': reason, 'error': str(e)}
+            log_to_file(f"Error in shutdown: {str(e)}\n{traceback.format_exc()}")
+        return self.shutdown_result
+    
+    def install_session_end_hooks(self, app):
+        """Record the final disconnect when the OS session ends"""
+        # WM_QUERYENDSESSION on Windows, the session manager's save request on X11
+        app.commitDataRequest.connect(lambda manager: self.shutdown('session-end'))
+        app.aboutToQuit.connect(lambda: self.shutdown('quit'))
+        
+        # SIGTERM/SIGHUP; Python only runs signal handlers when it gets control,
+        # so wake the interpreter periodically while Qt's event loop runs
+        installed = install_signal_handlers(
+            lambda reason: (self.shutdown(reason), QtWidgets.QApplication.quit()))
+        self.signal_timer = QtCore.QTimer(self)
+        self.signal_timer.timeout.connect(lambda: None)
+        self.signal_timer.start(500)
+        
+        # systemd-logind: delay shutdown until the disconnect is sent
+        self.logind_hook = None
+        if sys.platform.startswith('linux'):
+            self.logind_hook = LogindShutdownHook(lambda: self.shutdown('system-shutdown'), self)
+        log_to_file(f"Session end hooks installed (signals: {', '.join(installed)})")
+    
+    def update_hours(self):
+        """Show today's and this week's connected time from the local ledger"""
+        try:
+            if self.agent.ledger:
+                self.hours_action.setText(self.agent.ledger.summary_text())
+        except Exception as e:
+            log_to_file(f"Error updating hours: {str(e)}")
+    
     def update_status(self, status_text):
         """Update the status text in the menu (thread-safe)"""
         try:
@@ -474,7 +695,7 @@ class SystemTrayAgent(QtWidgets.QSystemTrayIcon):
 def check_single_instance():
     """Ensure only one instance of the app is running"""
     # This is a simple implementation - consider using a proper mutex for production
-    lock_file = os.path.join(os.path.expanduser('~'), '.office_agent.lock')
+    lock_file = LOCK_FILE
     
     try:
         # If the lock file exists and is less than 1 minute old, assume another instance is running
@@ -522,6 +743,7 @@ def main():
         
         # Create the system tray agent
         tray_agent = SystemTrayAgent(window)
+        tray_agent.install_session_end_hooks(app)
         
         log_to_file("Application started, entering event loop")
         sys.exit(app.exec_())
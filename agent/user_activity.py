@@ -0,0 +1,220 @@
+"""
+User activity detection for the Office Agent.
+
+While the workstation is locked, or nobody has touched it for `idle_threshold`
+seconds, heartbeats prove nothing about presence. The agent then sends one
+"idle" event (the server closes the open attendance record at the time input
+stopped), pauses heartbeats and network probes, and reports a fresh connect
+when the user is back. See OfficeAgent.check_activity.
+
+Sources, picked by platform:
+    Linux    logind LockedHint / IdleHint of the caller's session (D-Bus), plus the
+             input idle time from the X server (MIT-SCREEN-SAVER) or, on Wayland,
+             GNOME's Mutter IdleMonitor
+    Windows  OpenInputDesktop (fails while the secure desktop is shown) and
+             GetLastInputInfo
+    macOS    HIDIdleTime from ioreg (no lock detection)
+Anything else reports the user as active, i.e. the normal cadence.
+
+Measure request volume on a simulated day with screen locks:
+    python agent_simulator.py --activity
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+LOGIND_SESSION = '/org/freedesktop/login1/session/auto'
+
+
+class ActivityState:
+    """One reading of the user's session: screen locked, seconds without input"""
+
+    def __init__(self, locked=False, idle_seconds=None):
+        self.locked = locked
+        self.idle_seconds = idle_seconds
+
+    def is_away(self, tunables):
+        """Locked, or idle for at least idle_threshold seconds (0 disables the idle check)"""
+        if self.locked:
+            return True
+        threshold = tunables.idle_threshold
+        return bool(threshold) and self.idle_seconds is not None and self.idle_seconds >= threshold
+
+    def __repr__(self):
+        idle = f" idle {int(self.idle_seconds)}s" if self.idle_seconds is not None else ''
+        return f"ActivityState({'locked' if self.locked else 'unlocked'}{idle})"
+
+
+ACTIVE = ActivityState()
+
+
+def _busctl(*args):
+    """Whitespace-split stdout of a busctl call, None when it fails"""
+    try:
+        result = subprocess.run(['busctl'] + list(args), capture_output=True, text=True, timeout=2)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.split() if result.returncode == 0 else None
+
+
+def logind_activity_state():
+    """LockedHint / IdleHint of the caller's logind session (set by the desktop environment)"""
+    output = _busctl('get-property', 'org.freedesktop.login1', LOGIND_SESSION,
+                     'org.freedesktop.login1.Session', 'LockedHint', 'IdleHint', 'IdleSinceHint')
+    if not output or output[0::2] != ['b', 'b', 't']:
+        return None
+    locked, idle, idle_since = output[1] == 'true', output[3] == 'true', int(output[5])
+    idle_seconds = max(time.time() - idle_since / 1e6, 0) if idle and idle_since else None
+    return ActivityState(locked, idle_seconds)
+
+
+class X11IdleQuery:
+    """Seconds since the last input event, from the X server's MIT-SCREEN-SAVER extension"""
+
+    def __init__(self):
+        self._libraries = None
+
+    def _load(self):
+        import ctypes
+        import ctypes.util
+
+        class XScreenSaverInfo(ctypes.Structure):
+            _fields_ = [('window', ctypes.c_ulong), ('state', ctypes.c_int), ('kind', ctypes.c_int),
+                        ('til_or_since', ctypes.c_ulong), ('idle', ctypes.c_ulong),
+                        ('eventMask', ctypes.c_ulong)]
+
+        x11_name, xss_name = ctypes.util.find_library('X11'), ctypes.util.find_library('Xss')
+        if not x11_name or not xss_name:
+            return False
+        x11, xss = ctypes.CDLL(x11_name), ctypes.CDLL(xss_name)
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XFree.argtypes = [ctypes.c_void_p]
+        xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(XScreenSaverInfo)
+        xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                              ctypes.POINTER(XScreenSaverInfo)]
+        return x11, xss
+
+    def __call__(self):
+        if self._libraries is None:
+            try:
+                self._libraries = self._load()
+            except OSError:
+                self._libraries = False
+        if not self._libraries:
+            return None
+        x11, xss = self._libraries
+        display = x11.XOpenDisplay(None)
+        if not display:
+            return None
+        try:
+            info = xss.XScreenSaverAllocInfo()
+            try:
+                if not xss.XScreenSaverQueryInfo(display, x11.XDefaultRootWindow(display), info):
+                    return None
+                return info.contents.idle / 1000.0
+            finally:
+                x11.XFree(info)
+        finally:
+            x11.XCloseDisplay(display)
+
+
+def wayland_idle_seconds():
+    """Seconds without input from GNOME's Mutter IdleMonitor (other compositors: None)"""
+    output = _busctl('--user', 'call', 'org.gnome.Mutter.IdleMonitor',
+                     '/org/gnome/Mutter/IdleMonitor/Core', 'org.gnome.Mutter.IdleMonitor',
+                     'GetIdletime')
+    if output and len(output) == 2 and output[0] == 't':
+        return int(output[1]) / 1000.0
+    return None
+
+
+_x11_idle = X11IdleQuery()
+
+
+def linux_activity_state():
+    """logind lock state plus the display server's input idle time"""
+    state = logind_activity_state() or ActivityState()
+    if state.locked:
+        return state
+    idle_seconds = None
+    if os.environ.get('WAYLAND_DISPLAY'):
+        idle_seconds = wayland_idle_seconds()
+    elif os.environ.get('DISPLAY'):
+        idle_seconds = _x11_idle()
+    if idle_seconds is not None:
+        state.idle_seconds = idle_seconds
+    return state
+
+
+def windows_activity_state():
+    """Lock state from OpenInputDesktop, idle time from GetLastInputInfo"""
+    import ctypes
+    from ctypes import wintypes
+
+    class LASTINPUTINFO(ctypes.Structure):
+        _fields_ = [('cbSize', wintypes.UINT), ('dwTime', wintypes.DWORD)]
+
+    user32, kernel32 = ctypes.windll.user32, ctypes.windll.kernel32
+    info = LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(info)
+    idle_seconds = None
+    if user32.GetLastInputInfo(ctypes.byref(info)):
+        idle_seconds = ((kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+
+    # The input desktop cannot be opened while the lock screen (secure desktop) is shown
+    desktop = user32.OpenInputDesktop(0, False, 0x0100)  # DESKTOP_SWITCHDESKTOP
+    if desktop:
+        user32.CloseDesktop(desktop)
+    return ActivityState(locked=not desktop, idle_seconds=idle_seconds)
+
+
+def macos_activity_state():
+    """Idle time from the HID system's HIDIdleTime (nanoseconds)"""
+    try:
+        output = subprocess.run(['ioreg', '-c', 'IOHIDSystem', '-d', '4'], capture_output=True,
+                                text=True, timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    for line in output.splitlines():
+        if '"HIDIdleTime"' in line:
+            value = line.rsplit('=', 1)[-1].strip()
+            if value.isdigit():
+                return ActivityState(idle_seconds=int(value) / 1e9)
+    return None
+
+
+def system_activity_state():
+    """Activity state of this machine's user session, active when it cannot be determined"""
+    try:
+        if sys.platform.startswith('linux'):
+            return linux_activity_state()
+        if sys.platform == 'win32':
+            return windows_activity_state()
+        if sys.platform == 'darwin':
+            return macos_activity_state() or ACTIVE
+    except Exception:
+        pass
+    return ACTIVE
+
+
+class ActivityMonitor:
+    """Activity source the agent loop consults once per network check"""
+
+    def __init__(self, source=None):
+        self.source = source or system_activity_state
+
+    def state(self):
+        try:
+            return self.source() or ACTIVE
+        except Exception:
+            return ACTIVE
+
+
+if __name__ == "__main__":
+    print(system_activity_state())
@@ -0,0 +1,262 @@
+"""
+Derive a replayable agent workload from backend request logs.
+
+Streams backend/logs/combined.log (or any log with morgan "combined" request
+lines, plain or wrapped in winston's "ISO level: message" format) one line at a
+time, so multi-gigabyte logs never sit in memory, and extracts:
+
+    - arrival rates per endpoint, by minute of day
+    - the login-time distribution (the morning logon curve)
+    - connect / heartbeat / disconnect ratios for /track-connection
+
+Heartbeats are also recognised from the controller's "Received heartbeat from"
+messages when request lines carry no event type.
+
+Usage:
+    python workload_profile.py ../backend/logs/combined.log -o workload.json
+    python workload_profile.py access-*.log.gz --tz-offset +05:30 -o workload.json
+    python agent_simulator.py --agents 500 --workload workload.json
+"""
+
+import re
+import sys
+import gzip
+import json
+import bisect
+import argparse
+from datetime import datetime, timedelta, timezone
+
+WORKLOAD_VERSION = 1
+MINUTES_PER_DAY = 1440
+
+# [23/Apr/2025:07:25:38 +0000] "POST /api/desktop/login HTTP/1.1" 200 ...
+COMBINED_RE = re.compile(
+    r'\[(?P<date>\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\] '
+    r'"(?P<method>[A-Z]+) (?P<url>\S+) [^"]*" (?P<status>\d{3}) \S+ "[^"]*" "[^"]*"'
+    r'(?: (?P<event>[\w-]+))?')
+HEARTBEAT_RE = re.compile(r'Received heartbeat from \S+ at (?P<ts>\d{4}-\d{2}-\d{2}T[\d:.]+Z)')
+
+MONTHS = {name: index for index, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+def parse_tz_offset(value):
+    """'+05:30' / '-0400' / 'local' -> tzinfo"""
+    if value in (None, 'local'):
+        return datetime.now().astimezone().tzinfo
+    sign = -1 if value.startswith('-') else 1
+    digits = value.lstrip('+-').replace(':', '')
+    return timezone(sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:4] or 0)))
+
+
+def _parse_clf_date(value):
+    """'23/Apr/2025:07:25:38 +0000' -> aware datetime (locale independent)"""
+    day, month, rest = value.split('/', 2)
+    year, hour, minute, second_zone = rest.split(':', 3)
+    second, zone = second_zone.split(' ')
+    sign = -1 if zone[0] == '-' else 1
+    tz = timezone(sign * timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5])))
+    return datetime(int(year), MONTHS[month], int(day), int(hour), int(minute), int(second), tzinfo=tz)
+
+
+def _parse_iso(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def endpoint_key(method, url):
+    """'POST /api/desktop/login?x=1' -> 'POST /api/desktop/login', numeric ids collapsed"""
+    path = url.split('?', 1)[0]
+    parts = [':id' if part.isdigit() else part for part in path.split('/')]
+    return f"{method} {'/'.join(parts)}"
+
+
+def open_log(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+class WorkloadProfiler:
+    """Streaming aggregator; memory is bounded by endpoints x minutes of day"""
+
+    def __init__(self, tz=None, path_prefix='/api/'):
+        self.tz = tz or parse_tz_offset('local')
+        self.path_prefix = path_prefix
+        self.endpoints = {}                # key -> [count per minute of day]
+        self.logins = [0] * MINUTES_PER_DAY
+        self.events = {}                   # track-connection event type -> count
+        self.message_heartbeats = 0
+        self.days = set()
+        self.first = None
+        self.last = None
+        self.lines = 0
+        self.matched = 0
+
+    def _observe_time(self, when):
+        local = when.astimezone(self.tz)
+        self.days.add(local.date())
+        if self.first is None or when < self.first:
+            self.first = when
+        if self.last is None or when > self.last:
+            self.last = when
+        return local.hour * 60 + local.minute
+
+    def feed(self, line):
+        self.lines += 1
+        match = COMBINED_RE.search(line)
+        if match:
+            url = match.group('url')
+            if not url.startswith(self.path_prefix):
+                return
+            try:
+                when = _parse_clf_date(match.group('date'))
+            except (ValueError, KeyError):
+                return
+            self.matched += 1
+            minute = self._observe_time(when)
+            key = endpoint_key(match.group('method'), url)
+            bins = self.endpoints.get(key)
+            if bins is None:
+                bins = self.endpoints[key] = [0] * MINUTES_PER_DAY
+            bins[minute] += 1
+            if key.endswith('/desktop/login') and match.group('status') == '200':
+                self.logins[minute] += 1
+            if key.endswith('/desktop/track-connection'):
+                event = match.group('event') or '-'
+                event = event if event != '-' else 'unknown'
+                self.events[event] = self.events.get(event, 0) + 1
+            return
+
+        match = HEARTBEAT_RE.search(line)
+        if match:
+            try:
+                self._observe_time(_parse_iso(match.group('ts')))
+            except ValueError:
+                return
+            self.message_heartbeats += 1
+
+    def feed_file(self, path):
+        with open_log(path) as f:
+            for line in f:
+                self.feed(line)
+
+    def event_mix(self):
+        """Fractions of connect/heartbeat/disconnect among track-connection requests"""
+        events = dict(self.events)
+        unknown = events.pop('unknown', 0)
+        if unknown and self.message_heartbeats and 'heartbeat' not in events:
+            # Request lines without event types: heartbeats come from controller messages
+            heartbeats = min(self.message_heartbeats, unknown)
+            events['heartbeat'] = heartbeats
+            unknown -= heartbeats
+        if unknown:
+            events['unknown'] = unknown
+        total = sum(events.values())
+        return {event: round(count / total, 4) for event, count in sorted(events.items())} if total else {}
+
+    def profile(self, sources=()):
+        days = max(len(self.days), 1)
+        endpoints = {}
+        for key, bins in sorted(self.endpoints.items()):
+            total = sum(bins)
+            endpoints[key] = {
+                'total': total,
+                'per_day': round(total / days, 2),
+                'peak_per_minute': round(max(bins) / days, 3),
+                'rate_per_minute': [round(count / days, 4) for count in bins],
+            }
+
+        login_total = sum(self.logins)
+        login_curve = [round(count / login_total, 6) for count in self.logins] if login_total else []
+        return {
+            'version': WORKLOAD_VERSION,
+            'sources': list(sources),
+            'utc_offset_minutes': int(datetime.now(self.tz).utcoffset().total_seconds() // 60),
+            'first': self.first.isoformat() if self.first else None,
+            'last': self.last.isoformat() if self.last else None,
+            'days': len(self.days),
+            'lines': self.lines,
+            'request_lines': self.matched,
+            'endpoints': endpoints,
+            'logins': {
+                'total': login_total,
+                'quantiles': _curve_quantiles(self.logins),
+                'curve': login_curve,
+            },
+            'track_connection_mix': self.event_mix(),
+        }
+
+
+def _curve_quantiles(bins):
+    total = sum(bins)
+    if not total:
+        return {}
+    quantiles = {}
+    running = 0
+    targets = [('p10', 0.1), ('p50', 0.5), ('p90', 0.9)]
+    for minute, count in enumerate(bins):
+        running += count
+        while targets and running >= targets[0][1] * total:
+            name, _ = targets.pop(0)
+            quantiles[name] = f"{minute // 60:02d}:{minute % 60:02d}"
+    return quantiles
+
+
+class Workload:
+    """A workload file loaded for replay"""
+
+    def __init__(self, data):
+        if data.get('version') != WORKLOAD_VERSION:
+            raise ValueError(f"Unsupported workload version {data.get('version')}")
+        self.data = data
+        curve = data.get('logins', {}).get('curve') or []
+        self._cdf = []
+        running = 0.0
+        for share in curve:
+            running += share
+            self._cdf.append(running)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def sample_login_minute(self, rng):
+        """Minute of day (float) drawn from the recorded login curve, None if there is none"""
+        if not self._cdf or self._cdf[-1] <= 0:
+            return None
+        minute = bisect.bisect_left(self._cdf, rng.random() * self._cdf[-1])
+        return min(minute, MINUTES_PER_DAY - 1) + rng.random()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a replayable workload from backend logs")
+    parser.add_argument('logs', nargs='+', help="Log files (.gz supported, '-' for stdin)")
+    parser.add_argument('-o', '--output', help="Write the workload JSON here (default: stdout)")
+    parser.add_argument('--tz-offset', default='local',
+                        help="Office timezone for minute-of-day bins, e.g. +05:30 (default: local)")
+    parser.add_argument('--prefix', default='/api/', help="Only count request paths under this prefix")
+    args = parser.parse_args(argv)
+
+    profiler = WorkloadProfiler(parse_tz_offset(args.tz_offset), args.prefix)
+    for path in args.logs:
+        profiler.feed_file(path)
+    workload = profiler.profile(args.logs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(workload, f)
+    else:
+        json.dump(workload, sys.stdout)
+        sys.stdout.write('\n')
+
+    print(f"{profiler.matched} request lines of {profiler.lines} over {workload['days']} day(s); "
+          f"logins {workload['logins']['quantiles'] or 'none'}; "
+          f"track-connection mix {workload['track_connection_mix'] or 'none'}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
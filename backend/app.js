@@ -5,6 +5,7 @@ const helmet = require("helmet");
 const morgan = require("morgan");
 const path = require("path");
 require("dotenv").config();
+const logger = require("./utils/logger");
 
 const app = express();
 
@@ -15,10 +16,21 @@ app.use(express.json());
 app.use(express.urlencoded({ extended: true }));
 
 // Logging
+// Desktop agent event type (connect/heartbeat/disconnect), for load profiling
+morgan.token("event-type", (req) => (req.body && req.body.event_type) || "-");
+
 if (process.env.NODE_ENV === "development") {
   app.use(morgan("dev"));
 } else {
-  app.use(morgan("combined"));
+  // Combined format plus event type, response time and the agent's traceparent, written
+  // through winston so request traffic lands in logs/combined.log (read by
+  // agent/workload_profile.py and agent/agent_tracing.py)
+  app.use(
+    morgan(
+      ':remote-addr - :remote-user [:date[clf]] ":method :url HTTP/:http-version" :status :res[content-length] ":referrer" ":user-agent" :event-type :response-time :req[traceparent]',
+      { stream: { write: (line) => logger.info(line.trim()) } }
+    )
+  );
 }
 
 // Routes
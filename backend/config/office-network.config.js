@@ -0,0 +1,22 @@
+// backend/config/office-network.config.js
+// Networks that count as the office for desktop agent check-ins. The same policy
+// is published to agents (GET /api/desktop/network-policy) so they can skip
+// reporting from other networks.
+const list = (value, fallback) =>
+  (value || fallback)
+    .split(",")
+    .map((item) => item.trim())
+    .filter(Boolean);
+
+module.exports = {
+  ssids: list(process.env.OFFICE_SSIDS, "GIGLABZ_5G"),
+  bssids: list(process.env.OFFICE_BSSIDS, "").map((bssid) => bssid.toLowerCase()),
+  cidrs: list(process.env.OFFICE_CIDRS, "192.168.100.0/24"),
+  // What agents do on other networks: "drop" (report nothing) or "thin" (report
+  // connects/disconnects, heartbeat only every offsiteHeartbeatCycles checks)
+  offsiteAction: process.env.OFFICE_OFFSITE_ACTION || "drop",
+  offsiteHeartbeatCycles: parseInt(
+    process.env.OFFICE_OFFSITE_HEARTBEAT_CYCLES || "20",
+    10
+  ),
+};
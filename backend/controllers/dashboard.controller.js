@@ -1,6 +1,7 @@
 // backend/controllers/dashboard.controller.js
 const dashboardService = require("../services/dashboard.service");
 const apiResponse = require("../utils/apiResponse");
+const officeNetwork = require("../utils/officeNetwork");
 const db = require("../db/models");
 
 /**
@@ -83,7 +84,7 @@ exports.getTodayAttendance = async (req, res) => {
       );
       
       // Check if the attendance was from office network
-      const isOfficeNetwork = userAttendance ? userAttendance.ssid === 'GIGLABZ_5G' : false;
+      const isOfficeNetwork = userAttendance ? officeNetwork.isOfficeSsid(userAttendance.ssid) : false;
       
       return {
         id: booking.id,
@@ -111,7 +112,7 @@ exports.getTodayAttendance = async (req, res) => {
           checkInTime: record.connectionStartTime,
           checkOutTime: record.connectionEndTime,
           network: record.ssid,
-          isOfficeNetwork: record.ssid === 'GIGLABZ_5G',
+          isOfficeNetwork: officeNetwork.isOfficeSsid(record.ssid),
           status: 'attendance-only'
         });
       }
@@ -288,7 +289,7 @@ exports.getMonthlyAttendanceReport = async (req, res) => {
       }
       
       // Count office attendance
-      if (record.ssid === 'GIGLABZ_5G') {
+      if (officeNetwork.isOfficeSsid(record.ssid)) {
         dateMap[date].officeAttendance++;
       }
     });
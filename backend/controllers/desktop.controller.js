@@ -6,6 +6,7 @@ const DesktopSession = db.desktopSession; // We'll need to create this model
 const jwt = require("jsonwebtoken");
 const bcrypt = require("bcryptjs");
 const apiResponse = require("../utils/apiResponse");
+const officeNetwork = require("../utils/officeNetwork");
 
 // Utility function to format dates in Indian Standard Time
 function formatDateTimeIST(date) {
@@ -39,8 +40,8 @@ exports.desktopLogin = async (req, res) => {
       );
     }
 
-    // Check if the network is GIGLABZ_5G for attendance tracking purposes
-    const isOfficeNetwork = ssid === "GIGLABZ_5G";
+    // Check if the network is an office SSID for attendance tracking purposes
+    const isOfficeNetwork = officeNetwork.isOfficeSsid(ssid);
 
     // We'll record attendance for office network connections only
     // but allow connections from any network
@@ -119,6 +120,43 @@ exports.desktopLogin = async (req, res) => {
   }
 };
 
+/**
+ * Time reported by the agent (epoch seconds) if it lies between the record's
+ * start and now, otherwise the current time
+ */
+const reportedTime = (epochSeconds, notBefore) => {
+  const now = new Date();
+  const reported = new Date(Number(epochSeconds) * 1000);
+  if (!epochSeconds || isNaN(reported.getTime())) {
+    return now;
+  }
+  if (reported > now || (notBefore && reported < notBefore)) {
+    return now;
+  }
+  return reported;
+};
+
+// Idle sessions send no heartbeats until the user returns; expire them much later
+const IDLE_SESSION_TIMEOUT_HOURS = 12;
+
+/**
+ * Where clause for active sessions with no activity since the cutoff. Sessions
+ * the agent reported idle (locked screen) are kept until IDLE_SESSION_TIMEOUT_HOURS.
+ */
+const staleSessionWhere = (cutoff) => {
+  const Op = db.Sequelize.Op;
+  const idleCutoff = new Date(
+    Date.now() - IDLE_SESSION_TIMEOUT_HOURS * 60 * 60 * 1000
+  );
+  return {
+    isActive: true,
+    [Op.or]: [
+      { idleSince: null, lastActivityAt: { [Op.lt]: cutoff } },
+      { idleSince: { [Op.lt]: idleCutoff } },
+    ],
+  };
+};
+
 /**
  * Handle desktop application logout
  */
@@ -144,8 +182,12 @@ exports.desktopLogout = async (req, res) => {
       });
 
       if (activeRecord) {
-        // Calculate duration and close the attendance record
-        const now = new Date();
+        // Calculate duration and close the attendance record (at the agent's
+        // logout time when a journaled logout is replayed later)
+        const now = reportedTime(
+          req.body && req.body.logout_time,
+          activeRecord.connectionStartTime
+        );
         const duration =
           (now.getTime() - activeRecord.connectionStartTime.getTime()) / 1000;
 
@@ -187,6 +229,8 @@ exports.trackConnection = async (req, res) => {
       connection_duration_formatted,
       connection_start_time,
       connection_start_time_formatted,
+      disconnect_time,
+      idle_since,
     } = req.body;
 
     // Validate required fields
@@ -241,9 +285,8 @@ exports.trackConnection = async (req, res) => {
       });
 
       // Check if this is a connection from the office network and correct IP range
-      const isOfficeNetwork = ssid === "GIGLABZ_5G";
-      const isOfficeIPRange =
-        ip_address && ip_address.startsWith("192.168.100.");
+      const isOfficeNetwork = officeNetwork.isOfficeSsid(ssid);
+      const isOfficeIPRange = officeNetwork.isOfficeIp(ip_address);
       const isValidOfficeConnection = isOfficeNetwork && isOfficeIPRange;
 
       console.log(
@@ -300,6 +343,11 @@ exports.trackConnection = async (req, res) => {
       // Update the session with the IP address
       await desktopSession.update({
         lastActivityAt: new Date(),
+        idleSince: null,
+      });
+
+      return apiResponse.success(res, "Connection recorded successfully", {
+        recordId: record.id,
       });
     } else if (event_type === "heartbeat") {
       // Handle heartbeat event - just update the lastActivityAt timestamp
@@ -310,6 +358,7 @@ exports.trackConnection = async (req, res) => {
       // Update the desktop session with the current time
       await desktopSession.update({
         lastActivityAt: new Date(),
+        idleSince: null,
       });
 
       // Find the active connection record
@@ -395,9 +444,10 @@ exports.trackConnection = async (req, res) => {
         );
       }
 
-      // Update the record with disconnect information
+      // Update the record with disconnect information; disconnects replayed by the
+      // agent after a failed shutdown carry the time the agent actually disconnected
       await record.update({
-        connectionEndTime: new Date(),
+        connectionEndTime: reportedTime(disconnect_time, record.connectionStartTime),
         connectionDuration: connection_duration,
         isActive: false,
       });
@@ -406,6 +456,39 @@ exports.trackConnection = async (req, res) => {
         recordId: record.id,
         duration: connection_duration_formatted,
       });
+    } else if (event_type === "idle") {
+      // Workstation locked or idle: the agent pauses heartbeats until the user is
+      // back (then sends "connect"). Close the open record when the user left.
+      record = await AttendanceRecord.findOne({
+        where: {
+          userId: user.id,
+          macAddress: mac_address,
+          isActive: true,
+        },
+        order: [["connectionStartTime", "DESC"]],
+      });
+
+      const idleTime = reportedTime(
+        idle_since,
+        record ? record.connectionStartTime : null
+      );
+      if (record) {
+        await record.update({
+          connectionEndTime: idleTime,
+          connectionDuration:
+            (idleTime.getTime() - record.connectionStartTime.getTime()) / 1000,
+          isActive: false,
+        });
+      }
+
+      await desktopSession.update({
+        lastActivityAt: new Date(),
+        idleSince: idleTime,
+      });
+
+      return apiResponse.success(res, "Idle recorded successfully", {
+        recordId: record ? record.id : null,
+      });
     } else {
       return apiResponse.badRequest(res, "Invalid event type");
     }
@@ -414,8 +497,65 @@ exports.trackConnection = async (req, res) => {
   }
 };
 
+/**
+ * Store a daily attendance summary computed by the desktop agent's local ledger.
+ * One record per user per day replaces reconstructing hours from raw heartbeats.
+ */
+exports.dailySummary = async (req, res) => {
+  try {
+    const {
+      date,
+      sessions,
+      total_seconds,
+      first_seen,
+      last_seen,
+      mac_address,
+    } = req.body;
+
+    // Validate required fields
+    if (!date || !/^\d{4}-\d{2}-\d{2}$/.test(date) || total_seconds === undefined) {
+      return apiResponse.badRequest(
+        res,
+        "Date (YYYY-MM-DD) and total seconds are required"
+      );
+    }
+
+    const totalSeconds = Number(total_seconds);
+    if (!Number.isFinite(totalSeconds) || totalSeconds < 0 || totalSeconds > 86400) {
+      return apiResponse.badRequest(res, "Total seconds must be between 0 and 86400");
+    }
+
+    // Replaces an earlier upload for the same day (the agent retries after failures)
+    await db.dailySummary.upsert({
+      userId: req.userId,
+      date,
+      sessions: Number(sessions) || 0,
+      totalSeconds,
+      firstSeen: first_seen ? new Date(first_seen * 1000) : null,
+      lastSeen: last_seen ? new Date(last_seen * 1000) : null,
+      macAddress: mac_address || null,
+    }, { conflictFields: ["userId", "date"] });
+
+    return apiResponse.success(res, "Daily summary recorded successfully", {
+      date,
+      totalSeconds,
+    });
+  } catch (error) {
+    return apiResponse.serverError(res, error);
+  }
+};
+
 // Add this to desktop.controller.js
 
+/**
+ * Office network policy for desktop agents (SSIDs, BSSIDs, CIDR ranges).
+ * Express adds an ETag, so agents polling with If-None-Match get a 304 while it is unchanged.
+ */
+exports.getNetworkPolicy = (req, res) => {
+  res.set("Cache-Control", "private, no-cache");
+  return apiResponse.success(res, "Network policy", officeNetwork.policy());
+};
+
 /**
  * Reset the MAC address for a specific user
  * This allows the user to register with a new device
@@ -636,7 +776,11 @@ exports.getActiveSessions = async (req, res) => {
 
           return {
             id: session.id,
-            event_type: latestRecord ? "connect" : "unknown",
+            event_type: latestRecord
+              ? "connect"
+              : session.idleSince
+              ? "idle"
+              : "unknown",
             ssid: session.ssid,
             email: session.user ? session.user.email : null,
             ip_address: latestRecord ? latestRecord.ipAddress : ipAddress, // Use historical record if no active one
@@ -709,12 +853,7 @@ exports.cleanupInactiveSessions = async (req, res) => {
 
     // Find active sessions that haven't been updated in the last 5 minutes
     const outdatedSessions = await DesktopSession.findAll({
-      where: {
-        isActive: true,
-        lastActivityAt: {
-          [db.Sequelize.Op.lt]: fiveMinutesAgo,
-        },
-      },
+      where: staleSessionWhere(fiveMinutesAgo),
       include: [
         {
           model: db.user,
@@ -804,12 +943,7 @@ const autoCleanupInactiveSessions = async (timeoutMinutes = 10) => {
 
     // Find active sessions that haven't been updated in the specified time
     const outdatedSessions = await DesktopSession.findAll({
-      where: {
-        isActive: true,
-        lastActivityAt: {
-          [db.Sequelize.Op.lt]: cutoffTime,
-        },
-      },
+      where: staleSessionWhere(cutoffTime),
     });
 
     console.log(
@@ -916,7 +1050,11 @@ exports.getAttendanceHistory = async (req, res) => {
           attributes: ["id", "username", "email", "fullName", "department"],
         },
       ],
-      order: [["connectionStartTime", "DESC"]],
+      // id breaks ties between equal start times so offset pages neither skip nor repeat rows
+      order: [
+        ["connectionStartTime", "DESC"],
+        ["id", "DESC"],
+      ],
       limit: parseInt(limit),
       offset: parseInt(offset),
     });
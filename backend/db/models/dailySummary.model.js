@@ -0,0 +1,47 @@
+// backend/db/models/dailySummary.model.js
+module.exports = (sequelize, Sequelize) => {
+  // One row per user per day, computed by the desktop agent's local ledger
+  const DailySummary = sequelize.define(
+    "dailySummaries",
+    {
+      id: {
+        type: Sequelize.INTEGER,
+        primaryKey: true,
+        autoIncrement: true,
+      },
+      userId: {
+        type: Sequelize.INTEGER,
+        allowNull: false,
+      },
+      date: {
+        type: Sequelize.DATEONLY,
+        allowNull: false,
+      },
+      sessions: {
+        type: Sequelize.INTEGER,
+        defaultValue: 0,
+      },
+      totalSeconds: {
+        type: Sequelize.FLOAT,
+        allowNull: false,
+      },
+      firstSeen: {
+        type: Sequelize.DATE,
+        allowNull: true,
+      },
+      lastSeen: {
+        type: Sequelize.DATE,
+        allowNull: true,
+      },
+      macAddress: {
+        type: Sequelize.STRING,
+        allowNull: true,
+      },
+    },
+    {
+      indexes: [{ unique: true, fields: ["userId", "date"] }],
+    }
+  );
+
+  return DailySummary;
+};
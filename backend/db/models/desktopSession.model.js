@@ -30,6 +30,11 @@ module.exports = (sequelize, Sequelize) => {
       type: Sequelize.DATE,
       allowNull: false,
     },
+    // Set while the agent reports the workstation locked/idle (heartbeats paused)
+    idleSince: {
+      type: Sequelize.DATE,
+      allowNull: true,
+    },
   });
 
   return DesktopSession;
@@ -68,6 +68,7 @@ db.attendanceRecord = require("./attendanceRecord.model.js")(
   sequelize,
   Sequelize
 );
+db.dailySummary = require("./dailySummary.model.js")(sequelize, Sequelize);
 
 // Add relationships
 db.user.hasMany(db.desktopSession);
@@ -76,4 +77,7 @@ db.desktopSession.belongsTo(db.user);
 db.user.hasMany(db.attendanceRecord);
 db.attendanceRecord.belongsTo(db.user);
 
+db.user.hasMany(db.dailySummary);
+db.dailySummary.belongsTo(db.user);
+
 module.exports = db;
@@ -15,6 +15,8 @@ router.post(
   authJwt.verifyToken,
   controller.trackConnection
 );
+router.post("/daily-summary", authJwt.verifyToken, controller.dailySummary);
+router.get("/network-policy", authJwt.verifyToken, controller.getNetworkPolicy);
 
 // Admin routes
 router.post(
@@ -0,0 +1,45 @@
+// backend/utils/officeNetwork.js
+const config = require("../config/office-network.config");
+
+const ipToInt = (ip) => {
+  const parts = String(ip).split(".").map(Number);
+  if (parts.length !== 4 || parts.some((p) => !Number.isInteger(p) || p < 0 || p > 255)) {
+    return null;
+  }
+  return ((parts[0] << 24) | (parts[1] << 16) | (parts[2] << 8) | parts[3]) >>> 0;
+};
+
+// Parse "a.b.c.d/n" once into [network, mask]
+const ranges = config.cidrs
+  .map((cidr) => {
+    const [address, bits = "32"] = cidr.split("/");
+    const base = ipToInt(address);
+    const prefix = parseInt(bits, 10);
+    if (base === null || !(prefix >= 0 && prefix <= 32)) return null;
+    const mask = prefix === 0 ? 0 : (0xffffffff << (32 - prefix)) >>> 0;
+    return [(base & mask) >>> 0, mask];
+  })
+  .filter(Boolean);
+
+const officeNetwork = {
+  isOfficeSsid: (ssid) => config.ssids.includes(ssid),
+
+  isOfficeIp: (ip) => {
+    const value = ipToInt(ip);
+    return value !== null && ranges.some(([network, mask]) => ((value & mask) >>> 0) === network);
+  },
+
+  /**
+   * Policy published to desktop agents
+   */
+  policy: () => ({
+    version: 1,
+    ssids: config.ssids,
+    bssids: config.bssids,
+    cidrs: config.cidrs,
+    offsite_action: config.offsiteAction,
+    offsite_heartbeat_cycles: config.offsiteHeartbeatCycles,
+  }),
+};
+
+module.exports = officeNetwork;